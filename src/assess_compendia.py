@@ -1,56 +1,100 @@
+"""Assess the compendia through the Node, Clique and Edge Parquet files export_compendia_to_parquet() writes for them.
+
+These used to parse every compendium JSONL file in Python, and assess_completeness() held every identifier of a
+semantic type in a Python set while it did so. They are now DuckDB queries over the Parquet files in
+`duckdb/parquet/filename=*/`, run with the spill settings from setup_duckdb(), so they only need as much memory as
+they are given. Within a compendium, cliques are identified by their clique leader, as they are in the Edge table.
+"""
+
 import os
 from collections import defaultdict
-from os import path
 
-import jsonlines
+from src.exporters.duckdb_exporters import log_duckdb_settings_on_error, setup_duckdb
+
+# How many missing identifiers assess_completeness() fetches from DuckDB at a time.
+FETCH_ROWS = 100_000
+
 
-from src.util import Text
+def _duckdb_config(memory_limit_mb):
+    return {"memory_limit": f"{memory_limit_mb}MB"} if memory_limit_mb is not None else {}
 
 
 # TODO: Assess whether we are bringing in any new identifiers (we shouldn't, unless we just don't have id's for a thing)
-def assess_completeness(input_dir, compendia, reportfile):
-    """Given a directory containing id files, make sure that every id in those files ended up in one of the compendia"""
-    id_files = os.listdir(input_dir)
-    all_identifiers = set()
-    for idf in id_files:
-        with open(path.join(input_dir, idf)) as inf:
-            for line in inf:
-                x = line.strip().split("\t")[0]
-                all_identifiers.add(x)
-    for comp in compendia:
-        print(comp)
-        with jsonlines.open(comp, "r") as inf:
-            for j in inf:
-                ids = [x["i"] for x in j["identifiers"]]
-                for identifier in ids:
-                    all_identifiers.discard(identifier)
-    with open(reportfile, "w") as outf:
-        list_all_identifiers = list(all_identifiers)
-        list_all_identifiers.sort()
-        print(f"Missing identifiers: {len(list_all_identifiers)}\n")
-        outf.write(f"Missing identifiers: {len(list_all_identifiers)}\n")
-        for missing_id in list_all_identifiers:
-            outf.write(f"{missing_id}\n")
-
-
-def makecountset(j):
-    eids = [Text.get_prefix_or_none(x["i"]) for x in j["identifiers"]]
-    pcounts = defaultdict(int)
-    for p in eids:
-        pcounts[p] += 1
-    return frozenset([(k, v) for k, v in pcounts.items()])
-
-
-def assess(compendium, reportfile):
-    nclusters = 0
-    clustersizes = defaultdict(int)
-    clustertypes = defaultdict(int)
-    with jsonlines.open(compendium, "r") as inf:
-        for j in inf:
-            nclusters += 1
-            clustersizes[len(j["identifiers"])] += 1
-            countset = makecountset(j)
-            clustertypes[countset] += 1
+def assess_completeness(input_dir, edge_parquet_files, reportfile, memory_limit_mb=None):
+    """Given a directory containing id files, make sure that every id in those files ended up in one of the compendia.
+
+    :param input_dir: The directory of ids files. The first tab-separated column of every line is an identifier.
+    :param edge_parquet_files: The Edge.parquet files of the compendia the identifiers should have ended up in.
+    :param reportfile: The report to write: the number of missing identifiers, then each of them, sorted.
+    :param memory_limit_mb: DuckDB memory limit in MB, past which it spills to its temp_directory.
+    """
+    id_files = sorted(os.path.join(input_dir, idf) for idf in os.listdir(input_dir))
+
+    with setup_duckdb(":memory:", _duckdb_config(memory_limit_mb)) as db:
+        with log_duckdb_settings_on_error(db, f"assess_completeness: anti-join {input_dir} against the compendia"):
+            # Only the first column is read: strict_mode=false lets lines have any number of columns after it.
+            db.execute(
+                """CREATE TEMP TABLE missing AS
+                   WITH ids AS (
+                       SELECT DISTINCT trim(identifier) AS identifier
+                       FROM read_csv($id_files, columns={'identifier': 'VARCHAR'}, delim='\t', quote='', escape='',
+                                     header=false, auto_detect=false, strict_mode=false)
+                       WHERE trim(identifier) <> ''
+                   )
+                   SELECT identifier FROM ids
+                   ANTI JOIN read_parquet($edge_parquet_files) AS edge ON ids.identifier = edge.curie""",
+                {"id_files": id_files, "edge_parquet_files": list(edge_parquet_files)},
+            )
+        missing_count = db.execute("SELECT COUNT(*) FROM missing").fetchone()[0]
+
+        with open(reportfile, "w") as outf:
+            print(f"Missing identifiers: {missing_count}\n")
+            outf.write(f"Missing identifiers: {missing_count}\n")
+            result = db.execute("SELECT identifier FROM missing ORDER BY identifier")
+            while rows := result.fetchmany(FETCH_ROWS):
+                outf.writelines(f"{missing_id}\n" for (missing_id,) in rows)
+
+
+def assess(clique_parquet_file, edge_parquet_file, reportfile, memory_limit_mb=None):
+    """Write a report of how many cliques a compendium has, how large they are, and which prefixes they are made of.
+
+    A clique's type is the set of (prefix, count) pairs of its identifiers, with prefixes upper-cased as in
+    Text.get_prefix_or_none(): an identifier without a prefix counts towards None.
+
+    :param clique_parquet_file: The compendium's Clique.parquet file.
+    :param edge_parquet_file: The compendium's Edge.parquet file.
+    :param reportfile: The report to write.
+    :param memory_limit_mb: DuckDB memory limit in MB, past which it spills to its temp_directory.
+    """
+    with setup_duckdb(":memory:", _duckdb_config(memory_limit_mb)) as db:
+        db.read_parquet(clique_parquet_file).create_view("clique")
+        db.read_parquet(edge_parquet_file).create_view("edge")
+
+        with log_duckdb_settings_on_error(db, f"assess: cluster sizes in {clique_parquet_file}"):
+            clustersizes = dict(
+                db.execute(
+                    "SELECT clique_identifier_count, COUNT(*) FROM clique GROUP BY clique_identifier_count"
+                ).fetchall()
+            )
+        with log_duckdb_settings_on_error(db, f"assess: cluster types in {edge_parquet_file}"):
+            clustertypes = defaultdict(int)
+            for prefix_counts, count in db.execute(
+                """WITH prefix_counts AS (
+                       SELECT clique_leader,
+                              CASE WHEN contains(curie, ':') THEN upper(curie_prefix) END AS prefix,
+                              COUNT(*) AS prefix_count
+                       FROM edge
+                       GROUP BY ALL
+                   ), clique_types AS (
+                       SELECT list((prefix, prefix_count) ORDER BY prefix, prefix_count) AS clique_type
+                       FROM prefix_counts
+                       GROUP BY clique_leader
+                   )
+                   SELECT clique_type, COUNT(*) FROM clique_types GROUP BY clique_type"""
+            ).fetchall():
+                clustertypes[frozenset(prefix_counts)] += count
+
+    nclusters = sum(clustersizes.values())
     with open(reportfile, "w") as outf:
         outf.write(f"{nclusters} clusters\n")
         sizes = list(clustersizes.keys())
@@ -0,0 +1,195 @@
+"""An asyncio client for rate-limited JSON APIs such as NCBI E-utilities.
+
+ThrottledRequester (in src/babel_utils.py) makes one blocking request at a time, sleeping between them. The
+AsyncThrottledRequester here keeps several requests in flight at once, while a token bucket holds the rate at which
+they are started to the API's limit (for E-utilities, 3 requests a second, or 10 with an API key). Failed requests
+-- connection errors, timeouts, HTTP 429 and 5xx, and responses that aren't JSON -- are retried with exponential
+backoff, and successful responses can be cached on disk so that re-running a rule doesn't make the same requests
+again. The cache never expires, so give each build its own cache_dir.
+
+The requests themselves are made with `requests` in asyncio's default thread pool, so this needs no async HTTP
+library.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+import requests
+
+from src.util import get_logger
+
+logger = get_logger(__name__)
+
+# Retry a failed request this many times in all, waiting BACKOFF_BASE_SECONDS, then twice that, and so on (up to
+# BACKOFF_MAX_SECONDS) between attempts.
+DEFAULT_MAX_ATTEMPTS = 6
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+# HTTP responses that are worth retrying.
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# Query parameters that don't change the response, and so are left out of the cache key.
+UNCACHED_PARAMS = {"api_key", "email", "tool"}
+# The key of an error message in a JSON response that is otherwise successful (HTTP 200), as E-utilities sends.
+ERROR_KEY = "ERROR"
+
+
+class TokenBucket:
+    """Allow `rate` events a second on average, and at most `capacity` at once after a quiet spell.
+
+    A capacity of 1 (the default) spaces events at least 1/rate seconds apart, as ThrottledRequester does.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until a token is available, and take it."""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ResponseCache:
+    """Cache JSON responses on disk, one file per request, keyed by a hash of the request."""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def key(method, url, params):
+        request = [method, url, sorted((str(k), str(v)) for k, v in params if k not in UNCACHED_PARAMS)]
+        return hashlib.sha256(json.dumps(request).encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self.path(key)) as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, result):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first, so a concurrent or interrupted write can't leave half a response.
+        with open(f"{path}.{os.getpid()}.tmp", "w") as cache_file:
+            json.dump(result, cache_file)
+        os.replace(f"{path}.{os.getpid()}.tmp", path)
+
+
+class RetryableError(Exception):
+    """A response that is worth retrying: HTTP 429 or 5xx, or a body that isn't JSON."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AsyncThrottledRequester:
+    """Make JSON requests concurrently, no faster than `rate` requests a second and no more than `max_concurrency`
+    at a time, retrying failures with exponential backoff and caching responses in `cache_dir` (if set).
+
+    Responses with an `ERROR` key, as E-utilities returns with an HTTP 200, are returned but not cached."""
+
+    def __init__(
+        self,
+        rate,
+        max_concurrency=4,
+        max_attempts=DEFAULT_MAX_ATTEMPTS,
+        cache_dir=None,
+        timeout=60,
+        backoff_base=BACKOFF_BASE_SECONDS,
+        backoff_max=BACKOFF_MAX_SECONDS,
+    ):
+        self.bucket = TokenBucket(rate)
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.max_attempts = max_attempts
+        self.cache = ResponseCache(cache_dir) if cache_dir else None
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.session = requests.Session()
+        # How many requests were answered from the cache, and how many were sent.
+        self.cache_hits = 0
+        self.requests_sent = 0
+
+    def _request(self, method, url, params):
+        if method == "POST":
+            response = self.session.post(url, data=params, timeout=self.timeout)
+        else:
+            response = self.session.get(url, params=params, timeout=self.timeout)
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            retry_after = response.headers.get("Retry-After")
+            raise RetryableError(
+                f"HTTP {response.status_code} from {url}",
+                float(retry_after) if retry_after and retry_after.isdigit() else None,
+            )
+        response.raise_for_status()
+        try:
+            return response.json()
+        except ValueError as e:
+            raise RetryableError(f"{url} did not return JSON: {response.text[:200]!r}") from e
+
+    async def request_json(self, url, params=(), method="GET"):
+        """
+        Make a request and return its JSON response.
+
+        :param url: The URL to request.
+        :param params: The query parameters (or, for a POST, the form fields), as a list of (name, value) pairs so
+            that a name can be repeated.
+        :param method: GET or POST. Use POST for requests with many parameters, such as E-utilities requests for
+            more than a couple of hundred ids.
+        :return: The decoded JSON response.
+        """
+        params = list(params.items()) if isinstance(params, dict) else list(params)
+        key = ResponseCache.key(method, url, params) if self.cache else None
+        if key is not None and (cached := self.cache.get(key)) is not None:
+            self.cache_hits += 1
+            return cached
+
+        for attempt in range(1, self.max_attempts + 1):
+            async with self.semaphore:
+                await self.bucket.acquire()
+                self.requests_sent += 1
+                try:
+                    result = await asyncio.to_thread(self._request, method, url, params)
+                    break
+                except (RetryableError, requests.ConnectionError, requests.Timeout) as e:
+                    if attempt == self.max_attempts:
+                        raise RuntimeError(f"{method} {url} failed after {attempt} attempts: {e}") from e
+                    delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+                    delay = max(delay, getattr(e, "retry_after", None) or 0)
+                    logger.warning(f"{method} {url} failed (attempt {attempt}): {e}; retrying in {delay:.1f}s.")
+            # Back off outside the semaphore, so other requests can go ahead meanwhile.
+            await asyncio.sleep(delay)
+
+        if key is not None:
+            if isinstance(result, dict) and ERROR_KEY in result:
+                # Don't keep an error around for the next run to read as an answer.
+                logger.warning(f"Not caching the response to {method} {url}, which is an error: {result[ERROR_KEY]}")
+            else:
+                self.cache.put(key, result)
+        return result
+
+    async def request_all_json(self, requests_to_make):
+        """
+        Make many requests concurrently, returning their JSON responses in the same order.
+
+        :param requests_to_make: An iterable of (url, params, method) tuples, as for request_json().
+        """
+        return await asyncio.gather(*(self.request_json(*request) for request in requests_to_make))
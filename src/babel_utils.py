@@ -1,4 +1,8 @@
+import contextlib
 import gzip
+import itertools
+import json
+import multiprocessing
 import os
 import re
 import shutil
@@ -9,6 +13,8 @@ import time
 import traceback
 import urllib
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 from enum import Enum
 from ftplib import FTP
@@ -16,19 +22,53 @@ from io import BytesIO
 from pathlib import Path
 from typing import NamedTuple
 
-import jsonlines
 import requests
 from humanfriendly import format_timespan
 
+import src.util
+from src.downloads import DownloadError, download_file
+from src.exporters.duckdb_exporters import (
+    CompendiumParquetWriter,
+    compendium_parquet_dir,
+    merge_compendium_parquet_parts,
+)
+from src.incremental import (
+    NOT_REUSABLE,
+    CliqueLog,
+    CompendiumReuse,
+    DigestCache,
+    clique_key,
+    compendium_manifest,
+    incremental_state_dir,
+    save_compendium_state,
+)
 from src.LabeledID import LabeledID
 from src.metadata.provenance import write_combined_metadata
+from src.model.disjoint_set import GlomDisjointSet
 from src.node import DescriptionFactory, InformationContentFactory, NodeFactory, SynonymFactory, TaxonFactory
 from src.properties import HAS_ALTERNATIVE_ID, PropertyList
+from src.stage_profile import NULL_STAGE_PROFILE, StageProfile, add_stage_stats, stage_stats_to_dict
 from src.synonyms.filter import get_synonym_filter
 from src.util import Text, ensure_parent_dir, get_config, get_logger, get_memory_usage_summary
 
 # Configuration items
 WRITE_COMPENDIUM_LOG_EVERY_X_CLIQUES = 1_000_000
+WRITE_COMPENDIUM_SHARDS_PER_WORKER = 4
+# write_compendium() looks up taxa for this many cliques at a time (see TaxonFactory.prefetch()).
+WRITE_COMPENDIUM_TAXA_PREFETCH_CLIQUES = 10_000
+# The stages of writing a clique that write_compendium() profiles, in the order they are reported.
+WRITE_COMPENDIUM_STAGES = (
+    "create_node",
+    "apply_labels",
+    "information_content",
+    "preferred_name",
+    "properties",
+    "descriptions",
+    "taxa",
+    "synonyms",
+    "json_encode",
+    "write",
+)
 MAX_DOWNLOAD_ERROR = 1
 
 
@@ -236,7 +276,10 @@ def dump_sets(sets, fname):
 class ThrottledRequester:
     """Make sure that the time from the last call to the current call is greater than or equal to
     a configurable delta.   Wait before making request to ensure this. Used to make sure eutils
-    doesn't get angry.  Returns the json, as well as a flag whether this call waited or not."""
+    doesn't get angry.  Returns the json, as well as a flag whether this call waited or not.
+
+    For many requests, src.async_requester.AsyncThrottledRequester makes them concurrently, retries
+    with backoff and caches the responses on disk."""
 
     def __init__(self, delta_ms):
         self.last_time = None
@@ -295,6 +338,9 @@ def pull_via_urllib(url: str, in_file_name: str, decompress=True, subpath=None,
     Download a file via the given URL, optionally decompress it, and save it
     to the specified local path. Handles HTTP redirects gracefully.
 
+    The download itself is done by src.downloads.download_file(), which fetches large files in
+    parallel byte-range segments and resumes an interrupted download on the next attempt.
+
     :param url: The base URL of the remote server (e.g., "http://example.com/").
         It is combined with the provided filename to determine the full file path.
     :type url: str
@@ -343,23 +389,18 @@ def pull_via_urllib(url: str, in_file_name: str, decompress=True, subpath=None,
             )
         logger.info(f"Downloading {dl_file_name} using urllib, attempt {download_attempt}...")
 
-        # Open a fresh connection on each attempt so a truncated response doesn't
-        # leave us reading from an exhausted handle on the next retry.
+        # download_file() fetches large files in parallel byte-range segments, and a retry resumes from
+        # where the previous attempt stopped. It makes a single attempt itself: the retries are ours.
         try:
-            req = urllib.request.Request(download_url, headers={"User-Agent": user_agent})
-            with opener.open(req) as handle, open(dl_file_name, "wb") as compressed_file:
-                # while there is data
-                while True:
-                    # read a block of data
-                    data = handle.read(1024)
-
-                    # if nothing read, abort
-                    if len(data) == 0:
-                        break
-
-                    # write out the data to the output file
-                    compressed_file.write(data)
-        except urllib.error.URLError as e:
+            download_file(
+                download_url,
+                dl_file_name,
+                verify_gzip=verify_gzip and not decompress,
+                attempts=1,
+                headers={"User-Agent": user_agent},
+                opener=opener,
+            )
+        except (urllib.error.URLError, DownloadError) as e:
             raise_if_cloudflare_challenge(download_url, dl_file_name, e)
             logger.warning(f"Download attempt {download_attempt} of {download_url} failed with network/HTTP error: {e}")
             time.sleep(5 * download_attempt)
@@ -383,10 +424,10 @@ def pull_via_urllib(url: str, in_file_name: str, decompress=True, subpath=None,
         else:
             out_file_name = dl_file_name
 
-            # Do we need to verify this gzip file?
+            # Do we need to verify this gzip file? download_file() has already read it as it arrived, and raised if
+            # it wasn't a valid Gzip file, but a blank/very small file fails verification regardless.
             download_verified = True
             if verify_gzip:
-                # Is it blank/very small? If so, we immediately fail verification.
                 file_size = os.path.getsize(out_file_name)
                 if file_size < 1024:
                     logger.warning(
@@ -395,16 +436,6 @@ def pull_via_urllib(url: str, in_file_name: str, decompress=True, subpath=None,
                     download_verified = False
                     continue
 
-                # To verify a Gzip file, we need to read it entirely.
-                try:
-                    with gzip.open(out_file_name, "rb") as f:
-                        for _ in iter(lambda: f.read(1024 * 1024), b""):
-                            pass
-                    download_verified = True
-                except Exception as e:
-                    logger.warning(f"Error while verifying downloaded Gzip file {out_file_name}: {e}")
-                    download_verified = False
-
     # return the filename to the caller
     return out_file_name
 
@@ -432,8 +463,11 @@ def pull_via_wget(
     verify_gzip: bool = False,
 ):
     """
-    Download a file using wget. We call wget from the command line, and use command line options to
-    request continuing incomplete downloads.
+    Download a file, or (recursively) a directory, from a URL.
+
+    A single file is downloaded by src.downloads.download_file(), which fetches large files in parallel
+    byte-range segments and resumes an incomplete download from its `.partial` file, but only if the
+    server's copy hasn't changed since. A recursive download calls wget from the command line.
 
     :param url_prefix: The URL prefix to download.
     :param in_file_name: The filename to download -- this will be concatenated to the URL prefix. This should include
@@ -442,14 +476,18 @@ def pull_via_wget(
     :param decompress: Whether this is a Gzip file that should be decompressed after download.
     :param subpath: The subdirectory of `babel_download` where this file should be stored.
     :param outpath: The full output directory to write this file to. Both subpath and outpath cannot be set at the same time.
-    :param continue_incomplete: Should wget continue an incomplete download? Must be False in a recursive
+    :param continue_incomplete: Should we continue an incomplete download, and keep a file we already have
+        if it is the same size as the server's copy (as `wget --continue` would)? Must be False in a recursive
         download, where resuming can corrupt a file whose content changed upstream; we raise if it isn't.
     :param timestamping: Should wget re-fetch a file only when the server's copy is newer, or differs in
-        size, from ours? Must be True in a recursive download; we raise if it isn't.
+        size, from ours? Must be True in a recursive download; we raise if it isn't. Has no effect on a
+        single file.
     :param recurse: Do we want to download recursively? Should be from WgetRecursionOptions, such as WgetRecursionOptions.NO_RECURSION.
     :param retries: The number of retries to attempt.
+    :param connect_timeout: The connection timeout in seconds (wget only: a single file uses read_timeout for both).
+    :param read_timeout: The read timeout in seconds.
     :param verify_gzip: If downloading a Gzip file that isn't being decompressed, verify that the
-        file is valid (by reading it entirely). Has no effect if decompress=True.
+        file is valid (by reading it entirely, as it arrives). Has no effect if decompress=True.
     """
 
     # Prepare download URL and location
@@ -474,8 +512,8 @@ def pull_via_wget(
     # in full — and it is also what stops wget saving a second copy as `file.1` when the file is
     # already there, which is the job --continue would otherwise be doing.
     #
-    # (Non-recursive downloads pass -O, which makes wget ignore --timestamping entirely, so there
-    # --continue is the only resume mechanism and is kept.)
+    # (A single file is downloaded by download_file() instead, which only resumes a download if the
+    # server's ETag or Last-Modified shows its copy hasn't changed since, so continuing is safe there.)
     if recurse != WgetRecursionOptions.NO_RECURSION:
         if continue_incomplete:
             raise ValueError(
@@ -490,48 +528,59 @@ def pull_via_wget(
                 f"file we already have as `file.1`."
             )
 
-    # Prepare wget options.
-    wget_command_line = [
-        "wget",
-        "--progress=bar:force:noscroll",
-    ]
-    if continue_incomplete:
-        wget_command_line.append("--continue")
-    # --timestamping is a no-op combined with -O (wget disables -N and warns); only pass it when
-    # we're not writing to a fixed output file via -O.
-    if timestamping and recurse != WgetRecursionOptions.NO_RECURSION:
-        wget_command_line.append("--timestamping")
-    if retries > 0:
-        wget_command_line.append(f"--tries={retries}")
-    if connect_timeout > 0:
-        wget_command_line.append(f"--connect-timeout={connect_timeout}")
-    if read_timeout > 0:
-        wget_command_line.append(f"--read-timeout={read_timeout}")
-
-    # Add URL and output file.
-    wget_command_line.append(url)
-
-    # Handle recursion options
-    match recurse:
-        case WgetRecursionOptions.NO_RECURSION:
-            # Write to a single file, dl_file_name
-            wget_command_line.extend(["-O", dl_file_name])
-        case WgetRecursionOptions.RECURSE_SUBFOLDERS:
-            # dl_file_name should be a directory name.
-            wget_command_line.extend(
-                ["--recursive", "--no-parent", "--no-directories", "--directory-prefix=" + dl_file_name]
-            )
-        case WgetRecursionOptions.RECURSE_DIRECTORY_ONLY:
-            # dl_file_name should be a directory name.
-            wget_command_line.extend(
-                ["--recursive", "--no-parent", "--no-directories", "--level=1", "--directory-prefix=" + dl_file_name]
-            )
+    if recurse == WgetRecursionOptions.NO_RECURSION:
+        logger.info(f"Downloading {url} to {dl_file_name}.")
+        if not download_file(
+            url,
+            dl_file_name,
+            verify_gzip=verify_gzip and not decompress,
+            attempts=max(1, retries),
+            timeout=read_timeout if read_timeout > 0 else None,
+            keep_existing=continue_incomplete,
+            resume=continue_incomplete,
+            headers={"User-Agent": get_user_agent()},
+        ):
+            logger.info(f"{dl_file_name} has already been downloaded from {url}.")
+    else:
+        # Prepare wget options.
+        wget_command_line = [
+            "wget",
+            "--progress=bar:force:noscroll",
+            # A recursive download is always timestamped (see above).
+            "--timestamping",
+        ]
+        if retries > 0:
+            wget_command_line.append(f"--tries={retries}")
+        if connect_timeout > 0:
+            wget_command_line.append(f"--connect-timeout={connect_timeout}")
+        if read_timeout > 0:
+            wget_command_line.append(f"--read-timeout={read_timeout}")
+
+        # Add URL and output directory.
+        wget_command_line.append(url)
+        match recurse:
+            case WgetRecursionOptions.RECURSE_SUBFOLDERS:
+                # dl_file_name should be a directory name.
+                wget_command_line.extend(
+                    ["--recursive", "--no-parent", "--no-directories", "--directory-prefix=" + dl_file_name]
+                )
+            case WgetRecursionOptions.RECURSE_DIRECTORY_ONLY:
+                # dl_file_name should be a directory name.
+                wget_command_line.extend(
+                    [
+                        "--recursive",
+                        "--no-parent",
+                        "--no-directories",
+                        "--level=1",
+                        "--directory-prefix=" + dl_file_name,
+                    ]
+                )
 
-    # Execute wget.
-    logger.info(f"Downloading {dl_file_name} using wget: {wget_command_line}")
-    process = subprocess.run(wget_command_line)
-    if process.returncode != 0:
-        raise RuntimeError(f"Could not execute wget {wget_command_line}: {process.stderr}")
+        # Execute wget.
+        logger.info(f"Downloading {dl_file_name} using wget: {wget_command_line}")
+        process = subprocess.run(wget_command_line)
+        if process.returncode != 0:
+            raise RuntimeError(f"Could not execute wget {wget_command_line}: {process.stderr}")
 
     # Decompress the downloaded file if needed.
     uncompressed_filename = None
@@ -555,17 +604,11 @@ def pull_via_wget(
         if os.path.isfile(dl_file_name):
             file_size = os.path.getsize(dl_file_name)
             logger.info(f"Downloaded {dl_file_name} from {url}, file size {file_size} bytes.")
-            if verify_gzip:
-                if file_size < 1024:
-                    raise RuntimeError(
-                        f"Downloaded Gzip file {dl_file_name} is too small ({file_size} bytes) to be valid."
-                    )
-                result = subprocess.run(["gzip", "-t", dl_file_name], capture_output=True, text=True)
-                if result.returncode != 0:
-                    raise RuntimeError(
-                        f"Downloaded Gzip file {dl_file_name} failed verification: {result.stderr.strip()}"
-                    )
-                logger.info(f"Verified {dl_file_name} as a valid Gzip file.")
+            # download_file() has already read the whole file -- as it arrived, or before keeping an existing copy
+            # -- and raised if it wasn't a valid Gzip file, but a blank or very small file fails verification
+            # regardless.
+            if verify_gzip and file_size < 1024:
+                raise RuntimeError(f"Downloaded Gzip file {dl_file_name} is too small ({file_size} bytes) to be valid.")
         elif os.path.isdir(dl_file_name):
             # Count the number of files in directory dl_file_name
             dir_size = sum(
@@ -676,6 +719,9 @@ def write_compendium(
     extra_prefixes=None,
     icrdf_filename=None,
     properties_jsonl_gz_files=None,
+    workers=None,
+    parquet=None,
+    profile_json=None,
 ):
     """
     :param metadata_yaml: The YAML files containing the metadata for this compendium.
@@ -697,11 +743,24 @@ def write_compendium(
         write_compendium() will throw a RuntimeError if it is not specified. This is to ensure that it has been
         properly specified as a prerequisite in a Snakemake file, so that write_compendium() is not run until after
         icRDF.tsv has been generated.
-    :param properties_files: (OPTIONAL) A list of SQLite3 files containing properties to be added to the output.
+    :param properties_jsonl_gz_files: (OPTIONAL) A list of JSONL.gz files containing properties to be added to the output.
+    :param workers: (OPTIONAL) The number of worker processes to write this compendium with. Defaults to
+        `write_compendium_workers` in config.yaml; Snakemake rules pass their `threads` instead. With more than
+        one worker, synonym_list is split into contiguous shards that are written in a process pool and then
+        concatenated in their original order, so the output is identical to a single-process run. Every worker
+        loads its own factories, so peak memory grows with the number of workers.
+    :param parquet: (OPTIONAL) Whether to also write the compendium's Node, Clique and Edge Parquet files (in the
+        schema of src/exporters/duckdb_exporters.py) to `duckdb/compendium_parquet/filename={ofname without
+        extension}` while writing it, so that export_compendia_to_duckdb only needs to verify and copy them.
+        Defaults to `write_compendium_parquet` in config.yaml.
+    :param profile_json: (OPTIONAL) Whether to also write the time and memory spent in each stage of writing the
+        cliques (see WRITE_COMPENDIUM_STAGES), which is always recorded in the compendium's metadata YAML, to
+        `reports/write_compendium/{ofname}.json` for babel-slurm-resources to read. Defaults to
+        `write_compendium_profile_json` in config.yaml.
     :return:
     """
     logger.info(
-        f"Starting write_compendium({metadata_yamls}, {len(synonym_list)} slists, {ofname}, {node_type}, {len(labels)} labels, {extra_prefixes}, {icrdf_filename}, {properties_jsonl_gz_files}): {get_memory_usage_summary()}"
+        f"Starting write_compendium({metadata_yamls}, {len(synonym_list)} slists, {ofname}, {node_type}, {len(labels) if labels else 0} labels, {extra_prefixes}, {icrdf_filename}, {properties_jsonl_gz_files}, workers={workers}, parquet={parquet}, profile_json={profile_json}): {get_memory_usage_summary()}"
     )
 
     if extra_prefixes is None:
@@ -710,323 +769,754 @@ def write_compendium(
         labels = {}
     config = get_config()
     cdir = config["output_directory"]
-    biolink_version = config["biolink_version"]
-
-    node_factory = NodeFactory(make_local_name(""), biolink_version)
-    logger.info(f"NodeFactory ready: {node_factory} with {get_memory_usage_summary()}")
-    synonym_factory = SynonymFactory(make_local_name(""))
-    logger.info(f"SynonymFactory ready: {synonym_factory} with {get_memory_usage_summary()}")
-
-    # Load the preferred_name_boost_prefixes -- this tells us which prefixes to boost when
-    # coming up with a preferred label for a particular Biolink class.
-    preferred_name_boost_prefixes = config["preferred_name_boost_prefixes"]
-
-    # Load the per-type label length demotion config. Types not listed here are never demoted.
-    demote_labels_longer_than = config.get("demote_labels_longer_than", {})
+    if workers is None:
+        workers = config.get("write_compendium_workers", 1)
+    if parquet is None:
+        parquet = config.get("write_compendium_parquet", False)
+    if profile_json is None:
+        profile_json = config.get("write_compendium_profile_json", False)
 
     # Create an InformationContentFactory based on the specified icRDF.tsv file. Default to the one in the download
     # directory.
     if not icrdf_filename:
         raise RuntimeError("No icrdf_filename parameter provided to write_compendium() -- this is required!")
-    ic_factory = InformationContentFactory(icrdf_filename)
-    logger.info(f"InformationContentFactory ready: {ic_factory} with {get_memory_usage_summary()}")
-
-    description_factory = DescriptionFactory(make_local_name(""))
-    logger.info(f"DescriptionFactory ready: {description_factory} with {get_memory_usage_summary()}")
-
-    taxon_factory = TaxonFactory(make_local_name(""))
-    logger.info(f"TaxonFactory ready: {taxon_factory} with {get_memory_usage_summary()}")
-
-    if node_type is not None:
-        node_test = node_factory.create_node(
-            input_identifiers=[], node_type=node_type, labels={}, extra_prefixes=extra_prefixes
-        )
-        logger.info(f"NodeFactory test complete: {node_test} with {get_memory_usage_summary()}")
-    else:
-        logger.info("Skipping NodeFactory type test for heterogeneous typed cliques.")
 
     # Create compendia and synonyms directories, just in case they haven't been created yet.
     os.makedirs(os.path.join(cdir, "compendia"), exist_ok=True)
     os.makedirs(os.path.join(cdir, "synonyms"), exist_ok=True)
-
-    # Load all the properties.
-    property_list = PropertyList()
-    if properties_jsonl_gz_files:
-        for properties_jsonl_gz_file in properties_jsonl_gz_files:
-            logger.info(f"Loading properties from {properties_jsonl_gz_file}...")
-            count_loaded = property_list.add_properties_jsonl_gz(properties_jsonl_gz_file)
-            logger.info(f"Loaded {count_loaded} unique properties from {properties_jsonl_gz_file}")
-        logger.info(
-            f"All {len(properties_jsonl_gz_files)} property files loaded ({property_list.count_unique()} total unique properties): {get_memory_usage_summary()}"
+    compendium_filename = os.path.join(cdir, "compendia", ofname)
+    synonyms_filename = os.path.join(cdir, "synonyms", ofname)
+
+    writer_kwargs = {
+        "node_type": node_type,
+        "labels": labels,
+        "extra_prefixes": extra_prefixes,
+        "icrdf_filename": icrdf_filename,
+        "properties_jsonl_gz_files": properties_jsonl_gz_files,
+    }
+
+    # With incremental builds, reuse the output of unchanged cliques from the previous build of this compendium if
+    # nothing else it depends on has changed (see src/incremental.py).
+    state_dir = incremental_state_dir("compendia", ofname)
+    reuse_dir = None
+    if state_dir:
+        digest_cache = DigestCache.for_config()
+        manifest = compendium_manifest(
+            ofname,
+            node_type,
+            synonym_list,
+            labels,
+            extra_prefixes,
+            icrdf_filename,
+            properties_jsonl_gz_files,
+            digest_cache,
         )
-    else:
-        logger.info("No property files provided or loaded.")
-
-    property_source_count = defaultdict(int)
-
-    synonym_filter = get_synonym_filter()
-    filter_count_snapshot = synonym_filter.filtered_count
-
-    # Counts.
-    count_cliques = 0
-    count_eq_ids = 0
-    count_synonyms = 0
-
-    # Write compendium and synonym files.
-    with (
-        jsonlines.open(os.path.join(cdir, "compendia", ofname), "w") as outf,
-        jsonlines.open(os.path.join(cdir, "synonyms", ofname), "w") as sfile,
-    ):
-        # Calculate an estimated time to completion.
-        start_time = time.time_ns()
-        count_slist = 0
-        total_slist = len(synonym_list)
-
-        for slist in synonym_list:
-            if isinstance(slist, TypedClique):
-                current_node_type = slist.node_type
-                input_identifiers = slist.identifiers
-            else:
-                if node_type is None:
-                    raise RuntimeError("write_compendium() requires node_type unless every clique is a TypedClique.")
-                current_node_type = node_type
-                input_identifiers = slist
-
-            # Before we get started, let's estimate where we're at.
-            count_slist += 1
-            if (count_slist == 1) or (count_slist % WRITE_COMPENDIUM_LOG_EVERY_X_CLIQUES == 0):
-                # TODO: replace with tqdm.
-                time_elapsed_seconds = (time.time_ns() - start_time) / 1e9
-                if time_elapsed_seconds < 0.001:
-                    # We don't want to divide by zero.
-                    time_elapsed_seconds = 0.001
-                remaining_slist = total_slist - count_slist
-                # count_slist --> time_elapsed_seconds
-                # remaining_slist --> remaining_slist/count_slit*time_elapsed_seconds
-                logger.info(
-                    f"Generating compendia and synonyms for {ofname} currently at {count_slist:,} out of {total_slist:,} ({count_slist / total_slist * 100:.2f}%) in {format_timespan(time_elapsed_seconds)}: {get_memory_usage_summary()}"
-                )
-                logger.info(
-                    f" - Current rate: {count_slist / time_elapsed_seconds:.2f} cliques/second or {time_elapsed_seconds / count_slist:.6f} seconds/clique."
-                )
-
-                time_remaining_seconds = time_elapsed_seconds / count_slist * remaining_slist
-                logger.info(f" - Estimated time remaining: {format_timespan(time_remaining_seconds)}")
-
-            node = node_factory.create_node(
-                input_identifiers=input_identifiers,
-                node_type=current_node_type,
-                labels=labels,
-                extra_prefixes=extra_prefixes,
+        digest_cache.save()
+        reuse_dir = CompendiumReuse.usable_state_dir(state_dir, manifest)
+        # The previous outputs may be hard links to the state we are about to read from, so remove them rather than
+        # truncating them.
+        for filename in (compendium_filename, synonyms_filename):
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    with contextlib.ExitStack() as stack:
+        clique_log_filename = None
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+            clique_log_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix=".cliques-", dir=state_dir))
+            clique_log_filename = os.path.join(clique_log_dir, "cliques.tsv")
+
+        parquet_parts_dir = None
+        if parquet:
+            parquet_dir = compendium_parquet_dir(cdir, ofname)
+            os.makedirs(os.path.dirname(parquet_dir), exist_ok=True)
+            parquet_parts_dir = stack.enter_context(
+                tempfile.TemporaryDirectory(prefix=f".{ofname}.parquet-", dir=os.path.dirname(parquet_dir))
             )
-            if node is None:
-                # This usually happens because every CURIE in the node is not in the id_prefixes list for that node_type.
-                # Something to fix at some point, but we don't want to break the pipeline for this, so
-                # we emit a warning and skip this clique.
-                logger.warning(
-                    f"Could not create node for ({input_identifiers}, {current_node_type}, {labels}, {extra_prefixes}): returned None."
-                )
-                continue
-            else:
-                count_cliques += 1
-                count_eq_ids += len(input_identifiers)
-
-                nw = {"type": node["type"]}
-                ic = ic_factory.get_ic(node)
-                nw["ic"] = ic
 
-                # Determine types.
-                types = node_factory.get_ancestors(node["type"])
-
-                # Generate a preferred label for this clique using choose_preferred_name().
-                preferred_name = choose_preferred_name(
-                    node, types, preferred_name_boost_prefixes, demote_labels_longer_than
-                )
+        write_start = time.perf_counter()
+        if workers > 1 and len(synonym_list) > 1:
+            counts = _write_compendium_in_parallel(
+                synonym_list,
+                compendium_filename,
+                synonyms_filename,
+                ofname,
+                workers,
+                writer_kwargs,
+                parquet_parts_dir,
+                reuse_dir,
+                clique_log_filename,
+            )
+        else:
+            writer = CompendiumWriter(**writer_kwargs)
+            counts = writer.write(
+                synonym_list,
+                compendium_filename,
+                synonyms_filename,
+                ofname,
+                parquet_parts_dir,
+                reuse_dir=reuse_dir,
+                clique_log_filename=clique_log_filename,
+            )
+            writer.close()
+        write_seconds = time.perf_counter() - write_start
 
-                # At this point, we insert any HAS_ADDITIONAL_ID IDs we have.
-                # The logic we use is: we insert all additional IDs for a CURIE *AFTER* that CURIE, in a random order, as long
-                # as the additional CURIE is not already in the list of CURIEs.
-                #
-                # We will attempt to retrieve a label or description for this ID as well.
-                current_curies = set()
-                identifier_list = []
-                curie_labels = dict()
-                for nid in node["identifiers"]:
-                    iid = nid["identifier"]
-
-                    # Prevent duplicates (might happen if e.g. we have an additional CURIE that duplicates an existing one later in the list).
-                    if iid in current_curies:
-                        continue
-
-                    identifier_list.append(iid)
-                    current_curies.add(iid)
-
-                    if "label" in nid:
-                        curie_labels[iid] = nid["label"]
-
-                    # Are there any additional CURIEs for this CURIE?
-                    props = property_list.get_all(iid, HAS_ALTERNATIVE_ID)
-                    if props:
-                        # Get just the additional CURIEs.
-                        additional_curies = [prop.value for prop in props]
-
-                        # ac_labelled will be a list that consists of either LabeledID (if the CURIE could be labeled)
-                        # or str objects (consisting of an unlabeled CURIE).
-                        ac_labelled = node_factory.apply_labels(
-                            input_identifiers=additional_curies, labels=labels, node_types=types
-                        )
+        # Merge the Parquet parts only once the compendium is complete, so the Parquet files are never older than it.
+        if parquet_parts_dir:
+            merge_compendium_parquet_parts(parquet_parts_dir, parquet_dir)
 
-                        for prop, label in zip(props, ac_labelled):
-                            additional_curie = Text.get_curie(label)
-                            if ":" not in additional_curie:
-                                raise ValueError(
-                                    f"Additional ID '{additional_curie}' for '{iid}' is not a valid CURIE: {prop}, {label} (from {ac_labelled})"
-                                )
-                            if additional_curie not in current_curies:
-                                identifier_list.append(additional_curie)
-                                current_curies.add(additional_curie)
-
-                                # Track the property sources we used.
-                                property_source_count[prop.source] += 1
-
-                                if isinstance(label, LabeledID) and label.label:
-                                    curie_labels[additional_curie] = label.label
-
-                # Add description and taxon information and construct the final nw object.
-                logger.debug(f"Getting descriptions and taxa for {len(identifier_list)} identifiers: {identifier_list}")
-                descs = description_factory.get_descriptions(identifier_list)
-                taxa = taxon_factory.get_taxa(identifier_list)
-
-                # Construct the written-out identifier objects.
-                nw["identifiers"] = []
-                for iid in identifier_list:
-                    id_info = {"i": iid}
-
-                    if iid in curie_labels:
-                        id_info["l"] = curie_labels[iid]
-                    else:
-                        id_info["l"] = ""
-
-                    if id_info["i"] in descs:
-                        # Sort descriptions from the shortest to the longest.
-                        id_info["d"] = list(sorted(descs[id_info["i"]], key=lambda x: len(x)))
-                    else:
-                        id_info["d"] = []
-
-                    if id_info["i"] in taxa:
-                        # Sort taxa by CURIE suffix.
-                        id_info["t"] = list(sorted(taxa[id_info["i"]], key=get_numerical_curie_suffix))
-                    else:
-                        id_info["t"] = []
-
-                    nw["identifiers"].append(id_info)
-
-                # Write out the preferred name, if we have one.
-                nw["preferred_name"] = preferred_name
-
-                # Collect taxon IDs for this node.
-                nw["taxa"] = list(sorted(set().union(*taxa.values()), key=get_numerical_curie_suffix))
-
-                outf.write(nw)
-
-                # get_synonyms() returns tuples in the form ('http://www.geneontology.org/formats/oboInOwl#hasExactSynonym', 'Caudal articular process of eighteenth thoracic vertebra')
-                # But we're only interested in the synonyms themselves, so we can skip the relationship for now.
-                curie = node["identifiers"][0]["identifier"]
-
-                # get_synonyms() returns a list of tuples, where each tuple is a relation and a synonym.
-                # So we extract just the synonyms here, ditching the relations (result[0]), then unique-ify the
-                # synonyms.
-                synonyms = [
-                    result[1] for result in synonym_factory.get_synonyms(identifier_list, node_types=types) if result[1]
-                ]
-                synonyms_list = sorted(set(synonyms), key=lambda x: len(x))
-
-                try:
-                    document = {
-                        "curie": curie,
-                        "names": synonyms_list,
-                        "types": [t[8:] for t in types],
-                    }  # remove biolink:
-
-                    count_synonyms += len(synonyms_list)
-
-                    # Write out the preferred name.
-                    if preferred_name:
-                        document["preferred_name"] = preferred_name
-                    else:
-                        logger.debug(
-                            f"No preferred name for {nw}, probably because all names were filtered out, skipping."
-                        )
-                        continue
-
-                    # We previously used the shortest length of a name as a proxy for how good a match it is, i.e. given
-                    # two concepts that both have the word "acetaminophen" in them, we assume that the shorter one is the
-                    # more interesting one for users. I'm not sure if there's a better way to do that -- for instance,
-                    # could we consider the information content values? -- but in the interests of getting something
-                    # working quickly, this code restores that previous method.
-
-                    # Since synonyms_list is sorted, we can use the length of the first term as the synonym.
-                    if len(synonyms_list) == 0:
-                        logger.debug(f"Synonym list for {nw} is empty: no valid name. Skipping.")
-                        continue
-                    else:
-                        document["shortest_name_length"] = len(synonyms_list[0])
-
-                    # Cliques with more identifiers might be better than cliques with smaller identifiers.
-                    # So let's try to incorporate that here.
-                    # Note that this includes all the alternative IDs.kl
-                    document["clique_identifier_count"] = len(nw["identifiers"])
-
-                    # We want to see if we can use the CURIE suffix to sort concepts with similar identifiers.
-                    # We want to sort this numerically, so we only do this if the CURIE suffix is numerical.
-                    curie_parts = curie.split(":", 1)
-                    if len(curie_parts) > 0:
-                        # Try to cast the CURIE suffix to an integer. If we get a ValueError, don't worry about it.
-                        try:
-                            document["curie_suffix"] = int(curie_parts[1])
-                        except ValueError:
-                            pass
-
-                    # Collect taxon names for this node.
-                    document["taxa"] = list(sorted(set().union(*taxa.values()), key=get_numerical_curie_suffix))
-                    if len(document["taxa"]) > 0:
-                        # This concept is specific to one or more particular taxa.
-                        document["taxon_specific"] = True
-                    else:
-                        # This concept is not specific to any taxa (that we know about).
-                        document["taxon_specific"] = False
-
-                    sfile.write(document)
-                except Exception as ex:
-                    print(f"Exception thrown while write_compendium() was generating {ofname}: {ex}")
-                    print(nw["type"])
-                    print(node_factory.get_ancestors(nw["type"]))
-                    traceback.print_exc()
-                    raise ex
+        if state_dir:
+            save_compendium_state(state_dir, manifest, compendium_filename, synonyms_filename, clique_log_filename)
 
     # Log a per-compendium summary of any obsolete labels that were filtered.
-    filtered_this_run = synonym_filter.filtered_count - filter_count_snapshot
-    if filtered_this_run > 0:
-        logger.warning(f"SynonymFilter: matched {filtered_this_run} obsolete label(s)/synonym(s) in {ofname}")
+    if counts.filtered > 0:
+        logger.warning(f"SynonymFilter: matched {counts.filtered} obsolete label(s)/synonym(s) in {ofname}")
     else:
         logger.info(f"SynonymFilter: no obsolete labels found in {ofname}")
 
+    # With more than one worker, the stage times add up the workers' times, so they can add up to more than seconds.
+    profile = {
+        "workers": workers if len(synonym_list) > 1 else 1,
+        "seconds": round(write_seconds, 3),
+        "stages": stage_stats_to_dict(counts.stages),
+    }
+    log_stage_profile(ofname, profile)
+    if profile_json:
+        profile_filename = os.path.join(cdir, "reports", "write_compendium", ofname + ".json")
+        ensure_parent_dir(profile_filename)
+        with open(profile_filename, "w") as outf:
+            json.dump({"compendium": ofname, "cliques": counts.cliques, **profile}, outf, indent=2)
+            outf.write("\n")
+
     # Write out the metadata.yaml file combining information from all the metadata.yaml files.
     write_combined_metadata(
         os.path.join(cdir, "metadata", ofname + ".yaml"),
         typ="compendium",
         name=ofname,
         counts={
-            "cliques": count_cliques,
-            "eq_ids": count_eq_ids,
-            "synonyms": count_synonyms,
-            "property_sources": dict(property_source_count),
+            "cliques": counts.cliques,
+            "eq_ids": counts.eq_ids,
+            "synonyms": counts.synonyms,
+            "property_sources": dict(counts.property_sources),
         },
         combined_from_filenames=metadata_yamls,
+        profile=profile,
+    )
+
+
+def log_stage_profile(ofname, profile):
+    """Log where write_compendium() spent its time, slowest stage first."""
+    stages = profile["stages"]
+    total = sum(stage["seconds"] for stage in stages.values()) or 1
+    logger.info(
+        f"Stage profile for {ofname} ({profile['seconds']:.1f}s over {profile['workers']} worker(s)): "
+        + ", ".join(
+            f"{name} {stage['seconds']:.1f}s ({stage['seconds'] / total:.0%}, +{stage['peak_rss_growth_mib']:.0f} MiB)"
+            for name, stage in sorted(stages.items(), key=lambda item: item[1]["seconds"], reverse=True)
+        )
+    )
+
+
+@dataclass
+class CompendiumCounts:
+    """Counts accumulated while writing (part of) a compendium, reported in its metadata YAML."""
+
+    cliques: int = 0
+    eq_ids: int = 0
+    synonyms: int = 0
+    property_sources: defaultdict = field(default_factory=lambda: defaultdict(int))
+    # Labels and synonyms suppressed by the SynonymFilter.
+    filtered: int = 0
+    # Time and memory spent in each of WRITE_COMPENDIUM_STAGES (see src/stage_profile.py).
+    stages: dict = field(default_factory=dict)
+
+    def add(self, other: "CompendiumCounts"):
+        """Add the counts from another shard of the same compendium into this one."""
+        self.cliques += other.cliques
+        self.eq_ids += other.eq_ids
+        self.synonyms += other.synonyms
+        for source, count in other.property_sources.items():
+            self.property_sources[source] += count
+        self.filtered += other.filtered
+        add_stage_stats(self.stages, other.stages)
+
+
+class CompendiumWriter:
+    """The factories and configuration needed to turn cliques into compendium and synonym JSONL.
+
+    write_compendium() creates one of these in a single-process run, and one per worker process
+    when it writes a compendium in shards (see _write_compendium_in_parallel()). Creating one
+    loads the information content and property files; the other factories load lazily as
+    write() asks them for each prefix.
+    """
+
+    def __init__(self, node_type, labels, extra_prefixes, icrdf_filename, properties_jsonl_gz_files=None):
+        config = get_config()
+        self.node_type = node_type
+        self.labels = labels
+        self.extra_prefixes = extra_prefixes
+
+        self.node_factory = NodeFactory(make_local_name(""), config["biolink_version"])
+        logger.info(f"NodeFactory ready: {self.node_factory} with {get_memory_usage_summary()}")
+        self.synonym_factory = SynonymFactory(make_local_name(""))
+        logger.info(f"SynonymFactory ready: {self.synonym_factory} with {get_memory_usage_summary()}")
+
+        # Load the preferred_name_boost_prefixes -- this tells us which prefixes to boost when
+        # coming up with a preferred label for a particular Biolink class.
+        self.preferred_name_boost_prefixes = config["preferred_name_boost_prefixes"]
+
+        # Load the per-type label length demotion config. Types not listed here are never demoted.
+        self.demote_labels_longer_than = config.get("demote_labels_longer_than", {})
+
+        self.ic_factory = InformationContentFactory(icrdf_filename)
+        logger.info(f"InformationContentFactory ready: {self.ic_factory} with {get_memory_usage_summary()}")
+
+        self.description_factory = DescriptionFactory(make_local_name(""))
+        logger.info(f"DescriptionFactory ready: {self.description_factory} with {get_memory_usage_summary()}")
+
+        self.taxon_factory = TaxonFactory(make_local_name(""))
+        logger.info(f"TaxonFactory ready: {self.taxon_factory} with {get_memory_usage_summary()}")
+
+        if node_type is not None:
+            node_test = self.node_factory.create_node(
+                input_identifiers=[], node_type=node_type, labels={}, extra_prefixes=extra_prefixes
+            )
+            logger.info(f"NodeFactory test complete: {node_test} with {get_memory_usage_summary()}")
+        else:
+            logger.info("Skipping NodeFactory type test for heterogeneous typed cliques.")
+
+        # Load all the properties.
+        self.property_list = PropertyList()
+        if properties_jsonl_gz_files:
+            for properties_jsonl_gz_file in properties_jsonl_gz_files:
+                logger.info(f"Loading properties from {properties_jsonl_gz_file}...")
+                count_loaded = self.property_list.add_properties_jsonl_gz(properties_jsonl_gz_file)
+                logger.info(f"Loaded {count_loaded} unique properties from {properties_jsonl_gz_file}")
+            logger.info(
+                f"All {len(properties_jsonl_gz_files)} property files loaded ({self.property_list.count_unique()} total unique properties): {get_memory_usage_summary()}"
+            )
+        else:
+            logger.info("No property files provided or loaded.")
+
+    def write(
+        self,
+        synonym_list,
+        compendium_filename,
+        synonyms_filename,
+        ofname,
+        parquet_parts_dir=None,
+        parquet_part_prefix="",
+        reuse_dir=None,
+        clique_log_filename=None,
+    ) -> CompendiumCounts:
+        """Write the compendium and synonym entries for every clique in synonym_list.
+
+        :param synonym_list: The cliques to write, in output order.
+        :param compendium_filename: The compendium JSONL file to write.
+        :param synonyms_filename: The synonym JSONL file to write.
+        :param ofname: The compendium name, used in log messages.
+        :param parquet_parts_dir: (OPTIONAL) If set, also write the Node, Clique and Edge Parquet rows for every
+            clique to part files in this directory (see CompendiumParquetWriter).
+        :param parquet_part_prefix: A prefix for those part files, which orders them among other shards' parts.
+        :param reuse_dir: (OPTIONAL) An incremental state directory holding a previous build made from the same
+            inputs (see src/incremental.py). Cliques with the same type and identifiers as one in that build are
+            copied from it rather than regenerated.
+        :param clique_log_filename: (OPTIONAL) If set, write a CliqueLog of every clique to this file, so that this
+            build can be reused by the next one.
+        :return: The counts for the cliques written.
+        """
+        node_type = self.node_type
+        labels = self.labels
+        extra_prefixes = self.extra_prefixes
+        node_factory = self.node_factory
+        synonym_factory = self.synonym_factory
+        ic_factory = self.ic_factory
+        description_factory = self.description_factory
+        taxon_factory = self.taxon_factory
+        property_list = self.property_list
+        preferred_name_boost_prefixes = self.preferred_name_boost_prefixes
+        demote_labels_longer_than = self.demote_labels_longer_than
+
+        synonym_filter = get_synonym_filter()
+        filter_count_snapshot = synonym_filter.filtered_count
+
+        counts = CompendiumCounts()
+        profile = StageProfile(WRITE_COMPENDIUM_STAGES)
+        stage = profile.stage
+        node_factory.stage_profile = profile
+        # The encoder jsonlines.Writer would use, called directly so that encoding and writing are profiled apart.
+        encode_json = json.JSONEncoder(ensure_ascii=False).encode
+        parquet_writer = CompendiumParquetWriter(parquet_parts_dir, parquet_part_prefix) if parquet_parts_dir else None
+        reuse = CompendiumReuse(reuse_dir) if reuse_dir else None
+        clique_log = CliqueLog(clique_log_filename) if clique_log_filename else None
+        reused_cliques = 0
+        reused_filtered = 0
+
+        # Write compendium and synonym files. They are opened in binary mode so that we know how many bytes each line
+        # takes up, and so that reused lines can be copied in as they are.
+        with (
+            open(compendium_filename, "wb") as compendium_file,
+            open(synonyms_filename, "wb") as synonyms_file,
+        ):
+            # Calculate an estimated time to completion.
+            start_time = time.time_ns()
+            count_slist = 0
+            total_slist = len(synonym_list)
+
+            for slist in self.prefetch_taxa_in_chunks(synonym_list, profile):
+                if isinstance(slist, TypedClique):
+                    current_node_type = slist.node_type
+                    input_identifiers = slist.identifiers
+                else:
+                    if node_type is None:
+                        raise RuntimeError(
+                            "write_compendium() requires node_type unless every clique is a TypedClique."
+                        )
+                    current_node_type = node_type
+                    input_identifiers = slist
+
+                # Before we get started, let's estimate where we're at.
+                count_slist += 1
+                if (count_slist == 1) or (count_slist % WRITE_COMPENDIUM_LOG_EVERY_X_CLIQUES == 0):
+                    # TODO: replace with tqdm.
+                    time_elapsed_seconds = (time.time_ns() - start_time) / 1e9
+                    if time_elapsed_seconds < 0.001:
+                        # We don't want to divide by zero.
+                        time_elapsed_seconds = 0.001
+                    remaining_slist = total_slist - count_slist
+                    # count_slist --> time_elapsed_seconds
+                    # remaining_slist --> remaining_slist/count_slit*time_elapsed_seconds
+                    logger.info(
+                        f"Generating compendia and synonyms for {ofname} currently at {count_slist:,} out of {total_slist:,} ({count_slist / total_slist * 100:.2f}%) in {format_timespan(time_elapsed_seconds)}: {get_memory_usage_summary()}"
+                    )
+                    logger.info(
+                        f" - Current rate: {count_slist / time_elapsed_seconds:.2f} cliques/second or {time_elapsed_seconds / count_slist:.6f} seconds/clique."
+                    )
+
+                    time_remaining_seconds = time_elapsed_seconds / count_slist * remaining_slist
+                    logger.info(f" - Estimated time remaining: {format_timespan(time_remaining_seconds)}")
+
+                key = clique_key(current_node_type, input_identifiers) if (reuse or clique_log) else NOT_REUSABLE
+                reused = None
+                if reuse is not None:
+                    with stage("reuse"):
+                        reused = reuse.get(key)
+                if reused is not None:
+                    with stage("write"):
+                        compendium_file.write(reused.compendium_line)
+                        synonyms_file.write(reused.synonyms_line)
+                    if reused.compendium_line:
+                        counts.cliques += 1
+                        counts.eq_ids += len(input_identifiers)
+                        if parquet_writer is not None:
+                            with stage("parquet"):
+                                parquet_writer.add(json.loads(reused.compendium_line))
+                    counts.synonyms += reused.synonym_count
+                    reused_filtered += reused.filtered_count
+                    reused_cliques += 1
+                    if clique_log is not None:
+                        clique_log.add(key, *(len(line) for line in reused[:2]), *reused[2:])
+                    continue
+
+                # What we've written for this clique so far, for the clique log.
+                compendium_length = synonyms_length = 0
+                synonyms_before = counts.synonyms
+                filtered_before = synonym_filter.filtered_count
+
+                def log_clique():
+                    if clique_log is not None:
+                        clique_log.add(
+                            key,
+                            compendium_length,
+                            synonyms_length,
+                            counts.synonyms - synonyms_before,
+                            synonym_filter.filtered_count - filtered_before,
+                        )
+
+                with stage("create_node"):
+                    node = node_factory.create_node(
+                        input_identifiers=input_identifiers,
+                        node_type=current_node_type,
+                        labels=labels,
+                        extra_prefixes=extra_prefixes,
+                    )
+                if node is None:
+                    # This usually happens because every CURIE in the node is not in the id_prefixes list for that node_type.
+                    # Something to fix at some point, but we don't want to break the pipeline for this, so
+                    # we emit a warning and skip this clique.
+                    logger.warning(
+                        f"Could not create node for ({input_identifiers}, {current_node_type}, {labels}, {extra_prefixes}): returned None."
+                    )
+                    log_clique()
+                    continue
+                else:
+                    counts.cliques += 1
+                    counts.eq_ids += len(input_identifiers)
+
+                    nw = {"type": node["type"]}
+                    with stage("information_content"):
+                        ic = ic_factory.get_ic(node)
+                    nw["ic"] = ic
+
+                    with stage("preferred_name"):
+                        # Determine types.
+                        types = node_factory.get_ancestors(node["type"])
+
+                        # Generate a preferred label for this clique using choose_preferred_name().
+                        preferred_name = choose_preferred_name(
+                            node, types, preferred_name_boost_prefixes, demote_labels_longer_than
+                        )
+
+                    # At this point, we insert any HAS_ADDITIONAL_ID IDs we have.
+                    # The logic we use is: we insert all additional IDs for a CURIE *AFTER* that CURIE, in a random order, as long
+                    # as the additional CURIE is not already in the list of CURIEs.
+                    #
+                    # We will attempt to retrieve a label or description for this ID as well.
+                    current_curies = set()
+                    identifier_list = []
+                    curie_labels = dict()
+                    for nid in node["identifiers"]:
+                        iid = nid["identifier"]
+
+                        # Prevent duplicates (might happen if e.g. we have an additional CURIE that duplicates an existing one later in the list).
+                        if iid in current_curies:
+                            continue
+
+                        identifier_list.append(iid)
+                        current_curies.add(iid)
+
+                        if "label" in nid:
+                            curie_labels[iid] = nid["label"]
+
+                        # Are there any additional CURIEs for this CURIE?
+                        with stage("properties"):
+                            props = property_list.get_all(iid, HAS_ALTERNATIVE_ID)
+                        if props:
+                            # The clique's output now depends on more than its own identifiers.
+                            key = NOT_REUSABLE
+
+                            # Get just the additional CURIEs.
+                            additional_curies = [prop.value for prop in props]
+
+                            # ac_labelled will be a list that consists of either LabeledID (if the CURIE could be labeled)
+                            # or str objects (consisting of an unlabeled CURIE).
+                            with stage("apply_labels"):
+                                ac_labelled = node_factory.apply_labels(
+                                    input_identifiers=additional_curies, labels=labels, node_types=types
+                                )
+
+                            for prop, label in zip(props, ac_labelled):
+                                additional_curie = Text.get_curie(label)
+                                if ":" not in additional_curie:
+                                    raise ValueError(
+                                        f"Additional ID '{additional_curie}' for '{iid}' is not a valid CURIE: {prop}, {label} (from {ac_labelled})"
+                                    )
+                                if additional_curie not in current_curies:
+                                    identifier_list.append(additional_curie)
+                                    current_curies.add(additional_curie)
+
+                                    # Track the property sources we used.
+                                    counts.property_sources[prop.source] += 1
+
+                                    if isinstance(label, LabeledID) and label.label:
+                                        curie_labels[additional_curie] = label.label
+
+                    # Add description and taxon information and construct the final nw object.
+                    logger.debug(
+                        f"Getting descriptions and taxa for {len(identifier_list)} identifiers: {identifier_list}"
+                    )
+                    with stage("descriptions"):
+                        descs = description_factory.get_descriptions(identifier_list)
+                    with stage("taxa"):
+                        taxa = taxon_factory.get_taxa(identifier_list)
+
+                    # Construct the written-out identifier objects.
+                    nw["identifiers"] = []
+                    for iid in identifier_list:
+                        id_info = {"i": iid}
+
+                        if iid in curie_labels:
+                            id_info["l"] = curie_labels[iid]
+                        else:
+                            id_info["l"] = ""
+
+                        if id_info["i"] in descs:
+                            # Sort descriptions from the shortest to the longest (and then alphabetically, so that
+                            # the order doesn't depend on the string hashing of this process).
+                            id_info["d"] = list(sorted(descs[id_info["i"]], key=lambda x: (len(x), x)))
+                        else:
+                            id_info["d"] = []
+
+                        if id_info["i"] in taxa:
+                            # Sort taxa by CURIE suffix.
+                            id_info["t"] = list(sorted(taxa[id_info["i"]], key=get_numerical_curie_suffix))
+                        else:
+                            id_info["t"] = []
+
+                        nw["identifiers"].append(id_info)
+
+                    # Write out the preferred name, if we have one.
+                    nw["preferred_name"] = preferred_name
+
+                    # Collect taxon IDs for this node.
+                    nw["taxa"] = list(sorted(set().union(*taxa.values()), key=get_numerical_curie_suffix))
+
+                    with stage("json_encode"):
+                        line = encode_json(nw).encode() + b"\n"
+                    with stage("write"):
+                        compendium_file.write(line)
+                    compendium_length = len(line)
+                    if parquet_writer is not None:
+                        with stage("parquet"):
+                            parquet_writer.add(nw)
+
+                    # get_synonyms() returns tuples in the form ('http://www.geneontology.org/formats/oboInOwl#hasExactSynonym', 'Caudal articular process of eighteenth thoracic vertebra')
+                    # But we're only interested in the synonyms themselves, so we can skip the relationship for now.
+                    curie = node["identifiers"][0]["identifier"]
+
+                    # get_synonyms() returns a list of tuples, where each tuple is a relation and a synonym.
+                    # So we extract just the synonyms here, ditching the relations (result[0]), then unique-ify the
+                    # synonyms.
+                    with stage("synonyms"):
+                        synonyms = [
+                            result[1]
+                            for result in synonym_factory.get_synonyms(identifier_list, node_types=types)
+                            if result[1]
+                        ]
+                        # Shortest first, then alphabetically: ordering by length alone would leave names of the same
+                        # length in set order, which differs from process to process, and so between a single-process
+                        # run and a sharded one.
+                        synonyms_list = sorted(set(synonyms), key=lambda x: (len(x), x))
+
+                    try:
+                        document = {
+                            "curie": curie,
+                            "names": synonyms_list,
+                            "types": [t[8:] for t in types],
+                        }  # remove biolink:
+
+                        counts.synonyms += len(synonyms_list)
+
+                        # Write out the preferred name.
+                        if preferred_name:
+                            document["preferred_name"] = preferred_name
+                        else:
+                            logger.debug(
+                                f"No preferred name for {nw}, probably because all names were filtered out, skipping."
+                            )
+                            log_clique()
+                            continue
+
+                        # We previously used the shortest length of a name as a proxy for how good a match it is, i.e. given
+                        # two concepts that both have the word "acetaminophen" in them, we assume that the shorter one is the
+                        # more interesting one for users. I'm not sure if there's a better way to do that -- for instance,
+                        # could we consider the information content values? -- but in the interests of getting something
+                        # working quickly, this code restores that previous method.
+
+                        # Since synonyms_list is sorted, we can use the length of the first term as the synonym.
+                        if len(synonyms_list) == 0:
+                            logger.debug(f"Synonym list for {nw} is empty: no valid name. Skipping.")
+                            log_clique()
+                            continue
+                        else:
+                            document["shortest_name_length"] = len(synonyms_list[0])
+
+                        # Cliques with more identifiers might be better than cliques with smaller identifiers.
+                        # So let's try to incorporate that here.
+                        # Note that this includes all the alternative IDs.kl
+                        document["clique_identifier_count"] = len(nw["identifiers"])
+
+                        # We want to see if we can use the CURIE suffix to sort concepts with similar identifiers.
+                        # We want to sort this numerically, so we only do this if the CURIE suffix is numerical.
+                        curie_parts = curie.split(":", 1)
+                        if len(curie_parts) > 0:
+                            # Try to cast the CURIE suffix to an integer. If we get a ValueError, don't worry about it.
+                            try:
+                                document["curie_suffix"] = int(curie_parts[1])
+                            except ValueError:
+                                pass
+
+                        # Collect taxon names for this node.
+                        document["taxa"] = list(sorted(set().union(*taxa.values()), key=get_numerical_curie_suffix))
+                        if len(document["taxa"]) > 0:
+                            # This concept is specific to one or more particular taxa.
+                            document["taxon_specific"] = True
+                        else:
+                            # This concept is not specific to any taxa (that we know about).
+                            document["taxon_specific"] = False
+
+                        with stage("json_encode"):
+                            line = encode_json(document).encode() + b"\n"
+                        with stage("write"):
+                            synonyms_file.write(line)
+                        synonyms_length = len(line)
+                        log_clique()
+                    except Exception as ex:
+                        print(f"Exception thrown while write_compendium() was generating {ofname}: {ex}")
+                        print(nw["type"])
+                        print(node_factory.get_ancestors(nw["type"]))
+                        traceback.print_exc()
+                        raise ex
+
+        if parquet_writer is not None:
+            parquet_writer.close()
+        if clique_log is not None:
+            clique_log.close()
+        if reuse is not None:
+            reuse.close()
+            logger.info(
+                f"Reused {reused_cliques:,} of {len(synonym_list):,} cliques from the previous build of {ofname}"
+            )
+
+        counts.filtered = synonym_filter.filtered_count - filter_count_snapshot + reused_filtered
+        node_factory.stage_profile = NULL_STAGE_PROFILE
+        counts.stages = profile.stats
+        return counts
+
+    def prefetch_taxa_in_chunks(self, synonym_list, profile=NULL_STAGE_PROFILE):
+        """Yield the cliques in synonym_list, prefetching the taxa for each chunk of them before it is yielded."""
+        cliques = iter(synonym_list)
+        while chunk := list(itertools.islice(cliques, WRITE_COMPENDIUM_TAXA_PREFETCH_CLIQUES)):
+            with profile.stage("taxa"):
+                self.taxon_factory.prefetch(
+                    [
+                        Text.get_curie(identifier)
+                        for clique in chunk
+                        for identifier in (clique.identifiers if isinstance(clique, TypedClique) else clique)
+                    ]
+                )
+            yield from chunk
+
+    def close(self):
+        """Close all the factories."""
+        self.taxon_factory.close()
+
+
+# The CompendiumWriter for this worker process, set up by _init_compendium_worker().
+_worker_compendium_writer = None
+
+
+def _init_compendium_worker(writer_kwargs, config):
+    """Process pool initializer: give this worker the parent's configuration, and its own CompendiumWriter (and
+    factories). A spawned worker would otherwise read config.yaml afresh, missing any changes the parent made."""
+    global _worker_compendium_writer
+    src.util.config_yaml = config
+    _worker_compendium_writer = CompendiumWriter(**writer_kwargs)
+
+
+def _write_compendium_shard(
+    shard,
+    compendium_filename,
+    synonyms_filename,
+    shard_name,
+    parquet_parts_dir=None,
+    parquet_part_prefix="",
+    reuse_dir=None,
+    clique_log_filename=None,
+) -> CompendiumCounts:
+    """Process pool task: write one shard of a compendium with this worker's CompendiumWriter."""
+    return _worker_compendium_writer.write(
+        shard,
+        compendium_filename,
+        synonyms_filename,
+        shard_name,
+        parquet_parts_dir,
+        parquet_part_prefix,
+        reuse_dir,
+        clique_log_filename,
+    )
+
+
+def split_into_shards(items, shard_count):
+    """Split items into at most shard_count contiguous, non-empty lists of near-equal size.
+
+    Concatenating the shards in order gives back the items in their original iteration order.
+    """
+    items = list(items)
+    shard_count = max(1, min(shard_count, len(items)))
+    shard_size, remainder = divmod(len(items), shard_count)
+    shards = []
+    start = 0
+    for index in range(shard_count):
+        end = start + shard_size + (1 if index < remainder else 0)
+        shards.append(items[start:end])
+        start = end
+    return [shard for shard in shards if shard]
+
+
+def concatenate_files(input_filenames, output_filename):
+    """Concatenate input_filenames, in order, into output_filename."""
+    with open(output_filename, "wb") as outf:
+        for input_filename in input_filenames:
+            with open(input_filename, "rb") as inf:
+                shutil.copyfileobj(inf, outf)
+
+
+def _write_compendium_in_parallel(
+    synonym_list,
+    compendium_filename,
+    synonyms_filename,
+    ofname,
+    workers,
+    writer_kwargs,
+    parquet_parts_dir=None,
+    reuse_dir=None,
+    clique_log_filename=None,
+):
+    """Write a compendium in shards over a pool of worker processes, then merge the shards in order.
+
+    synonym_list is split into WRITE_COMPENDIUM_SHARDS_PER_WORKER shards per worker, so that one slow shard
+    (a run of very large cliques, say) doesn't leave the other workers idle at the end. Each worker writes
+    its shards to a temporary directory next to the compendium; once every shard is done, they are
+    concatenated in shard order, which reproduces the order a single-process run would write. Parquet part
+    files (if parquet_parts_dir is set) are prefixed with their shard index, so they sort in shard order too,
+    and the shards' clique logs (if clique_log_filename is set) are concatenated in the same order.
+
+    Workers are started with the "spawn" method rather than forked, so they don't inherit (and, through
+    reference counting, gradually copy) the caller's glom state, which can be hundreds of GB.
+    """
+    shards = split_into_shards(synonym_list, workers * WRITE_COMPENDIUM_SHARDS_PER_WORKER)
+    logger.info(
+        f"Writing {ofname} in {len(shards)} shards over {workers} worker processes: {get_memory_usage_summary()}"
     )
 
-    # Close all the factories.
-    taxon_factory.close()
+    counts = CompendiumCounts()
+    with tempfile.TemporaryDirectory(
+        prefix=f".{ofname}.shards-", dir=os.path.dirname(compendium_filename)
+    ) as shard_dir:
+        compendium_shards = [os.path.join(shard_dir, f"compendium-{i}.jsonl") for i in range(len(shards))]
+        synonyms_shards = [os.path.join(shard_dir, f"synonyms-{i}.jsonl") for i in range(len(shards))]
+        clique_log_shards = [os.path.join(shard_dir, f"cliques-{i}.tsv") for i in range(len(shards))]
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_compendium_worker,
+            initargs=(writer_kwargs, get_config()),
+        ) as pool:
+            futures = [
+                pool.submit(
+                    _write_compendium_shard,
+                    shard,
+                    compendium_shards[index],
+                    synonyms_shards[index],
+                    f"{ofname} (shard {index + 1} of {len(shards)})",
+                    parquet_parts_dir,
+                    f"{index:06d}-",
+                    reuse_dir,
+                    clique_log_shards[index] if clique_log_filename else None,
+                )
+                for index, shard in enumerate(shards)
+            ]
+            for future in futures:
+                counts.add(future.result())
+
+        concatenate_files(compendium_shards, compendium_filename)
+        concatenate_files(synonyms_shards, synonyms_filename)
+        if clique_log_filename:
+            concatenate_files(clique_log_shards, clique_log_filename)
+
+    logger.info(f"Merged {len(shards)} shards of {ofname}: {get_memory_usage_summary()}")
+    return counts
 
 
 def glom(conc_set, newgroups, unique_prefixes=["INCHIKEY"], pref="HP", close={}):
@@ -1035,134 +1525,17 @@ def glom(conc_set, newgroups, unique_prefixes=["INCHIKEY"], pref="HP", close={})
     the keys are all of the elements in the set.   For each element in a set, there is a key
     in the dictionary that points to the set.
     newgroups is an iterable that of new equivalence groups (expressed as sets,tuples,or lists)
-    with which we want to update conc_set."""
-    n = 0
-    bad = 0
-    shit_prefixes = set(["KEGG", "PUBCHEM"])
-    test_id = "xUBERON:0002262"
-    debugit = False
-    # excised = set()
-    for xgroup in newgroups:
-        if isinstance(xgroup, frozenset):
-            group = set(xgroup)
-        else:
-            group = xgroup
-        # As of now, xgroup should never be more than two things
-        if len(xgroup) > 2:
-            print(xgroup)
-            print("nope nope nope")
-            raise ValueError
-        n += 1
-        if debugit:
-            print("new group", group)
-        if test_id in group:
-            print("higroup", group)
-        # Find all the equivalence sets that already correspond to any of the identifiers in the new set.
-        existing_sets_w_x = [(conc_set[x], x) for x in group if x in conc_set]
-        # All of these sets are now going to be combined through the equivalence of our new set.
-        existing_sets = [es[0] for es in existing_sets_w_x]
-        # x = [es[1] for es in existing_sets_w_x]
-        newset = set().union(*existing_sets)
-        if debugit:
-            print("merges:", existing_sets)
-        # put all the new stuff in it.  Do it element-wise, cause we don't know the type of the new group
-        for element in group:
-            newset.add(element)
-        if test_id in newset:
-            print("hiset", newset)
-            print("input_set", group)
-            print("esets")
-            for eset in existing_sets:
-                print(" ", eset, group.intersection(eset))
-        for check_element in newset:
-            prefix = check_element.split(":")[0]
-            if prefix in shit_prefixes:
-                print(prefix)
-                print(check_element)
-                raise Exception("garbage")
-        if debugit:
-            print("final set", newset)
-        # make sure we didn't combine anything we want to keep separate
-        setok = True
-        if test_id in group:
-            print("setok?", setok)
-        for up in unique_prefixes:
-            if test_id in group:
-                print("up?", up)
-            idents = [e if isinstance(e, str) else e.identifier for e in newset]
-            if len(set([e for e in idents if (e.split(":")[0] == up)])) > 1:
-                bad += 1
-                setok = False
-                wrote = set()
-                for s in existing_sets:
-                    fs = frozenset(s)
-                    wrote.add(fs)
-                for gel in group:
-                    if Text.get_prefix_or_none(gel) == pref:
-                        # killer = gel
-                        pass
-                # for preset in wrote:
-                #    print(f'{killer}\t{set(group).intersection(preset)}\t{preset}\n')
-                # print('------------')
-        NPC = sum(1 for s in newset if s.startswith("PUBCHEM.COMPOUND:"))
-        if ("PUBCHEM.COMPOUND:3100" in newset) and (NPC > 3):
-            if debugit:
-                raise ValueError(f"Debugging information: {sorted(list(newset))}")
-        if not setok:
-            # Our new group created a new set that merged stuff we didn't want to merge.
-            # Previously we did a lot of fooling around at this point.  But now we're just going to say, I have a
-            # pairwise concordance.  That can at most link two groups.  just don't link them. In other words,
-            # we are simply ignoring this concordance.
-            continue
-            # Let's figure out the culprit(s) and excise them
-            # counts = defaultdict(int)
-            # for x in group:
-            #    counts[x] += 1
-            ##THe way existing sets was created, means that the same set can be in there twice, and we don't want to
-            # count things that way
-            # unique_existing_sets = []
-            # for ex in existing_sets:
-            #    u = True
-            #    for q in unique_existing_sets:
-            #        if ex == q:
-            #            u = False
-            #    if u:
-            #        unique_existing_sets.append(ex)
-            # for es in unique_existing_sets:
-            #    for y in es:
-            #        counts[y] += 1
-            # bads = [ x for x,y in counts.items() if y > 1 ]
-            # now we know which identifiers are causing trouble.
-            # We don't want to completely throw them out, but we can't allow them to gum things up.
-            # So, we need to first remove them from all the sets, then we need to put them in their own set
-            # It might be good to track this somehow?
-            # excised.update(bads)
-            # for b in bads:
-            #    if b in group:
-            #        group.remove(b)
-            #    for exset in existing_sets:
-            #        if b in exset:
-            #            exset.remove(b)
-            #    conc_set[b] = set([b])
-            # for x in group:
-            #    conc_set[x] = group
-            # continue
-        # Now check the 'close' dictionary to see if we've accidentally gotten to a close match becoming an exact match
-        setok = True
-        for cpref, closedict in close.items():
-            idents = set([e if isinstance(e, str) else e.identifier for e in newset])
-            prefidents = [e for e in idents if e.startswith(cpref)]
-            for pident in prefidents:
-                for cd in closedict[pident]:
-                    if cd in newset:
-                        setok = False
-            if len(prefidents) == 0:
-                continue
-        if not setok:
-            continue
-        # Now make all the elements point to this new set:
-        for element in newset:
-            conc_set[element] = newset
+    with which we want to update conc_set.
+
+    A new group is ignored if merging it would put two identifiers with the same prefix from
+    unique_prefixes into one set, or would put an identifier in the same set as one of its
+    close matches (close maps a prefix to a dict of CURIE -> close-match CURIEs). The merging
+    itself is done by the union-find engine in src/model/disjoint_set.py; conc_set is only
+    updated once all of newgroups has been processed. `pref` is no longer used."""
+    engine = GlomDisjointSet(conc_set, unique_prefixes=unique_prefixes, close=close)
+    for group in newgroups:
+        engine.add_group(group)
+    engine.materialize()
 
 
 def get_prefixes(idlist):
@@ -0,0 +1,9 @@
+"""Offline benchmarks of the clique-building hot paths, over seeded synthetic inputs.
+
+:mod:`src.benchmarks.synthetic` generates the inputs -- identifiers, concords, labels, synonyms,
+descriptions, taxa and information content shaped like real prefixes -- and
+:mod:`src.benchmarks.cases` times ``glom()``, ``NodeFactory.create_node()``,
+``choose_preferred_name()``, ``SynonymFactory.get_synonyms()`` and ``write_compendium()`` over them.
+``babel-benchmark`` (src/tools/benchmark/cli.py) runs them and compares the results with a
+baseline. See ``docs/tools/Benchmarks.md``.
+"""
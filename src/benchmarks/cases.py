@@ -0,0 +1,287 @@
+"""Benchmark cases for the clique-building hot paths, and running and comparing them.
+
+Each case times one hot path over a :class:`src.benchmarks.synthetic.SyntheticDataset`: its
+setup (loading the cliques, creating the factories) is not timed, and its run returns the number
+of items it processed, so results are reported as throughput. Peak RSS is the high-water mark of
+the whole process running the case, setup included, as SLURM would see it. That is only
+meaningful if the case has the process to itself, so :func:`run_benchmarks` runs every case in a
+fresh process.
+
+Cases run offline: :func:`benchmark_environment` points ``get_config()`` at the synthetic
+dataset, and sets ``biolink_model_yaml`` to the Biolink Model bundled with bmt's
+``biolink-model`` dependency rather than fetching ``biolink_version`` from GitHub. Benchmarks are compared with
+other benchmarks, never with a production build, so it only matters that the model is the same
+from run to run.
+"""
+
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import time
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+
+import biolink_model
+
+import src.util
+from src.babel_utils import choose_preferred_name, glom, write_compendium
+from src.benchmarks.synthetic import SCALES, SyntheticDataset, load_or_generate
+from src.memory import process_peak_rss_bytes
+from src.node import NodeFactory, SynonymFactory
+from src.util import get_config, get_logger
+
+logger = get_logger(__name__)
+
+# Bump this if the layout of a results file changes.
+RESULTS_FORMAT_VERSION = 1
+
+# By default, a case is a regression if it is this much slower, or uses this much more memory, than its baseline.
+DEFAULT_TOLERANCE = 0.2
+
+
+@dataclass
+class BenchmarkResult:
+    """How long one case took to process its items at one scale, and the peak RSS of the process that ran it."""
+
+    case: str
+    scale: str
+    items: int
+    seconds: float
+    peak_rss_mib: float
+
+    @property
+    def items_per_second(self) -> float:
+        return self.items / self.seconds if self.seconds > 0 else float("inf")
+
+
+@dataclass
+class Comparison:
+    """A result compared with the baseline result for the same case and scale."""
+
+    result: BenchmarkResult
+    baseline: BenchmarkResult
+    tolerance: float
+
+    @property
+    def time_ratio(self) -> float:
+        return self.result.seconds / self.baseline.seconds if self.baseline.seconds > 0 else float("inf")
+
+    @property
+    def rss_ratio(self) -> float:
+        return self.result.peak_rss_mib / self.baseline.peak_rss_mib if self.baseline.peak_rss_mib > 0 else float("inf")
+
+    @property
+    def regressed(self) -> bool:
+        return self.time_ratio > 1 + self.tolerance or self.rss_ratio > 1 + self.tolerance
+
+
+def bundled_biolink_model_yaml() -> str:
+    """Return the path to the Biolink Model YAML bundled with the biolink-model package."""
+    return os.path.join(list(biolink_model.__path__)[0], "schema", "biolink_model.yaml")
+
+
+@contextlib.contextmanager
+def benchmark_environment(dataset: SyntheticDataset):
+    """Point Babel's configuration at a synthetic dataset, and use the bundled Biolink Model, until exiting."""
+    config = dict(get_config())
+    input_directory = config.get("input_directory", "input_data")
+    if not os.path.isabs(input_directory):
+        input_directory = os.path.join(os.path.dirname(src.util.__file__), "..", input_directory)
+    config.update(
+        {
+            "input_directory": input_directory,
+            "download_directory": dataset.download_directory,
+            "output_directory": dataset.output_directory,
+            "intermediate_directory": os.path.join(dataset.output_directory, "intermediate"),
+            "incremental_builds": False,
+            "write_compendium_workers": 1,
+            "write_compendium_parquet": False,
+            "write_compendium_profile_json": False,
+            # Otherwise the SQLite databases a first run persists would make later runs faster.
+            "persist_tsv_sqlite": False,
+            "biolink_model_yaml": bundled_biolink_model_yaml(),
+        }
+    )
+
+    saved = src.util.config_yaml
+    src.util.config_yaml = config
+    try:
+        yield config
+    finally:
+        src.util.config_yaml = saved
+
+
+# Each case takes a dataset, does its untimed setup, and returns a function that runs the timed part and returns the
+# number of items it processed.
+
+
+def _glom_case(dataset: SyntheticDataset) -> Callable[[], int]:
+    pairs = dataset.read_concords()
+
+    def run():
+        glom({}, pairs)
+        return len(pairs)
+
+    return run
+
+
+def _create_node_case(dataset: SyntheticDataset) -> Callable[[], int]:
+    node_factory = NodeFactory(dataset.download_directory, get_config()["biolink_version"])
+    cliques = dataset.read_cliques()
+
+    def run():
+        for clique in cliques:
+            node_factory.create_node(input_identifiers=clique.identifiers, node_type=clique.node_type)
+        return len(cliques)
+
+    return run
+
+
+def _choose_preferred_name_case(dataset: SyntheticDataset) -> Callable[[], int]:
+    config = get_config()
+    node_factory = NodeFactory(dataset.download_directory, config["biolink_version"])
+    nodes = []
+    for clique in dataset.read_cliques():
+        node = node_factory.create_node(input_identifiers=clique.identifiers, node_type=clique.node_type)
+        nodes.append((node, node_factory.get_ancestors(node["type"])))
+    boost_prefixes = config["preferred_name_boost_prefixes"]
+    demote_labels_longer_than = config.get("demote_labels_longer_than", {})
+
+    def run():
+        for node, types in nodes:
+            choose_preferred_name(node, types, boost_prefixes, demote_labels_longer_than)
+        return len(nodes)
+
+    return run
+
+
+def _get_synonyms_case(dataset: SyntheticDataset) -> Callable[[], int]:
+    synonym_factory = SynonymFactory(dataset.download_directory)
+    cliques = dataset.read_cliques()
+
+    def run():
+        for clique in cliques:
+            synonym_factory.get_synonyms(clique.identifiers, node_types=[clique.node_type])
+        return len(cliques)
+
+    return run
+
+
+def _write_compendium_case(dataset: SyntheticDataset) -> Callable[[], int]:
+    cliques = dataset.read_cliques()
+
+    def run():
+        write_compendium([], cliques, "Benchmark.txt", None, icrdf_filename=dataset.icrdf_filename)
+        return len(cliques)
+
+    return run
+
+
+CASES = {
+    "glom": _glom_case,
+    "create_node": _create_node_case,
+    "choose_preferred_name": _choose_preferred_name_case,
+    "get_synonyms": _get_synonyms_case,
+    "write_compendium": _write_compendium_case,
+}
+
+
+def peak_rss_mib() -> float:
+    """Return the peak resident set size of this process so far, in MiB."""
+    return process_peak_rss_bytes() / (1024 * 1024)
+
+
+def run_case(case: str, scale: str, dataset: SyntheticDataset) -> BenchmarkResult:
+    """Run one case over a dataset in this process."""
+    with benchmark_environment(dataset):
+        run = CASES[case](dataset)
+        start = time.perf_counter()
+        items = run()
+        seconds = time.perf_counter() - start
+    return BenchmarkResult(case, scale, items, seconds, peak_rss_mib())
+
+
+def run_benchmarks(
+    cases: list[str], scales: list[str], workdir: str, seed: int = 0, repeat: int = 1, isolate: bool = True
+) -> list[BenchmarkResult]:
+    """Run some cases at some scales, generating (or reusing) a synthetic dataset for each scale in workdir.
+
+    :param cases: The names of the cases to run (keys of :data:`CASES`).
+    :param scales: The names of the scales to run them at (keys of :data:`SCALES`).
+    :param workdir: The directory to keep the synthetic datasets in.
+    :param seed: The random seed for the synthetic datasets.
+    :param repeat: How many times to run each case. The result has the fastest time and the highest peak RSS.
+    :param isolate: Run each case in a fresh process, so that its peak RSS is its own. Without this, every case
+        runs in this process and the peak RSS is that of everything run so far.
+    :return: One result per case and scale, in the order they were run.
+    """
+    unknown = sorted(set(cases) - set(CASES)) + sorted(set(scales) - set(SCALES))
+    if unknown:
+        raise ValueError(f"Unknown benchmark cases or scales: {unknown}")
+
+    results = []
+    for scale in scales:
+        dataset = load_or_generate(os.path.join(workdir, f"{scale}-{seed}"), SCALES[scale], seed)
+        for case in cases:
+            runs = []
+            for _ in range(repeat):
+                if isolate:
+                    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                        runs.append(pool.submit(run_case, case, scale, dataset).result())
+                else:
+                    runs.append(run_case(case, scale, dataset))
+            result = BenchmarkResult(
+                case,
+                scale,
+                runs[0].items,
+                min(r.seconds for r in runs),
+                max(r.peak_rss_mib for r in runs),
+            )
+            logger.info(
+                f"{case} at {scale}: {result.items:,} items in {result.seconds:.3f}s "
+                f"({result.items_per_second:,.0f}/s), peak RSS {result.peak_rss_mib:,.0f} MiB"
+            )
+            results.append(result)
+    return results
+
+
+def write_results(results: list[BenchmarkResult], filename: str, seed: int = 0):
+    """Write benchmark results to a JSON file, with enough about the machine to tell whether they are comparable."""
+    with open(filename, "w") as outf:
+        json.dump(
+            {
+                "format": RESULTS_FORMAT_VERSION,
+                "seed": seed,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "results": [asdict(result) for result in results],
+            },
+            outf,
+            indent=2,
+        )
+        outf.write("\n")
+
+
+def read_results(filename: str) -> list[BenchmarkResult]:
+    """Read the results written by write_results()."""
+    with open(filename) as inf:
+        document = json.load(inf)
+    if document.get("format") != RESULTS_FORMAT_VERSION:
+        raise ValueError(f"{filename} is not a version {RESULTS_FORMAT_VERSION} benchmark results file")
+    return [BenchmarkResult(**result) for result in document["results"]]
+
+
+def compare_results(
+    results: list[BenchmarkResult], baseline: list[BenchmarkResult], tolerance: float = DEFAULT_TOLERANCE
+) -> list[Comparison]:
+    """Compare results with the baseline results for the same case and scale. Results without a baseline are skipped."""
+    baseline_by_key = {(b.case, b.scale): b for b in baseline}
+    return [
+        Comparison(result, baseline_by_key[(result.case, result.scale)], tolerance)
+        for result in results
+        if (result.case, result.scale) in baseline_by_key
+    ]
@@ -0,0 +1,308 @@
+"""A seeded generator of synthetic Babel inputs for the benchmarks.
+
+Real inputs are too big to benchmark on a laptop and change with every download, so the
+benchmarks run over generated ones instead. :func:`generate` writes a ``babel_downloads``-shaped
+directory -- per-prefix ``labels``, ``synonyms``, ``descriptions`` and ``taxa`` files (with the
+label and synonym indexes the pipeline builds for them), the ``common`` files, and a compiled
+``icRDF.tsv`` -- plus the cliques and concords to build from it.
+
+The data is shaped like the prefixes that dominate real builds:
+
+- ``biolink:SmallMolecule`` cliques led by CHEBI or PUBCHEM.COMPOUND, with a heavy tail of
+  PUBCHEM.COMPOUND identifiers, long IUPAC-style labels (so label demotion kicks in) and many
+  synonyms;
+- ``biolink:Protein`` cliques of UniProtKB accessions, with taxa drawn from a Zipf distribution
+  over a taxon list led by NCBITaxon:9606, as in UniProtKB;
+- UMLS concepts (``C`` plus seven digits) and MESH descriptors scattered through both, with
+  UMLS-style synonym lists.
+
+The same seed and clique count always produce byte-identical files, so two benchmark runs (or
+two machines) measure the same work.
+"""
+
+import itertools
+import json
+import os
+import random
+import shutil
+import string
+from dataclasses import dataclass
+
+import curies
+
+from src.babel_utils import TypedClique
+from src.categories import PROTEIN, SMALL_MOLECULE
+from src.node import compile_information_content
+from src.predicates import HAS_EXACT_SYNONYM, HAS_RELATED_SYNONYM, HAS_SYNONYM
+from src.prefixes import CHEBI, MESH, NCBITAXON, PUBCHEMCOMPOUND, UMLS, UNIPROTKB
+from src.synonyms.label_index import LABELS, SYNONYMS, build_index, index_filename
+from src.util import get_logger
+
+logger = get_logger(__name__)
+
+# Bump this whenever a change to this module changes what it generates, so cached datasets are regenerated.
+GENERATOR_VERSION = 1
+
+# The number of cliques generated at each named scale.
+SCALES = {
+    "tiny": 200,
+    "small": 5_000,
+    "medium": 50_000,
+    "large": 500_000,
+}
+
+MANIFEST_FILENAME = "manifest.json"
+CLIQUES_FILENAME = "cliques.jsonl"
+CONCORDS_FILENAME = "concords.tsv"
+DOWNLOADS_DIRNAME = "babel_downloads"
+OUTPUTS_DIRNAME = "babel_outputs"
+ICRDF_FILENAME = "icRDF.tsv"
+
+# The fraction of cliques of each type.
+SMALL_MOLECULE_FRACTION = 0.6
+
+IC_IRI_STEM = "http://purl.obolibrary.org/obo/CHEBI_"
+
+CHEMICAL_FRAGMENTS = [
+    "methyl", "ethyl", "propyl", "butyl", "hydroxy", "amino", "chloro", "fluoro", "bromo", "nitro",
+    "phenyl", "benzyl", "oxo", "carbonyl", "sulfonyl", "pyridin", "piperazin", "morpholin", "imidazol",
+    "thiazol", "indol", "quinolin", "cyclohexyl", "acetyl", "methoxy", "ethoxy", "carbamoyl", "cyano",
+]  # fmt: skip
+CHEMICAL_SUFFIXES = ["amide", "ol", "one", "ine", "oic acid", "ate", "ane", "ene", "yl ester", "amine"]
+SYLLABLES = ["ka", "lo", "mi", "ran", "tes", "vo", "zi", "pro", "nex", "dor", "fil", "gan", "bu", "cel", "ta", "xin"]
+
+
+@dataclass
+class SyntheticDataset:
+    """The files generate() wrote, and the cliques and concords to build from them."""
+
+    root: str
+    seed: int
+    clique_count: int
+
+    @property
+    def download_directory(self) -> str:
+        return os.path.join(self.root, DOWNLOADS_DIRNAME)
+
+    @property
+    def output_directory(self) -> str:
+        return os.path.join(self.root, OUTPUTS_DIRNAME)
+
+    @property
+    def icrdf_filename(self) -> str:
+        return os.path.join(self.download_directory, ICRDF_FILENAME)
+
+    def read_cliques(self) -> list[TypedClique]:
+        """Return the cliques, each with its Biolink type, in the order they were generated."""
+        with open(os.path.join(self.root, CLIQUES_FILENAME)) as inf:
+            return [TypedClique(row["type"], row["identifiers"]) for row in map(json.loads, inf)]
+
+    def read_concords(self) -> list[tuple[str, str]]:
+        """Return the concord pairs that glom into the cliques, in a shuffled order."""
+        with open(os.path.join(self.root, CONCORDS_FILENAME)) as inf:
+            return [(x[0], x[2]) for x in (line.rstrip("\n").split("\t") for line in inf)]
+
+
+class _Identifiers:
+    """Draws unique identifiers for a prefix from a local-ID generator."""
+
+    def __init__(self, prefix, draw):
+        self.prefix = prefix
+        self.draw = draw
+        self.seen = set()
+
+    def next(self, rng: random.Random) -> str:
+        while True:
+            local_id = self.draw(rng)
+            if local_id not in self.seen:
+                self.seen.add(local_id)
+                return f"{self.prefix}:{local_id}"
+
+
+def _uniprot_accession(rng: random.Random) -> str:
+    # The two six-character UniProtKB accession formats: [OPQ][0-9][A-Z0-9]{3}[0-9] and [A-NR-Z][0-9][A-Z][A-Z0-9]{2}[0-9].
+    alnum = string.ascii_uppercase + string.digits
+    if rng.random() < 0.5:
+        return (
+            rng.choice("OPQ") + rng.choice(string.digits) + "".join(rng.choices(alnum, k=3)) + rng.choice(string.digits)
+        )
+    first = rng.choice("ABCDEFGHIJKLMNRSTUVWXYZ")
+    return (
+        first
+        + rng.choice(string.digits)
+        + rng.choice(string.ascii_uppercase)
+        + "".join(rng.choices(alnum, k=2))
+        + rng.choice(string.digits)
+    )
+
+
+def _tail(rng: random.Random, alpha: float, cap: int) -> int:
+    """A heavy-tailed count of at least 1: mostly 1 or 2, occasionally up to cap."""
+    return min(cap, int(rng.paretovariate(alpha)))
+
+
+def _word(rng: random.Random) -> str:
+    return "".join(rng.choices(SYLLABLES, k=rng.randint(2, 4)))
+
+
+def _iupac_name(rng: random.Random) -> str:
+    parts = [f"{rng.randint(1, 9)}-{rng.choice(CHEMICAL_FRAGMENTS)}" for _ in range(_tail(rng, 1.2, 8))]
+    return "-".join(parts) + rng.choice(CHEMICAL_FRAGMENTS) + rng.choice(CHEMICAL_SUFFIXES)
+
+
+def _common_name(rng: random.Random) -> str:
+    return _word(rng) + rng.choice(CHEMICAL_SUFFIXES).split()[0]
+
+
+def _protein_name(rng: random.Random) -> str:
+    return f"{_word(rng).capitalize()} {rng.choice(['kinase', 'receptor', 'transporter', 'ligase', 'factor'])} {rng.randint(1, 20)}"
+
+
+def _concept_name(rng: random.Random) -> str:
+    return " ".join(_word(rng) for _ in range(rng.randint(1, 4))).capitalize()
+
+
+class _Writer:
+    """Appends label, synonym, description and taxon lines to the per-prefix files under babel_downloads."""
+
+    def __init__(self, download_directory):
+        self.download_directory = download_directory
+        self.files = {}
+
+    def write(self, prefix, kind, line):
+        if (prefix, kind) not in self.files:
+            os.makedirs(os.path.join(self.download_directory, prefix), exist_ok=True)
+            self.files[(prefix, kind)] = open(os.path.join(self.download_directory, prefix, kind), "w")
+        self.files[(prefix, kind)].write(line)
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+
+def _describe_identifier(rng, writer, curie, name, synonym_alpha, taxa=None):
+    """Write the labels, synonyms, description and taxa of one identifier."""
+    prefix = curie.split(":", 1)[0]
+    # About one identifier in ten has no label, as in real prefixes.
+    if rng.random() < 0.9:
+        writer.write(prefix, LABELS, f"{curie}\t{name}\n")
+    for _ in range(_tail(rng, synonym_alpha, 200) - 1):
+        predicate = rng.choice([HAS_EXACT_SYNONYM, HAS_EXACT_SYNONYM, HAS_RELATED_SYNONYM, HAS_SYNONYM])
+        writer.write(prefix, SYNONYMS, f"{curie}\t{predicate}\t{name} {_word(rng)}\n")
+    if rng.random() < 0.3:
+        writer.write(prefix, "descriptions", f"{curie}\tA {_concept_name(rng).lower()} described for benchmarking.\n")
+    if taxa is not None:
+        writer.write(prefix, "taxa", f"{curie}\t{taxa}\n")
+
+
+def generate(root: str, clique_count: int, seed: int = 0) -> SyntheticDataset:
+    """Generate a synthetic dataset of clique_count cliques in root, replacing anything already there.
+
+    :param root: The directory to write the dataset to.
+    :param clique_count: The number of cliques to generate (see :data:`SCALES`).
+    :param seed: The random seed. The same seed and clique_count always produce the same files.
+    :return: The generated dataset.
+    """
+    shutil.rmtree(root, ignore_errors=True)
+    os.makedirs(root)
+    rng = random.Random(seed)
+    dataset = SyntheticDataset(root, seed, clique_count)
+    download_directory = dataset.download_directory
+
+    ids = {
+        PUBCHEMCOMPOUND: _Identifiers(PUBCHEMCOMPOUND, lambda r: str(r.randint(1, 180_000_000))),
+        CHEBI: _Identifiers(CHEBI, lambda r: str(r.randint(1, 200_000))),
+        MESH: _Identifiers(MESH, lambda r: r.choice("CD") + f"{r.randint(0, 999_999):06d}"),
+        UMLS: _Identifiers(UMLS, lambda r: f"C{r.randint(0, 9_999_999):07d}"),
+        UNIPROTKB: _Identifiers(UNIPROTKB, _uniprot_accession),
+    }
+    # A taxon list with a Zipf-like distribution, led by human.
+    taxa = [f"{NCBITAXON}:9606"] + [f"{NCBITAXON}:{taxon}" for taxon in rng.sample(range(10_000, 3_000_000), 999)]
+    taxon_cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(taxa) + 1)))
+
+    writer = _Writer(download_directory)
+    concords = []
+    chebi_ids = []
+    with open(os.path.join(root, CLIQUES_FILENAME), "w") as cliquesf:
+        for _ in range(clique_count):
+            if rng.random() < SMALL_MOLECULE_FRACTION:
+                node_type = SMALL_MOLECULE
+                name = _iupac_name(rng)
+                identifiers = [ids[PUBCHEMCOMPOUND].next(rng) for _ in range(_tail(rng, 2.0, 40))]
+                if rng.random() < 0.4:
+                    identifiers.append(ids[CHEBI].next(rng))
+                    chebi_ids.append(identifiers[-1])
+                for prefix, probability in ((MESH, 0.2), (UMLS, 0.25)):
+                    if rng.random() < probability:
+                        identifiers.append(ids[prefix].next(rng))
+                for curie in identifiers:
+                    # CHEBI has shorter common names; the others mostly reuse the IUPAC name.
+                    label = _common_name(rng) if curie.startswith(CHEBI) or rng.random() < 0.3 else name
+                    _describe_identifier(rng, writer, curie, label, 1.1 if curie.startswith(UMLS) else 1.5)
+            else:
+                node_type = PROTEIN
+                name = _protein_name(rng)
+                taxon = rng.choices(taxa, cum_weights=taxon_cum_weights)[0]
+                identifiers = [ids[UNIPROTKB].next(rng) for _ in range(_tail(rng, 4.0, 5))]
+                if rng.random() < 0.15:
+                    identifiers.append(ids[UMLS].next(rng))
+                for curie in identifiers:
+                    taxon_for_curie = taxon if curie.startswith(UNIPROTKB) else None
+                    _describe_identifier(rng, writer, curie, name, 2.5, taxa=taxon_for_curie)
+
+            rng.shuffle(identifiers)
+            cliquesf.write(json.dumps({"type": node_type, "identifiers": identifiers}) + "\n")
+            # A random spanning tree of the clique, plus the odd redundant edge, as concords usually have.
+            for i in range(1, len(identifiers)):
+                concords.append((identifiers[rng.randrange(i)], identifiers[i]))
+            if len(identifiers) > 2 and rng.random() < 0.1:
+                concords.append(tuple(rng.sample(identifiers, 2)))
+    writer.close()
+
+    rng.shuffle(concords)
+    with open(os.path.join(root, CONCORDS_FILENAME), "w") as outf:
+        for subject, obj in concords:
+            outf.write(f"{subject}\toboInOwl:hasDbXref\t{obj}\n")
+
+    _write_common_files(download_directory)
+    _write_information_content(rng, dataset, chebi_ids)
+    for prefix in ids:
+        for kind in (LABELS, SYNONYMS):
+            filename = os.path.join(download_directory, prefix, kind)
+            if os.path.exists(filename):
+                build_index(filename, index_filename(filename), kind)
+
+    with open(os.path.join(root, MANIFEST_FILENAME), "w") as outf:
+        json.dump({"generator_version": GENERATOR_VERSION, "seed": seed, "clique_count": clique_count}, outf)
+    logger.info(f"Generated {clique_count:,} synthetic cliques and {len(concords):,} concords in {root}")
+    return dataset
+
+
+def _write_common_files(download_directory):
+    """Write the (empty) common label, synonym and description files that the factories expect."""
+    common_dir = os.path.join(download_directory, "common", "ubergraph")
+    os.makedirs(common_dir, exist_ok=True)
+    for filename in ("labels", "synonyms.jsonl", "descriptions.jsonl"):
+        open(os.path.join(common_dir, filename), "w").close()
+
+
+def _write_information_content(rng, dataset, chebi_ids):
+    """Write an icRDF.tsv covering the CHEBI identifiers, and compile it as the pipeline does."""
+    with open(dataset.icrdf_filename, "w") as outf:
+        for curie in chebi_ids:
+            outf.write(f"{IC_IRI_STEM}{curie.split(':', 1)[1]}\t{rng.uniform(20, 100):.3f}\n")
+    converter = curies.Converter.from_prefix_map({CHEBI: IC_IRI_STEM})
+    compile_information_content(dataset.icrdf_filename, converters=[converter])
+
+
+def load_or_generate(root: str, clique_count: int, seed: int = 0) -> SyntheticDataset:
+    """Return the dataset in root if it was generated with these parameters, or generate it there."""
+    try:
+        with open(os.path.join(root, MANIFEST_FILENAME)) as inf:
+            manifest = json.load(inf)
+    except (OSError, ValueError):
+        manifest = None
+    if manifest == {"generator_version": GENERATOR_VERSION, "seed": seed, "clique_count": clique_count}:
+        logger.info(f"Reusing the synthetic dataset in {root}")
+        return SyntheticDataset(root, seed, clique_count)
+    return generate(root, clique_count, seed)
@@ -0,0 +1,193 @@
+"""Memory-mapped CURIE → clique indexes of the compendia, for the conflation builders.
+
+``drugchemical.build_conflation()`` used to parse every chemical compendium into three dicts
+(preferred CURIE, type and clique members for every CURIE) and then parse them all again to find
+the cliques containing an RxCUI, and ``geneprotein.build_conflation()`` built a set of every Gene
+and Protein CURIE: tens of GB of Python objects, rebuilt on every run. Instead, the ``compendium_index``
+Snakemake rule writes an index of each compendium those rules read (see :func:`compendium_index_filename`),
+and the conflation builders look CURIEs up in those with a :class:`CompendiumIndex`.
+
+A compendium index is a :class:`src.synonyms.label_index.SortedStringIndex` of ``RECORDS``, with
+one record for every identifier in the compendium::
+
+    CURIE <TAB> clique leader <TAB> clique type [<TAB> clique identifiers...]
+
+The identifiers of the clique are only recorded for its leader. If there is no index for a
+compendium, or it is older than the compendium, :class:`CompendiumIndex` builds one in a temporary
+directory instead, so the conflation builders still work on compendia written without one.
+"""
+
+import contextlib
+import heapq
+import itertools
+import json
+import os
+import tempfile
+from collections.abc import Iterator, Mapping
+from typing import NamedTuple
+
+from src.external_sort import DEFAULT_CHUNK_SIZE
+from src.synonyms.label_index import INDEX_SUFFIX, RECORDS, SortedStringIndex, build_index
+from src.util import get_logger
+
+logger = get_logger(__name__)
+
+# Compendium indexes are kept out of the compendia directory, which is checked to only contain compendia.
+COMPENDIUM_INDEX_DIRNAME = "compendium_index"
+
+
+class CliqueRef(NamedTuple):
+    """The clique a CURIE belongs to: its leader (preferred CURIE), its Biolink type and the compendium it is in."""
+
+    leader: str
+    type: str
+    compendium: str
+
+
+class Clique(NamedTuple):
+    """A clique looked up by its leader, with all of its identifiers in compendium order."""
+
+    leader: str
+    type: str
+    compendium: str
+    identifiers: list[str]
+
+
+def compendium_index_filename(compendium_filename: str) -> str:
+    """Return the path of the index of a compendium written to ``{output_directory}/compendia/``.
+
+    :param compendium_filename: The compendium, e.g. ``babel_outputs/compendia/Gene.txt``.
+    :return: Its index, e.g. ``babel_outputs/compendium_index/Gene.txt.idx``.
+    """
+    compendium_filename = os.path.abspath(compendium_filename)
+    output_directory = os.path.dirname(os.path.dirname(compendium_filename))
+    return os.path.join(
+        output_directory, COMPENDIUM_INDEX_DIRNAME, os.path.basename(compendium_filename) + INDEX_SUFFIX
+    )
+
+
+def build_compendium_index(
+    compendium_filename: str, output_filename: str | None = None, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> int:
+    """Index every identifier in a compendium by the leader and type of its clique.
+
+    :param compendium_filename: The compendium JSONL file to index.
+    :param output_filename: Where to write the index. Defaults to :func:`compendium_index_filename`.
+    :param chunk_size: The number of records to sort in memory before spilling to disk.
+    :return: The number of distinct CURIEs in the index.
+    """
+    if output_filename is None:
+        output_filename = compendium_index_filename(compendium_filename)
+    output_dir = os.path.dirname(os.path.abspath(output_filename))
+    os.makedirs(output_dir, exist_ok=True)
+
+    with tempfile.TemporaryDirectory(dir=output_dir, prefix=".compendium_index-") as tmp_dir:
+        records_filename = os.path.join(tmp_dir, "records.tsv")
+        with open(compendium_filename) as inf, open(records_filename, "w") as records:
+            for line in inf:
+                clique = json.loads(line)
+                identifiers = [ident["i"] for ident in clique["identifiers"]]
+                if not identifiers:
+                    continue
+                leader = identifiers[0]
+                clique_type = clique["type"]
+                records.write(f"{leader}\t{leader}\t{clique_type}\t" + "\t".join(identifiers) + "\n")
+                for curie in identifiers[1:]:
+                    records.write(f"{curie}\t{leader}\t{clique_type}\n")
+        return build_index(records_filename, output_filename, RECORDS, chunk_size=chunk_size)
+
+
+class CompendiumIndex:
+    """Look CURIEs up in the indexes of one or more compendia.
+
+    A CURIE that is in more than one of the compendia is looked up in the last of them that has it,
+    as if the compendia had been loaded into one dict in order.
+    """
+
+    def __init__(self, compendium_filenames: list[str]):
+        self.compendium_filenames = list(compendium_filenames)
+        self._stack = contextlib.ExitStack()
+        self._indexes = []
+        tmp_dir = None
+        for compendium_filename in self.compendium_filenames:
+            index_filename = compendium_index_filename(compendium_filename)
+            if not os.path.exists(index_filename):
+                logger.warning(f"No index for {compendium_filename} in {index_filename}, building one.")
+                index_filename = None
+            elif os.path.getmtime(index_filename) < os.path.getmtime(compendium_filename):
+                logger.warning(f"Ignoring {index_filename}: it is older than {compendium_filename}, building one.")
+                index_filename = None
+            if index_filename is None:
+                if tmp_dir is None:
+                    tmp_dir = self._stack.enter_context(tempfile.TemporaryDirectory(prefix="compendium_index-"))
+                index_filename = os.path.join(tmp_dir, f"{len(self._indexes)}{INDEX_SUFFIX}")
+                build_compendium_index(compendium_filename, index_filename)
+            index = SortedStringIndex(index_filename)
+            self._stack.callback(index.close)
+            self._indexes.append((os.path.basename(compendium_filename), index))
+            logger.info(f"Opened {len(index):,} CURIEs of {compendium_filename} from {index.filename}")
+
+    def _records(self, curie: str) -> Iterator[tuple[str, list[str]]]:
+        """Yield the compendium name and record fields for a CURIE from each compendium that has it, last first."""
+        for compendium, index in reversed(self._indexes):
+            values = index.get(curie)
+            if values is not None:
+                # Within a compendium, the last record for a CURIE wins.
+                yield compendium, values[-1].split("\t")
+
+    def get(self, curie: str) -> CliqueRef | None:
+        """Return the clique a CURIE belongs to, or None if it isn't in any of the compendia."""
+        for compendium, fields in self._records(curie):
+            return CliqueRef(fields[0], fields[1], compendium)
+        return None
+
+    def get_clique(self, leader: str) -> Clique | None:
+        """Return the clique that a CURIE is the leader of, or None if it doesn't lead a clique in any of the compendia."""
+        for compendium, fields in self._records(leader):
+            if len(fields) > 2:
+                return Clique(fields[0], fields[1], compendium, fields[2:])
+        return None
+
+    def __contains__(self, curie) -> bool:
+        return isinstance(curie, str) and any(curie in index for _, index in self._indexes)
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over every CURIE in the compendia once, in sorted order."""
+        curies = heapq.merge(*(iter(index) for _, index in self._indexes))
+        return (curie for curie, _ in itertools.groupby(curies))
+
+    def preferred_curies(self) -> "IndexedPreferredCuries":
+        """Return a read-only ``{curie: leader}`` mapping over these compendia."""
+        return IndexedPreferredCuries(self)
+
+    def close(self):
+        """Release the indexes and remove any that were built in a temporary directory."""
+        self._stack.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class IndexedPreferredCuries(Mapping):
+    """The ``{curie: preferred curie}`` dict that used to be loaded from the compendia, backed by a CompendiumIndex."""
+
+    def __init__(self, index: CompendiumIndex):
+        self.index = index
+
+    def __getitem__(self, curie: str) -> str:
+        ref = self.index.get(curie) if isinstance(curie, str) else None
+        if ref is None:
+            raise KeyError(curie)
+        return ref.leader
+
+    def __contains__(self, curie) -> bool:
+        return curie in self.index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.index)
+
+    def __len__(self):
+        return sum(1 for _ in self.index)
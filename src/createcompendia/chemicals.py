@@ -1,7 +1,9 @@
-import ast
 import gzip
 import logging
+import multiprocessing
+import tempfile
 from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
 import jsonlines
 import requests
@@ -28,7 +30,9 @@ from src.categories import (
 from src.datahandlers.unichem import UNICHEM_REFERENCE_TSV_HEADER, UNICHEM_STRUCT_TSV_HEADER
 from src.datahandlers.unichem import data_sources as unichem_data_sources
 from src.datahandlers.unii import UNII_ORGANISM_COLUMNS, read_unii_records
+from src.external_sort import DEFAULT_CHUNK_SIZE, ExternalSorter
 from src.metadata.provenance import write_combined_metadata, write_concord_metadata
+from src.model.clique_file import read_cliques, write_cliques
 from src.prefixes import (
     CHEBI,
     CHEMBLCOMPOUND,
@@ -492,60 +496,174 @@ def write_gtopdb_ids(infile, outfile):
     parse_smifile(infile, outfile, '"SMILES"', '"Ligand ID"', GTOPDB, stripquotes=True)
 
 
-def write_unichem_concords(structfile, reffile, outdir):
-    inchikeys = read_inchikeys(structfile)
+class _NotInUciOrder(Exception):
+    """Raised by _in_uci_order() when a UniChem file turns out not to be sorted by UCI."""
+
+
+def _in_uci_order(records, filename):
+    """Pass through (uci, ...) records, raising _NotInUciOrder as soon as a UCI is lower than the one before it."""
+    previous = -1
+    for record in records:
+        if record[0] < previous:
+            raise _NotInUciOrder(f"{filename} is not sorted by UCI ({record[0]} follows {previous})")
+        previous = record[0]
+        yield record
+
+
+def _merge_join_inchikeys(references, inchikeys, reffile):
+    """Merge-join (uci, reference) records with (uci, InChIKey CURIE) records, both sorted by UCI.
+
+    Yields a (reference, InChIKey CURIE) tuple per reference, in the order of the references. If a UCI is listed
+    more than once in the structure file, its last InChIKey wins, as it did in the dict this join replaced.
+    """
+    inchikeys = iter(inchikeys)
+    current_uci, current_inchikey = None, None
+    pending = next(inchikeys, None)
+    for uci, reference in references:
+        while pending is not None and pending[0] <= uci:
+            current_uci, current_inchikey = pending
+            pending = next(inchikeys, None)
+        if current_uci != uci:
+            raise KeyError(f"UCI {uci} in {reffile} is not in the UniChem structure file")
+        yield reference, current_inchikey
+
+
+def read_unichem_references(reffile):
+    """Yield a (uci, src_id, compound_id) tuple for each row of the filtered UniChem reference file, in file order.
+
+    Every row must be a current assignment, and a compound ID that embeds its own source's prefix (e.g. CHEBI's
+    "CHEBI:12345") has it stripped, with a warning once per source.
+    """
+    double_prefix_warned = set()  # sources where we already logged the strip-warning
+    with open(reffile) as inf:
+        header_line = inf.readline()
+        assert header_line == UNICHEM_REFERENCE_TSV_HEADER, f"Incorrect header line in {reffile}: {header_line}"
+        for line in inf:
+            x = line.rstrip().split("\t")
+            src_id = x[1]
+            compound_id = x[2]
+            expected_prefix = unichem_data_sources[src_id]
+            assert x[3] == "1", (  # Only '1' (current) assignments should be in this file
+                f"Expected assignment '1' (current) but got {x[3]!r} for src_id={src_id!r}, "
+                f"compound_id={compound_id!r}; filter_unichem should have excluded non-current rows "
+                f"(see https://chembl.gitbook.io/unichem/definitions/what-is-an-assignment)"
+            )
+
+            # Guard against UniChem embedding the prefix inside the compound ID.
+            # e.g. CHEBI source stores "CHEBI:12345" instead of bare "12345".
+            if ":" in compound_id:
+                embedded_prefix, bare_id = compound_id.split(":", 1)
+                if embedded_prefix == expected_prefix:
+                    # Double prefix — strip the embedded one and warn once per source.
+                    if src_id not in double_prefix_warned:
+                        logger.warning(
+                            f"UniChem source {src_id} ({expected_prefix}): compound ID already contains "
+                            f"the prefix (e.g. {compound_id!r}). Stripping embedded prefix. "
+                            f"Consider reporting this to UniChem."
+                        )
+                        double_prefix_warned.add(src_id)
+                    compound_id = bare_id
+                else:
+                    raise ValueError(
+                        f"UniChem source {src_id} ({expected_prefix}): compound ID {compound_id!r} "
+                        f"contains an unexpected embedded prefix {embedded_prefix!r}. "
+                        f"Expected either a bare ID or one prefixed with {expected_prefix!r}. "
+                        f"Update unichem_data_sources in src/datahandlers/unichem.py if this source "
+                        f"has changed its identifier scheme."
+                    )
+
+            yield int(x[0]), src_id, compound_id
+
+
+def read_inchikeys(struct_file):
+    """Yield a (uci, InChIKey CURIE) tuple for each row of the gzipped UniChem structure file, in file order."""
+    # struct header [0'uci', 1'standardinchi', 2'standardinchikey'],
+    with gzip.open(struct_file, "rt") as inf:
+        header_line = inf.readline()
+        assert header_line == UNICHEM_STRUCT_TSV_HEADER, f"Unexpected header line in {struct_file}: {header_line}"
+        for sline in inf:
+            line = sline.rstrip().split("\t")
+            if len(line) == 0:
+                continue
+            yield int(line[0]), f"{INCHIKEY}:{line[2]}"
+
+
+def _join_unichem_in_file_order(structfile, reffile):
+    """Join the reference and structure files on UCI in one streaming pass, if both are already sorted by UCI.
+
+    UniChem publishes both files in UCI order, so this is the usual case; _NotInUciOrder is raised otherwise. A UCI
+    missing from the structure file raises it too, since an unsorted structure file could still list it further on.
+    """
+    references = (
+        (uci, (src_id, compound_id))
+        for uci, src_id, compound_id in _in_uci_order(read_unichem_references(reffile), reffile)
+    )
+    inchikeys = _in_uci_order(read_inchikeys(structfile), structfile)
+    try:
+        for (src_id, compound_id), inchikey in _merge_join_inchikeys(references, inchikeys, reffile):
+            yield src_id, compound_id, inchikey
+    except KeyError as e:
+        raise _NotInUciOrder(e.args[0]) from e
+
+
+def _join_unichem_out_of_core(structfile, reffile, tmp_dir, chunk_size):
+    """Join the reference and structure files on UCI by sorting both on disk, then restore the reference order."""
+    inchikeys = ExternalSorter(tmp_dir, chunk_size, key_type=int)
+    for uci, inchikey in read_inchikeys(structfile):
+        inchikeys.add(uci, inchikey)
+    references = ExternalSorter(tmp_dir, chunk_size, key_type=int)
+    for line_num, (uci, src_id, compound_id) in enumerate(read_unichem_references(reffile)):
+        references.add(uci, f"{line_num}\t{src_id}\t{compound_id}")
+    logger.info(f"Sorted {len(inchikeys):,} InChIKeys and {len(references):,} references: {get_memory_usage_summary()}")
+
+    joined = ExternalSorter(tmp_dir, chunk_size, key_type=int)
+    for reference, inchikey in _merge_join_inchikeys(references.sorted(), inchikeys.sorted(), reffile):
+        line_num, src_id, compound_id = reference.split("\t")
+        joined.add(int(line_num), f"{src_id}\t{compound_id}\t{inchikey}")
+    for _, row in joined.sorted():
+        yield row.split("\t")
+
+
+def _write_unichem_concord_files(joined_rows, outdir):
+    """Write each (src_id, compound_id, InChIKey CURIE) row to its source's concord file, returning the row counts."""
     concfiles = {}
     row_counts = {}
-    double_prefix_warned = set()  # sources where we already logged the strip-warning
     for num, name in unichem_data_sources.items():
         concname = f"{outdir}/UNICHEM_{name}"
         print(concname)
         concfiles[num] = open(concname, "w")
         row_counts[num] = 0
     try:
-        with open(reffile) as inf:
-            header_line = inf.readline()
-            assert header_line == UNICHEM_REFERENCE_TSV_HEADER, f"Incorrect header line in {reffile}: {header_line}"
-            for line in inf:
-                x = line.rstrip().split("\t")
-                src_id = x[1]
-                compound_id = x[2]
-                expected_prefix = unichem_data_sources[src_id]
-                outf = concfiles[src_id]
-                assert x[3] == "1", (  # Only '1' (current) assignments should be in this file
-                    f"Expected assignment '1' (current) but got {x[3]!r} for src_id={src_id!r}, "
-                    f"compound_id={compound_id!r}; filter_unichem should have excluded non-current rows "
-                    f"(see https://chembl.gitbook.io/unichem/definitions/what-is-an-assignment)"
-                )
-
-                # Guard against UniChem embedding the prefix inside the compound ID.
-                # e.g. CHEBI source stores "CHEBI:12345" instead of bare "12345".
-                if ":" in compound_id:
-                    embedded_prefix, bare_id = compound_id.split(":", 1)
-                    if embedded_prefix == expected_prefix:
-                        # Double prefix — strip the embedded one and warn once per source.
-                        if src_id not in double_prefix_warned:
-                            logger.warning(
-                                f"UniChem source {src_id} ({expected_prefix}): compound ID already contains "
-                                f"the prefix (e.g. {compound_id!r}). Stripping embedded prefix. "
-                                f"Consider reporting this to UniChem."
-                            )
-                            double_prefix_warned.add(src_id)
-                        compound_id = bare_id
-                    else:
-                        raise ValueError(
-                            f"UniChem source {src_id} ({expected_prefix}): compound ID {compound_id!r} "
-                            f"contains an unexpected embedded prefix {embedded_prefix!r}. "
-                            f"Expected either a bare ID or one prefixed with {expected_prefix!r}. "
-                            f"Update unichem_data_sources in src/datahandlers/unichem.py if this source "
-                            f"has changed its identifier scheme."
-                        )
-
-                outf.write(f"{expected_prefix}:{compound_id}\toio:equivalent\t{inchikeys[x[0]]}\n")
-                row_counts[src_id] += 1
+        for src_id, compound_id, inchikey in joined_rows:
+            concfiles[src_id].write(f"{unichem_data_sources[src_id]}:{compound_id}\toio:equivalent\t{inchikey}\n")
+            row_counts[src_id] += 1
     finally:
         for outf in concfiles.values():
             outf.close()
+    return row_counts
+
+
+def write_unichem_concords(structfile, reffile, outdir, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Write a UNICHEM_<source> concord file for each UniChem source, pairing its compounds with their InChIKeys.
+
+    The reference file's rows are joined to the structure file's InChIKeys on UCI. Both files have hundreds of
+    millions of rows, so rather than holding a dict of every UCI, they are merge-joined: in one pass when both are
+    already sorted by UCI, and otherwise by sorting them on disk with ExternalSorter. Either way, each concord
+    file lists its rows in reference file order.
+
+    :param structfile: The gzipped UniChem structure file.
+    :param reffile: The UniChem reference file, filtered by filter_unichem().
+    :param outdir: The directory to write the concord files to.
+    :param chunk_size: The number of records ExternalSorter sorts in memory at a time, if the files need sorting.
+    """
+    try:
+        row_counts = _write_unichem_concord_files(_join_unichem_in_file_order(structfile, reffile), outdir)
+    except _NotInUciOrder as e:
+        logger.info(f"{e}: joining the UniChem files by sorting them on disk instead.")
+        with tempfile.TemporaryDirectory(dir=outdir) as tmp_dir:
+            row_counts = _write_unichem_concord_files(
+                _join_unichem_out_of_core(structfile, reffile, tmp_dir, chunk_size), outdir
+            )
 
     empty_sources = [(num, unichem_data_sources[num]) for num, count in row_counts.items() if count == 0]
     if empty_sources:
@@ -559,60 +677,97 @@ def write_unichem_concords(structfile, reffile, outdir):
         )
 
 
-def read_inchikeys(struct_file):
-    # struct header [0'uci', 1'standardinchi', 2'standardinchikey'],
-    inchikeys = {}
-    with gzip.open(struct_file, "rt") as inf:
-        header_line = inf.readline()
-        assert header_line == UNICHEM_STRUCT_TSV_HEADER, f"Unexpected header line in {struct_file}: {header_line}"
-        for sline in inf:
-            line = sline.rstrip().split("\t")
-            if len(line) == 0:
-                continue
-            uci = line[0]
-            inchikeys[uci] = f"{INCHIKEY}:{line[2]}"
-    return inchikeys
+# UniChem sources whose xrefs to an InChIKey shared by more than one of their compounds are dropped.
+UNICHEM_PREFIXES_TO_REMOVE_OVERUSED_XREFS = [UNII, KEGGCOMPOUND, DRUGCENTRAL]
 
 
-def combine_unichem(concordances, output):
-    PREFIXES_TO_REMOVE_OVERUSED_XREFS = [UNII, KEGGCOMPOUND, DRUGCENTRAL]
+def glom_unichem_concord(infile):
+    """Glom the pairs of one UNICHEM_<source> concord on their own, for combine_unichem().
 
-    dicts = {}
-    for infile in concordances:
-        print(infile)
-        print("loading", infile)
-        pairs = []
+    :param infile: A concord written by write_unichem_concords().
+    :return: A (prefix, components) tuple: the source's prefix, and the cliques its pairs glom into.
+    """
+    logger.info(f"Loading {infile}")
+    pairs = []
 
-        # We will want to only remove overused xrefs for specific prefixes.
-        # UniChem files should only have a single prefix in the first column,
-        # but out of paranoia we'll double-check that.
-        prefixes_in_file = set()
+    # We will want to only remove overused xrefs for specific prefixes.
+    # UniChem files should only have a single prefix in the first column,
+    # but out of paranoia we'll double-check that.
+    prefixes_in_file = set()
 
-        with open(infile) as inf:
-            for line in inf:
-                x = line.strip().split("\t")
-                pairs.append([x[0], x[2]])
-                # Get the prefix from the first row to determine if we need to remove overused xrefs
-                prefixes_in_file.add(Text.get_prefix(x[0]))
+    with open(infile) as inf:
+        for line in inf:
+            x = line.strip().split("\t")
+            pairs.append([x[0], x[2]])
+            # Get the prefix from the first row to determine if we need to remove overused xrefs
+            prefixes_in_file.add(Text.get_prefix(x[0]))
 
-        # Was there exactly one prefix in the first column?
-        if len(prefixes_in_file) == 0:
-            raise RuntimeError(
-                f"No prefixes found in {infile} (file may be empty or have no valid CURIE in column 1). All UNICHEM files should have exactly one prefix."
-            )
-        if len(prefixes_in_file) > 1:
-            raise RuntimeError(
-                f"Multiple prefixes found in {infile}: {prefixes_in_file}. All UNICHEM files should have exactly one prefix."
-            )
-        prefix_to_check = prefixes_in_file.pop()
+    # Was there exactly one prefix in the first column?
+    if len(prefixes_in_file) == 0:
+        raise RuntimeError(
+            f"No prefixes found in {infile} (file may be empty or have no valid CURIE in column 1). All UNICHEM files should have exactly one prefix."
+        )
+    if len(prefixes_in_file) > 1:
+        raise RuntimeError(
+            f"Multiple prefixes found in {infile}: {prefixes_in_file}. All UNICHEM files should have exactly one prefix."
+        )
+    prefix_to_check = prefixes_in_file.pop()
 
-        # Only remove overused xrefs for specific prefixes
-        newpairs = pairs
-        if prefix_to_check in PREFIXES_TO_REMOVE_OVERUSED_XREFS:
-            newpairs = remove_overused_xrefs(pairs)
-        setpairs = [set(x) for x in newpairs]
-        glom(dicts, setpairs, unique_prefixes=[INCHIKEY])
+    # Only remove overused xrefs for specific prefixes
+    newpairs = pairs
+    if prefix_to_check in UNICHEM_PREFIXES_TO_REMOVE_OVERUSED_XREFS:
+        newpairs = remove_overused_xrefs(pairs)
+    setpairs = [set(x) for x in newpairs]
+    dicts = {}
+    glom(dicts, setpairs, unique_prefixes=[INCHIKEY])
+    components = set([frozenset(x) for x in dicts.values()])
+    logger.info(f"Glommed {len(setpairs):,} pairs from {infile} into {len(components):,} components")
+    return prefix_to_check, components
+
+
+def combine_unichem(concordances, output, workers=1):
+    """Glom the UNICHEM_<source> concords into the partial UniChem cliques.
+
+    Each concord is filtered and glommed into its own components by glom_unichem_concord(), in a pool of `workers`
+    processes, and the components are then glommed together in concordance order with the same INCHIKEY
+    unique-prefix rule. That gives the same cliques as glomming every concord's pairs into one dict in turn, as
+    this used to: every pair joins a source CURIE to an InChIKey, and each source has its own prefix, so a
+    source CURIE only ever meets pairs from its own concord. Whether one of its pairs is rejected therefore only
+    depends on the InChIKey its earlier pairs in the same concord attached it to, and every component holds at
+    most one InChIKey, so gluing the components together never rejects anything.
+
+    :param concordances: The UNICHEM_<source> concords written by write_unichem_concords().
+    :param output: The JSONL file to write the cliques to.
+    :param workers: The number of worker processes to glom concords in.
+    """
+    if workers > 1:
+        logger.info(f"Glomming {len(concordances)} UniChem concords over {workers} worker processes")
+        # Spawn rather than fork, as write_compendium() does, so workers don't inherit the caller's state.
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = list(pool.map(glom_unichem_concord, concordances))
+    else:
+        results = [glom_unichem_concord(infile) for infile in concordances]
+
+    # The argument above needs every concord to have a different prefix.
+    concordances_for_prefix = defaultdict(list)
+    for infile, (prefix, _) in zip(concordances, results):
+        concordances_for_prefix[prefix].append(infile)
+    shared = {prefix: files for prefix, files in concordances_for_prefix.items() if len(files) > 1}
+    if shared:
+        raise RuntimeError(f"UNICHEM concords share a prefix, so they can't be glommed separately: {shared}")
+
+    dicts = {}
+    for _, components in results:
+        groups = []
+        for component in components:
+            first, *others = component
+            if others:
+                groups.extend([first, other] for other in others)
+            else:
+                groups.append([first])
+        glom(dicts, groups, unique_prefixes=[INCHIKEY])
     chem_sets = set([frozenset(x) for x in dicts.values()])
+    logger.info(f"Combined the UniChem concords into {len(chem_sets):,} cliques: {get_memory_usage_summary()}")
     with jsonlines.open(output, mode="w") as writer:
         for chemset in chem_sets:
             writer.write(list(chemset))
@@ -828,7 +983,7 @@ def read_chebi_lookup_ids(lookup_tsv, wanted_names=None):
     return ids_by_name
 
 
-def check_chebi_sdf_keys(chebi_sdf_dat, sdf):
+def check_chebi_sdf_keys(keys_seen, sdf):
     """
     Fail if any tag make_chebi_relations() reads is absent from every entry of the ChEBI SDF.
 
@@ -841,14 +996,10 @@ def check_chebi_sdf_keys(chebi_sdf_dat, sdf):
     Checking key presence rather than merely "did we write a non-zero number of rows" means the
     error names the tag that vanished, which is the part that takes the time to work out.
 
-    :param chebi_sdf_dat: The parsed SDF, as returned by read_sdf().
+    :param keys_seen: Every key read_sdf() returned for any entry of the SDF.
     :param sdf: The SDF filename, for the error message.
     :raise ValueError: If any key in CHEBI_SDF_KEYS appears in no entry at all.
     """
-    keys_seen = set()
-    for props in chebi_sdf_dat.values():
-        keys_seen.update(props.keys())
-
     missing = CHEBI_SDF_KEYS - keys_seen
     if missing:
         raise ValueError(
@@ -864,19 +1015,12 @@ def make_chebi_relations(sdf, dbx, dbx_source, dbx_status, outfile, propfile_gz,
     links in that case, so we will use both the structured and unstructured chemical entries."""
     # THE SDF and XREF stuff are handled in the same function because knowing what we found in the SDF impacts
     # what we want to get out of the xrefs. But the function is quite unwieldy
-    # READ SDF
-    chebi_sdf_dat = read_sdf(sdf, CHEBI_SDF_KEYS)
-    check_chebi_sdf_keys(chebi_sdf_dat, sdf)
-    # CHEBIs in the sdf by definition have structure (the sdf is a structure file)
-    structured_chebi = set(chebi_sdf_dat.keys())
     # READ xrefs
     dbx_prefixes_by_source_id = {
         source_id: CHEBI_DBX_SOURCE_NAMES[name]
         for source_id, name in read_chebi_lookup_ids(dbx_source, set(CHEBI_DBX_SOURCE_NAMES)).items()
     }
     dbx_accepted_status_ids = set(read_chebi_lookup_ids(dbx_status, CHEBI_DBX_ACCEPTED_STATUSES))
-    with open(dbx) as inf:
-        dbxdata = inf.read()
     kk = CHEBI_SDF_KEY_KEGG
     pk = CHEBI_SDF_KEY_PUBCHEM
     secondary_chebi_id = CHEBI_SDF_KEY_SECONDARY_ID
@@ -894,9 +1038,17 @@ def make_chebi_relations(sdf, dbx, dbx_source, dbx_status, outfile, propfile_gz,
     # the SDF's ~197,000 xrefs kept any whole-output guard quiet.
     dbx_key = "database_accession.tsv"
 
+    # CHEBIs in the sdf by definition have structure (the sdf is a structure file). The SDF and the xrefs are both
+    # streamed, so these two sets (and read_sdf()'s count of each ChEBI ID, which it uses to yield a repeated ID only
+    # once) are all that is kept of the SDF.
+    structured_chebi = set()
+    sdf_keys_seen = set()
+
     with open(outfile, "w") as outf, gzip.open(propfile_gz, "wt") as propf:
         # Write SDF structured things
-        for cid, props in chebi_sdf_dat.items():
+        for cid, props in read_sdf(sdf, CHEBI_SDF_KEYS):
+            structured_chebi.add(cid)
+            sdf_keys_seen.update(props.keys())
             if secondary_chebi_id in props:
                 # SECONDARY_ID holds already-prefixed CURIEs, semicolon-delimited on one line, e.g.
                 # CHEBI:421707 "abacavir" carries
@@ -925,28 +1077,31 @@ def make_chebi_relations(sdf, dbx, dbx_source, dbx_status, outfile, propfile_gz,
                 for pubchem_id in split_chebi_sdf_values(props[pk]):
                     outf.write(f"{cid}\txref\t{PUBCHEMCOMPOUND}:{pubchem_id}\n")
                     counts[pk] += 1
+        check_chebi_sdf_keys(sdf_keys_seen, sdf)
+
         # DO THE xref stuff
         # database_accession.tsv columns: id, compound_id, accession_number, type, status_id,
         # source_id. Type, source and status must all match: on a CAS row the accession belongs to
         # CAS rather than to the source that supplied it, and SUBMITTED rows are unreviewed depositor
         # claims. See CHEBI_DBX_SOURCE_NAMES above.
-        lines = dbxdata.split("\n")
-        for line in lines[1:]:
-            x = line.strip().split("\t")
-            if len(x) < 6:
-                continue
-            if x[3] != CHEBI_DBX_ACCESSION_TYPE:
-                continue
-            if x[4] not in dbx_accepted_status_ids:
-                continue
-            prefix = dbx_prefixes_by_source_id.get(x[5])
-            if prefix is None:
-                continue
-            cid = f"{CHEBI}:{x[1]}"
-            if cid in structured_chebi:
-                continue
-            outf.write(f"{cid}\txref\t{prefix}:{x[2]}\n")
-            counts[dbx_key] += 1
+        with open(dbx) as inf:
+            inf.readline()  # Skip the header.
+            for line in inf:
+                x = line.strip().split("\t")
+                if len(x) < 6:
+                    continue
+                if x[3] != CHEBI_DBX_ACCESSION_TYPE:
+                    continue
+                if x[4] not in dbx_accepted_status_ids:
+                    continue
+                prefix = dbx_prefixes_by_source_id.get(x[5])
+                if prefix is None:
+                    continue
+                cid = f"{CHEBI}:{x[1]}"
+                if cid in structured_chebi:
+                    continue
+                outf.write(f"{cid}\txref\t{prefix}:{x[2]}\n")
+                counts[dbx_key] += 1
 
     # Backstop to check_chebi_sdf_keys(): that catches a renamed SDF tag, this catches the failures
     # a tag name cannot show -- a changed value format, a truncated download, a parse bug. ChEBI
@@ -1108,9 +1263,7 @@ def build_untyped_compendia(
         for x, y in types.items():
             outf.write(f"{x}\t{y}\n")
     untyped_sets = set([frozenset(x) for x in dicts.values()])
-    with open(untyped_concord, "w") as outf:
-        for s in untyped_sets:
-            outf.write(f"{set(s)}\n")
+    write_cliques(untyped_concord, untyped_sets)
 
     # Build the metadata file by combining the input metadata_yamls.
     write_combined_metadata(
@@ -1131,6 +1284,7 @@ def build_compendia(
     metadata_yamls,
     icrdf_filename,
     food_type_files,
+    workers=None,
 ):
     types = {}
     with open(type_file) as inf:
@@ -1161,11 +1315,7 @@ def build_compendia(
             f"chemical_type_order, so they cannot be ranked against a clique's voted type: {sorted(unrankable)}"
         )
 
-    untyped_sets = set()
-    with open(untyped_compendia_file) as inf:
-        for line in inf:
-            s = ast.literal_eval(line.strip())
-            untyped_sets.add(frozenset(s))
+    untyped_sets = set(read_cliques(untyped_compendia_file))
     logger.info(f"Loaded {len(untyped_sets)} untyped sets from {untyped_compendia_file}: {get_memory_usage_summary()}")
 
     typed_sets = create_typed_sets(untyped_sets, types, food_types)
@@ -1185,6 +1335,7 @@ def build_compendia(
                 extra_prefixes=[MESH, UNII],
                 icrdf_filename=icrdf_filename,
                 properties_jsonl_gz_files=properties_jsonl_gz_files,
+                workers=workers,
             )
         else:
             write_compendium(
@@ -1196,6 +1347,7 @@ def build_compendia(
                 extra_prefixes=[RXCUI],
                 icrdf_filename=icrdf_filename,
                 properties_jsonl_gz_files=properties_jsonl_gz_files,
+                workers=workers,
             )
 
 
@@ -1,15 +1,19 @@
+import contextlib
 import csv
 import json
 import logging
 import sys
 import time
 from collections import defaultdict
+from collections.abc import Mapping
 
 import jsonlines
 from humanfriendly import format_timespan
 
 from src.babel_utils import get_numerical_curie_suffix, glom
 from src.categories import CHEMICAL_ENTITY
+from src.compendium_index import CompendiumIndex
+from src.datahandlers.rrf import read_rrf
 from src.metadata.provenance import write_combined_metadata, write_concord_metadata
 from src.node import InformationContentFactory
 from src.prefixes import PUBCHEMCOMPOUND, RXCUI, UMLS
@@ -104,27 +108,28 @@ def get_aui_to_cui(consofile):
     aui_to_cui = {}
     sdui_to_cui = defaultdict(set)
     # consofile = os.path.join('input_data', 'private', "RXNCONSO.RRF")
-    with open(consofile) as inf:
-        for line in inf:
-            x = line.strip().split("|")
-            aui = x[7]
-            cui = x[0]
-            sdui = (x[11], x[7])
-            if aui in aui_to_cui:
-                print("What the all time fuck?")
-                print(aui, cui)
-                print(aui_to_cui[aui])
-                raise RuntimeError("Something has gone very wrong")
-            aui_to_cui[aui] = cui
-            if sdui[1] == "":
-                continue
-            sdui_to_cui[sdui].add(cui)
+    for aui, cui, sab in read_rrf(consofile, ["AUI", "CUI", "SAB"]):
+        sdui = (sab, aui)
+        if aui in aui_to_cui:
+            print("What the all time fuck?")
+            print(aui, cui)
+            print(aui_to_cui[aui])
+            raise RuntimeError("Something has gone very wrong")
+        aui_to_cui[aui] = cui
+        if sdui[1] == "":
+            continue
+        sdui_to_cui[sdui].add(cui)
     return aui_to_cui, sdui_to_cui
 
 
+# The columns of MRREL and RXNREL that build_rxnorm_relationships() reads, in the order read_rrf() returns them.
+REL_COLUMNS = ["CUI1", "AUI1", "STYPE1", "REL", "CUI2", "AUI2", "STYPE2", "RELA", "SAB"]
+
+
 def get_cui(x, indicator_column, cui_column, aui_column, aui_to_cui, sdui_to_cui):
-    relation_column = 7
-    source_column = 10
+    """Get the CUI of the subject or object of a row of REL_COLUMNS from MRREL or RXNREL."""
+    relation_column = 7  # RELA
+    source_column = 8  # SAB
     if x[relation_column] in useful_relationships:
         if x[indicator_column] == "CUI":
             return x[cui_column]
@@ -201,9 +206,10 @@ def build_rxnorm_relationships(conso, relfile, outfile, metadata_yaml):
     one_to_one_relations = {}
     # one_to_one_relations = {"has_tradename": {"subject": defaultdict(set),
     #                                          "object": defaultdict(set)}}
-    with open(relfile) as inf, open(outfile, "w") as outf:
-        for line in inf:
-            x = line.strip().split("|")
+    # Only the useful_relationships can make it through get_cui().
+    where = {} if outfile == "UMLS" else {"RELA": useful_relationships}
+    with open(outfile, "w") as outf:
+        for x in read_rrf(relfile, REL_COLUMNS, where=where):
             # UMLS always has the CUI in it, while RXNORM does not.
             if outfile == "UMLS":
                 object_cui = x[0]
@@ -244,18 +250,12 @@ def build_rxnorm_relationships(conso, relfile, outfile, metadata_yaml):
     )
 
 
-def load_cliques_containing_rxcui(compendium):
-    rx_to_clique = {}
-    with open(compendium) as infile:
-        for line in infile:
-            if RXCUI not in line:
-                continue
-            j = json.loads(line)
-            clique = j["identifiers"][0]["i"]
-            for terms in j["identifiers"]:
-                if terms["i"].startswith(RXCUI):
-                    rx_to_clique[terms["i"]] = clique
-    return rx_to_clique
+def rxcui_leader(index, curie):
+    """Return the leader of the clique containing an RxCUI in a CompendiumIndex, or None if it isn't an RxCUI in it."""
+    if not curie.startswith(RXCUI):
+        return None
+    ref = index.get(curie)
+    return ref.leader if ref is not None else None
 
 
 def build_pubchem_relationships(infile, outfile, metadata_yaml):
@@ -286,7 +286,7 @@ def build_pubchem_relationships(infile, outfile, metadata_yaml):
 
 def _validate_and_apply_manual_concords(
     manual_concords: list[tuple[str, str]],
-    preferred_curie_for_curie: dict[str, str],
+    preferred_curie_for_curie: Mapping[str, str],
     pairs: list[tuple[str, str]],
     manual_concord_filename: str,
 ) -> int:
@@ -385,324 +385,305 @@ def build_conflation(
             manual_concords_curie_prefix_counts[prefix_count_label] += 1
     logger.info(f"{len(manual_concords)} manual concords loaded.")
 
-    logger.info("load all chemical compendia so we can normalize identifiers")
-    preferred_curie_for_curie = {}
-    type_for_preferred_curie = {}
-    clique_for_preferred_curie = {}
-    for chemical_compendium in chemical_compendia:
-        with open(chemical_compendium) as compendiumf:
-            logger.info(f"Loading {chemical_compendium}: {get_memory_usage_summary()}")
-            for line in compendiumf:
-                clique = json.loads(line)
-                preferred_id = clique["identifiers"][0]["i"]
-                clique_for_preferred_curie[preferred_id] = list(map(lambda ident: ident["i"], clique["identifiers"]))
-                type_for_preferred_curie[preferred_id] = clique["type"]
-                for ident in clique["identifiers"]:
-                    id = ident["i"]
-                    preferred_curie_for_curie[id] = preferred_id
-
-    logger.info(
-        f"Loaded preferred CURIEs for {len(preferred_curie_for_curie)} CURIEs from the chemical compendia: {get_memory_usage_summary()}"
-    )
+    with contextlib.ExitStack() as stack:
+        logger.info("open the indexes of all chemical compendia so we can normalize identifiers")
+        chemical_index = stack.enter_context(CompendiumIndex(chemical_compendia))
+        preferred_curie_for_curie = chemical_index.preferred_curies()
+        logger.info(f"Opened the indexes of {len(chemical_compendia)} chemical compendia: {get_memory_usage_summary()}")
 
-    logger.info("load drugs")
-    drug_rxcui_to_clique = load_cliques_containing_rxcui(drug_compendium)
-    chemical_rxcui_to_clique = {}
-    for chemical_compendium in chemical_compendia:
-        if chemical_compendium == drug_compendium:
-            continue
-        logger.info(f"load {chemical_compendium}: {get_memory_usage_summary()}")
-        chemical_rxcui_to_clique.update(load_cliques_containing_rxcui(chemical_compendium))
+        logger.info("open the indexes of the drug and other chemical compendia to find cliques containing RxCUIs")
+        drug_index = stack.enter_context(CompendiumIndex([drug_compendium]))
+        other_chemical_index = stack.enter_context(
+            CompendiumIndex([c for c in chemical_compendia if c != drug_compendium])
+        )
 
-    pairs = []
-    for concfile in [rxn_concord, umls_concord]:
-        with open(concfile) as infile:
+        pairs = []
+        for concfile in [rxn_concord, umls_concord]:
+            with open(concfile) as infile:
+                for line in infile:
+                    x = line.strip().split("\t")
+                    subject_curie = x[0]
+                    object_curie = x[2]
+                    subject_drug = rxcui_leader(drug_index, subject_curie)
+                    subject_chemical = rxcui_leader(other_chemical_index, subject_curie)
+                    object_drug = rxcui_leader(drug_index, object_curie)
+                    object_chemical = rxcui_leader(other_chemical_index, object_curie)
+
+                    # While we do this, we will also normalize all chemicals to their preferred clique IDs.
+                    if subject_drug and object_chemical:
+                        pairs.append((subject_drug, object_chemical))
+                    elif subject_chemical and object_drug:
+                        pairs.append((subject_chemical, object_drug))
+                    # OK, this is possible, and it's OK, as long as we get real clique leaders
+                    elif subject_drug and object_drug:
+                        pairs.append((subject_drug, object_drug))
+                    elif subject_chemical and object_chemical:
+                        pairs.append((subject_chemical, object_chemical))
+
+        # Add the manual concords, normalizing CURIEs to their preferred form.
+        manual_concords_skipped, manual_concords_applied_curies = _validate_and_apply_manual_concords(
+            manual_concords, preferred_curie_for_curie, pairs, manual_concord_filename
+        )
+
+        # We've had some issues with non-chemical types getting conflated, so we filter those out here.
+        biolink_model_toolkit = get_biolink_model_toolkit(config["biolink_version"])
+        biolink_chemical_types = set(
+            biolink_model_toolkit.get_descendants(
+                CHEMICAL_ENTITY,
+                reflexive=True,
+                formatted=True,
+                mixin=True,
+            )
+        )
+        logger.info(f"Filtering RxCUI pairs to those in these Biolink chemical types: {sorted(biolink_chemical_types)}")
+        with open(pubchem_rxn_concord) as infile:
             for line in infile:
                 x = line.strip().split("\t")
                 subject_curie = x[0]
                 object_curie = x[2]
 
-                # While we do this, we will also normalize all chemicals to their preferred clique IDs.
-                if subject_curie in drug_rxcui_to_clique and object_curie in chemical_rxcui_to_clique:
-                    subject_curie = drug_rxcui_to_clique[subject_curie]
-                    object_curie = chemical_rxcui_to_clique[object_curie]
-                    pairs.append((subject_curie, object_curie))
-                elif subject_curie in chemical_rxcui_to_clique and object_curie in drug_rxcui_to_clique:
-                    subject_curie = chemical_rxcui_to_clique[subject_curie]
-                    object_curie = drug_rxcui_to_clique[object_curie]
-                    pairs.append((subject_curie, object_curie))
-                # OK, this is possible, and it's OK, as long as we get real clique leaders
-                elif subject_curie in drug_rxcui_to_clique and object_curie in drug_rxcui_to_clique:
-                    subject_curie = drug_rxcui_to_clique[subject_curie]
-                    object_curie = drug_rxcui_to_clique[object_curie]
-                    pairs.append((subject_curie, object_curie))
-                elif subject_curie in chemical_rxcui_to_clique and object_curie in chemical_rxcui_to_clique:
-                    subject_curie = chemical_rxcui_to_clique[subject_curie]
-                    object_curie = chemical_rxcui_to_clique[object_curie]
-                    pairs.append((subject_curie, object_curie))
-
-    # Add the manual concords, normalizing CURIEs to their preferred form.
-    manual_concords_skipped, manual_concords_applied_curies = _validate_and_apply_manual_concords(
-        manual_concords, preferred_curie_for_curie, pairs, manual_concord_filename
-    )
+                subject_leader = rxcui_leader(drug_index, subject_curie)
+                if subject_leader is None:
+                    subject_leader = rxcui_leader(other_chemical_index, subject_curie)
+                if subject_leader is not None:
+                    subject_curie = subject_leader
+                else:
+                    logger.warning(
+                        f"Subject in subject-object pair ({subject_curie}, {object_curie}) isn't mapped to a RxCUI, skipping."
+                    )
+                    continue
+                    # raise RuntimeError(f"Unknown identifier in drugchemical conflation as subject: {subject_curie}")
 
-    # We've had some issues with non-chemical types getting conflated, so we filter those out here.
-    biolink_model_toolkit = get_biolink_model_toolkit(config["biolink_version"])
-    biolink_chemical_types = set(
-        biolink_model_toolkit.get_descendants(
-            CHEMICAL_ENTITY,
-            reflexive=True,
-            formatted=True,
-            mixin=True,
-        )
-    )
-    logger.info(f"Filtering RxCUI pairs to those in these Biolink chemical types: {sorted(biolink_chemical_types)}")
-    with open(pubchem_rxn_concord) as infile:
-        for line in infile:
-            x = line.strip().split("\t")
-            subject_curie = x[0]
-            object_curie = x[2]
-
-            if subject_curie in drug_rxcui_to_clique:
-                subject_curie = drug_rxcui_to_clique[subject_curie]
-            elif subject_curie in chemical_rxcui_to_clique:
-                subject_curie = chemical_rxcui_to_clique[subject_curie]
-            else:
-                logger.warning(
-                    f"Subject in subject-object pair ({subject_curie}, {object_curie}) isn't mapped to a RxCUI, skipping."
-                )
-                continue
-                # raise RuntimeError(f"Unknown identifier in drugchemical conflation as subject: {subject_curie}")
-
-            if object_curie in drug_rxcui_to_clique:
-                object_curie = drug_rxcui_to_clique[object_curie]
-            elif object_curie in chemical_rxcui_to_clique:
-                object_curie = chemical_rxcui_to_clique[object_curie]
-            else:
-                logger.warning(
-                    f"Object in subject-object pair ({subject_curie}, {object_curie}) isn't mapped to a RxCUI, skipping."
-                )
-                # raise RuntimeError(f"Unknown identifier in drugchemical conflation as object: {object_curie}")
-                continue
-
-            # Normalize both the subject and object, otherwise skip them.
-            if subject_curie not in preferred_curie_for_curie:
-                logger.warning(
-                    f"Subject in subject-object pair ({subject_curie}, {object_curie}) has no preferred CURIE, skipping."
-                )
-                continue
-            subject_curie = preferred_curie_for_curie[subject_curie]
-
-            if object_curie not in preferred_curie_for_curie:
-                logger.warning(
-                    f"Object in subject-object pair ({subject_curie}, {object_curie}) has no preferred CURIE, skipping."
-                )
-                continue
-            object_curie = preferred_curie_for_curie[object_curie]
-
-            if subject_curie == object_curie:
-                logger.warning(
-                    f"Subject and object in subject-object pair ({subject_curie}, {object_curie}) normalize to the same identifier ({subject_curie}), skipping."
-                )
-                continue
-
-            # Either the subject or the object might not be a chemical -- for example, MESH:C415772 shows up here,
-            # but it's a gene, not a chemical.
-            subject_type = type_for_preferred_curie[subject_curie]
-            if subject_type not in biolink_chemical_types:
-                logger.warning(
-                    f"Subject in subject-object pair ({subject_curie}, {object_curie}) has type {subject_type}, which is is not a chemical type, skipping."
-                )
-                continue
-
-            object_type = type_for_preferred_curie[object_curie]
-            if object_type not in biolink_chemical_types:
-                logger.warning(
-                    f"Object in subject-object pair ({subject_curie}, {object_curie}) has type {object_type}, which is is not a chemical type, skipping."
-                )
-                continue
-
-            pairs.append((subject_curie, object_curie))
-
-    # Glommin' time
-    logger.info(f"glom: {get_memory_usage_summary()}")
-    gloms = {}
-    glom(gloms, pairs)
-
-    # Set up the preferred conflation type order.
-    # preferred_conflation_type_order = PREFERRED_CONFLATION_TYPE_ORDER
-    # logger.info(f"Using preferred_conflation_type_order: {json.dumps(preferred_conflation_type_order, indent=2)}")
-
-    # Grouping conflation IDs by type is a great idea, and almost works! Unfortunately, we're currently
-    # identifying too many things as ChemicalEntity for this to work properly -- non-ideal concepts like
-    # CHEBI:5931 "insulin human" get placed further down in the conflation list than lots of other identifiers,
-    # including UNII:AVT680JB39 "Insulin pork", which is NOT good.
-    #
-    # So, instead, I'm going to group them by prefix and then to sort it using the ChemicalEntity
-    # prefix sort order.
-    biolink_model_toolkit = get_biolink_model_toolkit(config["biolink_version"])
-    biolink_chemical_entity = biolink_model_toolkit.get_element(CHEMICAL_ENTITY)
-    conflation_prefix_order = biolink_chemical_entity["id_prefixes"]
-    if not conflation_prefix_order:
-        raise RuntimeError(
-            f"Biolink model {config['biolink_version']} doesn't have a ChemicalEntity prefix order: {biolink_chemical_entity}"
-        )
+                object_leader = rxcui_leader(drug_index, object_curie)
+                if object_leader is None:
+                    object_leader = rxcui_leader(other_chemical_index, object_curie)
+                if object_leader is not None:
+                    object_curie = object_leader
+                else:
+                    logger.warning(
+                        f"Object in subject-object pair ({subject_curie}, {object_curie}) isn't mapped to a RxCUI, skipping."
+                    )
+                    # raise RuntimeError(f"Unknown identifier in drugchemical conflation as object: {object_curie}")
+                    continue
+
+                # Normalize both the subject and object, otherwise skip them.
+                if subject_curie not in preferred_curie_for_curie:
+                    logger.warning(
+                        f"Subject in subject-object pair ({subject_curie}, {object_curie}) has no preferred CURIE, skipping."
+                    )
+                    continue
+                subject_curie = preferred_curie_for_curie[subject_curie]
 
-    # Add RXCUI at the bottom.
-    conflation_prefix_order.append("RXCUI")
-
-    # Turn it into a sort order.
-    conflation_prefix_sort_order = {}
-    for i, prefix in enumerate(conflation_prefix_order):
-        conflation_prefix_sort_order[prefix] = i
-
-    logger.info(f"Using prefix sort order: {json.dumps(conflation_prefix_sort_order, indent=2)}")
-
-    # Write out all the resulting cliques.
-    written = set()
-    with jsonlines.open(outfilename, "w") as outf:
-        cliques = list(gloms.values())
-        total_clique_count = len(gloms)
-        clique_count = 0
-        start_time = time.time_ns()
-        for clique in cliques:
-            # 0. Provide ongoing tracking of this task. There are only ~10K conflations, but
-            # it's useful to know how quickly they are being processed.
-            clique_count += 1
-            if (clique_count == 1) or (clique_count % 1000 == 0):
-                time_elapsed_seconds = (time.time_ns() - start_time) / 1e9
-                if time_elapsed_seconds < 0.001:
-                    # We don't want to divide by zero.
-                    time_elapsed_seconds = 0.001
-                remaining_cliques = total_clique_count - clique_count
-                logger.info(
-                    f"Generating DrugChemical conflations currently at {clique_count:,} out of {total_clique_count:,} ({clique_count / total_clique_count * 100:.2f}%) in {format_timespan(time_elapsed_seconds)}: {get_memory_usage_summary()}"
-                )
-                logger.info(
-                    f" - Current rate: {clique_count / time_elapsed_seconds:.2f} cliques/second or {time_elapsed_seconds / clique_count:.6f} seconds/clique."
-                )
-
-                time_remaining_seconds = time_elapsed_seconds / clique_count * remaining_cliques
-                logger.info(f" - Estimated time remaining: {format_timespan(time_remaining_seconds)}")
-
-            # 1. Prepare a list of identifiers so we can iterate over them.
-            fs = frozenset(clique)
-            if fs in written:
-                continue
-            conflation_id_list = list(clique)
-
-            # 2. Group identifiers by Biolink type, preserving the order of the clique members.
-            # conflation_ids_by_type = defaultdict(list)
-            conflation_ids_by_prefix = defaultdict(list)
-            normalized_conflation_id_list = list()
-            for iid in conflation_id_list:
-                # Normalization shouldn't be needed here, because they're all clique leaders, but just in case.
-                if iid not in preferred_curie_for_curie:
-                    raise RuntimeError(
-                        f"Conflation clique member {iid} (in clique {conflation_id_list}) is not in any chemical "
-                        f"compendium. This is an internal logic error: all CURIEs entering glom() should have been "
-                        f"validated against the compendia beforehand. Check the RXN/UMLS concord processing paths "
-                        f"above, as manual concord entries from {manual_concord_filename} are already validated by "
-                        f"_validate_and_apply_manual_concords."
+                if object_curie not in preferred_curie_for_curie:
+                    logger.warning(
+                        f"Object in subject-object pair ({subject_curie}, {object_curie}) has no preferred CURIE, skipping."
                     )
-                preferred_curie = preferred_curie_for_curie[iid]
-                if preferred_curie != iid:
+                    continue
+                object_curie = preferred_curie_for_curie[object_curie]
+
+                if subject_curie == object_curie:
+                    logger.warning(
+                        f"Subject and object in subject-object pair ({subject_curie}, {object_curie}) normalize to the same identifier ({subject_curie}), skipping."
+                    )
+                    continue
+
+                # Either the subject or the object might not be a chemical -- for example, MESH:C415772 shows up here,
+                # but it's a gene, not a chemical.
+                subject_type = chemical_index.get_clique(subject_curie).type
+                if subject_type not in biolink_chemical_types:
+                    logger.warning(
+                        f"Subject in subject-object pair ({subject_curie}, {object_curie}) has type {subject_type}, which is is not a chemical type, skipping."
+                    )
+                    continue
+
+                object_type = chemical_index.get_clique(object_curie).type
+                if object_type not in biolink_chemical_types:
                     logger.warning(
-                        f"Conflation leader {iid} should have been normalized to {preferred_curie}, normalizing now."
+                        f"Object in subject-object pair ({subject_curie}, {object_curie}) has type {object_type}, which is is not a chemical type, skipping."
                     )
-                if preferred_curie not in normalized_conflation_id_list:
-                    normalized_conflation_id_list.append(preferred_curie)
-
-                # Add it to the dictionary of types in the order of the clique members.
-                # At the moment, we get these from glomming, so the order should not actually be significant.
-                # But maybe in the future it will be if that changes? And it doesn't cost us much to maintain
-                # insertion order.
-                # preferred_curie_type = type_for_preferred_curie[preferred_curie]
-                # if preferred_curie not in conflation_ids_by_type[preferred_curie_type]:
-                #    # Don't add duplicates!
-                #    conflation_ids_by_type[preferred_curie_type].append(preferred_curie)
-
-                # We will use the preferred CURIE prefix to sort instead.
-                preferred_curie_prefix = Text.get_prefix(preferred_curie)
-                if preferred_curie not in conflation_ids_by_prefix[preferred_curie_prefix]:
-                    conflation_ids_by_prefix[preferred_curie_prefix].append(preferred_curie)
-
-            # After all the normalization, it's possible that we'll end up with a conflation that only has a
-            # single identifier in it. If so, we don't need to add it to the conflation list, because it won't
-            # do anything there.
-            if len(normalized_conflation_id_list) == 1:
-                logger.debug(
-                    f"Found a DrugChemical conflation with a single identifier, skipping: {normalized_conflation_id_list}."
-                )
-                continue
-
-            # Within each of those groups, we want to sort by:
-            #   - information_content (lowest to highest, so that more general concepts are front-loaded)
-            #   - clique size (largest to smallest, so that larger cliques are front-loaded)
-            #   - numerical suffix (lowest to highest)
-            # Note that this does NOT include prefix order for the Biolink type. I think mixing that with multiple
-            # Biolink types will just make the output lists more confusing. Most people will only care about the
-            # clique conflation leader.
-            final_conflation_id_list = []
-            clique_ics = []
-
-            # If we want to put the biolink type order back, you can generate it with:
-            #   grouped_by_conflation_type = sorted(conflation_ids_by_type.items(), key=lambda bt: preferred_conflation_type_order.get(bt[0], 100))
-            # If you do that, please remember to sort these identifiers in the prefix order for that type,
-            # which I forgot to do in the previous implementation!
-
-            for prefix, ids in sorted(
-                conflation_ids_by_prefix.items(), key=lambda bt: conflation_prefix_sort_order.get(bt[0], 100)
-            ):
-                # Is this Biolink type a chemical type? If not, ignore it.
-                # if biolink_type not in biolink_chemical_types:
-                #     logger.warning(f"Skipping Biolink type {biolink_type} because it's not a chemical type, with IDs: {ids}")
-                #     continue
-
-                # To sort the identifiers, we'll need to calculate a tuple for each identifier to sort on.
-                sorted_ids = {}
-                for curie in ids:
-                    clique_for_id = clique_for_preferred_curie[curie]
-
-                    # Criteria 1: the information content of the clique represented by this identifier (lowest -> highest).
-                    clique_ic = ic_factory.get_ic(
-                        {"identifiers": list(map(lambda c: {"identifier": c}, clique_for_id))}
+                    continue
+
+                pairs.append((subject_curie, object_curie))
+
+        # Glommin' time
+        logger.info(f"glom: {get_memory_usage_summary()}")
+        gloms = {}
+        glom(gloms, pairs)
+
+        # Set up the preferred conflation type order.
+        # preferred_conflation_type_order = PREFERRED_CONFLATION_TYPE_ORDER
+        # logger.info(f"Using preferred_conflation_type_order: {json.dumps(preferred_conflation_type_order, indent=2)}")
+
+        # Grouping conflation IDs by type is a great idea, and almost works! Unfortunately, we're currently
+        # identifying too many things as ChemicalEntity for this to work properly -- non-ideal concepts like
+        # CHEBI:5931 "insulin human" get placed further down in the conflation list than lots of other identifiers,
+        # including UNII:AVT680JB39 "Insulin pork", which is NOT good.
+        #
+        # So, instead, I'm going to group them by prefix and then to sort it using the ChemicalEntity
+        # prefix sort order.
+        biolink_model_toolkit = get_biolink_model_toolkit(config["biolink_version"])
+        biolink_chemical_entity = biolink_model_toolkit.get_element(CHEMICAL_ENTITY)
+        conflation_prefix_order = biolink_chemical_entity["id_prefixes"]
+        if not conflation_prefix_order:
+            raise RuntimeError(
+                f"Biolink model {config['biolink_version']} doesn't have a ChemicalEntity prefix order: {biolink_chemical_entity}"
+            )
+
+        # Add RXCUI at the bottom.
+        conflation_prefix_order.append("RXCUI")
+
+        # Turn it into a sort order.
+        conflation_prefix_sort_order = {}
+        for i, prefix in enumerate(conflation_prefix_order):
+            conflation_prefix_sort_order[prefix] = i
+
+        logger.info(f"Using prefix sort order: {json.dumps(conflation_prefix_sort_order, indent=2)}")
+
+        # Write out all the resulting cliques.
+        written = set()
+        with jsonlines.open(outfilename, "w") as outf:
+            cliques = list(gloms.values())
+            total_clique_count = len(gloms)
+            clique_count = 0
+            start_time = time.time_ns()
+            for clique in cliques:
+                # 0. Provide ongoing tracking of this task. There are only ~10K conflations, but
+                # it's useful to know how quickly they are being processed.
+                clique_count += 1
+                if (clique_count == 1) or (clique_count % 1000 == 0):
+                    time_elapsed_seconds = (time.time_ns() - start_time) / 1e9
+                    if time_elapsed_seconds < 0.001:
+                        # We don't want to divide by zero.
+                        time_elapsed_seconds = 0.001
+                    remaining_cliques = total_clique_count - clique_count
+                    logger.info(
+                        f"Generating DrugChemical conflations currently at {clique_count:,} out of {total_clique_count:,} ({clique_count / total_clique_count * 100:.2f}%) in {format_timespan(time_elapsed_seconds)}: {get_memory_usage_summary()}"
+                    )
+                    logger.info(
+                        f" - Current rate: {clique_count / time_elapsed_seconds:.2f} cliques/second or {time_elapsed_seconds / clique_count:.6f} seconds/clique."
                     )
-                    clique_ics.append(clique_ic)
-                    if clique_ic is None:
-                        clique_ic = 100.0
-
-                    # Criteria 2: the size of the clique represented by this identifier (highest -> lowest)
-                    clique_size = len(clique_for_id)
-
-                    # Criteria 3: the numerical suffix of the identifier (lowest -> highest)
-                    numerical_suffix = get_numerical_curie_suffix(curie)
-                    if numerical_suffix is None:
-                        numerical_suffix = sys.maxsize
-
-                    # Put all that information into a tuple for sorting.
-                    sorted_ids[curie] = (
-                        clique_ic,  # clique_ic (smallest -> largest)
-                        -clique_size,  # clique_size DESC (largest -> smallest)
-                        numerical_suffix,  # numerical_suffix ASC (smallest -> largest)
+
+                    time_remaining_seconds = time_elapsed_seconds / clique_count * remaining_cliques
+                    logger.info(f" - Estimated time remaining: {format_timespan(time_remaining_seconds)}")
+
+                # 1. Prepare a list of identifiers so we can iterate over them.
+                fs = frozenset(clique)
+                if fs in written:
+                    continue
+                conflation_id_list = list(clique)
+
+                # 2. Group identifiers by Biolink type, preserving the order of the clique members.
+                # conflation_ids_by_type = defaultdict(list)
+                conflation_ids_by_prefix = defaultdict(list)
+                normalized_conflation_id_list = list()
+                for iid in conflation_id_list:
+                    # Normalization shouldn't be needed here, because they're all clique leaders, but just in case.
+                    if iid not in preferred_curie_for_curie:
+                        raise RuntimeError(
+                            f"Conflation clique member {iid} (in clique {conflation_id_list}) is not in any chemical "
+                            f"compendium. This is an internal logic error: all CURIEs entering glom() should have been "
+                            f"validated against the compendia beforehand. Check the RXN/UMLS concord processing paths "
+                            f"above, as manual concord entries from {manual_concord_filename} are already validated by "
+                            f"_validate_and_apply_manual_concords."
+                        )
+                    preferred_curie = preferred_curie_for_curie[iid]
+                    if preferred_curie != iid:
+                        logger.warning(
+                            f"Conflation leader {iid} should have been normalized to {preferred_curie}, normalizing now."
+                        )
+                    if preferred_curie not in normalized_conflation_id_list:
+                        normalized_conflation_id_list.append(preferred_curie)
+
+                    # Add it to the dictionary of types in the order of the clique members.
+                    # At the moment, we get these from glomming, so the order should not actually be significant.
+                    # But maybe in the future it will be if that changes? And it doesn't cost us much to maintain
+                    # insertion order.
+                    # preferred_curie_type = type_for_preferred_curie[preferred_curie]
+                    # if preferred_curie not in conflation_ids_by_type[preferred_curie_type]:
+                    #    # Don't add duplicates!
+                    #    conflation_ids_by_type[preferred_curie_type].append(preferred_curie)
+
+                    # We will use the preferred CURIE prefix to sort instead.
+                    preferred_curie_prefix = Text.get_prefix(preferred_curie)
+                    if preferred_curie not in conflation_ids_by_prefix[preferred_curie_prefix]:
+                        conflation_ids_by_prefix[preferred_curie_prefix].append(preferred_curie)
+
+                # After all the normalization, it's possible that we'll end up with a conflation that only has a
+                # single identifier in it. If so, we don't need to add it to the conflation list, because it won't
+                # do anything there.
+                if len(normalized_conflation_id_list) == 1:
+                    logger.debug(
+                        f"Found a DrugChemical conflation with a single identifier, skipping: {normalized_conflation_id_list}."
+                    )
+                    continue
+
+                # Within each of those groups, we want to sort by:
+                #   - information_content (lowest to highest, so that more general concepts are front-loaded)
+                #   - clique size (largest to smallest, so that larger cliques are front-loaded)
+                #   - numerical suffix (lowest to highest)
+                # Note that this does NOT include prefix order for the Biolink type. I think mixing that with multiple
+                # Biolink types will just make the output lists more confusing. Most people will only care about the
+                # clique conflation leader.
+                final_conflation_id_list = []
+                clique_ics = []
+
+                # If we want to put the biolink type order back, you can generate it with:
+                #   grouped_by_conflation_type = sorted(conflation_ids_by_type.items(), key=lambda bt: preferred_conflation_type_order.get(bt[0], 100))
+                # If you do that, please remember to sort these identifiers in the prefix order for that type,
+                # which I forgot to do in the previous implementation!
+
+                for prefix, ids in sorted(
+                    conflation_ids_by_prefix.items(), key=lambda bt: conflation_prefix_sort_order.get(bt[0], 100)
+                ):
+                    # Is this Biolink type a chemical type? If not, ignore it.
+                    # if biolink_type not in biolink_chemical_types:
+                    #     logger.warning(f"Skipping Biolink type {biolink_type} because it's not a chemical type, with IDs: {ids}")
+                    #     continue
+
+                    # To sort the identifiers, we'll need to calculate a tuple for each identifier to sort on.
+                    sorted_ids = {}
+                    for curie in ids:
+                        clique_for_id = chemical_index.get_clique(curie).identifiers
+
+                        # Criteria 1: the information content of the clique represented by this identifier (lowest -> highest).
+                        clique_ic = ic_factory.get_ic(
+                            {"identifiers": list(map(lambda c: {"identifier": c}, clique_for_id))}
+                        )
+                        clique_ics.append(clique_ic)
+                        if clique_ic is None:
+                            clique_ic = 100.0
+
+                        # Criteria 2: the size of the clique represented by this identifier (highest -> lowest)
+                        clique_size = len(clique_for_id)
+
+                        # Criteria 3: the numerical suffix of the identifier (lowest -> highest)
+                        numerical_suffix = get_numerical_curie_suffix(curie)
+                        if numerical_suffix is None:
+                            numerical_suffix = sys.maxsize
+
+                        # Put all that information into a tuple for sorting.
+                        sorted_ids[curie] = (
+                            clique_ic,  # clique_ic (smallest -> largest)
+                            -clique_size,  # clique_size DESC (largest -> smallest)
+                            numerical_suffix,  # numerical_suffix ASC (smallest -> largest)
+                        )
+
+                    sorted_ids = sorted(ids, key=sorted_ids.get)
+                    final_conflation_id_list.extend(sorted_ids)
+
+                # The final conflation list won't match the initial list only if some of the Biolink types weren't
+                # chemical types, and so were skipped that way.
+                if set(final_conflation_id_list) != set(normalized_conflation_id_list):
+                    logger.warning(
+                        "Final conflation ID list does not match the normalized conflation ID list:\n"
+                        + f" - Final conflation ID list: {sorted(final_conflation_id_list)}\n"
+                        + f" - Normalized conflation ID list: {sorted(normalized_conflation_id_list)}"
                     )
 
-                sorted_ids = sorted(ids, key=sorted_ids.get)
-                final_conflation_id_list.extend(sorted_ids)
-
-            # The final conflation list won't match the initial list only if some of the Biolink types weren't
-            # chemical types, and so were skipped that way.
-            if set(final_conflation_id_list) != set(normalized_conflation_id_list):
-                logger.warning(
-                    "Final conflation ID list does not match the normalized conflation ID list:\n"
-                    + f" - Final conflation ID list: {sorted(final_conflation_id_list)}\n"
-                    + f" - Normalized conflation ID list: {sorted(normalized_conflation_id_list)}"
-                )
-
-            # Write out all the identifiers.
-            logger.info(f"Ordered DrugChemical conflation {final_conflation_id_list} with IC values {clique_ics}.")
-            outf.write(final_conflation_id_list)
-            written.add(fs)
+                # Write out all the identifiers.
+                logger.info(f"Ordered DrugChemical conflation {final_conflation_id_list} with IC values {clique_ics}.")
+                outf.write(final_conflation_id_list)
+                written.add(fs)
 
     # Write out metadata.yaml
     write_combined_metadata(
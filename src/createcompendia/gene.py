@@ -5,9 +5,12 @@ import os
 import re
 
 import src.datahandlers.umls as umls
-from src.babel_utils import glom, read_identifier_file, write_compendium
+from src.babel_utils import write_compendium
 from src.categories import GENE
+from src.datahandlers.rrf import read_rrf
+from src.incremental import incremental_state_dir
 from src.metadata.provenance import write_concord_metadata
+from src.model.incremental_glom import glom_files
 from src.prefixes import DICTYBASE, ENSEMBL, FLYBASE, HGNC, MGI, NCBIGENE, OMIM, RGD, SGD, UMLS, WORMBASE, ZFIN
 from src.util import LoggingUtil
 
@@ -133,36 +136,19 @@ def write_umls_ids(mrconso, mrsty, outfile):
         ]
     )
     umls_keepers = set()
-    with open(mrsty) as inf:
-        for line in inf:
-            x = line.strip().split("|")
-            cat = x[2]
-            if cat == "A1.2.3.5":
-                umls_keepers.add(x[0])
+    for cui, cat in read_rrf(mrsty, ["CUI", "STN"]):
+        if cat == "A1.2.3.5":
+            umls_keepers.add(cui)
     umls_keepers.difference_update(blacklist)
-    # Now filter out OMIM variants
-    with open(mrconso) as inf:
-        for line in inf:
-            x = line.strip().split("|")
-            cui = x[0]
-            if cui not in umls_keepers:
-                continue
-            lang = x[1]
-            # Only keep english terms
-            if lang != "ENG":
-                continue
-            # only keep unsuppressed rows
-            suppress = x[16]
-            if suppress == "O" or suppress == "E":
-                continue
-            # only keep sources we're looking for
-            source = x[11]
-            if source == "OMIM":
-                value = x[13]
-                if "." in value:
-                    umls_keepers.remove(x[0])
-            if "Allele" in x[14] or "Mutation" in x[14]:
-                umls_keepers.remove(x[0])
+    # Now filter out OMIM variants, only looking at english, unsuppressed rows
+    for cui, source, code, term in read_rrf(mrconso, ["CUI", "SAB", "CODE", "STR"], standard=True):
+        if cui not in umls_keepers:
+            continue
+        if source == "OMIM":
+            if "." in code:
+                umls_keepers.remove(cui)
+        if "Allele" in term or "Mutation" in term:
+            umls_keepers.remove(cui)
     with open(outfile, "w") as outf:
         for umls in umls_keepers:
             outf.write(f"{UMLS}:{umls}\t{GENE}\n")
@@ -331,23 +317,7 @@ def build_gene_umls_hgnc_relationships(mrconso, umls_idfile, outfile, metadata_y
 def build_gene_compendia(concordances, metadata_yamls, identifiers, icrdf_filename):
     """:concordances: a list of files from which to read relationships
     :identifiers: a list of files from which to read identifiers and optional categories"""
-    dicts = {}
-    types = {}
     uniques = [NCBIGENE, HGNC, ENSEMBL, OMIM]
-    for ifile in identifiers:
-        print("loading", ifile)
-        new_identifiers, new_types = read_identifier_file(ifile)
-        glom(dicts, new_identifiers, unique_prefixes=uniques)
-        types.update(new_types)
-    for infile in concordances:
-        print(infile)
-        print("loading", infile)
-        pairs = []
-        with open(infile) as inf:
-            for line in inf:
-                x = line.strip().split("\t")
-                pairs.append(set([x[0], x[2]]))
-        glom(dicts, pairs, unique_prefixes=uniques)
-    gene_sets = set([frozenset(x) for x in dicts.values()])
+    gene_sets = glom_files(identifiers, concordances, uniques, state_dir=incremental_state_dir("glom", "gene"))
     baretype = GENE.split(":")[-1]
     write_compendium(metadata_yamls, gene_sets, f"{baretype}.txt", GENE, {}, icrdf_filename=icrdf_filename)
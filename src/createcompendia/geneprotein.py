@@ -5,6 +5,7 @@ import jsonlines
 
 from src.babel_utils import glom
 from src.categories import GENE
+from src.compendium_index import CompendiumIndex
 from src.metadata.provenance import write_concord_metadata
 from src.prefixes import NCBIGENE, UNIPROTKB
 from src.util import LoggingUtil
@@ -70,25 +71,15 @@ def gpkey(curie):
     return (kl[pref], curie)
 
 
-def collect_valid_ids(compendium_file, idset):
-    with jsonlines.open(compendium_file, "r") as inf:
-        for line in inf:
-            ids = [x["i"] for x in line["identifiers"]]
-            idset.update(ids)
-
-
 def build_conflation(geneprotein_concord, gene_compendium, protein_compendium, outfile):
     """
     Fortunately our concord is in terms of the two preferred ids.
     All we should have to do is load that in, glom it up, and write out the groups
     But, there are some things in the concord that don't exist in at least the gene (maybe in the protein as well)
     """
-    all_ids = set()
-    collect_valid_ids(gene_compendium, all_ids)
-    collect_valid_ids(protein_compendium, all_ids)
     conf = {}
     pairs = []
-    with open(geneprotein_concord) as inf:
+    with CompendiumIndex([gene_compendium, protein_compendium]) as all_ids, open(geneprotein_concord) as inf:
         for line in inf:
             x = line.strip().split("\t")
             if (x[0] in all_ids) and (x[2] in all_ids):
@@ -22,7 +22,7 @@ from src.categories import (
     PROCEDURE,
     SMALL_MOLECULE,
 )
-from src.datahandlers import umls
+from src.datahandlers.rrf import read_rrf
 from src.node import NodeFactory
 from src.prefixes import UMLS
 from src.util import get_biolink_model_toolkit, get_logger
@@ -404,27 +404,22 @@ def write_leftover_umls(
         types_by_id = dict()
         types_by_tui = dict()
         tui_to_tree = dict()
-        with open(mrsty) as inf:
-            for line in inf:
-                x = line.strip().split("|")
-                umls_id = f"{UMLS}:{x[0]}"
-                tui = x[1]
-                tree = x[2]
-                sty = x[3]
-
-                if umls_id not in types_by_id:
-                    types_by_id[umls_id] = dict()
-                if tui not in types_by_id[umls_id]:
-                    types_by_id[umls_id][tui] = set()
-                types_by_id[umls_id][tui].add(sty)
-
-                if tui not in types_by_tui:
-                    types_by_tui[tui] = set()
-                types_by_tui[tui].add(sty)
-
-                # A TUI has a single, fixed tree number; record the first one we see.
-                if tui not in tui_to_tree:
-                    tui_to_tree[tui] = tree
+        for cui, tui, tree, sty in read_rrf(mrsty, ["CUI", "TUI", "STN", "STY"]):
+            umls_id = f"{UMLS}:{cui}"
+
+            if umls_id not in types_by_id:
+                types_by_id[umls_id] = dict()
+            if tui not in types_by_id[umls_id]:
+                types_by_id[umls_id][tui] = set()
+            types_by_id[umls_id][tui].add(sty)
+
+            if tui not in types_by_tui:
+                types_by_tui[tui] = set()
+            types_by_tui[tui].add(sty)
+
+            # A TUI has a single, fixed tree number; record the first one we see.
+            if tui not in tui_to_tree:
+                tui_to_tree[tui] = tree
 
         logger.info(f"Completed loading {len(types_by_id.keys())} UMLS IDs from MRSTY.RRF.")
         reportf.write(f"COMPLETED Loading {len(types_by_id.keys())} UMLS IDs from MRSTY.RRF.\n")
@@ -528,128 +523,115 @@ def write_leftover_umls(
         no_mrsty_curie_sources: dict[str, set[str]] = {}
         no_mrsty_curie_label: dict[str, str] = {}
 
-        with open(mrconso) as inf:
-            for line in inf:
-                if not umls.check_mrconso_line(line):
-                    continue
-
-                x = line.strip().split("|")
-                cui = x[0]
-                umls_id = f"{UMLS}:{cui}"
-                sab = x[11]
-                if umls_id in umls_ids_in_other_compendia:
-                    logger.debug(f"UMLS ID {umls_id} is in another compendium, skipping.")
-                    continue
-                if umls_id in no_mrsty_curie_sources:
-                    # Already typed as NAMED_THING on a prior MRCONSO row; just accumulate the SAB.
-                    no_mrsty_curie_sources[umls_id].add(sab)
-                    continue
-                if umls_id in umls_ids_in_this_compendium:
-                    logger.debug(f"UMLS ID {umls_id} has already been included in this compendium, skipping.")
-                    continue
-                if umls_id in curies_no_umls_type or umls_id in curies_multiple_umls_type or umls_id in curies_rejected:
-                    # This CURIE was already evaluated and skipped due to type resolution failure.
-                    # Skip it here to avoid redundant type lookups on subsequent MRCONSO rows for the same CUI.
-                    continue
-
-                # The STR value should be the label.
-                label = x[14]
-
-                # Resolve every semantic type (STY/TUI) on this concept into one of three outcomes:
-                # a Biolink type, an explicit rejection (STY_OVERRIDES -> None), or unmapped (Biolink
-                # has no mapping and there is no override).
-                tuis_for_id = types_by_id.get(umls_id)
-                mapped_types = set()
-                rejected_tuis = set()
-                unmapped_tuis = set()
-                if tuis_for_id is None:
-                    # Concept has no MRSTY entry: no semantic type annotation. Fall back to NAMED_THING
-                    # rather than treating the absence as an unmapped or rejected TUI.
-                    mapped_types.add(NAMED_THING)
-                    no_mrsty_curie_sources[umls_id] = {sab}
-                    no_mrsty_curie_label[umls_id] = label
-                else:
-                    for tui in tuis_for_id.keys():
-                        if tui in STY_OVERRIDES:
-                            override = STY_OVERRIDES[tui]
-                            if override is None:
-                                rejected_tuis.add(tui)
-                            else:
-                                mapped_types.add(override)
+        # The STR value should be the label.
+        for cui, sab, label in read_rrf(mrconso, ["CUI", "SAB", "STR"], standard=True):
+            umls_id = f"{UMLS}:{cui}"
+            if umls_id in umls_ids_in_other_compendia:
+                logger.debug(f"UMLS ID {umls_id} is in another compendium, skipping.")
+                continue
+            if umls_id in no_mrsty_curie_sources:
+                # Already typed as NAMED_THING on a prior MRCONSO row; just accumulate the SAB.
+                no_mrsty_curie_sources[umls_id].add(sab)
+                continue
+            if umls_id in umls_ids_in_this_compendium:
+                logger.debug(f"UMLS ID {umls_id} has already been included in this compendium, skipping.")
+                continue
+            if umls_id in curies_no_umls_type or umls_id in curies_multiple_umls_type or umls_id in curies_rejected:
+                # This CURIE was already evaluated and skipped due to type resolution failure.
+                # Skip it here to avoid redundant type lookups on subsequent MRCONSO rows for the same CUI.
+                continue
+
+            # Resolve every semantic type (STY/TUI) on this concept into one of three outcomes:
+            # a Biolink type, an explicit rejection (STY_OVERRIDES -> None), or unmapped (Biolink
+            # has no mapping and there is no override).
+            tuis_for_id = types_by_id.get(umls_id)
+            mapped_types = set()
+            rejected_tuis = set()
+            unmapped_tuis = set()
+            if tuis_for_id is None:
+                # Concept has no MRSTY entry: no semantic type annotation. Fall back to NAMED_THING
+                # rather than treating the absence as an unmapped or rejected TUI.
+                mapped_types.add(NAMED_THING)
+                no_mrsty_curie_sources[umls_id] = {sab}
+                no_mrsty_curie_label[umls_id] = label
+            else:
+                for tui in tuis_for_id.keys():
+                    if tui in STY_OVERRIDES:
+                        override = STY_OVERRIDES[tui]
+                        if override is None:
+                            rejected_tuis.add(tui)
                         else:
-                            biolink_type = resolve_sty_biolink(tui)
-                            if biolink_type is None:
-                                unmapped_tuis.add(tui)
-                            else:
-                                mapped_types.add(biolink_type)
-
-                # An unmapped semantic type means we can't fully type this concept, so we skip it
-                # entirely (the existing conservative behavior) and report it as unmapped.
-                if unmapped_tuis:
-                    if umls_id not in curies_no_umls_type:
-                        curies_no_umls_type.add(umls_id)
-                        logger.warning(
-                            f"No Biolink type for {umls_id}: unmapped STY {sorted(unmapped_tuis)} in {tuis_for_id}, skipping"
-                        )
-                        reportf.write(
-                            f"NO_UMLS_TYPE [{umls_id}]: unmapped STY {sorted(unmapped_tuis)} in {tuis_for_id}\n"
-                        )
-                        for tui in unmapped_tuis:
-                            unmapped_tui_counts[tui] += 1
-                            if len(unmapped_tui_examples[tui]) < _SAMPLE_LIMIT:
-                                unmapped_tui_examples[tui].append((umls_id, label))
-                    continue
-
-                # If every semantic type was deliberately rejected (or there were none), skip and
-                # report as rejected -- distinct from "couldn't be mapped".
-                if not mapped_types:
-                    if umls_id not in curies_rejected:
-                        curies_rejected.add(umls_id)
-                        logger.info(
-                            f"Rejected {umls_id}: rejected STY {sorted(rejected_tuis)} in {tuis_for_id}, skipping"
-                        )
-                        reportf.write(f"REJECTED [{umls_id}]: rejected STY {sorted(rejected_tuis)} in {tuis_for_id}\n")
-                        for tui in rejected_tuis:
-                            rejected_tui_counts[tui] += 1
-                            if len(rejected_tui_examples[tui]) < _SAMPLE_LIMIT:
-                                rejected_tui_examples[tui].append((umls_id, label))
-                    continue
-
-                # Disambiguate when a concept resolves to multiple Biolink types.
-                biolink_types = apply_generic_demotion(mapped_types)
-                if len(biolink_types) > 1 and frozenset(biolink_types) in TYPE_COMBO_OVERRIDES:
-                    biolink_types = {TYPE_COMBO_OVERRIDES[frozenset(biolink_types)]}
-
-                if len(biolink_types) > 1:
-                    # We skip this CURIE, but we don't want to print multiple log messages for the same CURIE.
-                    if umls_id not in curies_multiple_umls_type:
-                        curies_multiple_umls_type.add(umls_id)
-                        biolink_types_as_str = "|".join(sorted(biolink_types))
-                        logger.warning(
-                            f"Multiple Biolink types not yet supported for {umls_id}: {tuis_for_id} -> {biolink_types_as_str}, skipping"
-                        )
-                        reportf.write(f"MULTIPLE_UMLS_TYPES [{umls_id}]\t{biolink_types_as_str}\t{tuis_for_id}\n")
-                        key = frozenset(biolink_types)
-                        multi_type_counts[key] += 1
-                        if len(multi_type_samples[key]) < _SAMPLE_LIMIT:
-                            multi_type_samples[key].append((umls_id, label))
-                    continue
-
-                biolink_type = next(iter(biolink_types))
-                preferred_name_by_id[umls_id] = label
-
-                # Let write_compendium() generate this singleton's compendium and synonym JSON.
-                leftover_umls_cliques.append(TypedClique(node_type=biolink_type, identifiers=[umls_id]))
-                umls_ids_in_this_compendium.add(umls_id)
-
-                # Also record this leftover concept in the per-compendium semantic-type breakdown, so
-                # umls.txt appears alongside the input compendia. Every leftover clique is a single
-                # UMLS identifier, so it counts toward single_umls_clique_count too.
-                leftover_entry = semantic_breakdown[(leftover_compendium_name, biolink_type, semantic_key(umls_id))]
-                leftover_entry[0] += 1
-                leftover_entry[1] += 1
-                if len(leftover_entry[2]) < _SAMPLE_LIMIT:
-                    leftover_entry[2].append((umls_id, label))
+                            mapped_types.add(override)
+                    else:
+                        biolink_type = resolve_sty_biolink(tui)
+                        if biolink_type is None:
+                            unmapped_tuis.add(tui)
+                        else:
+                            mapped_types.add(biolink_type)
+
+            # An unmapped semantic type means we can't fully type this concept, so we skip it
+            # entirely (the existing conservative behavior) and report it as unmapped.
+            if unmapped_tuis:
+                if umls_id not in curies_no_umls_type:
+                    curies_no_umls_type.add(umls_id)
+                    logger.warning(
+                        f"No Biolink type for {umls_id}: unmapped STY {sorted(unmapped_tuis)} in {tuis_for_id}, skipping"
+                    )
+                    reportf.write(f"NO_UMLS_TYPE [{umls_id}]: unmapped STY {sorted(unmapped_tuis)} in {tuis_for_id}\n")
+                    for tui in unmapped_tuis:
+                        unmapped_tui_counts[tui] += 1
+                        if len(unmapped_tui_examples[tui]) < _SAMPLE_LIMIT:
+                            unmapped_tui_examples[tui].append((umls_id, label))
+                continue
+
+            # If every semantic type was deliberately rejected (or there were none), skip and
+            # report as rejected -- distinct from "couldn't be mapped".
+            if not mapped_types:
+                if umls_id not in curies_rejected:
+                    curies_rejected.add(umls_id)
+                    logger.info(f"Rejected {umls_id}: rejected STY {sorted(rejected_tuis)} in {tuis_for_id}, skipping")
+                    reportf.write(f"REJECTED [{umls_id}]: rejected STY {sorted(rejected_tuis)} in {tuis_for_id}\n")
+                    for tui in rejected_tuis:
+                        rejected_tui_counts[tui] += 1
+                        if len(rejected_tui_examples[tui]) < _SAMPLE_LIMIT:
+                            rejected_tui_examples[tui].append((umls_id, label))
+                continue
+
+            # Disambiguate when a concept resolves to multiple Biolink types.
+            biolink_types = apply_generic_demotion(mapped_types)
+            if len(biolink_types) > 1 and frozenset(biolink_types) in TYPE_COMBO_OVERRIDES:
+                biolink_types = {TYPE_COMBO_OVERRIDES[frozenset(biolink_types)]}
+
+            if len(biolink_types) > 1:
+                # We skip this CURIE, but we don't want to print multiple log messages for the same CURIE.
+                if umls_id not in curies_multiple_umls_type:
+                    curies_multiple_umls_type.add(umls_id)
+                    biolink_types_as_str = "|".join(sorted(biolink_types))
+                    logger.warning(
+                        f"Multiple Biolink types not yet supported for {umls_id}: {tuis_for_id} -> {biolink_types_as_str}, skipping"
+                    )
+                    reportf.write(f"MULTIPLE_UMLS_TYPES [{umls_id}]\t{biolink_types_as_str}\t{tuis_for_id}\n")
+                    key = frozenset(biolink_types)
+                    multi_type_counts[key] += 1
+                    if len(multi_type_samples[key]) < _SAMPLE_LIMIT:
+                        multi_type_samples[key].append((umls_id, label))
+                continue
+
+            biolink_type = next(iter(biolink_types))
+            preferred_name_by_id[umls_id] = label
+
+            # Let write_compendium() generate this singleton's compendium and synonym JSON.
+            leftover_umls_cliques.append(TypedClique(node_type=biolink_type, identifiers=[umls_id]))
+            umls_ids_in_this_compendium.add(umls_id)
+
+            # Also record this leftover concept in the per-compendium semantic-type breakdown, so
+            # umls.txt appears alongside the input compendia. Every leftover clique is a single
+            # UMLS identifier, so it counts toward single_umls_clique_count too.
+            leftover_entry = semantic_breakdown[(leftover_compendium_name, biolink_type, semantic_key(umls_id))]
+            leftover_entry[0] += 1
+            leftover_entry[1] += 1
+            if len(leftover_entry[2]) < _SAMPLE_LIMIT:
+                leftover_entry[2].append((umls_id, label))
 
         logger.info(f"Wrote out {len(umls_ids_in_this_compendium)} UMLS IDs into the leftover UMLS compendium.")
         reportf.write(
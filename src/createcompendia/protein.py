@@ -4,9 +4,11 @@ import re
 import src.datahandlers.mesh as mesh
 import src.datahandlers.obo as obo
 import src.datahandlers.umls as umls
-from src.babel_utils import Text, glom, read_identifier_file, write_compendium
+from src.babel_utils import Text, write_compendium
 from src.categories import PROTEIN
+from src.incremental import incremental_state_dir
 from src.metadata.provenance import write_concord_metadata
+from src.model.incremental_glom import glom_files
 from src.prefixes import DRUGBANK, ENSEMBL, MESH, NCBITAXON, NCIT, PR, UNIPROTKB
 from src.ubergraph import UberGraph
 from src.util import get_logger, get_memory_usage_summary
@@ -233,40 +235,16 @@ def build_umls_relationships(mrconso, idfile, outfile, metadata_yaml):
     )
 
 
-def build_protein_compendia(concordances, metadata_yamls, identifiers, icrdf_filename):
+def build_protein_compendia(concordances, metadata_yamls, identifiers, icrdf_filename, workers=None):
     """:concordances: a list of files from which to read relationships
-    :identifiers: a list of files from which to read identifiers and optional categories"""
-    dicts = {}
-    types = {}
+    :identifiers: a list of files from which to read identifiers and optional categories
+    :workers: the number of worker processes write_compendium() should use (None for the config default)"""
     uniques = [UNIPROTKB, PR]
     logger.info(
         f"Started building protein compendia ({concordances}, {metadata_yamls}, {identifiers}, {icrdf_filename}) with uniques {uniques}"
     )
-    for ifile in identifiers:
-        logger.info(f"Loading identifier file {ifile}")
-        new_identifiers, new_types = read_identifier_file(ifile)
-        glom(dicts, new_identifiers, unique_prefixes=uniques)
-        types.update(new_types)
-        logger.info(f"Loaded identifier file {ifile}: {get_memory_usage_summary()}")
-    logger.info(f"Finished loading identifiers, memory usage: {get_memory_usage_summary()}")
-    for infile in concordances:
-        logger.info(f"Loading concordance file {infile}")
-        pairs = []
-        with open(infile) as inf:
-            for line_index, line in enumerate(inf):
-                if line_index % 1000000 == 0:
-                    logger.info(f"Loading concordance file {infile}: line {line_index:,}")
-                x = line.strip().split("\t")
-                pairs.append(set([x[0], x[2]]))
-        # print("glomming", infile) # This takes a while, but doesn't add much to the memory
-        glom(dicts, pairs, unique_prefixes=uniques)
-        logger.info(f"Loaded concordance file {infile}: {get_memory_usage_summary()}")
-    logger.info(f"Finished loading concordances, memory usage: {get_memory_usage_summary()}")
-    logger.info("Building gene sets")
-    gene_sets = set([frozenset(x) for x in dicts.values()])
+    gene_sets = glom_files(identifiers, concordances, uniques, state_dir=incremental_state_dir("glom", "protein"))
     logger.info(f"Gene sets built, memory usage: {get_memory_usage_summary()}")
-    # Try to preserve some memory here.
-    dicts.clear()
 
     # Memory usage falls at some point; maybe here?
     # TODO: might be a good idea to write all of this out in one step and
@@ -282,5 +260,6 @@ def build_protein_compendia(concordances, metadata_yamls, identifiers, icrdf_fil
         {},
         extra_prefixes=[DRUGBANK],
         icrdf_filename=icrdf_filename,
+        workers=workers,
     )
     logger.info(f"Wrote compendium for {baretype}, memory usage: {get_memory_usage_summary()}")
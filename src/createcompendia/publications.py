@@ -1,16 +1,28 @@
 import gzip
 import hashlib
 import json
+import multiprocessing
 import os
+import tempfile
 import time
+import urllib.parse
 import xml.etree.ElementTree as ET
 from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from ftplib import FTP
 from mmap import ACCESS_READ, mmap
 from pathlib import Path
 
-from src.babel_utils import WgetRecursionOptions, glom, pull_via_wget, read_identifier_file, write_compendium
+from src.babel_utils import (
+    concatenate_files,
+    get_user_agent,
+    glom,
+    pull_via_wget,
+    read_identifier_file,
+    write_compendium,
+)
 from src.categories import JOURNAL_ARTICLE, PUBLICATION
+from src.downloads import DEFAULT_WORKERS, DownloadJob, download_files
 from src.metadata.provenance import write_concord_metadata
 from src.prefixes import DOI, PMC, PMID
 from src.util import ensure_parent_dir, get_logger
@@ -18,54 +30,90 @@ from src.util import ensure_parent_dir, get_logger
 logger = get_logger(__name__)
 
 # The same PubMed corpus, reachable two ways. We need both: NCBI's robots.txt
-# (https://ftp.ncbi.nlm.nih.gov/robots.txt) blocks a recursive HTTPS download, so the bulk fetch has
-# to go over FTP — but FTP is the less reliable of the two, so the single-file re-downloads that
-# repair a failed checksum use HTTPS.
+# (https://ftp.ncbi.nlm.nih.gov/robots.txt) keeps crawlers out of the HTTPS directory listings, so we
+# list the files over FTP — but FTP is the less reliable of the two, so the files themselves are
+# downloaded over HTTPS.
 PUBMED_FTP_BASE = "ftp://ftp.ncbi.nlm.nih.gov/pubmed/"
 PUBMED_HTTPS_BASE = "https://ftp.ncbi.nlm.nih.gov/pubmed/"
 
 
-def download_pubmed(download_file, pubmed_base=PUBMED_FTP_BASE, pmc_base="https://ftp.ncbi.nlm.nih.gov/pub/pmc/"):
+def list_pubmed_files(subdir, listing_base=PUBMED_FTP_BASE):
+    """
+    List the gzipped PubMed XML files in a PubMed directory.
+
+    We list the directory over FTP (NLST) rather than by parsing the HTTPS directory listing, which NCBI's
+    robots.txt asks crawlers to keep out of.
+
+    :param subdir: The PubMed directory to list, such as `baseline`.
+    :param listing_base: The PubMed FTP base URL.
+    :return: The sorted names of the `.xml.gz` files in that directory.
+    """
+    url = urllib.parse.urlparse(listing_base)
+    with FTP(url.hostname) as ftp:
+        ftp.login()
+        names = ftp.nlst(url.path + subdir)
+    return sorted(os.path.basename(name) for name in names if name.endswith(".xml.gz"))
+
+
+def download_pubmed(
+    download_file,
+    pubmed_base=PUBMED_HTTPS_BASE,
+    pmc_base="https://ftp.ncbi.nlm.nih.gov/pub/pmc/",
+    listing_base=PUBMED_FTP_BASE,
+    workers=DEFAULT_WORKERS,
+):
     """
     Download PubMed. We download both the PubMed annual baseline and the daily update files,
     which are in the same format, but the baseline is set up at the start of the year and then
     updates are included in the daily update files.
 
-    We would love to use HTTPS to do the downloads, but unfortunately the robots.txt
-    (https://ftp.ncbi.nlm.nih.gov/robots.txt) prevents this from working recursively.
+    Each directory is listed over FTP (see list_pubmed_files()), and its files downloaded over HTTPS
+    by download_files(), `workers` at a time. The `.md5` file PubMed publishes for each file is
+    downloaded first, every time: a file we already have (such as one preloaded from a previous run)
+    is kept if it matches its checksum, and any other file is downloaded and checked against its
+    checksum as it arrives. verify_pubmed_downloads() checks them all again afterwards.
 
-    :param download_file: A `done` file that should be created to indicate that we are done.
+    :param download_file: A `done` file that should be created to indicate that we are done. The
+        `baseline` and `updatefiles` directories are created next to it.
     :param pubmed_base: The PubMed base URL to download files from.
     :param pmc_base: The PubMed Central base URL to download files from.
+    :param listing_base: The PubMed base URL to list the files to download from (see list_pubmed_files()).
+    :param workers: The number of files to download at once.
     """
 
     # Create directories if they don't exist.
     ensure_parent_dir(download_file)
-
-    # Download baseline and updatefiles in parallel — each directory contains ~750 files,
-    # so running them concurrently roughly halves wall time on the HPC.
-    subdirs = ["baseline", "updatefiles"]
-
-    def _download_subdir(subdir):
-        pull_via_wget(
-            pubmed_base,
-            subdir,
-            decompress=False,
-            subpath="PubMed",
-            recurse=WgetRecursionOptions.RECURSE_SUBFOLDERS,
-            # A recursive download must be timestamped and must not resume: see pull_via_wget().
-            timestamping=True,
-            continue_incomplete=False,
+    pubmed_dir = os.path.dirname(download_file)
+
+    # Each directory contains ~750 files, and their `.md5` files.
+    pubmed_files = []
+    for subdir in ["baseline", "updatefiles"]:
+        filenames = list_pubmed_files(subdir, listing_base)
+        if not filenames:
+            raise RuntimeError(f"No PubMed files found in {listing_base}{subdir}/.")
+        logger.info(f"Found {len(filenames)} files in PubMed/{subdir}.")
+        pubmed_files.extend(
+            (f"{pubmed_base}{subdir}/{filename}", os.path.join(pubmed_dir, subdir, filename)) for filename in filenames
         )
 
-    with ThreadPoolExecutor(max_workers=len(subdirs)) as pool:
-        futures = {pool.submit(_download_subdir, sd): sd for sd in subdirs}
-        for future in as_completed(futures):
-            subdir = futures[future]
-            exc = future.exception()
-            if exc:
-                raise RuntimeError(f"Failed to download PubMed/{subdir}: {exc}") from exc
-            logger.info(f"Finished downloading PubMed/{subdir}.")
+    headers = {"User-Agent": get_user_agent()}
+    download_files(
+        [DownloadJob(url + ".md5", path + ".md5") for url, path in pubmed_files], workers=workers, headers=headers
+    )
+
+    # MD5 the files we already have (in parallel: hashlib releases the GIL), and download the rest.
+    def _needs_download(pubmed_file):
+        _, path = pubmed_file
+        return not (os.path.exists(path) and verify_pubmed_download_against_md5(path, path + ".md5"))
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        to_download = [f for f, needed in zip(pubmed_files, pool.map(_needs_download, pubmed_files)) if needed]
+    logger.info(f"Downloading {len(to_download)} of {len(pubmed_files)} PubMed files; the rest are already present.")
+    download_files(
+        [DownloadJob(url, path, md5=read_md5_file(path, path + ".md5")) for url, path in to_download],
+        workers=workers,
+        headers=headers,
+    )
 
     # Step 3. Download the PMC/PMID mapping file from PMC.
     # We don't actually use this file -- we currently only use the PMC IDs already included in the PubMed XML files.
@@ -75,6 +123,25 @@ def download_pubmed(download_file, pubmed_base=PUBMED_FTP_BASE, pmc_base="https:
     Path.touch(download_file)
 
 
+def read_md5_file(pubmed_filename, md5_filename):
+    """
+    Read the expected MD5 checksum of a PubMed file from the `.md5` file PubMed publishes alongside it,
+    which is a single line like `MD5(pubmed26n0001.xml.gz)= <checksum>`.
+
+    :param pubmed_filename: The PubMed file the checksum is for (only used in error messages).
+    :param md5_filename: The `.md5` file to read.
+    :return: The expected MD5 checksum, as a hex string.
+    """
+    with open(md5_filename) as md5f:
+        md5_line = md5f.readline().strip()
+        expected_md5 = md5_line.split("= ")[1]
+        if len(expected_md5) != 32:
+            raise RuntimeError(
+                f"Could not verify {pubmed_filename}: could not read MD5 hash from MD5 file {md5_filename}: '{md5_line}'"
+            )
+    return expected_md5
+
+
 def verify_pubmed_download_against_md5(pubmed_filename, md5_filename):
     """
     Verify a single PubMed download file against its MD5 checksum in the `.md5` file.
@@ -98,14 +165,7 @@ def verify_pubmed_download_against_md5(pubmed_filename, md5_filename):
         logger.warning(f"Could not verify {pubmed_filename}: no MD5 file found at {md5_filename}.")
         return False
 
-    with open(md5_filename) as md5f:
-        md5_line = md5f.readline().strip()
-        expected_md5 = md5_line.split("= ")[1]
-        if len(expected_md5) != 32:
-            raise RuntimeError(
-                f"Could not verify {pubmed_filename}: could not read MD5 hash from MD5 file {md5_filename}: '{md5_line}'"
-            )
-
+    expected_md5 = read_md5_file(pubmed_filename, md5_filename)
     if md5hash == expected_md5:
         return True
     logger.warning(
@@ -165,116 +225,190 @@ def verify_pubmed_downloads(pubmed_directories, done_filename, pubmed_base=PUBME
     Path.touch(done_filename)
 
 
+# The number of bytes of a gzipped PubMed XML file to decompress and feed to the XML parser at a time.
+PUBMED_PARSE_CHUNK_SIZE = 1 << 20
+
+
+def parse_pubmed_file(pubmed_filename, titles_file, pmid_id_file, pmid_doi_concord_file, status_file):
+    """
+    Parse a single PubMed XML file into shards of the outputs of parse_pubmed_into_tsvs().
+
+    Each PubmedArticle element is discarded as soon as it has been written out, so memory use doesn't grow with the
+    size of the file.
+
+    :param pubmed_filename: The gzipped PubMed XML file to parse.
+    :param titles_file: An output TSV file in the format `<PMID>\t<TITLE>`.
+    :param pmid_id_file: An output ids file in the format `<PMID>\t<TYPE>`.
+    :param pmid_doi_concord_file: An output concord file in the format `<PMID>\teq\t<DOI>` and other identifiers.
+    :param status_file: An output TSV file with a line for each PMID in the order they were first seen in this file,
+        followed by every PubStatus it had in this file, all separated by tabs.
+    """
+    logger.info(f"Parsing PubMed Baseline {pubmed_filename}")
+
+    start_time = time.time_ns()
+    count_articles = 0
+    count_pmids = 0
+    count_dois = 0
+    count_pmcs = 0
+    count_titles = 0
+    file_pubstatuses = set()
+    pmid_status = defaultdict(set)
+
+    with (
+        gzip.open(pubmed_filename, "rb") as pubmedf,
+        open(titles_file, "w") as titlesf,
+        open(pmid_id_file, "w") as pmidf,
+        open(pmid_doi_concord_file, "w") as concordf,
+    ):
+        # Read every XML entry from the PubMed file.
+        parser = ET.XMLPullParser(["end"])
+        while chunk := pubmedf.read(PUBMED_PARSE_CHUNK_SIZE):
+            parser.feed(chunk)
+            for event, elem in parser.read_events():
+                if elem.tag != "PubmedArticle":
+                    continue
+                count_articles += 1
+
+                # Look for the pieces of information we want.
+                pmids = elem.findall("./PubmedData/ArticleIdList/ArticleId[@IdType='pubmed']")
+                dois = elem.findall("./PubmedData/ArticleIdList/ArticleId[@IdType='doi']")
+                pmcs = elem.findall("./PubmedData/ArticleIdList/ArticleId[@IdType='pmc']")
+                titles = elem.findall(".//ArticleTitle")
+
+                # Retrieve the PubDates containing PubStatuses.
+                pubdates_with_pubstatus = elem.findall("./PubmedData/History/PubMedPubDate[@PubStatus]")
+                pubstatuses = set()
+                for pubdate in pubdates_with_pubstatus:
+                    # We ignore the dates, and instead record all the PubStatuses that a PMID has ever had.
+                    if pubdate.get("PubStatus"):
+                        pubstatuses.add(pubdate.get("PubStatus"))
+
+                # Write information for each PMID.
+                for pmid in pmids:
+                    count_pmids += 1
+
+                    # Write out PMID type.
+                    pmidf.write(f"{PMID}:{pmid.text}\t{JOURNAL_ARTICLE}\n")
+
+                    # Update PMID status.
+                    pmid_status[f"{PMID}:" + pmid.text].update(pubstatuses)
+                    file_pubstatuses.update(pubstatuses)
+
+                    # Write out the titles.
+                    for title in titles:
+                        count_titles += 1
+                        # Convert newlines into '\n'.
+                        title_text = title.text
+                        if not title_text:
+                            continue
+                        title_text = title_text.replace("\n", "\\n")
+
+                        titlesf.write(f"{PMID}:{pmid.text}\t{title_text}\n")
+
+                    # Write out the DOIs to the concords file.
+                    for doi in dois:
+                        count_dois += 1
+                        concordf.write(f"{PMID}:{pmid.text}\teq\t{DOI}:{doi.text}\n")
+
+                    # Write out the PMCIDs to the concords file.
+                    for pmc in pmcs:
+                        count_pmcs += 1
+                        concordf.write(f"{PMID}:{pmid.text}\teq\t{PMC}:{pmc.text}\n")
+
+                # We're done with this article, so only keep an empty element in the tree.
+                elem.clear()
+        parser.close()
+
+    with open(status_file, "w") as statusf:
+        for pmid, statuses in pmid_status.items():
+            statusf.write("\t".join([pmid, *sorted(statuses)]) + "\n")
+
+    time_taken_in_seconds = float(time.time_ns() - start_time) / 1_000_000_000
+    logger.info(
+        f"Parsed {count_articles} articles from PubMed {pubmed_filename} in "
+        + f"{time_taken_in_seconds:.4f} seconds: {count_pmids} PMIDs, {count_dois} DOIs, "
+        + f"{count_pmcs} PMCs, "
+        + f"{count_titles} titles with the following PubStatuses: {sorted(file_pubstatuses)}."
+    )
+
+
 def parse_pubmed_into_tsvs(
-    baseline_dir, updatefiles_dir, titles_file, status_file, pmid_id_file, pmid_doi_concord_file, metadata_yaml
+    baseline_dir,
+    updatefiles_dir,
+    titles_file,
+    status_file,
+    pmid_id_file,
+    pmid_doi_concord_file,
+    metadata_yaml,
+    workers=1,
 ):
     """
     Read through the PubMed files in the baseline_dir and updatefiles_dir, and writes out label and status information.
 
+    Each PubMed file is parsed by parse_pubmed_file() into its own shard of the outputs, in a pool of `workers`
+    processes. The shards are then concatenated in file order, so the outputs are the same whatever the number of
+    workers.
+
     :param baseline_dir: The PubMed baseline directory to parse.
     :param updatefiles_dir: The PubMed updatefiles directory to parse.
     :param titles_file: An output TSV file in the format `<PMID>\t<TITLE>`.
     :param status_file: A JSON file containing publication status information.
     :param pmid_doi_concord_file: A concord file in the format `<PMID>\teq\t<DOI>` and other identifiers.
     :param metadata_yaml: The metadata YAML file to write.
+    :param workers: The number of worker processes to parse PubMed files in.
     """
 
-    # We can write labels and concords as we go.
-    with (
-        open(titles_file, "w") as titlesf,
-        open(pmid_id_file, "w") as pmidf,
-        open(pmid_doi_concord_file, "w") as concordf,
-    ):
-        # Track PubMed article statuses. In theory the final PubMed entry should have all the dates, which should
-        # tell us the final status of a publication, but really we just want to know if the article has ever been
-        # marked as retracted, so instead we track every status that has ever been attached to any article. We
-        # don't have a way of tracking properties yet (https://github.com/NCATSTranslator/Babel/issues/155), so for now
-        # we write this out in JSON to the status_file.
-        pmid_status = defaultdict(set)
-
-        # Read every file in the baseline and updatefiles directories (they have the same format).
-        baseline_filenames = list(map(lambda fn: os.path.join(baseline_dir, fn), sorted(os.listdir(baseline_dir))))
-        updatefiles_filenames = list(
-            map(lambda fn: os.path.join(updatefiles_dir, fn), sorted(os.listdir(updatefiles_dir)))
-        )
-
-        for pubmed_filename in baseline_filenames + updatefiles_filenames:
-            if not pubmed_filename.endswith(".xml.gz"):
-                logger.warning(f"Skipping non-gzipped-XML file {pubmed_filename} in PubMed files.")
-                continue
-
-            with gzip.open(pubmed_filename, "rt") as pubmedf:
-                logger.info(f"Parsing PubMed Baseline {pubmed_filename}")
-
-                start_time = time.time_ns()
-                count_articles = 0
-                count_pmids = 0
-                count_dois = 0
-                count_pmcs = 0
-                count_titles = 0
-                file_pubstatuses = set()
-
-                # Read every XML entry from every PubMed file.
-                parser = ET.XMLPullParser(["end"])
-                for line in pubmedf:
-                    parser.feed(line)
-                    for event, elem in parser.read_events():
-                        if event == "end" and elem.tag == "PubmedArticle":
-                            count_articles += 1
-
-                            # Look for the pieces of information we want.
-                            pmids = elem.findall("./PubmedData/ArticleIdList/ArticleId[@IdType='pubmed']")
-                            dois = elem.findall("./PubmedData/ArticleIdList/ArticleId[@IdType='doi']")
-                            pmcs = elem.findall("./PubmedData/ArticleIdList/ArticleId[@IdType='pmc']")
-                            titles = elem.findall(".//ArticleTitle")
-
-                            # Retrieve the PubDates containing PubStatuses.
-                            pubdates_with_pubstatus = elem.findall("./PubmedData/History/PubMedPubDate[@PubStatus]")
-                            pubstatuses = set()
-                            for pubdate in pubdates_with_pubstatus:
-                                # We ignore the dates, and instead record all the PubStatuses that a PMID has ever had.
-                                if pubdate.get("PubStatus"):
-                                    pubstatuses.add(pubdate.get("PubStatus"))
-
-                            # Write information for each PMID.
-                            for pmid in pmids:
-                                count_pmids += 1
-
-                                # Write out PMID type.
-                                pmidf.write(f"{PMID}:{pmid.text}\t{JOURNAL_ARTICLE}\n")
-
-                                # Update PMID status.
-                                pmid_status[f"{PMID}:" + pmid.text].update(pubstatuses)
-                                file_pubstatuses.update(pubstatuses)
-
-                                # Write out the titles.
-                                for title in titles:
-                                    count_titles += 1
-                                    # Convert newlines into '\n'.
-                                    title_text = title.text
-                                    if not title_text:
-                                        continue
-                                    title_text = title_text.replace("\n", "\\n")
-
-                                    titlesf.write(f"{PMID}:{pmid.text}\t{title_text}\n")
-
-                                # Write out the DOIs to the concords file.
-                                for doi in dois:
-                                    count_dois += 1
-                                    concordf.write(f"{PMID}:{pmid.text}\teq\t{DOI}:{doi.text}\n")
-
-                                # Write out the PMCIDs to the concords file.
-                                for pmc in pmcs:
-                                    count_pmcs += 1
-                                    concordf.write(f"{PMID}:{pmid.text}\teq\t{PMC}:{pmc.text}\n")
-
-                time_taken_in_seconds = float(time.time_ns() - start_time) / 1_000_000_000
-                logger.info(
-                    f"Parsed {count_articles} articles from PubMed {pubmed_filename} in "
-                    + f"{time_taken_in_seconds:.4f} seconds: {count_pmids} PMIDs, {count_dois} DOIs, "
-                    + f"{count_pmcs} PMCs, "
-                    + f"{count_titles} titles with the following PubStatuses: {sorted(file_pubstatuses)}."
-                )
+    # Read every file in the baseline and updatefiles directories (they have the same format).
+    baseline_filenames = list(map(lambda fn: os.path.join(baseline_dir, fn), sorted(os.listdir(baseline_dir))))
+    updatefiles_filenames = list(map(lambda fn: os.path.join(updatefiles_dir, fn), sorted(os.listdir(updatefiles_dir))))
+
+    pubmed_filenames = []
+    for pubmed_filename in baseline_filenames + updatefiles_filenames:
+        if not pubmed_filename.endswith(".xml.gz"):
+            logger.warning(f"Skipping non-gzipped-XML file {pubmed_filename} in PubMed files.")
+            continue
+        pubmed_filenames.append(pubmed_filename)
+
+    # Track PubMed article statuses. In theory the final PubMed entry should have all the dates, which should
+    # tell us the final status of a publication, but really we just want to know if the article has ever been
+    # marked as retracted, so instead we track every status that has ever been attached to any article. We
+    # don't have a way of tracking properties yet (https://github.com/NCATSTranslator/Babel/issues/155), so for now
+    # we write this out in JSON to the status_file.
+    pmid_status = defaultdict(set)
+
+    ensure_parent_dir(titles_file)
+    with tempfile.TemporaryDirectory(
+        prefix=".pubmed-shards-", dir=os.path.dirname(os.path.abspath(titles_file))
+    ) as shard_dir:
+        shards = [
+            {
+                kind: os.path.join(shard_dir, f"{kind}-{index}.tsv")
+                for kind in ("titles", "pmid_ids", "concords", "statuses")
+            }
+            for index in range(len(pubmed_filenames))
+        ]
+        tasks = [
+            (pubmed_filename, shard["titles"], shard["pmid_ids"], shard["concords"], shard["statuses"])
+            for pubmed_filename, shard in zip(pubmed_filenames, shards)
+        ]
+        if workers > 1:
+            logger.info(f"Parsing {len(pubmed_filenames)} PubMed files over {workers} worker processes")
+            # Spawn rather than fork, as write_compendium() does, so workers don't inherit the caller's state.
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                for future in [pool.submit(parse_pubmed_file, *task) for task in tasks]:
+                    future.result()
+        else:
+            for task in tasks:
+                parse_pubmed_file(*task)
+
+        concatenate_files([shard["titles"] for shard in shards], titles_file)
+        concatenate_files([shard["pmid_ids"] for shard in shards], pmid_id_file)
+        concatenate_files([shard["concords"] for shard in shards], pmid_doi_concord_file)
+        for shard in shards:
+            with open(shard["statuses"]) as statusf:
+                for line in statusf:
+                    pmid, *statuses = line.rstrip("\n").split("\t")
+                    pmid_status[pmid].update(statuses)
 
     # Write the statuses into a gzipped JSONL file.
     with gzip.open(status_file, "wt") as statusf:
@@ -287,8 +421,8 @@ def parse_pubmed_into_tsvs(
         name="parse_pubmed_into_tsvs()",
         description="Parse PubMed files into TSVs and JSONL status files.",
         sources=[
-            {"type": "download", "name": "PubMed Baseline", "url": f"{PUBMED_FTP_BASE}baseline/"},
-            {"type": "download", "name": "PubMed Updates", "url": f"{PUBMED_FTP_BASE}updatefiles/"},
+            {"type": "download", "name": "PubMed Baseline", "url": f"{PUBMED_HTTPS_BASE}baseline/"},
+            {"type": "download", "name": "PubMed Updates", "url": f"{PUBMED_HTTPS_BASE}updatefiles/"},
         ],
         counts={
             "pmid_count": len(pmid_status.keys()),
@@ -2,9 +2,11 @@ import logging
 
 import src.datahandlers.mesh as mesh
 import src.datahandlers.umls as umls
-from src.babel_utils import glom, read_identifier_file, write_compendium
+from src.babel_utils import write_compendium
 from src.categories import ORGANISM_TAXON
+from src.incremental import incremental_state_dir
 from src.metadata.provenance import write_concord_metadata
+from src.model.incremental_glom import glom_files
 from src.prefixes import MESH, NCBITAXON, UMLS
 from src.util import LoggingUtil
 
@@ -106,24 +108,8 @@ def build_relationships(outfile, mesh_ids, metadata_yaml):
 def build_compendia(concordances, metadata_yamls, identifiers, icrdf_filename):
     """:concordances: a list of files from which to read relationships
     :identifiers: a list of files from which to read identifiers and optional categories"""
-    dicts = {}
-    types = {}
     uniques = [NCBITAXON, MESH, UMLS]
-    for ifile in identifiers:
-        print("loading", ifile)
-        new_identifiers, new_types = read_identifier_file(ifile)
-        glom(dicts, new_identifiers, unique_prefixes=uniques)
-        types.update(new_types)
-    for infile in concordances:
-        print(infile)
-        print("loading", infile)
-        pairs = []
-        with open(infile) as inf:
-            for line in inf:
-                x = line.strip().split("\t")
-                pairs.append(set([x[0], x[2]]))
-        glom(dicts, pairs, unique_prefixes=uniques)
-    gene_sets = set([frozenset(x) for x in dicts.values()])
+    gene_sets = glom_files(identifiers, concordances, uniques, state_dir=incremental_state_dir("glom", "taxon"))
     baretype = ORGANISM_TAXON.split(":")[-1]
     # We need to use extra_prefixes since UMLS is not listed as an identifier prefix at
     # https://biolink.github.io/biolink-model/docs/OrganismTaxon.html
@@ -3,6 +3,7 @@ import ftplib
 import pyoxigraph
 
 from src.babel_utils import parse_rdf_literal, pull_via_ftp
+from src.datahandlers.rdf_store import RdfSource, open_rdf_store, store_dirname
 from src.prefixes import CHEMBLCOMPOUND
 
 
@@ -29,6 +30,11 @@ def pull_chembl(moleculefilename):
         # pull_via_ftp('ftp.ebi.ac.uk', '/pub/databases/chembl/ChEMBL-RDF/latest/', 'cco.ttl.gz', decompress_data=True, outfilename='CHEMBL/cco.ttl')
 
 
+def rdf_sources(moleculefile, ccofile):
+    """Return the RDF files that make up the ChEMBL store: the cco class hierarchy, then the molecules."""
+    return [RdfSource(ccofile, pyoxigraph.RdfFormat.TURTLE), RdfSource(moleculefile, pyoxigraph.RdfFormat.TURTLE)]
+
+
 def get_latest_chembl_name() -> str:
     # get a handle to the ftp directory
     ftp = ftplib.FTP("ftp.ebi.ac.uk")
@@ -57,18 +63,7 @@ class ChemblRDF:
 
     # Note that we need both the molecule file, and the cco file.  The latter contains the class hierarchy
     def __init__(self, ifname, ccofile):
-        from datetime import datetime as dt
-
-        print("loading chembl")
-        start = dt.now()
-        self.m = pyoxigraph.Store()
-        with open(ccofile, "rb") as inf:
-            self.m.bulk_load(input=inf, format=pyoxigraph.RdfFormat.TURTLE)
-        with open(ifname, "rb") as inf:
-            self.m.bulk_load(input=inf, format=pyoxigraph.RdfFormat.TURTLE)
-        end = dt.now()
-        print("loading complete")
-        print(f"took {end - start}")
+        self.m = open_rdf_store(store_dirname(ifname), rdf_sources(ifname, ccofile))
 
     def pull_labels(self, ofname):
         s = """PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
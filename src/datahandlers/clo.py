@@ -4,6 +4,7 @@ import pyoxigraph
 
 from src.babel_utils import parse_rdf_literal, pull_via_urllib
 from src.categories import CELL_LINE
+from src.datahandlers.rdf_store import RdfSource, open_rdf_store, store_dirname
 from src.metadata.provenance import write_download_metadata
 from src.prefixes import CLO, ORPHANET
 from src.util import LoggingUtil, Text
@@ -20,20 +21,16 @@ def pull_clo(metadata_file):
     )
 
 
+def rdf_sources(ifname):
+    """Return the RDF files that make up the CLO store."""
+    return [RdfSource(ifname, pyoxigraph.RdfFormat.RDF_XML, base_iri="http://example.org/")]
+
+
 class CLOgraph:
     """Load the file for querying"""
 
     def __init__(self, ifname):
-        from datetime import datetime as dt
-
-        print("loading CLO")
-        start = dt.now()
-        self.m = pyoxigraph.Store()
-        with open(ifname, "rb") as inf:
-            self.m.bulk_load(input=inf, format=pyoxigraph.RdfFormat.RDF_XML, base_iri="http://example.org/")
-        end = dt.now()
-        print("loading complete")
-        print(f"took {end - start}")
+        self.m = open_rdf_store(store_dirname(ifname), rdf_sources(ifname))
 
     def pull_CLO_labels_and_synonyms(self, lname, sname):
         with open(lname, "w") as labelfile, open(sname, "w") as synfile:
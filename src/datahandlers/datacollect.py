@@ -60,8 +60,10 @@ def pull_hgnc():
 def pull_prot(which, refresh):
     # swissname = pull_via_ftplib('ftp.uniprot.org','/pub/databases/uniprot/current_release/knowledgebase/complete/',f'uniprot_{which}.fasta.gz',decompress_data=True,outfilename=f'uniprot_{which}.fasta')
     if refresh:
+        # Over HTTPS rather than FTP, so that download_file() can resume an interrupted download (see
+        # docs/sources/DownloadPatterns.md).
         swissname = pull_via_urllib(
-            "ftp://ftp.uniprot.org/pub/databases/uniprot/current_release/knowledgebase/complete/",
+            "https://ftp.uniprot.org/pub/databases/uniprot/current_release/knowledgebase/complete/",
             f"uniprot_{which}.fasta.gz",
         )
     else:
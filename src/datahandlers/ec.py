@@ -2,6 +2,7 @@ import pyoxigraph
 
 from src.babel_utils import parse_rdf_literal, pull_via_urllib
 from src.categories import MOLECULAR_ACTIVITY
+from src.datahandlers.rdf_store import RdfSource, open_rdf_store, store_dirname
 from src.prefixes import EC
 
 
@@ -9,6 +10,14 @@ def pull_ec():
     pull_via_urllib("https://ftp.expasy.org/databases/enzyme/", "enzyme.rdf", subpath="EC", decompress=False)
 
 
+def rdf_sources(ifname):
+    """Return the RDF files that make up the EC store.
+
+    enzyme.rdf needs a base_iri; see ECgraph.__init__().
+    """
+    return [RdfSource(ifname, pyoxigraph.RdfFormat.RDF_XML, base_iri="http://example.org/")]
+
+
 class ECgraph:
     """Load the mesh rdf file for querying"""
 
@@ -23,16 +32,7 @@ class ECgraph:
 
         :param ifname: The path to the downloaded enzyme.rdf file.
         """
-        from datetime import datetime as dt
-
-        print("loading EC")
-        start = dt.now()
-        self.m = pyoxigraph.Store()
-        with open(ifname, "rb") as inf:
-            self.m.bulk_load(input=inf, format=pyoxigraph.RdfFormat.RDF_XML, base_iri="http://example.org/")
-        end = dt.now()
-        print("loading complete")
-        print(f"took {end - start}")
+        self.m = open_rdf_store(store_dirname(ifname), rdf_sources(ifname))
 
     def pull_EC_labels_and_synonyms(self, lname, sname):
         with open(lname, "w") as labelfile, open(sname, "w") as synfile:
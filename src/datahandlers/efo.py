@@ -3,6 +3,7 @@ import logging
 import pyoxigraph
 
 from src.babel_utils import parse_rdf_literal, pull_via_urllib
+from src.datahandlers.rdf_store import RdfSource, open_rdf_store, store_dirname
 from src.metadata.provenance import write_concord_metadata
 from src.prefixes import EFO, ORPHANET
 from src.util import LoggingUtil, Text
@@ -14,6 +15,14 @@ def pull_efo():
     _ = pull_via_urllib("http://www.ebi.ac.uk/efo/", "efo.owl", subpath="EFO", decompress=False)
 
 
+def rdf_sources(efo_owl_file_path):
+    """Return the RDF files that make up the EFO store.
+
+    efo.owl needs a base_iri; see EFOgraph.__init__().
+    """
+    return [RdfSource(efo_owl_file_path, pyoxigraph.RdfFormat.RDF_XML, base_iri="http://example.org/")]
+
+
 class EFOgraph:
     """Load the mesh rdf file for querying"""
 
@@ -25,15 +34,7 @@ class EFOgraph:
         </owl:Ontology>
 
         That about='' really makes pyoxigraph annoyed. So we have to give it a base_iri on load, then its ok"""
-        from datetime import datetime as dt
-
-        logger.info(f"Loading EFO from {efo_owl_file_path}.")
-        start = dt.now()
-        self.m = pyoxigraph.Store()
-        with open(efo_owl_file_path) as inf:
-            self.m.bulk_load(input=inf, format=pyoxigraph.RdfFormat.RDF_XML, base_iri="http://example.org/")
-        end = dt.now()
-        logger.info(f"EFO loading complete in {end - start}.")
+        self.m = open_rdf_store(store_dirname(efo_owl_file_path), rdf_sources(efo_owl_file_path))
 
     def pull_EFO_labels_and_synonyms(self, lname, sname):
         with open(lname, "w") as labelfile, open(sname, "w") as synfile:
@@ -35,10 +35,17 @@ def handle_metabolite(metabolite, lfile, synfile, smifile):
 
 
 def make_labels_and_synonyms_and_smiles(inputfile, labelfile, synfile, smifile):
-    with open(inputfile) as inf:
-        xml = inf.read()
-    parsed = xmltodict.parse(xml)
-    metabolites = parsed["hmdb"]["metabolite"]
+    """Write the labels, synonyms and SMILES of every metabolite in hmdb_metabolites.xml.
+
+    The XML is several GB, so rather than parsing all of it into one dict, xmltodict streams it and hands each
+    <metabolite> (depth 2, under <hmdb>) to handle_metabolite() as soon as it has been parsed. Returning True
+    from the callback tells xmltodict to carry on without keeping the metabolite, so memory stays flat.
+    """
     with open(labelfile, "w") as lfile, open(synfile, "w") as sfile, open(smifile, "w") as smiles:
-        for metabolite in metabolites:
+
+        def handle_item(_, metabolite):
             handle_metabolite(metabolite, lfile, sfile, smiles)
+            return True
+
+        with open(inputfile, "rb") as inf:
+            xmltodict.parse(inf, item_depth=2, item_callback=handle_item)
@@ -5,6 +5,7 @@ import pyoxigraph
 
 from src.babel_utils import make_local_name, pull_via_ftp
 from src.categories import ANATOMICAL_ENTITY, CELL, CELLULAR_COMPONENT
+from src.datahandlers.rdf_store import RdfSource, has_fresh_store, open_rdf_store, store_dirname
 from src.prefixes import MESH
 
 MESH_IRI_PREFIX = "http://id.nlm.nih.gov/mesh/"
@@ -24,6 +25,11 @@ def get_mesh_id_from_iri(iri) -> str:
     return s[len(MESH_IRI_PREFIX) :]
 
 
+def rdf_sources(meshfile):
+    """Return the RDF files that make up the MeSH store."""
+    return [RdfSource(meshfile, pyoxigraph.RdfFormat.N_TRIPLES)]
+
+
 def pull_mesh():
     pull_via_ftp("ftp.nlm.nih.gov", "/online/mesh/rdf", "mesh.nt.gz", decompress_data=True, outfilename="MESH/mesh.nt")
 
@@ -34,33 +40,31 @@ class Mesh:
     # Tracks how many Mesh instances currently hold mesh.nt in memory.
     # mesh.nt occupies ~2 GB in pyoxigraph's in-memory store; running two at the
     # same time on a 16 GB machine causes severe swapping or OOM failures.
+    # Instances that open the persistent store built by the mesh_rdf_store rule
+    # keep mesh.nt on disk and aren't counted.
     _active_instances: int = 0
 
     def __init__(self):
-        if Mesh._active_instances > 0:
+        ifname = make_local_name("mesh.nt", subpath="MESH")
+        sources = rdf_sources(ifname)
+        store_dir = store_dirname(ifname)
+        self.in_memory = not has_fresh_store(store_dir, sources)
+        if self.in_memory and Mesh._active_instances > 0:
             warnings.warn(
                 f"{Mesh._active_instances} Mesh instance(s) are already loaded in this "
                 "process. Each instance holds mesh.nt in an in-memory pyoxigraph store "
                 "(~2 GB); running multiple simultaneously can exhaust RAM on machines "
-                "with ≤16 GB and cause severe slowdowns or OOM failures.",
+                "with ≤16 GB and cause severe slowdowns or OOM failures. Build the "
+                "persistent store with the mesh_rdf_store rule to avoid this.",
                 ResourceWarning,
                 stacklevel=2,
             )
-        ifname = make_local_name("mesh.nt", subpath="MESH")
-        from datetime import datetime as dt
-
-        print("loading mesh.nt")
-        start = dt.now()
-        self.m = pyoxigraph.Store()
-        with open(ifname, "rb") as inf:
-            self.m.bulk_load(input=inf, format=pyoxigraph.RdfFormat.N_TRIPLES)
-        end = dt.now()
-        print("loading complete")
-        print(f"took {end - start}")
-        Mesh._active_instances += 1  # only after successful load
+        self.m = open_rdf_store(store_dir, sources)
+        if self.in_memory:
+            Mesh._active_instances += 1  # only after successful load
 
     def __del__(self):
-        if hasattr(self, "m"):  # only if __init__ completed successfully
+        if getattr(self, "in_memory", False) and hasattr(self, "m"):  # only if __init__ completed successfully
             Mesh._active_instances = max(0, Mesh._active_instances - 1)
 
     def get_terms_in_tree(self, top_treenum):
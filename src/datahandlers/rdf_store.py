@@ -0,0 +1,112 @@
+"""Persistent, on-disk pyoxigraph stores for the RDF sources that datahandlers query with SPARQL.
+
+MeSH, ChEMBL, EC, EFO, CLO and Rhea are each queried by several Snakemake rules, and every one of
+those rules used to bulk-load the whole RDF file into an in-memory ``pyoxigraph.Store`` before
+running a single query: for mesh.nt alone that is about 2 GB of RAM and several minutes per rule.
+Instead, a ``*_rdf_store`` rule now loads each source once into a RocksDB-backed store directory
+next to the downloaded file (see :func:`store_dirname`), and the datahandler classes open that
+directory read-only with :func:`open_rdf_store`. Opening a read-only store is near-instant, keeps
+the data on disk rather than in RAM, and any number of jobs can have the same store open at once.
+
+If there is no store, or it is older than one of the files it was built from (a re-downloaded
+source, say), :func:`open_rdf_store` falls back to loading the files into memory as before, so
+datahandlers still work when they are called outside of Snakemake.
+"""
+
+import os
+import shutil
+from datetime import datetime as dt
+from typing import NamedTuple
+
+import pyoxigraph
+
+from src.util import get_logger, get_memory_usage_summary
+
+logger = get_logger(__name__)
+
+STORE_SUFFIX = ".oxigraph"
+
+# Written into a store directory once it has been completely built; its mtime is the age of the store.
+COMPLETE_FILENAME = "babel-rdf-store-complete"
+
+
+class RdfSource(NamedTuple):
+    """An RDF file to load into a store, with the arguments Store.bulk_load() needs to parse it."""
+
+    filename: str
+    format: pyoxigraph.RdfFormat
+    base_iri: str | None = None
+
+
+def store_dirname(filename: str) -> str:
+    """Return the path of the persistent store built from an RDF file."""
+    return filename + STORE_SUFFIX
+
+
+def _bulk_load(store: pyoxigraph.Store, sources: list[RdfSource]):
+    for source in sources:
+        logger.info(f"Loading {source.filename}")
+        start = dt.now()
+        with open(source.filename, "rb") as inf:
+            store.bulk_load(input=inf, format=source.format, base_iri=source.base_iri)
+        logger.info(f"Loaded {source.filename} in {dt.now() - start}: {get_memory_usage_summary()}")
+
+
+def build_rdf_store(store_dir: str, sources: list[RdfSource]):
+    """Load RDF files into a new persistent store.
+
+    The store is built in a temporary directory next to store_dir and renamed into place once it is
+    complete, so an interrupted build never leaves a store that open_rdf_store() would use.
+
+    :param store_dir: The store directory to create. Any existing store there is replaced.
+    :param sources: The RDF files to load, in order.
+    """
+    tmp_dir = store_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    store = pyoxigraph.Store(tmp_dir)
+    _bulk_load(store, sources)
+    store.optimize()
+    store.flush()
+    del store
+
+    with open(os.path.join(tmp_dir, COMPLETE_FILENAME), "w") as outf:
+        for source in sources:
+            outf.write(f"{source.filename}\n")
+    shutil.rmtree(store_dir, ignore_errors=True)
+    os.replace(tmp_dir, store_dir)
+    logger.info(f"Built RDF store {store_dir} from {[source.filename for source in sources]}")
+
+
+def has_fresh_store(store_dir: str, sources: list[RdfSource]) -> bool:
+    """Return True if store_dir holds a completely built store that is newer than all of its sources.
+
+    A store older than one of its sources is ignored (with a warning) rather than returning stale triples.
+    """
+    complete_filename = os.path.join(store_dir, COMPLETE_FILENAME)
+    if not os.path.exists(complete_filename):
+        return False
+    built = os.path.getmtime(complete_filename)
+    for source in sources:
+        if os.path.exists(source.filename) and os.path.getmtime(source.filename) > built:
+            logger.warning(f"Ignoring RDF store {store_dir}: it is older than {source.filename}")
+            return False
+    return True
+
+
+def open_rdf_store(store_dir: str, sources: list[RdfSource]) -> pyoxigraph.Store:
+    """Open the persistent store for some RDF files read-only, or load them into memory if there isn't one.
+
+    :param store_dir: The store directory built by build_rdf_store().
+    :param sources: The RDF files the store was built from, loaded into an in-memory store if store_dir is
+        missing or out of date.
+    :return: A pyoxigraph Store to query.
+    """
+    if has_fresh_store(store_dir, sources):
+        logger.info(f"Opening RDF store {store_dir} read-only")
+        return pyoxigraph.Store.read_only(store_dir)
+
+    logger.info(f"No up-to-date RDF store in {store_dir}, loading its sources into memory")
+    store = pyoxigraph.Store()
+    _bulk_load(store, sources)
+    return store
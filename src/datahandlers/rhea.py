@@ -1,6 +1,7 @@
 import pyoxigraph
 
 from src.babel_utils import make_local_name, pull_via_urllib
+from src.datahandlers.rdf_store import RdfSource, open_rdf_store, store_dirname
 from src.metadata.provenance import write_concord_metadata
 from src.prefixes import EC, RHEA
 
@@ -9,22 +10,18 @@ def pull_rhea():
     pull_via_urllib("https://ftp.expasy.org/databases/rhea/rdf/", "rhea.rdf.gz", subpath="RHEA", decompress=True)
 
 
+def rdf_sources(ifname):
+    """Return the RDF files that make up the Rhea store."""
+    return [RdfSource(ifname, pyoxigraph.RdfFormat.RDF_XML)]
+
+
 class Rhea:
     """Load the mesh rdf file for querying"""
 
     def __init__(self):
         ifname = make_local_name("rhea.rdf", subpath="RHEA")
         self.filename = ifname
-        from datetime import datetime as dt
-
-        print("loading rhea")
-        start = dt.now()
-        self.m = pyoxigraph.Store()
-        with open(ifname, "rb") as inf:
-            self.m.bulk_load(input=inf, format=pyoxigraph.RdfFormat.RDF_XML)
-        end = dt.now()
-        print("loading complete")
-        print(f"took {end - start}")
+        self.m = open_rdf_store(store_dirname(ifname), rdf_sources(ifname))
 
     def pull_rhea_labels(self, ofname):
         s = """   PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
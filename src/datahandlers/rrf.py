@@ -0,0 +1,223 @@
+"""Read UMLS and RxNorm Rich Release Format (RRF) files from a column-pruned Parquet copy.
+
+MRCONSO.RRF is several gigabytes of pipe-separated text, and a dozen rules used to split every line
+of it in Python only to look at three or four columns of the few rows from the sources they
+wanted. The umls_parquet and rxnorm_parquet rules (datacollect.snakefile) convert each RRF file
+once, with :func:`convert_rrf_to_parquet`, into a Parquet file next to it (MRCONSO.RRF ->
+MRCONSO.parquet) that keeps only the columns Babel reads. For the concept name files
+(MRCONSO, RXNCONSO), it also precomputes whether each row passes the standard English and
+unsuppressed check in a STANDARD column, the same check as umls.check_mrconso_line().
+
+Call sites then use :func:`read_rrf` to ask for the columns and rows they need. It is given the
+RRF filename, as before: if the Parquet file next to it is up to date, only the requested columns
+are read from it, with the filters applied by DuckDB; otherwise, it warns and falls back to
+splitting the RRF file in Python, so the results are the same either way. Rows come back in the
+order they are in the RRF file, which write_rxnorm_ids() relies on.
+
+Every row is kept, whatever its language or SUPPRESS flag, because drugchemical.get_aui_to_cui()
+needs every AUI in MRCONSO and RXNCONSO.
+"""
+
+import os
+
+from src.exporters.duckdb_exporters import log_duckdb_settings_on_error, setup_duckdb
+from src.util import get_logger
+
+logger = get_logger(__name__)
+
+# The columns of each layout of RRF file, in order. RxNorm uses the same layouts as the UMLS
+# (RXNCONSO calls CUI and AUI RXCUI and RXAUI, but they are in the same places), so MRCONSO and
+# RXNCONSO share a layout, as do MRREL and RXNREL. Every line ends with a "|", so there is one more
+# field than there are columns. See https://www.ncbi.nlm.nih.gov/books/NBK9685/ for the UMLS
+# layouts and https://www.nlm.nih.gov/research/umls/rxnorm/docs/techdoc.html for the RxNorm ones.
+RRF_COLUMNS = {
+    "CONSO": (
+        "CUI",
+        "LAT",
+        "TS",
+        "LUI",
+        "STT",
+        "SUI",
+        "ISPREF",
+        "AUI",
+        "SAUI",
+        "SCUI",
+        "SDUI",
+        "SAB",
+        "TTY",
+        "CODE",
+        "STR",
+        "SRL",
+        "SUPPRESS",
+        "CVF",
+    ),
+    "STY": ("CUI", "TUI", "STN", "STY", "ATUI", "CVF"),
+    "REL": (
+        "CUI1",
+        "AUI1",
+        "STYPE1",
+        "REL",
+        "CUI2",
+        "AUI2",
+        "STYPE2",
+        "RELA",
+        "RUI",
+        "SRUI",
+        "SAB",
+        "SL",
+        "RG",
+        "DIR",
+        "SUPPRESS",
+        "CVF",
+    ),
+}
+
+# The columns kept in the Parquet copy of each layout: the ones some call site reads.
+PARQUET_COLUMNS = {
+    "CONSO": ("CUI", "LAT", "AUI", "SAB", "TTY", "CODE", "STR", "SRL", "SUPPRESS"),
+    "STY": ("CUI", "TUI", "STN", "STY"),
+    "REL": ("CUI1", "AUI1", "STYPE1", "REL", "CUI2", "AUI2", "STYPE2", "RELA", "SAB"),
+}
+
+# The layout of each RRF file, by the name of the file without its extension.
+RRF_LAYOUTS = {
+    "MRCONSO": "CONSO",
+    "RXNCONSO": "CONSO",
+    "MRSTY": "STY",
+    "MRREL": "REL",
+    "RXNREL": "REL",
+}
+
+# How many rows read_rrf() fetches from DuckDB at a time.
+FETCH_ROWS = 100_000
+# The DuckDB memory limit for read_rrf(), in MB. It shares its process with the rule that called it, which is
+# usually building dicts of its own, and a filtered, streamed scan of one Parquet file needs little memory.
+READ_RRF_MEMORY_LIMIT_MB = 2048
+
+
+def rrf_layout(rrf_filename):
+    """Return the layout ("CONSO", "STY" or "REL") of an RRF file, from its name."""
+    name = os.path.splitext(os.path.basename(rrf_filename))[0]
+    try:
+        return RRF_LAYOUTS[name]
+    except KeyError:
+        raise ValueError(f"Don't know the layout of {rrf_filename}: expected one of {sorted(RRF_LAYOUTS)}.") from None
+
+
+def parquet_filename_for(rrf_filename):
+    """Return the filename of the Parquet copy of an RRF file, e.g. UMLS/MRCONSO.parquet for UMLS/MRCONSO.RRF."""
+    return os.path.splitext(rrf_filename)[0] + ".parquet"
+
+
+def is_standard_row(lat, suppress):
+    """The standard check from umls.check_mrconso_line(): an English term that isn't obsolete (O) or suppressed (E)."""
+    return lat == "ENG" and suppress != "O" and suppress != "E"
+
+
+def convert_rrf_to_parquet(rrf_filename, parquet_filename=None, memory_limit_mb=None):
+    """Write the Parquet copy of an RRF file that read_rrf() reads from.
+
+    Only the PARQUET_COLUMNS of the file's layout are kept, as strings (empty fields stay empty strings
+    rather than becoming NULL), in the order of the RRF file. Concept name files also get a boolean
+    STANDARD column. The file is written to a temporary file and renamed into place, so a partly-written
+    file is never read.
+
+    :param rrf_filename: The RRF file to convert.
+    :param parquet_filename: Where to write the Parquet file. Defaults to parquet_filename_for(rrf_filename).
+    :param memory_limit_mb: DuckDB memory limit in MB, past which it spills to its temp_directory.
+    """
+    layout = rrf_layout(rrf_filename)
+    if parquet_filename is None:
+        parquet_filename = parquet_filename_for(rrf_filename)
+
+    # The trailing "|" on every line makes an extra, always-empty field.
+    csv_columns = {column: "VARCHAR" for column in RRF_COLUMNS[layout]}
+    csv_columns["_trailing"] = "VARCHAR"
+    selects = [f"COALESCE({column}, '') AS {column}" for column in PARQUET_COLUMNS[layout]]
+    if layout == "CONSO":
+        selects.append("(COALESCE(LAT, '') = 'ENG' AND COALESCE(SUPPRESS, '') NOT IN ('O', 'E')) AS STANDARD")
+
+    tmp_filename = parquet_filename + ".tmp"
+    duckdb_config = {"memory_limit": f"{memory_limit_mb}MB"} if memory_limit_mb is not None else {}
+    with setup_duckdb(":memory:", duckdb_config) as db:
+        with log_duckdb_settings_on_error(db, f"convert_rrf_to_parquet: write {parquet_filename}"):
+            # RRF has no quoting or escaping: a '"' or '\' in a string is just part of the string.
+            db.sql(
+                f"SELECT {', '.join(selects)} FROM read_csv($rrf, delim='|', header=false, quote='', escape='', "
+                "auto_detect=false, columns=$columns)",
+                params={"rrf": rrf_filename, "columns": csv_columns},
+            ).write_parquet(tmp_filename, compression="zstd")
+            row_count = db.sql("SELECT COUNT(*) FROM read_parquet($p)", params={"p": tmp_filename}).fetchone()[0]
+    os.replace(tmp_filename, parquet_filename)
+    logger.info(f"Converted {row_count:,} rows of {rrf_filename} to {parquet_filename}")
+
+
+def has_fresh_parquet(rrf_filename):
+    """Check whether the Parquet copy of an RRF file exists and is at least as new as the RRF file."""
+    parquet_filename = parquet_filename_for(rrf_filename)
+    if not os.path.exists(parquet_filename):
+        return False
+    if not os.path.exists(rrf_filename):
+        return True
+    return os.path.getmtime(parquet_filename) >= os.path.getmtime(rrf_filename)
+
+
+def read_rrf(rrf_filename, columns, where=None, standard=False):
+    """Yield the requested columns of the rows of an RRF file, in the order they are in the file.
+
+    :param rrf_filename: The RRF file, e.g. .../UMLS/MRCONSO.RRF. Its Parquet copy is read instead if it is
+        up to date.
+    :param columns: The names of the columns to return (from PARQUET_COLUMNS for the file's layout).
+    :param where: An optional dict of column name to a collection of values: only rows whose column has one
+        of those values are returned, e.g. ``{"SAB": {"MSH", "DRUGBANK"}}``.
+    :param standard: If true, only return rows that pass the standard English and unsuppressed check (see
+        umls.check_mrconso_line()). Only concept name files (MRCONSO, RXNCONSO) can be filtered this way.
+    :return: An iterator of tuples of strings, one per row, with the requested columns in the requested order.
+    """
+    layout = rrf_layout(rrf_filename)
+    where = where or {}
+    unknown_columns = sorted(set(columns).union(where) - set(PARQUET_COLUMNS[layout]))
+    if unknown_columns:
+        raise ValueError(f"{rrf_filename} has no columns {unknown_columns} in read_rrf(): {PARQUET_COLUMNS[layout]}")
+    if standard and layout != "CONSO":
+        raise ValueError(f"Only concept name files can be filtered to standard rows, not {rrf_filename}.")
+
+    if has_fresh_parquet(rrf_filename):
+        return _read_parquet(parquet_filename_for(rrf_filename), columns, where, standard)
+    logger.warning(
+        f"{parquet_filename_for(rrf_filename)} is missing or older than {rrf_filename}: reading the RRF file instead."
+    )
+    return _read_rrf_lines(rrf_filename, layout, columns, where, standard)
+
+
+def _read_parquet(parquet_filename, columns, where, standard):
+    conditions = ["STANDARD"] if standard else []
+    params = {"parquet": parquet_filename}
+    for index, (column, values) in enumerate(where.items()):
+        conditions.append(f"list_contains($values{index}, {column})")
+        params[f"values{index}"] = sorted(values)
+    query = f"SELECT {', '.join(columns)} FROM read_parquet($parquet)"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    with setup_duckdb(":memory:", {"memory_limit": f"{READ_RRF_MEMORY_LIMIT_MB}MB"}) as db:
+        with log_duckdb_settings_on_error(db, f"read_rrf: read {parquet_filename}"):
+            result = db.execute(query, params)
+            while rows := result.fetchmany(FETCH_ROWS):
+                yield from rows
+
+
+def _read_rrf_lines(rrf_filename, layout, columns, where, standard):
+    positions = {column: index for index, column in enumerate(RRF_COLUMNS[layout])}
+    column_positions = [positions[column] for column in columns]
+    where_positions = [(positions[column], set(values)) for column, values in where.items()]
+    if standard:
+        lat_position, suppress_position = positions["LAT"], positions["SUPPRESS"]
+
+    with open(rrf_filename) as inf:
+        for line in inf:
+            x = line.rstrip("\r\n").split("|")
+            if standard and not is_standard_row(x[lat_position], x[suppress_position]):
+                continue
+            if all(x[position] in values for position, values in where_positions):
+                yield tuple(x[position] for position in column_positions)
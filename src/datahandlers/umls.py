@@ -9,6 +9,7 @@ import requests
 
 from src.babel_utils import make_local_name
 from src.categories import CHEMICAL_ENTITY, DRUG, MOLECULAR_MIXTURE
+from src.datahandlers.rrf import read_rrf
 from src.metadata.provenance import write_concord_metadata, write_download_metadata
 from src.predicates import HAS_EXACT_SYNONYM
 from src.prefixes import RXCUI, UMLS
@@ -87,17 +88,13 @@ def write_umls_ids(
     output_lines = defaultdict(list)
     semantic_type_trees = defaultdict(set)
     tree_names = defaultdict(set)
-    with open(mrsty) as inf, open(umls_output, "w") as outf:
-        for line in inf:
-            x = line.strip().split("|")
-            cat = x[2]
-            cat_name = x[3]
-
+    with open(umls_output, "w") as outf:
+        for cui, cat, cat_name in read_rrf(mrsty, ["CUI", "STN", "STY"]):
             # Is this on the UMLS ID blocklist? If so, skip it!
-            if x[0] in blocklist_umls_ids:
+            if cui in blocklist_umls_ids:
                 continue
 
-            curie = f"{prefix}:{x[0]}"
+            curie = f"{prefix}:{cui}"
 
             tree_names[cat].add(cat_name)
             semantic_type_trees[curie].add(cat)
@@ -172,18 +169,15 @@ def write_rxnorm_ids(
     If there is an IN or PIN TTY, then it's a ChemicalEntity, otherwise a Drug.
     """
     rxnconso = infile  # os.path.join('input_data', 'private', "RXNCONSO.RRF")
-    with open(rxnconso) as inf, open(outfile, "w") as outf:
+    with open(outfile, "w") as outf:
         current_id = None
         current_ttys = set()
         has_rxnorm = False
-        for line in inf:
-            # THis will remove obsolete and non-english lines
-            if not check_mrconso_line(line):
+        # standard=True removes obsolete and non-english lines
+        for rxcui, sab, tty in read_rrf(rxnconso, ["CUI", "SAB", "TTY"], standard=True):
+            if rxcui in blacklist:
                 continue
-            x = line.strip().split("|")
-            if x[0] in blacklist:
-                continue
-            if x[0] != current_id:
+            if rxcui != current_id:
                 if (current_id is not None) and has_rxnorm:
                     if "DF" in current_ttys:
                         # These are dose forms.  Things like "Bottle" and "Tablet". Leads to all sorts of overglomming.
@@ -195,12 +189,12 @@ def write_rxnorm_ids(
                         outf.write(f"{prefix}:{current_id}\t{MOLECULAR_MIXTURE}\n")
                     else:
                         outf.write(f"{prefix}:{current_id}\t{DRUG}\n")
-                current_id = x[0]
+                current_id = rxcui
                 current_ttys = set()
                 has_rxnorm = False
-            if x[11] == "RXNORM":
+            if sab == "RXNORM":
                 has_rxnorm = True
-                current_ttys.add(x[12])
+                current_ttys.add(tty)
         if has_rxnorm:
             if "DF" in current_ttys:
                 # These are dose forms.  Things like "Bottle" and "Tablet". Leads to all sorts of overglomming.
@@ -247,31 +241,24 @@ def build_sets(
     acceptable_drugbank_tty = set(["IN", "PIN", "MIN"])
     pairs = set()
     # test_cui = 'C0026827'
-    with open(mrconso) as inf, open(umls_output, "w") as concordfile:
-        for line in inf:
-            if not check_mrconso_line(line):
-                continue
-
-            x = line.strip().split("|")
-            cui = x[0]
+    with open(umls_output, "w") as concordfile:
+        # only keep sources we're looking for
+        for cui, source, tty, code in read_rrf(
+            mrconso, ["CUI", "SAB", "TTY", "CODE"], where={"SAB": lookfor}, standard=True
+        ):
             if cui not in umls_ids:
                 continue
 
-            # only keep sources we're looking for
-            source = x[11]
-            if source not in lookfor:
-                continue
-            tty = x[12]
             if (source == "MSH") and (tty not in acceptable_mesh_tty):
                 continue
             if (source == "DRUGBANK") and (tty not in acceptable_drugbank_tty):
                 continue
             # For some dippy reason, in the id column they say "HGNC:76"
             pref = other_prefixes[source]
-            if ":" in x[13]:
-                other_id = f"{pref}:{x[13].split(':')[-1]}"
+            if ":" in code:
+                other_id = f"{pref}:{code.split(':')[-1]}"
             else:
-                other_id = f"{pref}:{x[13]}"
+                other_id = f"{pref}:{code}"
             # I don't know why this is in here, but it is not an identifier equivalent to anything
             if other_id == "NCIT:TCGA":
                 continue
@@ -439,21 +426,16 @@ def pull_umls(mrconso):
     priority = read_umls_priority()
     snomed_label_name = make_local_name("labels", subpath="SNOMEDCT")
     snomed_syn_name = make_local_name("synonyms", subpath="SNOMEDCT")
-    with open(mrconso) as inf, open(snomed_label_name, "w") as snolabels, open(snomed_syn_name, "w") as snosyns:
-        for line in inf:
-            if not check_mrconso_line(line):
-                continue
-
-            x = line.strip().split("|")
-            cui = x[0]
-            _lang = x[1]
-            suppress = x[16]
-            source = x[11]
-            termtype = x[12]
-            term = x[14]
+    with open(snomed_label_name, "w") as snolabels, open(snomed_syn_name, "w") as snosyns:
+        for cui, suppress, source, termtype, term, srl in read_rrf(
+            mrconso, ["CUI", "SUPPRESS", "SAB", "TTY", "STR", "SRL"], standard=True
+        ):
             # While we're here, if this thing is snomed, lets get it
             if source == "SNOMEDCT_US":
-                snomed_id = f"SNOMEDCT:{x[15]}"
+                # This has always taken the SNOMED CT identifier from SRL (the source restriction level, x[15]
+                # when this split MRCONSO lines itself) rather than CODE. That is kept as it was for now, but
+                # looks like a bug.
+                snomed_id = f"SNOMEDCT:{srl}"
                 if termtype == "PT":
                     snolabels.write(f"{snomed_id}\t{term}\n")
                 snosyns.write(f"{snomed_id}\t{HAS_EXACT_SYNONYM}\t{term}\n")
@@ -467,7 +449,7 @@ def pull_umls(mrconso):
                 logger.warning(f"Priority not found for key {pkey}. Defaulting to high priority (1000000).")
                 # print(pkey)
                 pri = 1000000
-            rows[cui].append((pri, term, line))
+            rows[cui].append((pri, term))
     lname = make_local_name("labels", subpath="UMLS")
     sname = make_local_name("synonyms", subpath="UMLS")
     re_numerical = re.compile(r"^\s*[+-]*[\d\.]+\s*$")
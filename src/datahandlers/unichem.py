@@ -28,9 +28,11 @@ def download_unichem_structure():
     """Download UniChem structure file. Gzip integrity is verified at download time; column-format
     validation happens in read_inchikeys() (called from write_unichem_concords).
 
-    structure.tsv.gz is ~12GB, so we let wget itself retry+resume (--continue) across transient
-    connection drops rather than relying on Snakemake's retries, which deletes the partial output
-    before rerunning the rule and would restart the download from 0% every time."""
+    structure.tsv.gz is ~12GB, so pull_via_wget() (through src.downloads.download_file()) retries
+    transient connection drops itself, resuming from structure.tsv.gz.partial, whose progress and
+    the server's ETag/Last-Modified are kept in structure.tsv.gz.download.json. Snakemake's retries
+    delete only the declared output, not those two files, so a rerun of the rule resumes too -- unless
+    the server's copy has changed since, in which case the download starts again from scratch."""
     pull_via_wget(
         _UNICHEM_HTTP_BASE, "structure.tsv.gz", decompress=False, subpath="UNICHEM", verify_gzip=True, retries=5
     )
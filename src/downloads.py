@@ -0,0 +1,415 @@
+"""A download engine for large and many-file sources: parallel byte-range segments, resumable and verified.
+
+download_file() fetches one URL. If the server advertises `Accept-Ranges: bytes` and the file is large enough, it is
+split into segments that are fetched in parallel with HTTP Range requests and written into place in a `.partial`
+file. Progress is recorded in a `.download.json` sidecar next to it, together with the server's ETag or
+Last-Modified validator, so an interrupted download resumes where it stopped -- but only if the server's copy is
+still the one we started on; otherwise it starts again from scratch, rather than appending new bytes to old ones.
+The finished file is checked against an MD5 checksum and/or as a valid Gzip stream as its bytes arrive, and only
+renamed into place once it passes.
+
+download_files() runs many download_file()s in a bounded thread pool, for sources like PubMed that publish
+hundreds of files.
+"""
+
+import hashlib
+import http.client
+import json
+import os
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+
+from src.util import get_logger
+
+logger = get_logger(__name__)
+
+# How many byte-range segments download_file() splits a large file into, and how large each segment must be
+# at least: files smaller than two segments are fetched in a single stream.
+DEFAULT_SEGMENTS = 4
+MIN_SEGMENT_BYTES = 64 * 1024 * 1024
+# How much to read from a response at a time.
+CHUNK_BYTES = 1024 * 1024
+# How often (in bytes downloaded across all segments) to save progress to the `.download.json` sidecar.
+SAVE_STATE_EVERY_BYTES = 64 * 1024 * 1024
+# Default socket timeout, in seconds, for connecting and for each read.
+DEFAULT_TIMEOUT = 300
+# The number of downloads download_files() runs at once.
+DEFAULT_WORKERS = 4
+
+PARTIAL_SUFFIX = ".partial"
+STATE_SUFFIX = ".download.json"
+
+# HTTP errors that are worth retrying; any other 4xx is an answer, not a hiccup.
+RETRYABLE_HTTP_CODES = {408, 429}
+
+_CONTENT_RANGE_RE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+
+class DownloadError(RuntimeError):
+    """A download that did not complete: a truncated response, or a server that didn't honour a Range request."""
+
+
+class VerificationError(DownloadError):
+    """A download that completed, but failed its MD5 or Gzip verification."""
+
+
+@dataclass
+class DownloadJob:
+    """One file for download_files() to download: the arguments of a download_file() call."""
+
+    url: str
+    filename: str
+    md5: str = None
+    verify_gzip: bool = False
+
+
+class _StreamVerifier:
+    """Check the bytes of a file, fed to it in order, against an MD5 checksum and/or as a Gzip stream.
+
+    The Gzip check decompresses (and discards) every member, which makes zlib check each member's CRC-32 and
+    length, as `gzip -t` would.
+    """
+
+    def __init__(self, url, md5=None, verify_gzip=False):
+        self.url = url
+        self.md5 = md5.lower() if md5 else None
+        self.verify_gzip = verify_gzip
+        self.hash = hashlib.md5() if md5 else None
+        self.decompressor = zlib.decompressobj(wbits=31) if verify_gzip else None
+        self.gzip_bytes = 0
+
+    def update(self, data):
+        if self.hash is not None:
+            self.hash.update(data)
+        if self.decompressor is not None:
+            self.gzip_bytes += len(data)
+            try:
+                while data:
+                    if self.decompressor.eof:
+                        # A Gzip file may be several members concatenated: start a new one on what follows.
+                        self.decompressor = zlib.decompressobj(wbits=31)
+                    # Decompress at most CHUNK_BYTES at a time, so a highly compressed file can't use much memory.
+                    self.decompressor.decompress(data, CHUNK_BYTES)
+                    data = self.decompressor.unused_data if self.decompressor.eof else self.decompressor.unconsumed_tail
+            except zlib.error as e:
+                raise VerificationError(f"{self.url} is not a valid Gzip file: {e}") from e
+
+    def finish(self):
+        if self.decompressor is not None and not (self.gzip_bytes and self.decompressor.eof):
+            raise VerificationError(f"{self.url} is not a valid Gzip file: it ends partway through a Gzip member.")
+        if self.hash is not None and self.hash.hexdigest() != self.md5:
+            raise VerificationError(
+                f"{self.url} failed MD5 verification: calculated {self.hash.hexdigest()}, expected {self.md5}."
+            )
+
+
+def _content_length(response):
+    length = response.headers.get("Content-Length")
+    return int(length) if length is not None and str(length).strip().isdigit() else None
+
+
+def _validator(response):
+    """The ETag (or failing that, Last-Modified) header that identifies this version of the server's file."""
+    return response.headers.get("ETag") or response.headers.get("Last-Modified")
+
+
+def _is_retryable(error):
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code >= 500 or error.code in RETRYABLE_HTTP_CODES
+    return isinstance(error, (DownloadError, urllib.error.URLError, http.client.HTTPException, OSError))
+
+
+class _Download:
+    """A single attempt at downloading a file, resuming from its `.partial` file and `.download.json` sidecar."""
+
+    def __init__(self, url, filename, opener, headers, segments, timeout, verifier):
+        self.url = url
+        self.filename = filename
+        self.partial_filename = filename + PARTIAL_SUFFIX
+        self.state_filename = filename + STATE_SUFFIX
+        self.opener = opener
+        self.headers = headers
+        self.segments = segments
+        self.timeout = timeout
+        self.verifier = verifier
+        self.lock = threading.Lock()
+        self.unsaved_bytes = 0
+        # Set from the server's response: the file's length (None if the server didn't say), its validator, whether
+        # it can be resumed with Range requests, and the [start, end, bytes downloaded] of each segment.
+        self.length = None
+        self.validator = None
+        self.resumable = False
+        self.ranges = []
+
+    def open(self, extra_headers=None):
+        request = urllib.request.Request(self.url, headers={**self.headers, **(extra_headers or {})})
+        return self.opener.open(request, timeout=self.timeout)
+
+    def load_state(self):
+        """Return the saved progress of an earlier attempt at this download, if it is for this URL."""
+        if not (os.path.exists(self.state_filename) and os.path.exists(self.partial_filename)):
+            return None
+        try:
+            with open(self.state_filename) as state_file:
+                state = json.load(state_file)
+        except (OSError, ValueError):
+            return None
+        if state.get("url") != self.url or os.path.getsize(self.partial_filename) != state["length"]:
+            return None
+        return state
+
+    def save_state(self):
+        state = {"url": self.url, "length": self.length, "validator": self.validator, "ranges": self.ranges}
+        with open(self.state_filename + ".tmp", "w") as state_file:
+            json.dump(state, state_file)
+        os.replace(self.state_filename + ".tmp", self.state_filename)
+
+    def discard(self):
+        Path(self.partial_filename).unlink(missing_ok=True)
+        Path(self.state_filename).unlink(missing_ok=True)
+
+    def run(self, keep_existing):
+        """Download the file, returning True if it was downloaded or False if the existing file was kept."""
+        state = self.load_state()
+        response = None
+        if state is not None:
+            self.resumable = True
+            pending = [start + done for start, end, done in state["ranges"] if done < end - start]
+            if not pending:
+                # Every byte arrived, but the last attempt stopped before it was verified and renamed into place.
+                self.length, self.validator, self.ranges = state["length"], state["validator"], state["ranges"]
+                return self.fetch(None, None)
+            # Resume from the first byte we don't have, if the server's copy hasn't changed since (If-Range makes
+            # the server send us the whole of its new copy if it has).
+            start = min(pending)
+            response = self.open({"Range": f"bytes={start}-", "If-Range": state["validator"]})
+            content_range = _CONTENT_RANGE_RE.fullmatch(response.headers.get("Content-Range") or "")
+            if response.status == 206 and content_range and int(content_range.group(1)) == start:
+                logger.info(f"Resuming download of {self.url} into {self.partial_filename} at byte {start}.")
+                self.length, self.validator, self.ranges = state["length"], state["validator"], state["ranges"]
+                return self.fetch(response, start)
+            logger.info(f"{self.url} has changed since it was partly downloaded: starting again.")
+            response.close()
+            response = None
+        self.discard()
+
+        response = self.open()
+        self.length = _content_length(response)
+        self.validator = _validator(response)
+        if keep_existing and os.path.exists(self.filename) and os.path.getsize(self.filename) == self.length:
+            # Close the response while we read the existing file, which may take a while.
+            response.close()
+            if self.existing_file_passes_verification():
+                logger.info(f"Keeping {self.filename}: it is the same size as {self.url}.")
+                return False
+            response = self.open()
+            self.length = _content_length(response)
+            self.validator = _validator(response)
+
+        segment_count = 1
+        self.resumable = bool(self.length and self.validator and response.headers.get("Accept-Ranges") == "bytes")
+        if self.resumable:
+            segment_count = max(1, min(self.segments, self.length // MIN_SEGMENT_BYTES))
+        if self.length is None:
+            self.ranges = [[0, None, 0]]
+        else:
+            bounds = [self.length * i // segment_count for i in range(segment_count + 1)]
+            self.ranges = [[bounds[i], bounds[i + 1], 0] for i in range(segment_count)]
+        with open(self.partial_filename, "wb") as partial_file:
+            if self.length:
+                partial_file.truncate(self.length)
+        logger.info(f"Downloading {self.url} ({self.length} bytes) in {segment_count} segment(s).")
+        return self.fetch(response, 0)
+
+    def existing_file_passes_verification(self):
+        """Check the existing file as a download of it would be checked: being the same size as the server's copy
+        doesn't make it a complete copy."""
+        verifier = _StreamVerifier(self.url, self.verifier.md5, self.verifier.verify_gzip)
+        if verifier.md5 is None and not verifier.verify_gzip:
+            return True
+        try:
+            with open(self.filename, "rb") as existing_file:
+                while data := existing_file.read(CHUNK_BYTES):
+                    verifier.update(data)
+            verifier.finish()
+        except VerificationError as e:
+            logger.warning(f"Not keeping {self.filename}, although it is the same size as {self.url}: {e}")
+            return False
+        return True
+
+    def fetch(self, response, start):
+        """Fetch every incomplete segment -- the one beginning at byte `start` from `response` -- and verify the file.
+
+        A single segment is verified as it streams in. Otherwise the segments are verified in file order from the
+        `.partial` file, each as soon as it (and every segment before it) is complete, overlapping the download of
+        the rest.
+        """
+        streaming = len(self.ranges) == 1 and start == 0
+        try:
+            fd = os.open(self.partial_filename, os.O_RDWR)
+            try:
+                if self.resumable:
+                    self.save_state()
+                with ThreadPoolExecutor(max_workers=len(self.ranges)) as pool:
+                    futures = {}
+                    for index, segment in enumerate(self.ranges):
+                        segment_start, end, done = segment
+                        if end is not None and done == end - segment_start:
+                            continue
+                        first = response if segment_start + done == start else None
+                        if first is not None:
+                            response = None
+                        futures[index] = pool.submit(self.fetch_segment, fd, segment, first, streaming)
+                    if response is not None:
+                        response.close()
+                        response = None
+                    for index, segment in enumerate(self.ranges):
+                        if index in futures:
+                            futures[index].result()
+                        if not streaming:
+                            for offset in range(segment[0], segment[1], CHUNK_BYTES):
+                                self.verifier.update(os.pread(fd, min(CHUNK_BYTES, segment[1] - offset), offset))
+            finally:
+                os.close(fd)
+                if self.resumable:
+                    self.save_state()
+        finally:
+            if response is not None:
+                response.close()
+
+        self.verifier.finish()
+        os.replace(self.partial_filename, self.filename)
+        Path(self.state_filename).unlink(missing_ok=True)
+        return True
+
+    def fetch_segment(self, fd, segment, response, streaming):
+        """Write the rest of `segment` into the `.partial` file, requesting it with a Range request if `response`
+        isn't already positioned at it."""
+        segment_start, end, done = segment
+        if response is None:
+            response = self.open({"Range": f"bytes={segment_start + done}-{end - 1}", "If-Range": self.validator})
+            content_range = _CONTENT_RANGE_RE.fullmatch(response.headers.get("Content-Range") or "")
+            if response.status != 206 or not content_range or int(content_range.group(1)) != segment_start + done:
+                response.close()
+                raise DownloadError(
+                    f"{self.url} did not honour a Range request for bytes {segment_start + done}-{end - 1} "
+                    f"(HTTP {response.status}, Content-Range {response.headers.get('Content-Range')})."
+                )
+        try:
+            while end is None or done < end - segment_start:
+                to_read = CHUNK_BYTES if end is None else min(CHUNK_BYTES, end - segment_start - done)
+                data = response.read(to_read)
+                if not data:
+                    if end is None:
+                        break
+                    raise DownloadError(
+                        f"{self.url} ended after {segment_start + done} of {self.length} bytes; "
+                        f"the download will resume from there."
+                    )
+                os.pwrite(fd, data, segment_start + done)
+                if streaming:
+                    self.verifier.update(data)
+                done += len(data)
+                with self.lock:
+                    segment[2] = done
+                    self.unsaved_bytes += len(data)
+                    if self.resumable and self.unsaved_bytes >= SAVE_STATE_EVERY_BYTES:
+                        self.unsaved_bytes = 0
+                        self.save_state()
+        finally:
+            response.close()
+        if end is None:
+            segment[1] = segment_start + done
+
+
+def download_file(
+    url,
+    filename,
+    md5=None,
+    verify_gzip=False,
+    segments=DEFAULT_SEGMENTS,
+    attempts=3,
+    timeout=DEFAULT_TIMEOUT,
+    keep_existing=False,
+    resume=True,
+    headers=None,
+    opener=None,
+):
+    """
+    Download `url` into `filename`, in parallel byte-range segments if the server allows it, resuming an earlier
+    interrupted attempt and verifying the file before it is put in place.
+
+    :param url: The URL to download.
+    :param filename: The local file to download it into. It is only written once the download is complete and
+        verified; until then, the download is in `filename.partial`.
+    :param md5: The expected MD5 checksum (as a hex string) of the file, if known.
+    :param verify_gzip: Check that the file is a valid Gzip file.
+    :param segments: The maximum number of byte-range segments to download in parallel. Each segment is at least
+        MIN_SEGMENT_BYTES long, so smaller files are downloaded in a single stream.
+    :param attempts: How many times to try. A failed attempt is resumed where it stopped, unless it failed
+        verification, in which case the next attempt starts from scratch. HTTP errors other than 5xx, 408 and 429
+        are raised immediately.
+    :param timeout: Socket timeout, in seconds.
+    :param keep_existing: If `filename` already exists and is the same size as the server's copy, keep it instead of
+        downloading it again, as `wget --continue` would -- but only if it also passes the `md5` and `verify_gzip`
+        checks, as a downloaded file would have to.
+    :param resume: Resume an interrupted earlier download of this URL into `filename`. If False, start again.
+    :param headers: Extra HTTP headers to send with every request, such as a User-Agent.
+    :param opener: The urllib opener to make requests with. Defaults to one that follows redirects.
+    :return: True if the file was downloaded, False if `keep_existing` kept the existing file.
+    """
+    if opener is None:
+        opener = urllib.request.build_opener(urllib.request.HTTPRedirectHandler())
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+
+    for attempt in range(1, attempts + 1):
+        download = _Download(
+            url, filename, opener, headers or {}, segments, timeout, _StreamVerifier(url, md5, verify_gzip)
+        )
+        if attempt == 1 and not resume:
+            download.discard()
+        try:
+            return download.run(keep_existing)
+        except Exception as e:
+            if isinstance(e, VerificationError):
+                # Whatever went wrong is already in the `.partial` file, so don't resume from it.
+                download.discard()
+            if attempt == attempts or not _is_retryable(e):
+                raise
+            logger.warning(f"Download attempt {attempt} of {url} failed: {e}; retrying.")
+            time.sleep(5 * attempt)
+
+
+def download_files(jobs, workers=DEFAULT_WORKERS, **kwargs):
+    """
+    Download many files with download_file(), `workers` of them at a time.
+
+    :param jobs: An iterable of DownloadJob.
+    :param workers: The number of files to download at once.
+    :param kwargs: Other arguments to pass to every download_file() call.
+    :return: The number of files downloaded (rather than kept by `keep_existing`).
+    """
+    jobs = list(jobs)
+    downloaded = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {
+            pool.submit(download_file, job.url, job.filename, md5=job.md5, verify_gzip=job.verify_gzip, **kwargs): job
+            for job in jobs
+        }
+        for future in as_completed(futures):
+            job = futures[future]
+            exc = future.exception()
+            if exc:
+                for other in futures:
+                    other.cancel()
+                raise RuntimeError(f"Failed to download {job.url}: {exc}") from exc
+            downloaded += future.result()
+    logger.info(f"Downloaded {downloaded} of {len(jobs)} files ({len(jobs) - downloaded} already present).")
+    return downloaded
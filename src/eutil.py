@@ -1,7 +1,21 @@
+import asyncio
 import itertools
 import os
 
-from src.babel_utils import ThrottledRequester
+from src.async_requester import AsyncThrottledRequester
+from src.util import get_config, get_logger
+
+logger = get_logger(__name__)
+
+EUTILS_BASE = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
+# NCBI allows 3 E-utilities requests a second, or 10 with an API key
+# (https://www.ncbi.nlm.nih.gov/books/NBK25497/#chapter2.Usage_Guidelines_and_Requiremen).
+EUTILS_RATE = 3
+EUTILS_RATE_WITH_API_KEY = 10
+# How many MeSH ids to send in a single elink request. NCBI asks for POST rather than GET for more than ~200.
+ELINK_BATCH_SIZE = 200
+# How many requests to have in flight at once.
+EUTILS_MAX_CONCURRENCY = 4
 
 
 def chunked(it, size):
@@ -14,70 +28,74 @@ def chunked(it, size):
         yield p
 
 
-def lookup(meshes):
+def lookup(meshes, cache_dir=None, eutils_base=EUTILS_BASE):
+    """
+    Look up the NCBITaxon that each MeSH term is linked to (if it is linked to exactly one), via E-utilities elink.
+
+    The MeSH ids are sent ELINK_BATCH_SIZE at a time, in concurrent requests held to NCBI's rate limit, and every
+    successful response is cached in `cache_dir`, so that running this again doesn't ask NCBI again. The cache
+    doesn't expire, so by default it is kept per release: a later build that reuses the download directory asks
+    NCBI afresh rather than reading links cached by an earlier one.
+
+    :param meshes: The MeSH CURIEs to look up, such as `MESH:D004926`.
+    :param cache_dir: The directory to cache E-utilities responses in. Defaults to `eutils/{release_name}` in the
+        download directory.
+    :param eutils_base: The E-utilities base URL.
+    :return: A dictionary of MeSH CURIE to NCBITaxon CURIE.
+    """
+    if cache_dir is None:
+        config = get_config()
+        cache_dir = os.path.join(config["download_directory"], "eutils", config["release_name"])
+    return asyncio.run(_lookup(meshes, cache_dir, eutils_base))
+
+
+async def _lookup(meshes, cache_dir, eutils_base):
     apikey = get_api_key()
-    print("Looking up by mesh")
-    term_to_pubs = {}
+    logger.info(f"Looking up {len(meshes)} MeSH terms in NCBITaxon")
     if apikey is None:
-        print("Warning: not using API KEY for eutils, resulting in 3x slowdown")
-        delta = 350  # milleseconds
-    else:
-        delta = 110  # milliseconds
-    requester = ThrottledRequester(delta)
-    chunksize = 10
+        logger.warning("Not using an API key for eutils, which is 3x slower.")
+    requester = AsyncThrottledRequester(
+        EUTILS_RATE if apikey is None else EUTILS_RATE_WITH_API_KEY,
+        max_concurrency=EUTILS_MAX_CONCURRENCY,
+        cache_dir=cache_dir,
+    )
+
+    # elink wants MeSH UIDs, in which the D or C of a MeSH descriptor or supplementary concept id is 68 or 67.
     backandforth = {"C": "67", "67": "C", "D": "68", "68": "D"}
-    num = len(meshes)
-    done = 0
-    for xterms in chunked(meshes, chunksize):
-        print(xterms)
-        terms = [t.split(":")[1] for t in xterms]
-        url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/elink.fcgi?&dbfrom=mesh&db=taxonomy&retmode=json"
+    # Q terms (qualifiers, things like "radiotherapy") have no UID we can link from.
+    uids = [f"{backandforth[term[0]]}{term[1:]}" for term in (mesh.split(":")[1] for mesh in meshes) if term[0] in "CD"]
+
+    elink_requests = []
+    for batch in chunked(uids, ELINK_BATCH_SIZE):
+        # Each id is its own `id` parameter, so that elink returns a linkset for each.
+        params = [("dbfrom", "mesh"), ("db", "taxonomy"), ("retmode", "json")]
         if apikey is not None:
-            url += f"&api_key={apikey}"
-        for term in terms:
-            try:
-                newterm = f"{backandforth[term[0]]}{term[1:]}"
-            except KeyError:
-                # Q terms get in here, which are things like "radiotherapy"
-                continue
-            url += f"&id={newterm}"
-        try:
-            # returns a throttled flag also, but we don't need it
-            result = requester.get_json(url)
-            # result = response.json()
-        except Exception as e:
-            print("E1")
-            print(url)
-            print(result)
-            print(e)
-        if "linksets" not in result:
-            continue
-        linksets = result["linksets"]
-        for ls in linksets:
+            params.append(("api_key", apikey))
+        params.extend(("id", uid) for uid in batch)
+        elink_requests.append((f"{eutils_base}elink.fcgi", params, "POST"))
+    results = await requester.request_all_json(elink_requests)
+    logger.info(
+        f"Made {requester.requests_sent} elink requests for {len(uids)} MeSH terms "
+        f"({requester.cache_hits} answered from the cache in {cache_dir})."
+    )
+
+    term_to_pubs = {}
+    for result in results:
+        for ls in result.get("linksets", []):
             cids = None
             if "linksetdbs" in ls:
                 mesh = ls["ids"][0]
                 for lsdb in ls["linksetdbs"]:
                     if lsdb["linkname"] == "mesh_taxonomy":
                         cids = lsdb["links"]
-            if cids is not None:
-                # 5 or more is probably a group, not a compound
-                if len(cids) >= 5:
-                    continue
+            # 5 or more is probably a group, not a compound; more than one at all is ambiguous.
+            if cids is not None and len(cids) == 1:
                 smesh = str(mesh)
                 remesh = f"{backandforth[smesh[0:2]]}{smesh[2:]}"
-                if len(cids) == 1:
-                    # There's no ambiguity
-                    term_to_pubs[f"MESH:{remesh}"] = f"NCBITaxon:{cids[0]}"
-                    print("found one", remesh, cids[0])
-                    continue
-        done += chunksize
-        if done % 1000 == 0:
-            print(f" completed {done} / {num}")
+                term_to_pubs[f"MESH:{remesh}"] = f"NCBITaxon:{cids[0]}"
     if len(term_to_pubs) == 0:
-        "We found no MESH/NCBI links, which is wrong.  Stopping."
-        exit()
-    print(f"mesh found {len(term_to_pubs)}")
+        raise RuntimeError("We found no MESH/NCBI links, which is wrong.")
+    logger.info(f"mesh found {len(term_to_pubs)}")
     return term_to_pubs
 
 
@@ -86,4 +104,4 @@ def get_api_key():
 
 
 if __name__ == "__main__":
-    lookup(["MESH:D004926"])
+    print(lookup(["MESH:D004926"]))
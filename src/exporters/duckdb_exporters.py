@@ -1,6 +1,9 @@
 # The DuckDB exporter can be used to export particular intermediate files into the
 # in-process database engine DuckDB (https://duckdb.org) for future querying.
+import glob
+import json
 import os.path
+import shutil
 import stat
 import tempfile
 from contextlib import contextmanager
@@ -147,7 +150,240 @@ def _prepare_duckdb_output(duckdb_filename):
     ensure_parent_dir(duckdb_filename)
 
 
-def export_compendia_to_parquet(compendium_filename, clique_parquet_filename, edge_parquet_filename, duckdb_filename):
+# The columns of the three compendium tables, shared by export_compendia_to_parquet() and the Parquet files that
+# write_compendium() writes directly (CompendiumParquetWriter).
+COMPENDIUM_TABLE_SCHEMAS = {
+    "Node": "curie STRING, curie_prefix STRING, label STRING, label_lc STRING, description STRING[], taxa STRING[]",
+    "Clique": "clique_leader STRING, preferred_name STRING, clique_identifier_count INT, biolink_type STRING, "
+    "information_content FLOAT",
+    "Edge": "clique_leader STRING, curie STRING, conflation STRING, clique_leader_prefix STRING, curie_prefix STRING, "
+    "biolink_type STRING",
+}
+
+# The number of cliques CompendiumParquetWriter buffers before writing them out as one Parquet part file.
+COMPENDIUM_PARQUET_BATCH_CLIQUES = 100_000
+
+# The JSON columns of the batch files CompendiumParquetWriter converts into Parquet. Every identifier row carries its
+# clique leader and type, so both the Node and the Edge rows can be selected from it.
+_IDENTIFIER_BATCH_COLUMNS = {
+    "curie": "VARCHAR",
+    "label": "VARCHAR",
+    "description": "VARCHAR[]",
+    "taxa": "VARCHAR[]",
+    "clique_leader": "VARCHAR",
+    "biolink_type": "VARCHAR",
+}
+_CLIQUE_BATCH_COLUMNS = {
+    "clique_leader": "VARCHAR",
+    "preferred_name": "VARCHAR",
+    "clique_identifier_count": "INTEGER",
+    "biolink_type": "VARCHAR",
+    "information_content": "FLOAT",
+}
+
+# For each compendium table, the batch file it is selected from and the query that selects it. These mirror the
+# queries in export_compendia_to_parquet(), so both routes produce the same rows.
+_COMPENDIUM_PART_QUERIES = {
+    "Node": (
+        "identifiers",
+        """SELECT curie, split_part(curie, ':', 1) AS curie_prefix, label, LOWER(label) AS label_lc, description, taxa
+           FROM read_json($path, format='newline_delimited', columns=$columns)""",
+    ),
+    "Clique": (
+        "cliques",
+        """SELECT clique_leader, preferred_name, clique_identifier_count, biolink_type, information_content
+           FROM read_json($path, format='newline_delimited', columns=$columns)""",
+    ),
+    "Edge": (
+        "identifiers",
+        """SELECT clique_leader, curie, 'None' AS conflation, split_part(clique_leader, ':', 1) AS clique_leader_prefix,
+               split_part(curie, ':', 1) AS curie_prefix, biolink_type
+           FROM read_json($path, format='newline_delimited', columns=$columns)""",
+    ),
+}
+_BATCH_COLUMNS = {"identifiers": _IDENTIFIER_BATCH_COLUMNS, "cliques": _CLIQUE_BATCH_COLUMNS}
+
+
+def compendium_parquet_dir(output_directory, compendium_basename):
+    """The directory write_compendium() writes a compendium's Node, Clique and Edge Parquet files to.
+
+    export_compendia_to_parquet() picks them up from here (see export_compendia_to_duckdb in duckdb.snakefile).
+
+    :param compendium_basename: The compendium filename, e.g. `Gene.txt`.
+    """
+    stem = os.path.splitext(compendium_basename)[0]
+    return os.path.join(output_directory, "duckdb", "compendium_parquet", f"filename={stem}")
+
+
+class CompendiumParquetWriter:
+    """Write the Node, Clique and Edge rows of compendium records to Parquet part files as they are written.
+
+    write_compendium() adds every clique it writes to the compendium. Every COMPENDIUM_PARQUET_BATCH_CLIQUES cliques,
+    the buffered rows are written to a newline-delimited JSON batch file with flat, typed columns and converted into
+    one Parquet part file per table by an in-process DuckDB, so memory stays bounded by the batch size rather than the
+    compendium. merge_compendium_parquet_parts() then combines the parts into Node.parquet, Clique.parquet and
+    Edge.parquet.
+
+    :param parts_dir: The directory to write part files to.
+    :param part_prefix: A prefix for the part filenames; parts sort by prefix and then in the order they were written,
+        so shards of a compendium written in parallel can use their zero-padded shard index.
+    """
+
+    def __init__(self, parts_dir, part_prefix="", batch_cliques=COMPENDIUM_PARQUET_BATCH_CLIQUES):
+        self.parts_dir = parts_dir
+        self.part_prefix = part_prefix
+        self.batch_cliques = batch_cliques
+        self.identifier_rows = []
+        self.clique_rows = []
+        self.part_count = 0
+        self.db = duckdb.connect()
+
+    def add(self, record):
+        """Add a compendium record (as written to the compendium JSONL) to the current batch."""
+        identifiers = record["identifiers"]
+        clique_leader = identifiers[0]["i"] if identifiers else None
+        biolink_type = record["type"]
+        for identifier in identifiers:
+            self.identifier_rows.append(
+                json.dumps(
+                    {
+                        "curie": identifier["i"],
+                        "label": identifier.get("l"),
+                        "description": identifier.get("d"),
+                        "taxa": identifier.get("t"),
+                        "clique_leader": clique_leader,
+                        "biolink_type": biolink_type,
+                    }
+                )
+            )
+        self.clique_rows.append(
+            json.dumps(
+                {
+                    "clique_leader": clique_leader,
+                    "preferred_name": record.get("preferred_name"),
+                    "clique_identifier_count": len(identifiers),
+                    "biolink_type": biolink_type,
+                    "information_content": record.get("ic"),
+                }
+            )
+        )
+        if len(self.clique_rows) >= self.batch_cliques:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered rows out as one Parquet part file per table."""
+        if not self.clique_rows:
+            return
+        batch_filenames = {
+            "identifiers": os.path.join(self.parts_dir, f"{self.part_prefix}identifiers.jsonl"),
+            "cliques": os.path.join(self.parts_dir, f"{self.part_prefix}cliques.jsonl"),
+        }
+        for batch, rows in (("identifiers", self.identifier_rows), ("cliques", self.clique_rows)):
+            with open(batch_filenames[batch], "w", encoding="utf-8") as outf:
+                outf.write("\n".join(rows) + "\n")
+
+        for table, (batch, query) in _COMPENDIUM_PART_QUERIES.items():
+            part_filename = os.path.join(self.parts_dir, f"{table}-{self.part_prefix}{self.part_count:06d}.parquet")
+            with log_duckdb_settings_on_error(self.db, f"CompendiumParquetWriter: write {part_filename}"):
+                self.db.sql(
+                    query, params={"path": batch_filenames[batch], "columns": _BATCH_COLUMNS[batch]}
+                ).write_parquet(part_filename)
+
+        for batch_filename in batch_filenames.values():
+            os.remove(batch_filename)
+        self.identifier_rows = []
+        self.clique_rows = []
+        self.part_count += 1
+
+    def close(self):
+        """Write out any buffered rows and close the DuckDB connection."""
+        self.flush()
+        self.db.close()
+
+
+def merge_compendium_parquet_parts(parts_dir, parquet_dir):
+    """Combine the part files written by CompendiumParquetWriter into Node.parquet, Clique.parquet and Edge.parquet.
+
+    Parts are read in filename order, so the rows come out in the order the cliques were written. Each table is
+    written to a temporary file and renamed into place, so a partly-written table is never picked up.
+    """
+    os.makedirs(parquet_dir, exist_ok=True)
+    with duckdb.connect() as db:
+        for table, schema in COMPENDIUM_TABLE_SCHEMAS.items():
+            part_filenames = sorted(glob.glob(os.path.join(parts_dir, f"{table}-*.parquet")))
+            parquet_filename = os.path.join(parquet_dir, f"{table}.parquet")
+            tmp_filename = parquet_filename + ".tmp"
+            with log_duckdb_settings_on_error(db, f"merge_compendium_parquet_parts: write {parquet_filename}"):
+                if part_filenames:
+                    db.sql("SELECT * FROM read_parquet($parts)", params={"parts": part_filenames}).write_parquet(
+                        tmp_filename
+                    )
+                else:
+                    db.sql(f"CREATE TABLE {table} ({schema})")
+                    db.table(table).write_parquet(tmp_filename)
+            os.replace(tmp_filename, parquet_filename)
+            logger.info(f"Merged {len(part_filenames)} part files into {parquet_filename}")
+
+
+def has_fresh_compendium_parquet(compendium_filename, prewritten_parquet_dir):
+    """Check whether write_compendium() wrote Node, Clique and Edge Parquet files for this compendium.
+
+    They are only used if they are all at least as new as the compendium itself, so a compendium rebuilt without
+    them (or by something other than write_compendium()) falls back to the full export.
+    """
+    if not prewritten_parquet_dir or not os.path.exists(compendium_filename):
+        return False
+    compendium_mtime = os.path.getmtime(compendium_filename)
+    for table in COMPENDIUM_TABLE_SCHEMAS:
+        parquet_filename = os.path.join(prewritten_parquet_dir, f"{table}.parquet")
+        if not os.path.exists(parquet_filename) or os.path.getmtime(parquet_filename) < compendium_mtime:
+            return False
+    return True
+
+
+def _export_prewritten_compendium_parquet(
+    compendium_filename, prewritten_parquet_dir, parquet_filenames, duckdb_filename
+):
+    """Verify the Parquet files write_compendium() wrote for a compendium and copy them into place.
+
+    The checks only need the compendium's line count and three Parquet row counts: there must be one Clique row per
+    compendium line, and one Node and one Edge row per identifier. The DuckDB file gets views over the copied
+    Parquet files rather than tables, so it can still be used for interactive querying.
+    """
+    with open(compendium_filename, "rb") as inf:
+        line_count = sum(1 for _ in inf)
+
+    with setup_duckdb(duckdb_filename) as db:
+        counts = {}
+        for table, parquet_filename in parquet_filenames.items():
+            prewritten_filename = os.path.join(prewritten_parquet_dir, f"{table}.parquet")
+            counts[table] = db.execute("SELECT COUNT(*) FROM read_parquet(?)", [prewritten_filename]).fetchone()[0]
+        identifier_count = db.execute(
+            "SELECT COALESCE(SUM(clique_identifier_count), 0) FROM read_parquet(?)",
+            [os.path.join(prewritten_parquet_dir, "Clique.parquet")],
+        ).fetchone()[0]
+
+        if counts["Clique"] != line_count or not counts["Node"] == counts["Edge"] == identifier_count:
+            raise RuntimeError(
+                f"Parquet files in {prewritten_parquet_dir} don't match {compendium_filename}: {line_count:,} lines "
+                f"and {identifier_count:,} identifiers, but {counts['Clique']:,} Clique, {counts['Node']:,} Node and "
+                f"{counts['Edge']:,} Edge rows"
+            )
+
+        for table, parquet_filename in parquet_filenames.items():
+            shutil.copyfile(os.path.join(prewritten_parquet_dir, f"{table}.parquet"), parquet_filename)
+            escaped_filename = os.path.abspath(parquet_filename).replace("'", "''")
+            db.execute(f"CREATE VIEW {table} AS SELECT * FROM read_parquet('{escaped_filename}')")
+
+    logger.info(
+        f"Verified and copied the Parquet files for {compendium_filename} from {prewritten_parquet_dir}: "
+        f"{counts['Clique']:,} cliques and {counts['Node']:,} identifiers."
+    )
+
+
+def export_compendia_to_parquet(
+    compendium_filename, clique_parquet_filename, edge_parquet_filename, duckdb_filename, prewritten_parquet_dir=None
+):
     """
     Export a compendium to a Parquet file via a DuckDB.
 
@@ -155,6 +391,9 @@ def export_compendia_to_parquet(compendium_filename, clique_parquet_filename, ed
     :param clique_parquet_filename: The filename for the Clique.parquet file.
     :param edge_parquet_filename: The filename for the Edge.parquet file.
     :param duckdb_filename: The DuckDB filename to write.
+    :param prewritten_parquet_dir: (OPTIONAL) The directory write_compendium() wrote this compendium's Parquet files
+        to (see compendium_parquet_dir()). If it has up-to-date Node, Clique and Edge files, they are checked against
+        the compendium and copied into place instead of being rebuilt from the compendium JSONL.
 
     The Node.parquet file is written alongside clique_parquet_filename (same directory); the
     Clique and Edge Parquet paths are passed explicitly so the Snakemake rule and this function
@@ -170,12 +409,24 @@ def export_compendia_to_parquet(compendium_filename, clique_parquet_filename, ed
     ensure_parent_dir(edge_parquet_filename)
     node_parquet_filename = os.path.join(parquet_dir, "Node.parquet")
 
+    if has_fresh_compendium_parquet(compendium_filename, prewritten_parquet_dir):
+        _export_prewritten_compendium_parquet(
+            compendium_filename,
+            prewritten_parquet_dir,
+            {"Node": node_parquet_filename, "Clique": clique_parquet_filename, "Edge": edge_parquet_filename},
+            duckdb_filename,
+        )
+        return
+    if prewritten_parquet_dir:
+        logger.warning(
+            f"No up-to-date Parquet files for {compendium_filename} in {prewritten_parquet_dir}, "
+            "exporting it from the compendium JSONL instead."
+        )
+
     compendium_basename = os.path.basename(compendium_filename)
     with setup_duckdb(duckdb_filename) as db:
         # Step 1. Create a Nodes table with all the nodes from compendium_filename.
-        db.sql(
-            """CREATE TABLE Node (curie STRING, curie_prefix STRING, label STRING, label_lc STRING, description STRING[], taxa STRING[])"""
-        )
+        db.sql(f"CREATE TABLE Node ({COMPENDIUM_TABLE_SCHEMAS['Node']})")
 
         compendium_filesize = os.path.getsize(compendium_filename)
         if compendium_filesize < MIN_FILE_SIZE_FOR_SPLITTING_LOAD:
@@ -268,9 +519,7 @@ def export_compendia_to_parquet(compendium_filename, clique_parquet_filename, ed
             db.table("Node").write_parquet(node_parquet_filename)
 
         # Step 2. Create a Cliques table with all the cliques from this file.
-        db.sql("""CREATE TABLE Clique
-                (clique_leader STRING, preferred_name STRING, clique_identifier_count INT, biolink_type STRING,
-                information_content FLOAT)""")
+        db.sql(f"CREATE TABLE Clique ({COMPENDIUM_TABLE_SCHEMAS['Clique']})")
         with log_duckdb_settings_on_error(
             db, f"export_compendia_to_parquet: build and write Clique table for {compendium_basename}"
         ):
@@ -294,10 +543,7 @@ def export_compendia_to_parquet(compendium_filename, clique_parquet_filename, ed
         # (curie_prefix, biolink_type) with a plain scan instead of joining the full Edge table
         # (~1.5B rows) against the Clique table (~200M rows) -- a large-vs-large join that OOM-killed
         # the report rule even on a largemem node.
-        db.sql(
-            """CREATE TABLE Edge (clique_leader STRING, curie STRING, conflation STRING,
-                clique_leader_prefix STRING, curie_prefix STRING, biolink_type STRING)"""
-        )
+        db.sql(f"CREATE TABLE Edge ({COMPENDIUM_TABLE_SCHEMAS['Edge']})")
         with log_duckdb_settings_on_error(
             db, f"export_compendia_to_parquet: build and write Edge table for {compendium_basename}"
         ):
@@ -2,20 +2,159 @@
 # Knowledge Graph Exchange (KGX, https://github.com/biolink/kgx) format.
 # This file provides code for doing that, based on the code from
 # https://github.com/NCATSTranslator/NodeNormalization/blob/68096b2f16e6c2eedb699178ace71cea98dc794f/node_normalizer/loader.py#L70-L208
+#
+# Large compendia (SmallMolecule took 2.7h single-threaded) can be converted in parallel: the compendium is split into
+# byte ranges that start on line boundaries, each range is converted by a worker process into its own gzip member,
+# and the members are concatenated in order (a sequence of gzip members is itself a valid gzip file).
 import gzip
 import hashlib
 import json
 import logging
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from itertools import combinations
 
+from src.babel_utils import concatenate_files
 from src.predicates import BIOLINK_SAME_AS
 from src.util import LoggingUtil, ensure_parent_dir, get_memory_usage_summary
 
 # Default logger for this file.
 logger = LoggingUtil.init_logging(__name__, level=logging.INFO)
 
+# Edge topologies: "clique" writes a same_as edge between every pair of identifiers in a clique (n*(n-1)/2 edges),
+# "star" only writes an edge from the first identifier (the clique leader) to every other identifier (n-1 edges).
+EDGE_TOPOLOGIES = {"clique", "star"}
 
-def convert_compendium_to_kgx(compendium_filename, kgx_nodes_filename, kgx_edges_filename):
+# The number of compendium lines to convert before writing the resulting nodes and edges out.
+BATCH_SIZE = 100_000
+
+# The number of chunks to split a compendium into for each worker, so that one slow chunk (a run of very large
+# cliques) doesn't leave the other workers idle at the end.
+CHUNKS_PER_WORKER = 4
+
+
+def kgx_edge_id(subject, obj, salt):
+    """The content-addressed ID of a same_as edge: the MD5 of subject + object + the compendium filename.
+
+    :param salt: The compendium filename, already UTF-8 encoded, as passed to convert_compendium_to_kgx().
+    """
+    return hashlib.md5((subject + obj).encode() + salt).hexdigest()
+
+
+def convert_clique_to_kgx(instance, salt, edge_topology="clique"):
+    """Convert a single compendium clique into lists of KGX nodes and edges.
+
+    :param instance: A clique from a compendium file.
+    :param salt: The UTF-8 encoded compendium filename, used in edge IDs (see kgx_edge_id()).
+    :param edge_topology: "clique" or "star" (see EDGE_TOPOLOGIES).
+    :return: A (nodes, edges) tuple.
+    """
+    identifiers = [x["i"] for x in instance["identifiers"]]
+
+    # All ids (even the root one) are in the equivalent identifiers. Create a node for each of them, using its
+    # label as the name if there is one.
+    nodes = [
+        {
+            "id": equiv_id["i"],
+            "name": equiv_id.get("l", ""),
+            "category": instance["type"],
+            "equivalent_identifiers": list(identifiers),
+        }
+        for equiv_id in instance["identifiers"]
+    ]
+
+    if edge_topology == "star":
+        pairs = ((identifiers[0], identifier) for identifier in identifiers[1:])
+    else:
+        pairs = combinations(identifiers, 2)
+    edges = [
+        {
+            "id": kgx_edge_id(subject, obj, salt),
+            "subject": subject,
+            "predicate": BIOLINK_SAME_AS,
+            "object": obj,
+        }
+        for subject, obj in pairs
+    ]
+    return nodes, edges
+
+
+def convert_compendium_chunk(
+    compendium_filename, start, end, kgx_nodes_filename, kgx_edges_filename, salt, edge_topology="clique"
+):
+    """Convert the compendium lines starting in the byte range [start, end) into gzipped KGX nodes and edges files.
+
+    start must be at the beginning of a line. Each line is written as one JSON object followed by a newline.
+
+    :return: A (lines, nodes, edges) tuple of counts.
+    """
+    count_lines = 0
+    count_nodes = 0
+    count_edges = 0
+    nodes = []
+    edges = []
+
+    def flush():
+        if nodes:
+            node_file.write("".join(json.dumps(node) + "\n" for node in nodes))
+        if edges:
+            edge_file.write("".join(json.dumps(edge) + "\n" for edge in edges))
+        nodes.clear()
+        edges.clear()
+
+    with (
+        open(compendium_filename, "rb") as compendium,
+        gzip.open(kgx_nodes_filename, "wt", encoding="utf-8") as node_file,
+        gzip.open(kgx_edges_filename, "wt", encoding="utf-8") as edge_file,
+    ):
+        compendium.seek(start)
+        position = start
+        while position < end:
+            line = compendium.readline()
+            if not line:
+                break
+            position += len(line)
+            count_lines += 1
+
+            clique_nodes, clique_edges = convert_clique_to_kgx(json.loads(line), salt, edge_topology)
+            nodes.extend(clique_nodes)
+            edges.extend(clique_edges)
+            count_nodes += len(clique_nodes)
+            count_edges += len(clique_edges)
+
+            if count_lines % BATCH_SIZE == 0:
+                flush()
+                logger.debug(
+                    f"Processed {count_lines:,} lines from {compendium_filename}: {get_memory_usage_summary()}"
+                )
+        flush()
+
+    return count_lines, count_nodes, count_edges
+
+
+def split_into_line_ranges(filename, chunk_count):
+    """Split a file into at most chunk_count contiguous (start, end) byte ranges that begin on line boundaries."""
+    size = os.path.getsize(filename)
+    boundaries = [0]
+    with open(filename, "rb") as f:
+        for index in range(1, chunk_count):
+            f.seek(max(size * index // chunk_count - 1, boundaries[-1]))
+            # Move on to the start of the next line (we backed up a byte in case we were already at one).
+            f.readline()
+            boundary = f.tell()
+            if boundary >= size:
+                break
+            if boundary > boundaries[-1]:
+                boundaries.append(boundary)
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+
+
+def convert_compendium_to_kgx(
+    compendium_filename, kgx_nodes_filename, kgx_edges_filename, workers=1, edge_topology="clique"
+):
     """
     Convert a compendium file to KGX (https://github.com/biolink/kgx) format.
 
@@ -24,145 +163,69 @@ def convert_compendium_to_kgx(compendium_filename, kgx_nodes_filename, kgx_edges
     :param compendium_filename: The compendium file to convert.
     :param kgx_nodes_gz_filename: The KGX nodes gzipped file to write out.
     :param kgx_edges_gz_filename: The KGX edges gzipped file to write out.
+    :param workers: The number of worker processes to convert chunks of the compendium in. The output is the same
+        regardless of the number of workers.
+    :param edge_topology: "clique" (the default) for an edge between every pair of identifiers in a clique, or "star"
+        for an edge from the clique leader to every other identifier.
     """
 
-    logger.info(f"convert_compendium_to_kgx({compendium_filename}, {kgx_nodes_filename}, {kgx_edges_filename})")
-
-    # Set up data structures.
-    nodes: list = []
-    edges: list = []
-    pass_nodes: list = []
-
-    count_lines = 0
-    count_nodes = 0
-    count_edges = 0
+    logger.info(
+        f"convert_compendium_to_kgx({compendium_filename}, {kgx_nodes_filename}, {kgx_edges_filename}, "
+        f"workers={workers}, edge_topology={edge_topology})"
+    )
+    if edge_topology not in EDGE_TOPOLOGIES:
+        raise ValueError(f"Unknown KGX edge topology {edge_topology!r}, expected one of {sorted(EDGE_TOPOLOGIES)}")
 
-    # Used to count batches of 100000 lines to process together.
-    batch_size = 100000
-    line_counter = 0
+    # Edge IDs are salted with the compendium filename as it was passed in, so they don't depend on how the
+    # compendium was chunked.
+    salt = f"{compendium_filename}".encode()
 
     # Make the output directories if they don't exist.
     ensure_parent_dir(kgx_nodes_filename)
     ensure_parent_dir(kgx_edges_filename)
 
-    # Open the compendium file for reading.
-    with open(compendium_filename, encoding="utf-8") as compendium:
-        # Open the nodes and edges files for writing.
-        with (
-            gzip.open(kgx_nodes_filename, "wt", encoding="utf-8") as node_file,
-            gzip.open(kgx_edges_filename, "wt", encoding="utf-8") as edge_file,
-        ):
-            # set the flag for suppressing the first ",\n" in the written data
-            first = True
-
-            # At this point we should validate the compendium file, but the report
-            # has already run, so hopefully it's already validated?
-
-            # for each line in the file
-            for line in compendium:
-                # increment the record counter
-                line_counter += 1
-
-                # clear storage for this pass
-                pass_nodes.clear()
-
-                # load the line into memory
-                instance: dict = json.loads(line)
-
-                # all ids (even the root one) are in the equivalent identifiers
-                if len(instance["identifiers"]) > 0:
-                    # loop through each identifier and create a node
-                    for equiv_id in instance["identifiers"]:
-                        # check to see if there is a label. if there is use it
-                        if "l" in equiv_id:
-                            name = equiv_id["l"]
-                        else:
-                            name = ""
-
-                        # add the node to the ones in this pass
-                        pass_nodes.append(
-                            {
-                                "id": equiv_id["i"],
-                                "name": name,
-                                "category": instance["type"],
-                                "equivalent_identifiers": list(x["i"] for x in instance["identifiers"]),
-                            }
-                        )
-
-                    # get the combinations of the nodes in this pass
-                    combos = combinations(pass_nodes, 2)
-
-                    # for all the node combinations create an edge between them
-                    for c in combos:
-                        # create a unique id
-                        record_id: str = c[0]["id"] + c[1]["id"] + f"{compendium_filename}"
-
-                        # save the edge
-                        edges.append(
-                            {
-                                "id": f"{hashlib.md5(record_id.encode('utf-8')).hexdigest()}",
-                                "subject": c[0]["id"],
-                                "predicate": BIOLINK_SAME_AS,
-                                "object": c[1]["id"],
-                            }
-                        )
-
-                # save the nodes in this pass to the big list
-                nodes.extend(pass_nodes)
-
-                # did we reach the write threshold
-                if line_counter == batch_size:
-                    # first time in doesn't get a leading comma
-                    if first:
-                        prefix = ""
-                    else:
-                        prefix = "\n"
-
-                    # reset the first record flag
-                    first = False
-
-                    # get all the nodes in a string and write them out
-                    nodes_to_write = prefix + "\n".join([json.dumps(node) for node in nodes])
-                    node_file.write(nodes_to_write)
-                    count_nodes += len(nodes)
-
-                    # are there any edges to output
-                    if len(edges) > 0:
-                        # get all the edges in a string and write them out
-                        edges_to_write = prefix + "\n".join([json.dumps(edge) for edge in edges])
-                        edge_file.write(edges_to_write)
-                        count_edges += len(edges)
-
-                    # reset for the next group
-                    nodes.clear()
-                    edges.clear()
-
-                    # Count total lines
-                    count_lines += line_counter
-                    logger.debug(
-                        f"Processed {count_lines:,} lines from {compendium_filename}: {get_memory_usage_summary()}"
+    ranges = split_into_line_ranges(compendium_filename, max(1, workers) * CHUNKS_PER_WORKER) if workers > 1 else []
+    if len(ranges) <= 1:
+        count_lines, count_nodes, count_edges = convert_compendium_chunk(
+            compendium_filename,
+            0,
+            os.path.getsize(compendium_filename),
+            kgx_nodes_filename,
+            kgx_edges_filename,
+            salt,
+            edge_topology,
+        )
+    else:
+        logger.info(
+            f"Converting {compendium_filename} in {len(ranges)} chunks over {workers} worker processes: "
+            f"{get_memory_usage_summary()}"
+        )
+        with tempfile.TemporaryDirectory(
+            prefix=".kgx-chunks-", dir=os.path.dirname(os.path.abspath(kgx_nodes_filename))
+        ) as chunk_dir:
+            nodes_chunks = [os.path.join(chunk_dir, f"nodes-{i}.jsonl.gz") for i in range(len(ranges))]
+            edges_chunks = [os.path.join(chunk_dir, f"edges-{i}.jsonl.gz") for i in range(len(ranges))]
+            # Spawn rather than fork, as write_compendium() does, so workers don't inherit the caller's state.
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                futures = [
+                    pool.submit(
+                        convert_compendium_chunk,
+                        compendium_filename,
+                        start,
+                        end,
+                        nodes_chunks[index],
+                        edges_chunks[index],
+                        salt,
+                        edge_topology,
                     )
-
-                    # reset the line counter for the next group
-                    line_counter = 0
-
-            # pick up any remainders in the file
-            if len(nodes) > 0:
-                nodes_to_write = "\n" + "\n".join([json.dumps(node) for node in nodes])
-                node_file.write(nodes_to_write)
-                count_nodes += len(nodes)
-
-            if len(edges) > 0:
-                edges_to_write = "\n" + "\n".join([json.dumps(edge) for edge in edges])
-                edge_file.write(edges_to_write)
-                count_edges += len(edges)
-
-            # Count total lines
-            count_lines += line_counter
-            logger.info(
-                f"Processed a total of {count_lines} lines from {compendium_filename}: {get_memory_usage_summary()}"
-            )
-
+                    for index, (start, end) in enumerate(ranges)
+                ]
+                counts = [future.result() for future in futures]
+            count_lines, count_nodes, count_edges = (sum(column) for column in zip(*counts))
+            concatenate_files(nodes_chunks, kgx_nodes_filename)
+            concatenate_files(edges_chunks, kgx_edges_filename)
+
+    logger.info(f"Processed a total of {count_lines} lines from {compendium_filename}: {get_memory_usage_summary()}")
     logger.info(
         f"Converted {compendium_filename} to KGX: "
         + f"wrote {count_nodes} nodes to {kgx_nodes_filename} and "
@@ -7,14 +7,23 @@
 #
 # This file provides code for doing that, based on the code from
 # https://github.com/TranslatorSRI/babel-validation/blob/f21b1b308e54ec0af616f2c24f7e2738ac4c261c/src/main/scala/org/renci/babel/utils/converter/Converter.scala#L107-L207
+#
+# The pairs for each clique are sampled with a random number generator seeded with its CURIE, so the output is the
+# same from run to run. Large synonym files can be converted in parallel: the entries are read in chunks, each chunk
+# is converted by a worker process into its own gzip member, and the members are written out in order (a sequence
+# of gzip members is itself a valid gzip file), as src/exporters/kgx.py does.
 import gzip
 import itertools
 import json
 import logging
+import math
+import multiprocessing
 import random
 import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
-from src.util import LoggingUtil, ensure_parent_dir
+from src.util import LoggingUtil, ensure_parent_dir, get_memory_usage_summary
 
 # Default logger for this file.
 logger = LoggingUtil.init_logging(__name__, level=logging.INFO)
@@ -29,8 +38,121 @@ MAX_SYNONYM_PAIRS = 50
 # Should we lowercase all the names?
 LOWERCASE_ALL_NAMES = True
 
+# The number of synonym entries to convert into each gzip member (and to hand a worker at a time).
+CHUNK_ENTRIES = 10_000
+
+# The number of chunks to have submitted to the pool per worker, so that workers don't wait on the chunk reader
+# while the number of converted chunks held in memory waiting to be written out stays bounded.
+CHUNKS_IN_FLIGHT_PER_WORKER = 2
+
+# We use '||' as a delimiter, so any occurrences of more than one pipe character should be changed to a single pipe
+# character in the SAPBERT output, so we don't confuse it up with our delimiter.
+MULTIPLE_PIPES = re.compile(r"\|\|+")
+
 
-def convert_synonyms_to_sapbert(synonym_filename_gz, sapbert_filename_gzipped):
+def sample_name_pairs(names, max_pairs, rng):
+    """Choose up to max_pairs distinct pairs of names, without listing every pair.
+
+    :param names: A list of distinct names.
+    :param max_pairs: The largest number of pairs to return.
+    :param rng: The random.Random to sample pairs with.
+    :return: Every pair, in itertools.combinations() order, if there are no more than max_pairs of them; otherwise
+        max_pairs pairs chosen uniformly at random without replacement.
+    """
+    name_count = len(names)
+    pair_count = name_count * (name_count - 1) // 2
+    if pair_count <= max_pairs:
+        return list(itertools.combinations(names, 2))
+    return [_pair_at(names, index) for index in rng.sample(range(pair_count), max_pairs)]
+
+
+def _pair_at(names, index):
+    """Return the pair at this index of itertools.combinations(names, 2), without generating the ones before it."""
+    name_count = len(names)
+
+    # The pairs starting with names[i] start at this index.
+    def first_index(i):
+        return i * name_count - i * (i + 1) // 2
+
+    # Solve first_index(i) <= index for the largest i, then correct for any rounding in the square root.
+    b = 2 * name_count - 1
+    i = max(0, (b - math.isqrt(b * b - 8 * index)) // 2)
+    while i > 0 and first_index(i) > index:
+        i -= 1
+    while first_index(i + 1) <= index:
+        i += 1
+    return names[i], names[index - first_index(i) + i + 1]
+
+
+def convert_synonym_lines(lines, generate_smaller=False):
+    """Convert some lines of a synonyms file into gzip-compressed SAPBERT training rows.
+
+    :param lines: Lines from a synonyms file, each a JSON synonym entry.
+    :param generate_smaller: Whether to also return the rows for the smaller training file (see
+        GENERATE_DRUG_CHEMICAL_SMALLER_FILE).
+    :return: A (training rows, smaller training rows, entries, training row count, smaller training row count)
+        tuple. The rows are each a gzip member, or None for the smaller rows if generate_smaller is false.
+    """
+    count_entry = 0
+    training_rows = []
+    smaller_rows = []
+    for input_line in lines:
+        count_entry += 1
+        entry = json.loads(input_line)
+
+        # Read fields from the synonym.
+        curie = entry["curie"]
+        preferred_name = entry.get("preferred_name", "").strip()
+        if not preferred_name:
+            logging.warning(f"Unable to convert synonym entry for curie {curie}, skipping: {entry}")
+            continue
+
+        # Is the preferred name small enough that we should ignore it from generate_smaller_file?
+        is_preferred_name_short = len(preferred_name) <= DRUG_CHEMICAL_SMALLER_MAX_LABEL_LENGTH
+        # if not is_preferred_name_short:
+        #    logging.warning(f"CURIE {curie} (preferred name: {preferred_name}) will be excluded from the Smaller training file.")
+
+        # Collect and process the list of names.
+        names = entry["names"]
+        if LOWERCASE_ALL_NAMES:
+            names = [name.lower() for name in names]
+        names = [MULTIPLE_PIPES.sub("|", name) if "||" in name else name for name in names]
+
+        # Figure out the Biolink type to report.
+        types = entry["types"]
+        if len(types) == 0:
+            biolink_type = "NamedThing"
+        else:
+            biolink_type = types[0]
+
+        # How many names do we have?
+        if len(names) == 0:
+            # This shouldn't happen, but let's anticipate this anyway.
+            name_pairs = [(preferred_name.lower(), preferred_name.lower())]
+        elif len(names) == 1:
+            # If we have less than two names, we don't have anything to randomize.
+            name_pairs = [(preferred_name.lower(), names[0])]
+        else:
+            # Randomly select up to MAX_SYNONYM_PAIRS pairs of distinct names. Seeding with the CURIE picks the
+            # same pairs every time.
+            name_pairs = sample_name_pairs(list(dict.fromkeys(names)), MAX_SYNONYM_PAIRS, random.Random(curie))
+
+        prefix = f"biolink:{biolink_type}||{curie}||{preferred_name}||"
+        rows = [f"{prefix}{name_pair[0]}||{name_pair[1]}\n" for name_pair in name_pairs]
+        training_rows.extend(rows)
+
+        # As long as the preferred name is shorter than the right size, we should add this clique to the
+        # smaller file as well.
+        if generate_smaller and is_preferred_name_short:
+            smaller_rows.extend(rows)
+
+    # mtime=0 so that the output only depends on the input.
+    training = gzip.compress("".join(training_rows).encode("utf-8"), mtime=0)
+    smaller = gzip.compress("".join(smaller_rows).encode("utf-8"), mtime=0) if generate_smaller else None
+    return training, smaller, count_entry, len(training_rows), len(smaller_rows)
+
+
+def convert_synonyms_to_sapbert(synonym_filename_gz, sapbert_filename_gzipped, workers=1):
     """
     Convert a synonyms file to the training format for SAPBERT (https://github.com/RENCI-NER/sapbert).
 
@@ -38,9 +160,11 @@ def convert_synonyms_to_sapbert(synonym_filename_gz, sapbert_filename_gzipped):
 
     :param synonym_filename_gz: The compendium file to convert.
     :param sapbert_filename_gzipped: The SAPBERT training file to generate.
+    :param workers: The number of worker processes to convert chunks of the synonyms file in. The output is the same
+        regardless of the number of workers.
     """
 
-    logger.info(f"convert_synonyms_to_sapbert({synonym_filename_gz}, {sapbert_filename_gzipped})")
+    logger.info(f"convert_synonyms_to_sapbert({synonym_filename_gz}, {sapbert_filename_gzipped}, workers={workers})")
 
     # For now, the simplest way to identify the DrugChemicalConflated file is by name.
     # In this case we still generate DrugChemicalConflated.txt, but we also generate
@@ -49,93 +173,59 @@ def convert_synonyms_to_sapbert(synonym_filename_gz, sapbert_filename_gzipped):
     generate_smaller_filename = None
     if GENERATE_DRUG_CHEMICAL_SMALLER_FILE and synonym_filename_gz.endswith("/DrugChemicalConflated.txt.gz"):
         generate_smaller_filename = sapbert_filename_gzipped.replace(".txt.gz", "Smaller.txt.gz")
+    generate_smaller = generate_smaller_filename is not None
 
     # Make the output directories if they don't exist.
     ensure_parent_dir(sapbert_filename_gzipped)
 
     # Open SmallerFile for writing if needed.
     generate_smaller_file = None
-    if generate_smaller_filename:
-        generate_smaller_file = gzip.open(generate_smaller_filename, "wt", encoding="utf-8")
+    if generate_smaller:
+        generate_smaller_file = open(generate_smaller_filename, "wb")
 
-    # Go through all the synonyms in the input file.
+    # Go through all the synonyms in the input file, a chunk at a time.
     count_entry = 0
     count_training_rows = 0
     count_smaller_rows = 0
     with (
         gzip.open(synonym_filename_gz, "rt", encoding="utf-8") as synonymf,
-        gzip.open(sapbert_filename_gzipped, "wt", encoding="utf-8") as sapbertf,
+        open(sapbert_filename_gzipped, "wb") as sapbertf,
     ):
-        for input_line in synonymf:
-            count_entry += 1
-            entry = json.loads(input_line)
-
-            # Read fields from the synonym.
-            curie = entry["curie"]
-            preferred_name = entry.get("preferred_name", "").strip()
-            if not preferred_name:
-                logging.warning(f"Unable to convert synonym entry for curie {curie}, skipping: {entry}")
-                continue
-
-            # Is the preferred name small enough that we should ignore it from generate_smaller_file?
-            is_preferred_name_short = len(preferred_name) <= DRUG_CHEMICAL_SMALLER_MAX_LABEL_LENGTH
-            # if not is_preferred_name_short:
-            #    logging.warning(f"CURIE {curie} (preferred name: {preferred_name}) will be excluded from the Smaller training file.")
-
-            # Collect and process the list of names.
-            names = entry["names"]
-            if LOWERCASE_ALL_NAMES:
-                names = [name.lower() for name in names]
-
-            # We use '||' as a delimiter, so any occurrences of more than one pipe character
-            # should be changed to a single pipe character in the SAPBERT output, so we don't
-            # confuse it up with our delimiter.
-            names = [re.sub(r"\|\|+", "|", name) for name in names]
-
-            # Figure out the Biolink type to report.
-            types = entry["types"]
-            if len(types) == 0:
-                biolink_type = "NamedThing"
-            else:
-                biolink_type = types[0]
-
-            # How many names do we have?
-            if len(names) == 0:
-                # This shouldn't happen, but let's anticipate this anyway.
-                line = f"biolink:{biolink_type}||{curie}||{preferred_name}||{preferred_name.lower()}||{preferred_name.lower()}\n"
-                sapbertf.write(line)
-                count_training_rows += 1
-                if generate_smaller_file and is_preferred_name_short:
-                    generate_smaller_file.write(line)
-                    count_smaller_rows += 1
-            elif len(names) == 1:
-                # If we have less than two names, we don't have anything to randomize.
-                line = f"biolink:{biolink_type}||{curie}||{preferred_name}||{preferred_name.lower()}||{names[0]}\n"
-                sapbertf.write(line)
-                count_training_rows += 1
-                if generate_smaller_file and is_preferred_name_short:
-                    generate_smaller_file.write(line)
-                    count_smaller_rows += 1
-            else:
-                name_pairs = list(itertools.combinations(set(names), 2))
-
-                if len(name_pairs) > MAX_SYNONYM_PAIRS:
-                    # Randomly select 50 pairs.
-                    name_pairs = random.sample(name_pairs, MAX_SYNONYM_PAIRS)
-
-                for name_pair in name_pairs:
-                    line = f"biolink:{biolink_type}||{curie}||{preferred_name}||{name_pair[0]}||{name_pair[1]}\n"
-                    sapbertf.write(line)
-                    count_training_rows += 1
-
-                    # As long as the preferred name is shorter than the right size, we should add this clique to the
-                    # smaller file as well.
-                    if generate_smaller_file and is_preferred_name_short:
-                        generate_smaller_file.write(line)
-                        count_smaller_rows += 1
+        chunks = iter(lambda: list(itertools.islice(synonymf, CHUNK_ENTRIES)), [])
+
+        def write_chunk(result):
+            nonlocal count_entry, count_training_rows, count_smaller_rows
+            training, smaller, entries, training_rows, smaller_rows = result
+            sapbertf.write(training)
+            if generate_smaller_file:
+                generate_smaller_file.write(smaller)
+            count_entry += entries
+            count_training_rows += training_rows
+            count_smaller_rows += smaller_rows
+
+        if workers > 1:
+            logger.info(
+                f"Converting {synonym_filename_gz} over {workers} worker processes: {get_memory_usage_summary()}"
+            )
+            # Spawn rather than fork, as write_compendium() does, so workers don't inherit the caller's state.
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                pending = deque()
+                for chunk in chunks:
+                    pending.append(pool.submit(convert_synonym_lines, chunk, generate_smaller))
+                    if len(pending) >= workers * CHUNKS_IN_FLIGHT_PER_WORKER:
+                        write_chunk(pending.popleft().result())
+                while pending:
+                    write_chunk(pending.popleft().result())
+        else:
+            for chunk in chunks:
+                write_chunk(convert_synonym_lines(chunk, generate_smaller))
+
+        # An empty synonyms file still needs a valid (empty) gzip file.
+        if count_entry == 0:
+            write_chunk(convert_synonym_lines([], generate_smaller))
 
     logger.info(
-        f"Converted {synonym_filename_gz} to SAPBERT training file {synonym_filename_gz}: "
+        f"Converted {synonym_filename_gz} to SAPBERT training file {sapbert_filename_gzipped}: "
         + f"read {count_entry} entries and wrote out {count_training_rows} training rows."
     )
 
@@ -0,0 +1,82 @@
+"""A stable, bounded-memory sort of (key, value) records that spills to disk.
+
+Several steps need to group a file's records by some key before processing each group: building the sorted
+label/synonym indexes (src/synonyms/label_index.py) and conflating synonyms (src/synonyms/synonymconflation.py).
+Doing that with a dict of lists holds the whole input in memory; ExternalSorter instead sorts chunks of
+`chunk_size` records in memory, writes each sorted chunk to a temporary file, and merges the chunk files with
+heapq.merge() when the sorted records are read back.
+
+The sort is stable: records with equal keys come back in the order they were added. Keys must be strings without
+tabs or newlines (or ints, with key_type=int); values must be strings without newlines.
+"""
+
+import heapq
+import os
+import tempfile
+from collections.abc import Iterator
+from operator import itemgetter
+
+from src.util import get_logger
+
+logger = get_logger(__name__)
+
+# Number of records sorted in memory before a chunk is spilled to disk.
+DEFAULT_CHUNK_SIZE = 5_000_000
+
+
+class ExternalSorter:
+    """Collect (key, value) records with add(), then read them back sorted by key with sorted().
+
+    :param tmp_dir: The directory to write sorted chunks to. It should be on a disk with room for a copy of the
+        records; the caller is responsible for cleaning it up (e.g. with tempfile.TemporaryDirectory()).
+    :param chunk_size: The number of records to sort in memory before spilling them to disk.
+    :param key_type: The type of the keys (str or int), used to read them back from disk.
+    """
+
+    def __init__(self, tmp_dir: str, chunk_size: int = DEFAULT_CHUNK_SIZE, key_type: type = str):
+        self.tmp_dir = tmp_dir
+        self.chunk_size = chunk_size
+        self.key_type = key_type
+        self.records: list[tuple] = []
+        self.chunk_files: list[str] = []
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, key, value: str) -> None:
+        self.records.append((key, value))
+        self.count += 1
+        if len(self.records) >= self.chunk_size:
+            self._spill()
+
+    def _spill(self) -> None:
+        self.records.sort(key=itemgetter(0))
+        fd, path = tempfile.mkstemp(dir=self.tmp_dir, suffix=".chunk")
+        with open(fd, "w", encoding="utf-8", newline="\n") as outf:
+            for key, value in self.records:
+                outf.write(f"{key}\t{value}\n")
+        self.chunk_files.append(path)
+        self.records = []
+
+    def _read_chunk(self, path: str) -> Iterator[tuple]:
+        with open(path, encoding="utf-8", newline="\n") as inf:
+            for line in inf:
+                key, value = line[:-1].split("\t", maxsplit=1)
+                yield self.key_type(key), value
+        os.remove(path)
+
+    def sorted(self) -> Iterator[tuple]:
+        """Yield every record added so far, stably sorted by key. This can only be called once."""
+        if not self.chunk_files:
+            self.records.sort(key=itemgetter(0))
+            records, self.records = self.records, []
+            yield from records
+            return
+
+        if self.records:
+            self._spill()
+        logger.info(f"Merging {len(self.chunk_files)} sorted chunks of {self.count:,} records in {self.tmp_dir}")
+        # heapq.merge() breaks ties by iterable order, and the chunks are in the order they were added, so the
+        # merge is stable.
+        yield from heapq.merge(*(self._read_chunk(path) for path in self.chunk_files), key=itemgetter(0))
@@ -0,0 +1,349 @@
+"""Incremental compendium rebuilds: redo only the parts of a build whose inputs changed.
+
+Every release used to rebuild every compendium from scratch, even when only one concord had
+changed. With ``incremental_builds`` set in config.yaml, two steps keep state from the previous
+build under ``{intermediate_directory}/incremental/`` and reuse what they can:
+
+- :func:`src.model.incremental_glom.glom_files` gloms a pipeline's identifier and concord files,
+  re-glomming only the connected components whose groups changed (see that module).
+- ``write_compendium()`` copies the compendium and synonym lines of every clique whose identifiers
+  and type are unchanged from the previous build (:class:`CompendiumReuse`), as long as none of the
+  files it reads labels, synonyms, descriptions, taxa, information content or properties from have
+  changed either, and the code that writes those lines hasn't changed its output
+  (``COMPENDIUM_OUTPUT_VERSION``; see :func:`compendium_manifest`).
+
+Each state directory holds a :class:`BuildManifest` of the content digests of the inputs and the
+parameters the state was built with, and the state is only reused if the manifest matches. An
+incremental build should produce the same cliques as a full one: ``babel-clique-diff``
+(src/model/compendium_diff.py) between the two should report no changes.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass, field
+from typing import NamedTuple
+
+from src.synonyms.label_index import RECORDS, SortedStringIndex, build_index
+from src.util import Text, get_config, get_logger
+
+logger = get_logger(__name__)
+
+# Bump this when the layout of a state directory changes, so that old state is ignored rather than misread.
+STATE_FORMAT_VERSION = 1
+# Bump this whenever a change to the code changes the compendium or synonym lines write_compendium() writes for a
+# clique (their fields, formatting, or the order of names or descriptions), so that an incremental build doesn't
+# reuse lines written by the old code. compendium_manifest() records it, and CompendiumReuse.usable_state_dir()
+# ignores state recorded with a different version.
+COMPENDIUM_OUTPUT_VERSION = 1
+
+MANIFEST_FILENAME = "manifest.json"
+DIGEST_CACHE_FILENAME = "digests.json"
+DIGEST_CHUNK_SIZE = 1 << 20
+
+# The files in a write_compendium() state directory.
+COMPENDIUM_FILENAME = "compendium.txt"
+SYNONYMS_FILENAME = "synonyms.txt"
+CLIQUE_INDEX_FILENAME = "cliques.idx"
+
+# The per-prefix files in the download directory that write_compendium() reads (through the node, synonym,
+# description and taxon factories) for the identifiers in a clique.
+PER_PREFIX_FILENAMES = ("labels", "synonyms", "descriptions", "taxa")
+
+# The key recorded for a clique whose output can't be reused (see clique_key()).
+NOT_REUSABLE = "-"
+
+
+def incremental_state_dir(*names):
+    """Return the directory to keep incremental build state for `names` in, or None if incremental builds are off."""
+    config = get_config()
+    if not config.get("incremental_builds", False):
+        return None
+    return os.path.join(config["intermediate_directory"], "incremental", *names)
+
+
+def file_digest(filename):
+    """Return the SHA-256 digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(filename, "rb") as f:
+        while chunk := f.read(DIGEST_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_json_atomically(filename, obj):
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "w") as f:
+        json.dump(obj, f, indent=2, sort_keys=True)
+    os.replace(tmp_filename, filename)
+
+
+class DigestCache:
+    """Content digests of input files, remembered by size and modification time.
+
+    Babel's inputs get new modification times whenever they are downloaded or regenerated, even if their
+    content is unchanged, so manifests compare content digests. This cache only avoids re-reading a file
+    whose size and modification time haven't changed since it was last digested.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.entries = {}
+        if os.path.exists(filename):
+            with open(filename) as f:
+                self.entries = json.load(f)
+        self.changed = False
+
+    @classmethod
+    def for_config(cls):
+        """The digest cache shared by every incremental state directory."""
+        state_dir = incremental_state_dir()
+        os.makedirs(state_dir, exist_ok=True)
+        return cls(os.path.join(state_dir, DIGEST_CACHE_FILENAME))
+
+    def digest(self, filename):
+        """Return the digest of a file, or None if it doesn't exist."""
+        if not os.path.exists(filename):
+            return None
+        stat = os.stat(filename)
+        key = os.path.abspath(filename)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+        digest = file_digest(filename)
+        self.entries[key] = [stat.st_size, stat.st_mtime_ns, digest]
+        self.changed = True
+        return digest
+
+    def save(self):
+        # Jobs running in parallel may overwrite each other's additions; that only costs a re-digest later.
+        if self.changed:
+            _write_json_atomically(self.filename, self.entries)
+            self.changed = False
+
+
+@dataclass
+class BuildManifest:
+    """The parameters a piece of incremental state was built with, and the content digests of its inputs.
+
+    :param params: JSON-serializable parameters. They are round-tripped through JSON, so tuples become lists.
+    :param inputs: A dict of input filename to content digest (None for an input that doesn't exist).
+    """
+
+    params: dict
+    inputs: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.params = json.loads(json.dumps({"format": STATE_FORMAT_VERSION, **self.params}))
+
+    @classmethod
+    def for_inputs(cls, params, input_filenames, digest_cache):
+        return cls(params, {filename: digest_cache.digest(filename) for filename in input_filenames})
+
+    @classmethod
+    def load(cls, state_dir):
+        """Load the manifest from a state directory, or return None if there isn't one."""
+        filename = os.path.join(state_dir, MANIFEST_FILENAME)
+        if not os.path.exists(filename):
+            return None
+        with open(filename) as f:
+            manifest = json.load(f)
+        return cls(manifest["params"], manifest["inputs"])
+
+    def save(self, state_dir):
+        _write_json_atomically(
+            os.path.join(state_dir, MANIFEST_FILENAME), {"params": self.params, "inputs": self.inputs}
+        )
+
+    @staticmethod
+    def invalidate(state_dir):
+        """Remove the manifest from a state directory, so that a half-updated state is never reused."""
+        filename = os.path.join(state_dir, MANIFEST_FILENAME)
+        if os.path.exists(filename):
+            os.remove(filename)
+
+    def params_changed_from(self, previous):
+        """Return the names of the parameters that differ from a previous manifest."""
+        return sorted(
+            key
+            for key in self.params.keys() | previous.params.keys()
+            if self.params.get(key) != previous.params.get(key)
+        )
+
+    def inputs_changed_from(self, previous):
+        """Return the input filenames that were added, removed or changed since a previous manifest."""
+        return sorted(
+            filename
+            for filename in self.inputs.keys() | previous.inputs.keys()
+            if self.inputs.get(filename) != previous.inputs.get(filename)
+        )
+
+
+def _link_or_copy(source, destination):
+    """Hard-link source to destination (replacing it), or copy it if the filesystem can't link."""
+    tmp_destination = destination + ".tmp"
+    if os.path.exists(tmp_destination):
+        os.remove(tmp_destination)
+    try:
+        os.link(source, tmp_destination)
+    except OSError:
+        shutil.copyfile(source, tmp_destination)
+    os.replace(tmp_destination, destination)
+
+
+def clique_key(node_type, identifiers):
+    """Return the key write_compendium() records the output of a clique under, or NOT_REUSABLE.
+
+    Cliques of LabeledIDs aren't reusable, since their labels are part of the input.
+    """
+    if node_type is None or not all(isinstance(identifier, str) for identifier in identifiers):
+        return NOT_REUSABLE
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update("\n".join([node_type, *sorted(identifiers)]).encode())
+    return digest.hexdigest()
+
+
+def compendium_manifest(
+    ofname, node_type, synonym_list, labels, extra_prefixes, icrdf_filename, properties_jsonl_gz_files, digest_cache
+):
+    """Return the BuildManifest of everything write_compendium() reads other than the cliques themselves."""
+    config = get_config()
+    download_dir = config["download_directory"]
+
+    prefixes = set()
+    for clique in synonym_list:
+        for identifier in getattr(clique, "identifiers", clique):
+            prefixes.add(Text.get_curie(identifier).split(":", 1)[0])
+    input_filenames = [
+        os.path.join(download_dir, prefix, filename) for prefix in sorted(prefixes) for filename in PER_PREFIX_FILENAMES
+    ]
+    for kind in ("labels", "synonyms", "descriptions"):
+        input_filenames.extend(os.path.join(download_dir, "common", filename) for filename in config["common"][kind])
+    input_filenames.append(icrdf_filename)
+    input_filenames.extend(properties_jsonl_gz_files or [])
+    input_filenames.append(os.path.join(config.get("input_directory", "input_data"), "obsolete_synonyms.yaml"))
+
+    labels_digest = hashlib.sha256(
+        json.dumps(sorted((str(curie), str(label)) for curie, label in labels.items())).encode()
+    ).hexdigest()
+    params = {
+        "compendium": ofname,
+        "output_version": COMPENDIUM_OUTPUT_VERSION,
+        "node_type": node_type,
+        "extra_prefixes": list(extra_prefixes),
+        "labels": labels_digest,
+        "biolink_version": config["biolink_version"],
+        "preferred_name_boost_prefixes": config["preferred_name_boost_prefixes"],
+        "demote_labels_longer_than": config.get("demote_labels_longer_than", {}),
+    }
+    return BuildManifest.for_inputs(params, input_filenames, digest_cache)
+
+
+class ReusedClique(NamedTuple):
+    """The output write_compendium() wrote for a clique in the previous build."""
+
+    compendium_line: bytes
+    synonyms_line: bytes
+    synonym_count: int
+    filtered_count: int
+
+
+class CliqueLog:
+    """Records, for every clique write_compendium() processes, what a later build needs to reuse its output.
+
+    Each line is the clique's key (see clique_key()), the lengths in bytes of the compendium and synonym lines
+    written for it (0 if none was written), its synonym count and its count of filtered synonyms. The lines are in
+    output order, so the offsets of each clique's lines can be recovered by summing the lengths before it.
+    """
+
+    def __init__(self, filename):
+        self.file = open(filename, "w")
+
+    def add(self, key, compendium_length, synonyms_length, synonym_count, filtered_count):
+        self.file.write(f"{key}\t{compendium_length}\t{synonyms_length}\t{synonym_count}\t{filtered_count}\n")
+
+    def close(self):
+        self.file.close()
+
+
+class CompendiumReuse:
+    """The previous build of a compendium, for write_compendium() to copy the output of unchanged cliques from."""
+
+    def __init__(self, state_dir):
+        self.index = SortedStringIndex(os.path.join(state_dir, CLIQUE_INDEX_FILENAME))
+        self.compendium = open(os.path.join(state_dir, COMPENDIUM_FILENAME), "rb")
+        self.synonyms = open(os.path.join(state_dir, SYNONYMS_FILENAME), "rb")
+
+    @staticmethod
+    def usable_state_dir(state_dir, manifest):
+        """Return state_dir if it holds a previous build made from the same inputs as manifest, otherwise None."""
+        previous = BuildManifest.load(state_dir)
+        if previous is None:
+            logger.info(f"No previous build in {state_dir} to reuse.")
+            return None
+        changed = manifest.params_changed_from(previous) + manifest.inputs_changed_from(previous)
+        if changed:
+            logger.info(
+                f"Not reusing the previous build in {state_dir}: {len(changed)} parameters or inputs changed, "
+                f"including {changed[:10]}"
+            )
+            return None
+        return state_dir
+
+    def get(self, key):
+        """Return the ReusedClique recorded under key, or None."""
+        if key == NOT_REUSABLE:
+            return None
+        values = self.index.get(key)
+        if values is None:
+            return None
+        compendium_offset, compendium_length, synonyms_offset, synonyms_length, synonym_count, filtered_count = map(
+            int, values[0].split("\t")
+        )
+        self.compendium.seek(compendium_offset)
+        self.synonyms.seek(synonyms_offset)
+        return ReusedClique(
+            self.compendium.read(compendium_length),
+            self.synonyms.read(synonyms_length),
+            synonym_count,
+            filtered_count,
+        )
+
+    def close(self):
+        self.index.close()
+        self.compendium.close()
+        self.synonyms.close()
+
+
+def save_compendium_state(state_dir, manifest, compendium_filename, synonyms_filename, clique_log_filename):
+    """Keep a just-written compendium as the previous build for the next incremental write_compendium().
+
+    The compendium and synonym files are hard-linked into the state directory (Snakemake removes the outputs of a
+    job before it runs again), and the clique log is turned into a sorted index of where each clique's lines are.
+    """
+    os.makedirs(state_dir, exist_ok=True)
+    BuildManifest.invalidate(state_dir)
+
+    with tempfile.TemporaryDirectory(dir=state_dir, prefix=".save-") as tmp_dir:
+        records_filename = os.path.join(tmp_dir, "records.tsv")
+        compendium_offset = synonyms_offset = 0
+        with open(clique_log_filename) as log, open(records_filename, "w") as records:
+            for line in log:
+                key, compendium_length, synonyms_length, synonym_count, filtered_count = line.rstrip("\n").split("\t")
+                if key != NOT_REUSABLE:
+                    records.write(
+                        f"{key}\t{compendium_offset}\t{compendium_length}\t{synonyms_offset}\t{synonyms_length}\t"
+                        f"{synonym_count}\t{filtered_count}\n"
+                    )
+                compendium_offset += int(compendium_length)
+                synonyms_offset += int(synonyms_length)
+        index_filename = os.path.join(tmp_dir, CLIQUE_INDEX_FILENAME)
+        build_index(records_filename, index_filename, RECORDS)
+
+        _link_or_copy(compendium_filename, os.path.join(state_dir, COMPENDIUM_FILENAME))
+        _link_or_copy(synonyms_filename, os.path.join(state_dir, SYNONYMS_FILENAME))
+        os.replace(index_filename, os.path.join(state_dir, CLIQUE_INDEX_FILENAME))
+
+    manifest.save(state_dir)
@@ -1,18 +1,17 @@
-import ast
 import json
 
 # Starting with a conflation file, and a set of compendia, create a new compendium merging conflated cliques.
 
 
 def get_conflation_ids(conffilename):
-    """Given the name of a conflation file, where each line looks like:
-    ['RXCUI:1092396', 'RXCUI:849078', 'PUBCHEM.COMPOUND:446284', 'RXCUI:1874904', 'RXCUI:1292744', 'RXCUI:830735', 'RXCUI:880179', 'UMLS:C1370123', 'RXCUI:968674', 'RXCUI:1535149', 'RXCUI:884745', 'RXCUI:1092388', 'RXCUI:1870972', 'RXCUI:1192495', 'RXCUI:451805', 'RXCUI:1092394', 'RXCUI:2391745', 'RXCUI:830716', 'RXCUI:831573', 'RXCUI:1356795', 'RXCUI:1014098']
+    """Given the name of a conflation file, where each line is a JSON list like:
+    ["RXCUI:1092396", "RXCUI:849078", "PUBCHEM.COMPOUND:446284", "RXCUI:1874904", "RXCUI:1292744", "RXCUI:830735", "RXCUI:880179", "UMLS:C1370123", "RXCUI:968674", "RXCUI:1535149", "RXCUI:884745", "RXCUI:1092388", "RXCUI:1870972", "RXCUI:1192495", "RXCUI:451805", "RXCUI:1092394", "RXCUI:2391745", "RXCUI:830716", "RXCUI:831573", "RXCUI:1356795", "RXCUI:1014098"]
     return a set of all the ids in the file.
     """
     ids = set()
     with open(conffilename) as inf:
         for line in inf:
-            ids.update(ast.literal_eval(line.strip()))
+            ids.update(json.loads(line))
     if "RXCUI:1092396" in ids:
         print("OK")
     else:
@@ -50,8 +49,8 @@ def get_compendia_names(cdir, compendia, ids):
 
 
 def label_cliques(conflation_fname, id2name):
-    """Given a conflation file, where each row looks like
-    ['RXCUI:1092396', 'RXCUI:849078', 'PUBCHEM.COMPOUND:446284', 'RXCUI:1874904', 'RXCUI:1292744', 'RXCUI:830735', 'RXCUI:880179', 'UMLS:C1370123', 'RXCUI:968674', 'RXCUI:1535149', 'RXCUI:884745', 'RXCUI:1092388', 'RXCUI:1870972', 'RXCUI:1192495', 'RXCUI:451805', 'RXCUI:1092394', 'RXCUI:2391745', 'RXCUI:830716', 'RXCUI:831573', 'RXCUI:1356795', 'RXCUI:1014098']
+    """Given a conflation file, where each row is a JSON list like
+    ["RXCUI:1092396", "RXCUI:849078", "PUBCHEM.COMPOUND:446284", "RXCUI:1874904", "RXCUI:1292744", "RXCUI:830735", "RXCUI:880179", "UMLS:C1370123", "RXCUI:968674", "RXCUI:1535149", "RXCUI:884745", "RXCUI:1092388", "RXCUI:1870972", "RXCUI:1192495", "RXCUI:451805", "RXCUI:1092394", "RXCUI:2391745", "RXCUI:830716", "RXCUI:831573", "RXCUI:1356795", "RXCUI:1014098"]
     and a dictionary between identifiers and labels, label the cliques.
     Write a new file "labeled.txt" where each row looks like:
     [{"i": "RXCUI:1092396", "l": "Acetinophem"}, {"i": "RXCUI:849078", "l": "100 mg Tylenol"}, ...]
@@ -60,7 +59,7 @@ def label_cliques(conflation_fname, id2name):
     with open("labeled.txt", "w") as outf, open(conflation_fname) as conflation:
         for line in conflation:
             clique = []
-            ids = ast.literal_eval(line)
+            ids = json.loads(line)
             for identifier in ids:
                 if identifier in id2name:
                     clique.append({"i": identifier, "l": id2name[identifier]})
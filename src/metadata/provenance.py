@@ -73,6 +73,7 @@ def write_combined_metadata(
     counts=None,
     combined_from_filenames: list[str] = None,
     also_combined_from=None,
+    profile=None,
 ):
     combined_from = {}
     if combined_from_filenames is not None:
@@ -117,10 +118,13 @@ def write_combined_metadata(
         description=description,
         counts=counts,
         combined_from=combined_from,
+        profile=profile,
     )
 
 
-def write_metadata(filename, typ, name, *, sources=None, url="", description="", counts=None, combined_from=None):
+def write_metadata(
+    filename, typ, name, *, sources=None, url="", description="", counts=None, combined_from=None, profile=None
+):
     if type(typ) is not str:
         raise ValueError(f"Metadata entry type must be a string, not {type(typ)}: '{typ}'")
     if type(name) is not str:
@@ -132,19 +136,24 @@ def write_metadata(filename, typ, name, *, sources=None, url="", description="",
     if combined_from is None:
         combined_from = []
 
+    metadata = {
+        "created_at": datetime.now().isoformat(),
+        "type": typ,
+        "name": name,
+        "url": url,
+        "description": description,
+        "sources": sources,
+        "counts": counts,
+    }
+    # Only compendia record how long each stage of writing them took (see write_compendium()).
+    if profile is not None:
+        metadata["profile"] = profile
+    metadata["combined_from"] = combined_from
+
     ensure_parent_dir(filename)
     with open(filename, "w") as fout:
         yaml.dump(
-            {
-                "created_at": datetime.now().isoformat(),
-                "type": typ,
-                "name": name,
-                "url": url,
-                "description": description,
-                "sources": sources,
-                "counts": counts,
-                "combined_from": combined_from,
-            },
+            metadata,
             fout,
             sort_keys=False,  # Prefer the order we specified above.
         )
@@ -0,0 +1,94 @@
+"""A compact binary file of cliques, for handing cliques from one Snakemake rule to the next.
+
+The untyped chemical compendium used to be written as one Python ``set`` repr per line and read
+back with ``ast.literal_eval()``, which parses every line into an AST before building the set: for
+tens of millions of cliques that dominated both the runtime and the peak memory of the typed
+chemical rule. A clique file instead holds every CURIE once, in a newline-separated string table,
+and each clique as a run of indexes into that table, so both sides are a handful of bulk
+reads and writes.
+
+File layout (counts and offsets are native-endian unsigned 64-bit integers, CURIE indexes are
+native-endian unsigned 32-bit integers)::
+
+    MAGIC (8 bytes) | CURIE count N (8 bytes) | clique count M (8 bytes) | string table size S (8 bytes)
+    clique offsets (M + 1 entries, into the member indexes)
+    member indexes (one per clique member)
+    string table   (S bytes: the N CURIEs, UTF-8 encoded and joined with "\\n")
+
+CURIEs never contain a newline, so "\\n" is a safe separator.
+"""
+
+import os
+import struct
+from array import array
+from collections.abc import Iterable, Iterator
+
+from src.util import get_logger
+
+logger = get_logger(__name__)
+
+MAGIC = b"BABELCQ1"
+HEADER = struct.Struct("=8sQQQ")
+OFFSET_TYPECODE = "Q"
+MEMBER_TYPECODE = "I"
+MAX_CURIES = 1 << 32
+
+
+def write_cliques(filename: str, cliques: Iterable[Iterable[str]]) -> int:
+    """Write cliques to a clique file.
+
+    :param filename: The file to write. It is written next to its final name and renamed into place.
+    :param cliques: The cliques to write, each an iterable of CURIEs. They are written in iteration order.
+    :return: The number of cliques written.
+    """
+    index_for_curie = {}
+    offsets = array(OFFSET_TYPECODE, [0])
+    members = array(MEMBER_TYPECODE)
+    for clique in cliques:
+        for curie in clique:
+            index = index_for_curie.get(curie)
+            if index is None:
+                index = index_for_curie[curie] = len(index_for_curie)
+            members.append(index)
+        offsets.append(len(members))
+    if len(index_for_curie) >= MAX_CURIES:
+        raise ValueError(f"Too many CURIEs ({len(index_for_curie):,}) to write to a clique file")
+
+    string_table = "\n".join(index_for_curie).encode("utf-8")
+    clique_count = len(offsets) - 1
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "wb") as outf:
+        outf.write(HEADER.pack(MAGIC, len(index_for_curie), clique_count, len(string_table)))
+        offsets.tofile(outf)
+        members.tofile(outf)
+        outf.write(string_table)
+    os.replace(tmp_filename, filename)
+
+    logger.info(f"Wrote {clique_count:,} cliques of {len(index_for_curie):,} CURIEs to {filename}")
+    return clique_count
+
+
+def read_cliques(filename: str) -> Iterator[frozenset[str]]:
+    """Yield the cliques in a clique file, in the order they were written, as frozensets of CURIEs.
+
+    :raises ValueError: If the file isn't a clique file (for instance, one written by an older version of Babel).
+    """
+    with open(filename, "rb") as inf:
+        header = inf.read(HEADER.size)
+        if len(header) < HEADER.size or header[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"{filename} is not a clique file (bad magic {header[: len(MAGIC)]!r}); regenerate it.")
+        _, curie_count, clique_count, string_table_size = HEADER.unpack(header)
+
+        offsets = array(OFFSET_TYPECODE)
+        offsets.fromfile(inf, clique_count + 1)
+        members = array(MEMBER_TYPECODE)
+        members.fromfile(inf, offsets[clique_count])
+        string_table = inf.read(string_table_size)
+
+    curies = string_table.decode("utf-8").split("\n") if curie_count else []
+    del string_table
+    if len(curies) != curie_count:
+        raise ValueError(f"{filename} is corrupt: expected {curie_count:,} CURIEs, found {len(curies):,}")
+
+    for i in range(clique_count):
+        yield frozenset([curies[index] for index in members[offsets[i] : offsets[i + 1]]])
@@ -0,0 +1,205 @@
+"""The union-find engine behind :func:`src.babel_utils.glom`.
+
+``glom()`` used to merge each incoming pair by building ``set().union(*existing_sets)`` and
+re-pointing every member of the result at the new set. That is quadratic in clique size: a
+clique that grows to a million members one pair at a time is copied a million times. Chemical
+and publication builds are dominated by exactly that shape.
+
+:class:`GlomDisjointSet` replaces it with a disjoint-set forest over interned integer ids
+(path compression, union by size). The two checks that can reject a pair are answered from
+per-root bookkeeping rather than by rescanning the merged set:
+
+- ``unique_prefixes``: each root keeps a count of its members in every unique prefix, so
+  "would this merge hold two identifiers with the same unique prefix?" is a sum over the
+  roots involved.
+- ``close``: each root keeps the members whose CURIE starts with one of the ``close``
+  prefixes, so only those members' close-match lists are consulted.
+
+The caller-facing contract is unchanged: ``glom()`` still reads and writes a plain
+``dict[curie, set[curie]]`` in which every member of a clique points at the same set object
+(see ``GlomDict`` in :mod:`src.model.glom_diff`). Every pipeline calls ``glom()`` several
+times on the same dict -- once per ids file and once per concord -- and some of them read the
+dict in between (anatomy's concord-pair filter), so the engine is scoped to a single call:
+it pulls a clique out of the dict only when an incoming pair touches it, and
+:meth:`GlomDisjointSet.materialize` writes a fresh set back for every clique that changed.
+Untouched cliques keep their set object, and a changed clique gets a new one rather than
+having the old one mutated, as before.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Hashable, Iterable, Mapping, MutableMapping
+
+# Prefixes that must never reach glom(). Their presence means a source emitted a bare KEGG or
+# PUBCHEM CURIE instead of a compound-level one (KEGG.COMPOUND, PUBCHEM.COMPOUND, ...).
+FORBIDDEN_PREFIXES = frozenset({"KEGG", "PUBCHEM"})
+
+
+def _identifier(element) -> str:
+    """Return the CURIE string for a glom element, which is either a str or a LabeledID."""
+    return element if isinstance(element, str) else element.identifier
+
+
+class GlomDisjointSet:
+    """A disjoint-set forest over the cliques of one glom dict, for the duration of one glom() call.
+
+    :param conc_set: The glom dict being updated. It is read lazily (a clique is interned the
+        first time one of its members appears in a pair) and only written by :meth:`materialize`.
+    :param unique_prefixes: Prefixes for which a clique may hold at most one identifier.
+    :param close: A map from CURIE prefix to a ``{curie: close-match curies}`` dict; a pair is
+        rejected if it would put a CURIE and one of its close matches in the same clique.
+    """
+
+    def __init__(
+        self,
+        conc_set: MutableMapping[Hashable, set],
+        unique_prefixes: Iterable[str] = (),
+        close: Mapping[str, Mapping[str, Iterable[str]]] | None = None,
+    ):
+        self.conc_set = conc_set
+        # Iterated rather than converted to a set: a caller passing a bare string ("UBERON") gets
+        # the same per-character behaviour it always has.
+        self.unique_prefixes = list(unique_prefixes)
+        self.close = dict(close) if close else {}
+
+        # Interning: element <-> integer id.
+        self._ids: dict[Hashable, int] = {}
+        self._elements: list[Hashable] = []
+        self._parent: list[int] = []
+        # Per-root bookkeeping; None for ids that are no longer roots.
+        self._members: list[list[int] | None] = []
+        self._unique_counts: list[dict[str, int] | None] = []
+        self._close_members: list[dict[str, list[int]] | None] = []
+
+        # Roots whose membership changed (possibly since merged into another root), and the
+        # elements that joined a clique for the first time, in the order they were accepted.
+        self._dirty: set[int] = set()
+        self._new_elements: list[int] = []
+        self._placed: set[int] = set()
+
+    def __len__(self):
+        return len(self._elements)
+
+    def _add(self, element) -> int:
+        """Intern one element as a singleton root and return its id."""
+        idx = len(self._elements)
+        self._ids[element] = idx
+        self._elements.append(element)
+        self._parent.append(idx)
+        self._members.append([idx])
+        ident = _identifier(element)
+        prefix = ident.split(":")[0]
+        self._unique_counts.append({up: 1 for up in self.unique_prefixes if up == prefix})
+        self._close_members.append({cpref: [idx] for cpref in self.close if ident.startswith(cpref)})
+        return idx
+
+    def _intern(self, element) -> int:
+        """Return the id for an element, pulling its whole existing clique in from conc_set if needed."""
+        idx = self._ids.get(element)
+        if idx is not None:
+            return idx
+        existing = self.conc_set.get(element)
+        if existing is None:
+            return self._add(element)
+        root = None
+        for member in existing:
+            member_idx = self._ids.get(member)
+            member_idx = self._add(member) if member_idx is None else self.find(member_idx)
+            if root is None:
+                root = member_idx
+            elif member_idx != root:
+                root = self._link(root, member_idx)
+        # Members of an existing clique are already keys of conc_set.
+        self._placed.update(self._members[root])
+        return self._ids[element]
+
+    def find(self, idx: int) -> int:
+        """Return the root of idx, compressing the path behind it."""
+        root = idx
+        parent = self._parent
+        while parent[root] != root:
+            root = parent[root]
+        while parent[idx] != root:
+            parent[idx], idx = root, parent[idx]
+        return root
+
+    def _link(self, a: int, b: int) -> int:
+        """Union two roots by size, merging their bookkeeping; return the surviving root."""
+        if len(self._members[a]) < len(self._members[b]):
+            a, b = b, a
+        self._parent[b] = a
+        self._members[a].extend(self._members[b])
+        counts = self._unique_counts[a]
+        for up, n in self._unique_counts[b].items():
+            counts[up] = counts.get(up, 0) + n
+        close_members = self._close_members[a]
+        for cpref, idxs in self._close_members[b].items():
+            close_members.setdefault(cpref, []).extend(idxs)
+        self._members[b] = self._unique_counts[b] = self._close_members[b] = None
+        return a
+
+    def _violates_unique_prefixes(self, roots: set[int]) -> bool:
+        for up in self.unique_prefixes:
+            if sum(self._unique_counts[r].get(up, 0) for r in roots) > 1:
+                return True
+        return False
+
+    def _violates_close(self, roots: set[int]) -> bool:
+        for cpref, closedict in self.close.items():
+            for r in roots:
+                for m in self._close_members[r].get(cpref, ()):
+                    for cd in closedict.get(_identifier(self._elements[m]), ()):
+                        cd_idx = self._ids.get(cd)
+                        if cd_idx is not None and self.find(cd_idx) in roots:
+                            return True
+        return False
+
+    def add_group(self, group: Iterable) -> bool:
+        """Merge one equivalence group (a pair or a singleton); return False if it was rejected.
+
+        A group is rejected -- leaving every clique as it was -- if the merged clique would hold
+        two identifiers sharing a unique prefix, or a CURIE together with one of its close matches.
+
+        :raises ValueError: if the group has more than two members.
+        :raises Exception: if the group contains a CURIE with a forbidden bare prefix.
+        """
+        elements = list(group)
+        if len(elements) > 2:
+            raise ValueError(f"glom() only accepts pairs or singletons, got {elements}")
+        for element in elements:
+            if _identifier(element).split(":")[0] in FORBIDDEN_PREFIXES:
+                raise Exception(f"garbage: {element} has a forbidden prefix")
+
+        idxs = [self._intern(element) for element in elements]
+        roots = {self.find(idx) for idx in idxs}
+        if not roots:
+            return True
+        if self._violates_unique_prefixes(roots) or self._violates_close(roots):
+            return False
+
+        root, *others = roots
+        for other in others:
+            root = self._link(root, other)
+        self._dirty.add(root)
+        for idx in idxs:
+            if idx not in self._placed:
+                self._placed.add(idx)
+                self._new_elements.append(idx)
+        return True
+
+    def materialize(self) -> None:
+        """Write a fresh set into conc_set for every member of every clique that changed.
+
+        Elements joining a clique for the first time are inserted in the order their groups were
+        accepted, so the dict's key order matches what the old set-rebuilding merge produced.
+        """
+        clique_for_root: dict[int, set] = {}
+        for root in {self.find(r) for r in self._dirty}:
+            clique_for_root[root] = {self._elements[m] for m in self._members[root]}
+        for idx in self._new_elements:
+            self.conc_set[self._elements[idx]] = clique_for_root[self.find(idx)]
+        for root, clique in clique_for_root.items():
+            for member in clique:
+                self.conc_set[member] = clique
+        self._dirty.clear()
+        self._new_elements.clear()
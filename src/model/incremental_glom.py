@@ -0,0 +1,209 @@
+"""Glom a pipeline's identifier and concord files, re-glomming only the components whose inputs changed.
+
+The simpler pipelines (gene, protein, taxon) build their cliques by glomming every identifier file
+and then every concord file, in order. :func:`glom_files` does the same, and with an incremental
+state directory (see :mod:`src.incremental`) it also keeps the result of the previous build:
+
+1. If the content digests of the input files and the glom parameters match the previous build's
+   :class:`~src.incremental.BuildManifest`, the previous cliques are returned as they are.
+2. Otherwise every file is read, and the groups (singletons from identifier files, pairs from
+   concords) are split into connected components. Whether ``glom()`` accepts or rejects a group
+   only depends on the cliques of that group's members, which never leave its component, so each
+   component can be glommed on its own and gives the same cliques as glomming everything.
+3. Each component is fingerprinted by the sequence of (file, group) it was built from. A component
+   with the same fingerprint as one in the previous build reuses that build's cliques; only the
+   groups of the remaining components are glommed again, in their original order.
+
+Changing one concord therefore re-gloms only the components that concord touches. Files are
+identified by their basename, so moving the intermediate directory doesn't invalidate the state.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+
+from src.babel_utils import glom, read_identifier_file
+from src.incremental import BuildManifest, DigestCache
+from src.util import get_logger, get_memory_usage_summary
+
+logger = get_logger(__name__)
+
+COMPONENTS_FILENAME = "components.jsonl.gz"
+
+# Component fingerprints are a polynomial hash of their groups' digests, modulo 2**128.
+FINGERPRINT_MODULUS = 1 << 128
+FINGERPRINT_MULTIPLIER = 0x9E3779B97F4A7C15F39CC0605CEDC835
+
+
+def _read_steps(identifier_files, concordance_files):
+    """Yield a (source, groups) tuple for each input file, in glom order."""
+    for ifile in identifier_files:
+        logger.info(f"Loading identifier file {ifile}")
+        new_identifiers, _ = read_identifier_file(ifile)
+        yield f"ids:{os.path.basename(ifile)}", new_identifiers
+    for infile in concordance_files:
+        logger.info(f"Loading concordance file {infile}")
+        pairs = []
+        with open(infile) as inf:
+            for line in inf:
+                x = line.strip().split("\t")
+                pairs.append(set([x[0], x[2]]))
+        yield f"concord:{os.path.basename(infile)}", pairs
+
+
+def _glom_all(identifier_files, concordance_files, unique_prefixes):
+    dicts = {}
+    for _, groups in _read_steps(identifier_files, concordance_files):
+        glom(dicts, groups, unique_prefixes=unique_prefixes)
+        logger.info(f"Glommed {len(groups):,} groups: {get_memory_usage_summary()}")
+    return set([frozenset(x) for x in dicts.values()])
+
+
+def _group_digest(source, group):
+    return int.from_bytes(hashlib.blake2b("\t".join([source, *sorted(group)]).encode(), digest_size=16).digest())
+
+
+class _Components:
+    """A union-find forest over interned CURIEs, for splitting groups into connected components."""
+
+    def __init__(self):
+        self.ids = {}
+        self.curies = []
+        self.parent = []
+
+    def intern(self, curie):
+        idx = self.ids.get(curie)
+        if idx is None:
+            idx = self.ids[curie] = len(self.curies)
+            self.curies.append(curie)
+            self.parent.append(idx)
+        return idx
+
+    def find(self, idx):
+        parent = self.parent
+        while parent[idx] != idx:
+            parent[idx] = parent[parent[idx]]
+            idx = parent[idx]
+        return idx
+
+    def union(self, idxs):
+        roots = [self.find(idx) for idx in idxs]
+        for root in roots[1:]:
+            self.parent[root] = roots[0]
+
+
+def _load_components(state_dir, fingerprints):
+    """Return {fingerprint: cliques} for the components of the previous build whose fingerprint is in fingerprints."""
+    filename = os.path.join(state_dir, COMPONENTS_FILENAME)
+    reused = {}
+    with gzip.open(filename, "rt") as inf:
+        for line in inf:
+            component = json.loads(line)
+            if fingerprints is None or component["fingerprint"] in fingerprints:
+                reused[component["fingerprint"]] = [frozenset(clique) for clique in component["cliques"]]
+    return reused
+
+
+def _save_components(state_dir, manifest, cliques_by_fingerprint):
+    os.makedirs(state_dir, exist_ok=True)
+    BuildManifest.invalidate(state_dir)
+    filename = os.path.join(state_dir, COMPONENTS_FILENAME)
+    with gzip.open(filename + ".tmp", "wt") as outf:
+        for fingerprint, cliques in cliques_by_fingerprint.items():
+            outf.write(json.dumps({"fingerprint": fingerprint, "cliques": [sorted(c) for c in cliques]}) + "\n")
+    os.replace(filename + ".tmp", filename)
+    manifest.save(state_dir)
+
+
+def glom_files(identifier_files, concordance_files, unique_prefixes, state_dir=None, digest_cache=None):
+    """Glom identifier files and then concord files, in order, and return the resulting cliques.
+
+    :param identifier_files: Identifier files (see read_identifier_file()), glommed as singletons.
+    :param concordance_files: Concord files, whose first and third columns are glommed as pairs.
+    :param unique_prefixes: Passed to glom().
+    :param state_dir: (OPTIONAL) An incremental state directory (see src.incremental.incremental_state_dir()). If
+        None, every file is glommed from scratch, exactly as the pipelines used to.
+    :param digest_cache: (OPTIONAL) The DigestCache to digest the input files with. Defaults to the shared one.
+    :return: A set of cliques, each a frozenset of CURIEs.
+    """
+    if state_dir is None:
+        return _glom_all(identifier_files, concordance_files, unique_prefixes)
+
+    if digest_cache is None:
+        digest_cache = DigestCache.for_config()
+    manifest = BuildManifest.for_inputs(
+        {"unique_prefixes": list(unique_prefixes)}, [*identifier_files, *concordance_files], digest_cache
+    )
+    # Key the inputs by basename and keep their order, since it determines the glom.
+    manifest.inputs = {os.path.basename(filename): manifest.inputs[filename] for filename in manifest.inputs}
+    manifest.params["order"] = list(manifest.inputs)
+    digest_cache.save()
+
+    previous = BuildManifest.load(state_dir)
+    if (
+        previous is not None
+        and not previous.params_changed_from(manifest)
+        and not previous.inputs_changed_from(manifest)
+    ):
+        cliques_by_fingerprint = _load_components(state_dir, None)
+        logger.info(f"No glom inputs changed since the previous build in {state_dir}, reusing its cliques.")
+        return set().union(*cliques_by_fingerprint.values())
+    if previous is not None:
+        logger.info(
+            f"Glom inputs changed since the previous build in {state_dir}: "
+            f"{manifest.params_changed_from(previous) + manifest.inputs_changed_from(previous)}"
+        )
+
+    # Read every group, and split them into connected components.
+    components = _Components()
+    steps = []
+    for source, groups in _read_steps(identifier_files, concordance_files):
+        idx_groups = []
+        for group in groups:
+            idxs = tuple(components.intern(curie) for curie in group)
+            components.union(idxs)
+            idx_groups.append(idxs)
+        steps.append((source, idx_groups))
+    logger.info(f"Read {sum(len(groups) for _, groups in steps):,} groups: {get_memory_usage_summary()}")
+
+    fingerprint_for_root = {}
+    for source, idx_groups in steps:
+        for idxs in idx_groups:
+            if not idxs:
+                continue
+            root = components.find(idxs[0])
+            group_digest = _group_digest(source, [components.curies[idx] for idx in idxs])
+            fingerprint = fingerprint_for_root.get(root, 0)
+            fingerprint_for_root[root] = (fingerprint * FINGERPRINT_MULTIPLIER + group_digest) % FINGERPRINT_MODULUS
+    fingerprint_for_root = {root: f"{fingerprint:032x}" for root, fingerprint in fingerprint_for_root.items()}
+
+    # Component fingerprints already cover which file each group came from and the order of the groups, so a
+    # change in the order of the files alone doesn't stop components from being reused.
+    reused = {}
+    if previous is not None and set(manifest.params_changed_from(previous)) <= {"order"}:
+        reused = _load_components(state_dir, set(fingerprint_for_root.values()))
+    changed_roots = {root for root, fingerprint in fingerprint_for_root.items() if fingerprint not in reused}
+    logger.info(
+        f"Reusing {len(fingerprint_for_root) - len(changed_roots):,} of {len(fingerprint_for_root):,} components "
+        f"from {state_dir}; re-glomming the other {len(changed_roots):,}."
+    )
+
+    # Glom the groups of the changed components, in their original order.
+    dicts = {}
+    for _, idx_groups in steps:
+        groups = [
+            [components.curies[idx] for idx in idxs]
+            for idxs in idx_groups
+            if idxs and components.find(idxs[0]) in changed_roots
+        ]
+        glom(dicts, groups, unique_prefixes=unique_prefixes)
+
+    cliques_by_fingerprint = {fingerprint: [] for fingerprint in fingerprint_for_root.values()}
+    cliques_by_fingerprint.update(reused)
+    for clique in set([frozenset(x) for x in dicts.values()]):
+        root = components.find(components.ids[next(iter(clique))])
+        cliques_by_fingerprint[fingerprint_for_root[root]].append(clique)
+
+    _save_components(state_dir, manifest, cliques_by_fingerprint)
+    return set().union(*cliques_by_fingerprint.values())
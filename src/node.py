@@ -1,8 +1,12 @@
+import hashlib
 import itertools
 import json
 import os
+import pathlib
 import sqlite3
+import tempfile
 from collections import defaultdict
+from collections.abc import Mapping
 from urllib.parse import urlparse
 
 import curies
@@ -10,7 +14,17 @@ import curies
 from src.LabeledID import LabeledID
 from src.predicates import HAS_EXACT_SYNONYM
 from src.prefixes import PUBCHEMCOMPOUND
+from src.stage_profile import NULL_STAGE_PROFILE
 from src.synonyms.filter import get_synonym_filter
+from src.synonyms.label_index import (
+    RECORDS,
+    IndexedLabels,
+    IndexedSynonyms,
+    SortedStringIndex,
+    build_index,
+    index_filename,
+    open_fresh_index,
+)
 from src.util import (
     Text,
     get_biolink_model_toolkit,
@@ -68,8 +82,12 @@ class SynonymFactory:
         logger.info(f"Created SynonymFactory for directory {syndir}")
 
     def load_synonyms(self, prefix):
-        lbs = defaultdict(set)
         labelfname = os.path.join(self.synonym_dir, prefix, "labels")
+        synfname = os.path.join(self.synonym_dir, prefix, "synonyms")
+        if self.load_indexed_synonyms(prefix, labelfname, synfname):
+            return
+
+        lbs = defaultdict(set)
         logger.info(f"Loading synonyms for {prefix} from {labelfname}: {get_memory_usage_summary()}")
         count_labels = 0
         count_synonyms = 0
@@ -83,7 +101,6 @@ class SynonymFactory:
                         lbs[x[0]].add((HAS_EXACT_SYNONYM, x[1]))
                         if x[1]:
                             count_labels += 1
-        synfname = os.path.join(self.synonym_dir, prefix, "synonyms")
         if os.path.exists(synfname):
             with open(synfname) as inf:
                 for line in inf:
@@ -97,6 +114,29 @@ class SynonymFactory:
             f"Loaded {count_labels:,} labels and {count_synonyms:,} synonyms for {prefix} from {labelfname}: {get_memory_usage_summary()}"
         )
 
+    def load_indexed_synonyms(self, prefix, labelfname, synfname):
+        """Use the sorted indexes of the labels and synonyms files for a prefix, if they are all up to date.
+
+        Returns False -- so load_synonyms() reads the files into memory instead -- if any file that
+        exists is missing an index or has a stale one.
+        """
+        indexes = {}
+        for fname in (labelfname, synfname):
+            if not os.path.exists(fname):
+                indexes[fname] = None
+                continue
+            indexes[fname] = open_fresh_index(fname)
+            if indexes[fname] is None:
+                for index in indexes.values():
+                    if index is not None:
+                        index.close()
+                return False
+        if all(index is None for index in indexes.values()):
+            return False
+        self.synonyms[prefix] = IndexedSynonyms(indexes[labelfname], indexes[synfname])
+        logger.info(f"Using label and synonym indexes for {prefix}: {get_memory_usage_summary()}")
+        return True
+
     def get_synonyms(self, identifiers: list[str], node_types: list = None):
         synonym_filter = get_synonym_filter()
         node_synonyms = set()
@@ -173,17 +213,51 @@ class DescriptionFactory:
 class TaxonFactory:
     """A factory for loading taxa for CURIEs where available."""
 
-    def __init__(self, rootdir):
+    def __init__(self, rootdir, persist=None):
         self.root_dir = rootdir
-        self.tsvloader = TSVSQLiteLoader(rootdir, "taxa", "curie-curie")
+        if persist is None:
+            persist = get_config().get("persist_tsv_sqlite", False)
+        self.tsvloader = TSVSQLiteLoader(rootdir, "taxa", "curie-curie", persist=persist)
+        # Taxa fetched ahead of time by prefetch(), keyed by prefetch_key().
+        self.prefetched = {}
+
+    def __str__(self):
+        return f"TaxonFactory({self.root_dir}) with {self.tsvloader}"
 
     def load_taxa(self, prefix):
         return self.tsvloader.load_prefix(prefix)
 
+    @staticmethod
+    def prefetch_key(curie):
+        """TSVSQLiteLoader picks a database by the exact prefix but matches the rest case-insensitively."""
+        prefix, _, local_id = curie.partition(":")
+        return f"{prefix}:{local_id.upper()}"
+
+    def prefetch(self, curies: list[str]):
+        """Look up the taxa for a whole chunk of cliques at once, replacing any previously prefetched taxa.
+
+        get_taxa() answers from this cache where it can and only queries SQLite for the CURIEs it
+        hasn't seen, so calling this before working through a chunk of cliques turns one query per
+        CURIE into one batched query per prefix.
+        """
+        taxa = self.tsvloader.get_curies(list(set(curies)))
+        self.prefetched = {self.prefetch_key(curie): values for curie, values in taxa.items()}
+
     def get_taxa(self, curies: list[str]):
-        return self.tsvloader.get_curies(curies)
+        results = {}
+        misses = []
+        for curie in curies:
+            taxa = self.prefetched.get(self.prefetch_key(curie))
+            if taxa is None:
+                misses.append(curie)
+            else:
+                results[curie] = set(taxa)
+        if misses:
+            results.update(self.tsvloader.get_curies(misses))
+        return results
 
     def close(self):
+        self.prefetched = {}
         self.tsvloader.close()
 
 
@@ -197,18 +271,33 @@ class TSVSQLiteLoader:
     2.  Query identifiers by identifier prefix.
     3.  Close and delete the SQLite files when we're done.
 
+    With persist=True, step 1 writes each prefix's indexed database to `<TSV>.sqlite` next to the TSV file instead,
+    recording the TSV's mtime and size in it. Later loaders (in this process, another worker or a later Snakemake
+    rule) open that database read-only as long as the TSV hasn't changed, rather than reloading the TSV -- for
+    UniProtKB taxa that's over 100M rows. If the database can't be written (e.g. a read-only download directory),
+    we fall back to a temporary database.
+
     TODO: note that on Sterling, SQLite might not be able to detect when it's running out of memory (we have a limit
     of around 500Gi, but the node will have 1.5Ti, so SQLite won't detect a low-mem situation correctly). We should
     figure out how to configure that.
     """
 
-    def __init__(self, download_dir, filename, file_format):
+    # The maximum number of CURIEs to look up in a single `IN (...)` query; SQLite's default limit on host
+    # parameters is 32,766, and we stay well below it.
+    QUERY_BATCH_SIZE = 5_000
+
+    # Suffix for the persisted database, and the table recording which TSV file it was built from.
+    PERSISTED_SUFFIX = ".sqlite"
+    SOURCE_TABLE = "tsv_source"
+
+    def __init__(self, download_dir, filename, file_format, persist=False):
         self.download_dir = download_dir
         self.filename = filename
+        self.persist = persist
         self.sqlites = {}
 
         # We only support one format for now.
-        self.format = format
+        self.format = file_format
         if file_format in {"curie-curie"}:
             # Acceptable format!
             pass
@@ -225,10 +314,17 @@ class TSVSQLiteLoader:
 
     def get_sqlite_counts(self):
         counts = dict()
-        for prefix in self.sqlites:
-            counts[prefix] = self.sqlites[prefix].execute(f"SELECT COUNT(*) FROM {prefix}").fetchone()[0]
+        for prefix, db in self.sqlites.items():
+            if db is not None:
+                counts[prefix] = db.execute(f'SELECT COUNT(*) FROM "{prefix}"').fetchone()[0]
         return counts
 
+    @staticmethod
+    def tsv_signature(tsv_filename):
+        """The (mtime_ns, size) of a TSV file, which a persisted database must match to be reused."""
+        stat = os.stat(tsv_filename)
+        return stat.st_mtime_ns, stat.st_size
+
     def load_prefix(self, prefix):
         if prefix in self.sqlites:
             # We've already loaded this prefix!
@@ -242,13 +338,25 @@ class TSVSQLiteLoader:
             self.sqlites[prefix] = None
             return False
 
+        if self.persist:
+            conn = self.open_persisted(prefix, tsv_filename)
+            if conn is not None:
+                self.sqlites[prefix] = conn
+                return True
+
         # Write to a SQLite in-memory database so we don't need to hold it in memory all at once.
         logger.info(f"Loading {prefix} into SQLite: {get_memory_usage_summary()}")
 
         # Setting a SQLite database as "" does exactly what we want: create an in-memory database that will spill onto
         # a temporary file if needed.
         conn = sqlite3.connect("")
-        conn.execute(f"CREATE TABLE {prefix} (curie1 TEXT, curie2 TEXT)")
+        self.populate(conn, prefix, tsv_filename)
+        self.sqlites[prefix] = conn
+        return True
+
+    def populate(self, conn, prefix, tsv_filename):
+        """Create the table for a prefix in conn, load the TSV file into it and index it."""
+        conn.execute(f'CREATE TABLE "{prefix}" (curie1 TEXT, curie2 TEXT)')
 
         # Load taxa into memory.
         logger.info(
@@ -266,22 +374,68 @@ class TSVSQLiteLoader:
                     logger.info(
                         f"Inserting {len(records):,} records (total so far: {record_count:,}) from {tsv_filename} into SQLite: {get_memory_usage_summary()}"
                     )
-                    conn.executemany(f"INSERT INTO {prefix} VALUES (?, ?)", records)
+                    conn.executemany(f'INSERT INTO "{prefix}" VALUES (?, ?)', records)
                     records = []
 
         # Insert any remaining records.
         logger.info(f"Inserting {len(records):,} records from {tsv_filename} into SQLite: {get_memory_usage_summary()}")
-        conn.executemany(f"INSERT INTO {prefix} VALUES (?, ?)", records)
+        conn.executemany(f'INSERT INTO "{prefix}" VALUES (?, ?)', records)
         logger.info(
             f"Creating a case-insensitive index for the {record_count:,} records loaded into SQLite: {get_memory_usage_summary()}"
         )
-        conn.execute(f"CREATE INDEX curie1_idx ON {prefix}(curie1)")
+        conn.execute(f'CREATE INDEX curie1_idx ON "{prefix}"(curie1)')
         conn.commit()
         logger.info(
             f"Loaded {record_count:,} records from {tsv_filename} into SQLite table {prefix}: {get_memory_usage_summary()}"
         )
-        self.sqlites[prefix] = conn
-        return True
+
+    def open_persisted(self, prefix, tsv_filename):
+        """Open (building it first if needed) the persisted database for a prefix, or return None if we can't."""
+        db_filename = tsv_filename + self.PERSISTED_SUFFIX
+        signature = self.tsv_signature(tsv_filename)
+
+        conn = self.connect_read_only(db_filename, signature)
+        if conn is not None:
+            logger.info(f"Reusing persisted SQLite database {db_filename} for {prefix}: {get_memory_usage_summary()}")
+            return conn
+
+        logger.info(f"Building persisted SQLite database {db_filename} for {prefix}: {get_memory_usage_summary()}")
+        # Build under a per-process name and rename into place, so concurrent builders never see a partial database.
+        tmp_filename = f"{db_filename}.{os.getpid()}.tmp"
+        try:
+            conn = sqlite3.connect(tmp_filename)
+            try:
+                conn.execute("PRAGMA journal_mode = OFF")
+                conn.execute("PRAGMA synchronous = OFF")
+                self.populate(conn, prefix, tsv_filename)
+                conn.execute(f"CREATE TABLE {self.SOURCE_TABLE} (mtime_ns INTEGER, size INTEGER)")
+                conn.execute(f"INSERT INTO {self.SOURCE_TABLE} VALUES (?, ?)", signature)
+                conn.commit()
+            finally:
+                conn.close()
+            os.replace(tmp_filename, db_filename)
+        except (OSError, sqlite3.OperationalError) as e:
+            logger.warning(f"Could not persist SQLite database {db_filename} ({e}), loading {prefix} into memory.")
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+            return None
+
+        return self.connect_read_only(db_filename, signature)
+
+    def connect_read_only(self, db_filename, signature):
+        """Open a persisted database read-only if it exists and was built from a TSV with this signature."""
+        if not os.path.exists(db_filename):
+            return None
+        conn = sqlite3.connect(pathlib.Path(db_filename).resolve().as_uri() + "?mode=ro", uri=True)
+        try:
+            row = conn.execute(f"SELECT mtime_ns, size FROM {self.SOURCE_TABLE}").fetchone()
+        except sqlite3.DatabaseError:
+            row = None
+        if row is None or tuple(row) != tuple(signature):
+            logger.info(f"Persisted SQLite database {db_filename} is out of date, rebuilding it.")
+            conn.close()
+            return None
+        return conn
 
     def get_curies(self, curies_to_query: list) -> dict[str, set[str]]:
         results = defaultdict(set)
@@ -305,18 +459,20 @@ class TSVSQLiteLoader:
                     results[curie] = set()
                 continue
 
-            # Query the SQLite.
-            query = f"SELECT curie1, curie2 FROM {prefix} WHERE curie1 = ?"
+            # Query the SQLite in batches. Lookups are case-insensitive, so several of the CURIEs we were given might
+            # share an upper-cased form.
+            curies_by_upper = defaultdict(list)
             for curie in curies:
-                query_result = self.sqlites[prefix].execute(query, [curie.upper()]).fetchall()
-                if not query_result:
-                    results[curie] = set()
-                    continue
-
-                for row in query_result:
-                    curie1 = curie
-                    curie2 = row[1]
-                    results[curie1].add(curie2)
+                results[curie] = set()
+                curies_by_upper[curie.upper()].append(curie)
+            uppers = list(curies_by_upper)
+            for batch_start in range(0, len(uppers), self.QUERY_BATCH_SIZE):
+                batch = uppers[batch_start : batch_start + self.QUERY_BATCH_SIZE]
+                placeholders = ", ".join("?" * len(batch))
+                query = f'SELECT curie1, curie2 FROM "{prefix}" WHERE curie1 IN ({placeholders})'
+                for curie1, curie2 in self.sqlites[prefix].execute(query, batch):
+                    for curie in curies_by_upper[curie1]:
+                        results[curie].add(curie2)
 
         return dict(results)
 
@@ -336,6 +492,142 @@ class TSVSQLiteLoader:
         self.close()
 
 
+# The key under which compile_information_content() records the IRI-to-CURIE mapping it used. CURIEs never start
+# with "@", so it can't clash with one.
+IC_INDEX_MAPPING_KEY = "@mapping"
+
+
+def information_content_mapping():
+    """Return a digest of the configuration that determines how icRDF.tsv's IRIs are mapped to CURIEs."""
+    config = get_config()
+    mapping = [config["biolink_version"], config["ubergraph_iri_stem_to_prefix_map"]]
+    return hashlib.sha256(json.dumps(mapping, sort_keys=True).encode()).hexdigest()
+
+
+def information_content_converters():
+    """Return the curies.Converters used to map icRDF.tsv's IRIs to CURIEs, in the order they are tried."""
+    config = get_config()
+    return [
+        get_biolink_prefix_map(),
+        curies.Converter.from_reverse_prefix_map(config["ubergraph_iri_stem_to_prefix_map"]),
+    ]
+
+
+def read_information_content(ic_file, converters):
+    """Yield an (IRI, CURIE, IC) tuple for every line of an icRDF.tsv file.
+
+    :param ic_file: The icRDF.tsv file to read.
+    :param converters: The curies.Converters to compress each IRI with (see information_content_converters()).
+    :return: An iterator of (IRI, CURIE, IC value as written in the file) tuples. CURIE is None for an IRI that none
+        of the converters could compress.
+    """
+    with open(ic_file) as inf:
+        for line in inf:
+            x = line.strip().split("\t")
+            # We talk in CURIEs, but the infores download is in URLs. We can use the Biolink
+            # prefix map to convert between them, and the ubergraph_iri_stem_to_prefix_map for anything else.
+            node_id = None
+            for converter in converters:
+                node_id = converter.compress(x[0])
+                if node_id is not None:
+                    break
+            yield x[0], node_id, x[1]
+
+
+def _log_information_content_summary(count, count_by_prefix, unmapped_urls):
+    # Sort the dictionary items by value in descending order
+    sorted_by_prefix = sorted(count_by_prefix.items(), key=lambda item: item[1], reverse=True)
+
+    logger.info(f"Loaded {count} InformationContent values from {len(count_by_prefix.keys())} prefixes:")
+    # Now you can print the sorted items
+    for key, value in sorted_by_prefix:
+        logger.info(f"- {key}: {value}")
+
+    # We see a number of URLs being mapped to None (250,871 at present). Let's optionally raise an error if that
+    # happens.
+    if len(unmapped_urls) > 0:
+        # Group unmapped URLs by netloc
+        unmapped_urls_by_netloc = defaultdict(list)
+        for url in unmapped_urls:
+            netloc = urlparse(url).netloc
+            unmapped_urls_by_netloc[netloc].append(url)
+
+        # Print them in reverse count order.
+        logger.info(f"Found {len(unmapped_urls)} unmapped URLs:")
+        netlocs_by_count = sorted(unmapped_urls_by_netloc.items(), key=lambda item: len(item[1]), reverse=True)
+        for netloc, urls in netlocs_by_count:
+            logger.info(f" - {netloc} [{len(urls)}]")
+            for url in sorted(urls):
+                logger.info(f"   - {url}")
+
+        assert None not in sorted_by_prefix, (
+            "Found invalid CURIEs in information content values, probably because they couldn't be mapped from URLs to CURIEs."
+        )
+
+
+def compile_information_content(ic_file, output_filename=None, converters=None):
+    """Compile icRDF.tsv into a sorted, memory-mapped index of CURIE to information content.
+
+    InformationContentFactory used to compress every IRI in icRDF.tsv through the Biolink and Ubergraph prefix maps
+    and build a dict of the results every time it was created, which costs every compendium job minutes and several
+    GB. With this index (built once, by the get_icrdf rule) it only opens a memory map. IRIs that can't be mapped to
+    a CURIE are left out of the index.
+
+    :param ic_file: The icRDF.tsv file to compile.
+    :param output_filename: The index to write. Defaults to label_index.index_filename(ic_file), which is where
+        InformationContentFactory looks for it.
+    :param converters: (OPTIONAL) The curies.Converters to use instead of information_content_converters().
+    :return: The number of CURIEs indexed.
+    """
+    if output_filename is None:
+        output_filename = index_filename(ic_file)
+    if converters is None:
+        converters = information_content_converters()
+
+    count_by_prefix = defaultdict(int)
+    unmapped_urls = []
+    count = 0
+    output_dir = os.path.dirname(os.path.abspath(output_filename))
+    with tempfile.TemporaryDirectory(dir=output_dir, prefix=".icrdf-") as tmp_dir:
+        records_filename = os.path.join(tmp_dir, "records.tsv")
+        with open(records_filename, "w") as records:
+            records.write(f"{IC_INDEX_MAPPING_KEY}\t{information_content_mapping()}\n")
+            for iri, node_id, ic in read_information_content(ic_file, converters):
+                count += 1
+                if node_id is None:
+                    unmapped_urls.append(iri)
+                    count_by_prefix["None"] += 1
+                    continue
+                # Check that this is a number now, rather than in every job that reads the index.
+                float(ic)
+                records.write(f"{node_id}\t{ic}\n")
+                count_by_prefix[node_id.split(":")[0]] += 1
+        _log_information_content_summary(count, count_by_prefix, unmapped_urls)
+        return build_index(records_filename, output_filename, RECORDS) - 1
+
+
+class IndexedInformationContent(Mapping):
+    """The ``{curie: ic}`` dict of InformationContentFactory, backed by an index from compile_information_content().
+
+    As with the dict, a CURIE listed more than once gets the last value in the file.
+    """
+
+    def __init__(self, index: SortedStringIndex):
+        self.index = index
+
+    def __getitem__(self, curie):
+        values = self.index.get(curie) if isinstance(curie, str) and curie != IC_INDEX_MAPPING_KEY else None
+        if values is None:
+            raise KeyError(curie)
+        return float(values[-1])
+
+    def __iter__(self):
+        return (curie for curie in self.index if curie != IC_INDEX_MAPPING_KEY)
+
+    def __len__(self):
+        return len(self.index) - 1
+
+
 class InformationContentFactory:
     """
 
@@ -344,7 +636,8 @@ class InformationContentFactory:
     A class for creating and using information content objects.
 
     Attributes:
-        ic (dict): A dictionary containing information content values for different nodes.
+        ic (Mapping): The information content values for different nodes, either read from an index built by
+            compile_information_content() or (if there is no up-to-date index) loaded into a dict.
 
     Methods:
         __init__(ic_file)
@@ -366,78 +659,45 @@ class InformationContentFactory:
     """
 
     def __init__(self, ic_file):
-        config = get_config()
-        self.ic = {}
+        index = open_fresh_index(ic_file)
+        if index is not None:
+            if index.get(IC_INDEX_MAPPING_KEY) == [information_content_mapping()]:
+                self.ic = IndexedInformationContent(index)
+                logger.info(f"Opened {len(self.ic):,} InformationContent values from {index.filename}")
+                return
+            logger.warning(
+                f"Ignoring {index.filename}: it was compiled with a different biolink_version or "
+                f"ubergraph_iri_stem_to_prefix_map, so reading information content from {ic_file} instead."
+            )
+            index.close()
 
+        self.ic = {}
         unmapped_urls = []
-        biolink_prefix_map = get_biolink_prefix_map()
-        ubergraph_iri_stem_to_prefix_map = curies.Converter.from_reverse_prefix_map(
-            config["ubergraph_iri_stem_to_prefix_map"]
-        )
-
         count_by_prefix = defaultdict(int)
-        with open(ic_file) as inf:
-            for line in inf:
-                x = line.strip().split("\t")
-                # We talk in CURIEs, but the infores download is in URLs. We can use the Biolink
-                # prefix map to convert between them.
-                node_id = biolink_prefix_map.compress(x[0])
-                if node_id is None:
-                    # Try the ubergraph_iri_stem_to_prefix_map
-                    node_id = ubergraph_iri_stem_to_prefix_map.compress(x[0])
-
-                # If None, log this URL as unmapped.
-                if node_id is None:
-                    unmapped_urls.append(x[0])
+        for iri, node_id, ic in read_information_content(ic_file, information_content_converters()):
+            # If None, log this URL as unmapped.
+            if node_id is None:
+                unmapped_urls.append(iri)
 
-                ic = x[1]
-                self.ic[node_id] = float(ic)
+            self.ic[node_id] = float(ic)
 
-                # Track IC values by prefix.
-                if isinstance(node_id, str):
-                    prefix = node_id.split(":")[0]
-                else:
-                    # Probably None, but we'll collect everything.
-                    prefix = str(node_id)
-                count_by_prefix[prefix] += 1
-
-        # Sort the dictionary items by value in descending order
-        sorted_by_prefix = sorted(count_by_prefix.items(), key=lambda item: item[1], reverse=True)
-
-        logger.info(f"Loaded {len(self.ic)} InformationContent values from {len(count_by_prefix.keys())} prefixes:")
-        # Now you can print the sorted items
-        for key, value in sorted_by_prefix:
-            logger.info(f"- {key}: {value}")
-
-        # We see a number of URLs being mapped to None (250,871 at present). Let's optionally raise an error if that
-        # happens.
-        if len(unmapped_urls) > 0:
-            # Group unmapped URLs by netloc
-            unmapped_urls_by_netloc = defaultdict(list)
-            for url in unmapped_urls:
-                netloc = urlparse(url).netloc
-                unmapped_urls_by_netloc[netloc].append(url)
-
-            # Print them in reverse count order.
-            logger.info(f"Found {len(unmapped_urls)} unmapped URLs:")
-            netlocs_by_count = sorted(unmapped_urls_by_netloc.items(), key=lambda item: len(item[1]), reverse=True)
-            for netloc, urls in netlocs_by_count:
-                logger.info(f" - {netloc} [{len(urls)}]")
-                for url in sorted(urls):
-                    logger.info(f"   - {url}")
-
-            assert None not in sorted_by_prefix, (
-                "Found invalid CURIEs in information content values, probably because they couldn't be mapped from URLs to CURIEs."
-            )
+            # Track IC values by prefix.
+            if isinstance(node_id, str):
+                prefix = node_id.split(":")[0]
+            else:
+                # Probably None, but we'll collect everything.
+                prefix = str(node_id)
+            count_by_prefix[prefix] += 1
+        _log_information_content_summary(len(self.ic), count_by_prefix, unmapped_urls)
 
     def get_ic(self, node):
         ICs = []
         for ident in node["identifiers"]:
-            thisid = ident["identifier"]
-            if thisid in self.ic:
-                # IC values are numeric values between 0 and 100.
-                # Make sure this is a float for min() purposes.
-                ICs.append(float(self.ic[thisid]))
+            # IC values are numeric values between 0 and 100.
+            # Make sure this is a float for min() purposes.
+            ic = self.ic.get(ident["identifier"])
+            if ic is not None:
+                ICs.append(float(ic))
         if len(ICs) == 0:
             return None
         return min(ICs)
@@ -453,6 +713,8 @@ class NodeFactory:
         self.extra_labels = {}
         self.label_dir = label_dir
         self.common_labels = None
+        # Set to a StageProfile (see src/stage_profile.py) to have create_node() report the time it spends labelling.
+        self.stage_profile = NULL_STAGE_PROFILE
 
     def get_ancestors(self, input_type):
         if input_type in self.ancestor_map:
@@ -541,6 +803,10 @@ class NodeFactory:
             )
             return
         labelfname = os.path.join(self.label_dir, prefix, "labels")
+        index = open_fresh_index(labelfname)
+        if index is not None:
+            self.extra_labels[prefix] = IndexedLabels(index)
+            return
         lbs = {}
         if os.path.exists(labelfname):
             with open(labelfname) as inf:
@@ -651,7 +917,8 @@ class NodeFactory:
                 f"this seems like a lot of input_identifiers in node.create_node() [{len(input_identifiers)}]: {input_identifiers}"
             )
         ancestors = self.get_ancestors(node_type)
-        cleaned = self.apply_labels(input_identifiers, labels, node_types=ancestors)
+        with self.stage_profile.stage("apply_labels"):
+            cleaned = self.apply_labels(input_identifiers, labels, node_types=ancestors)
         try:
             idmap = defaultdict(list)
             for i in list(cleaned):
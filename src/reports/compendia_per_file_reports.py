@@ -2,13 +2,17 @@
 compendia_per_file_reports.py - Generate reports for the individual files in the compendia directory.
 """
 
-import itertools
 import json
-import logging
 import os
 from collections import defaultdict
 from datetime import datetime
 
+from src.exporters.duckdb_exporters import log_duckdb_settings_on_error, setup_duckdb
+
+# Matches any text that isn't empty once str.strip() has removed its whitespace (the characters str.isspace() is true
+# for), so labels and descriptions are counted the same way they were when this report parsed the compendium JSONL.
+NONBLANK_PATTERN = r"[^\pZ\t\n\x0b\x0c\r\x1c-\x1f\x85]"
+
 
 def get_datetime_as_string():
     """
@@ -49,76 +53,103 @@ def assert_files_in_directory(dir, expected_files, report_file):
         f.write(f"Confirmed that {dir} contains only the files {expected_files} at {get_datetime_as_string()}\n")
 
 
-def generate_content_report_for_compendium(compendium_path, report_path):
+def generate_content_report_for_compendium(
+    compendium_path, report_path, node_parquet_file, clique_parquet_file, edge_parquet_file, memory_limit_mb=None
+):
     """
     Generate a report of CURIE prefixes per file.
 
-    :param compendium_path: The path of the compendium file to read.
+    This is worked out from the Node, Clique and Edge Parquet files export_compendia_to_parquet() wrote for the
+    compendium, rather than by parsing the compendium itself. Edge rows say which clique (by clique leader) each
+    identifier is in, and are joined to Node rows by CURIE to get its label and descriptions.
+
+    :param compendium_path: The path of the compendium file the report is about.
     :param report_path: The path to write the CURIE prefixes per file report as a JSON file.
+    :param node_parquet_file: The compendium's Node.parquet file.
+    :param clique_parquet_file: The compendium's Clique.parquet file.
+    :param edge_parquet_file: The compendium's Edge.parquet file.
+    :param memory_limit_mb: DuckDB memory limit in MB, past which it spills to its temp_directory.
     """
 
-    with open(report_path, "w") as report_file:
-        with open(compendium_path) as compendium_file:
-            # This is a JSONL file, so we need to read each line as a JSON object.
-
-            # Track CURIE breakdowns for this compendium.
-            count_by_prefix = defaultdict(int)
-            count_by_biolink_type = defaultdict(int)
-            counters = {
-                "clique_count": 0,
-                "cliques_by_id_count": defaultdict(int),
-                "cliques_by_label_count": defaultdict(int),
-                "cliques_by_unique_label_count": defaultdict(int),
-                "cliques_by_description_count": defaultdict(int),
-                "cliques_by_unique_description_count": defaultdict(int),
-            }
-
-            # Since this is time-consuming, let's log a count as we go.
-            count_lines = 0
-
-            # Iterate through the compendium file.
-            for line in compendium_file:
-                count_lines += 1
-
-                # Report updates every 10 million lines.
-                if count_lines % 10000000 == 0:
-                    logging.info(f"Processed {count_lines:,} lines in {compendium_path}")
-
-                # Parse each line as a JSON object.
-                clique = json.loads(line)
-
-                # Track the CURIEs we're looking for.
-                identifiers = clique.get("identifiers", [])
-                ids = list(map(lambda x: x["i"], identifiers))
-
-                # Update counts by Biolink type.
-                count_by_biolink_type[clique.get("type", "")] += 1
-
-                # Update counts by prefix.
-                for curie in ids:
-                    prefix = curie.split(":")[0]
-                    count_by_prefix[prefix] += 1
-
-                # Update counts by flags.
-                counters["clique_count"] += 1
-                counters["cliques_by_id_count"][len(ids)] += 1
-                labels = list(filter(lambda x: x.strip() != "", map(lambda x: x.get("l", ""), identifiers)))
-                counters["cliques_by_label_count"][len(labels)] += 1
-                unique_labels = set(labels)
-                counters["cliques_by_unique_label_count"][len(unique_labels)] += 1
-
-                # Since descriptions are currently lists, we have to first flatten the list with
-                # itertools.chain.from_iterable() before we can count them.
-                descriptions = list(
-                    filter(
-                        lambda x: x.strip() != "",
-                        itertools.chain.from_iterable(map(lambda x: x.get("d", ""), identifiers)),
-                    )
-                )
-                counters["cliques_by_description_count"][len(descriptions)] += 1
-                unique_descriptions = set(descriptions)
-                counters["cliques_by_unique_description_count"][len(unique_descriptions)] += 1
+    duckdb_config = {"memory_limit": f"{memory_limit_mb}MB"} if memory_limit_mb is not None else {}
+    # The labels and descriptions of every identifier, with the clique leader of the clique it is in. A CURIE only
+    # has one label and one set of descriptions, so Node is reduced to one row per CURIE first: an identifier that is
+    # (wrongly) in two cliques then counts once in each, as it would in the compendium.
+    node_cliques = """SELECT edge.clique_leader, node.label, node.description
+                       FROM edge
+                       JOIN (SELECT curie, any_value(label) AS label, any_value(description) AS description
+                             FROM node GROUP BY curie) AS node
+                         ON edge.curie = node.curie"""
+
+    with setup_duckdb(":memory:", duckdb_config) as db:
+        db.read_parquet(node_parquet_file).create_view("node")
+        db.read_parquet(clique_parquet_file).create_view("clique")
+        db.read_parquet(edge_parquet_file).create_view("edge")
+
+        with log_duckdb_settings_on_error(
+            db, f"generate_content_report_for_compendium: count cliques in {compendium_path}"
+        ):
+            count_lines = db.execute("SELECT COUNT(*) FROM clique").fetchone()[0]
+            count_by_biolink_type = dict(
+                db.execute(
+                    "SELECT COALESCE(biolink_type, '') AS biolink_type, COUNT(*) FROM clique GROUP BY ALL"
+                ).fetchall()
+            )
+            cliques_by_id_count = dict(
+                db.execute("SELECT clique_identifier_count, COUNT(*) FROM clique GROUP BY ALL").fetchall()
+            )
+            count_by_prefix = dict(db.execute("SELECT curie_prefix, COUNT(*) FROM edge GROUP BY ALL").fetchall())
+
+        # Both label and description counts come from a two-level aggregate -- per (clique, text), then per clique --
+        # rather than COUNT(DISTINCT ...), so that each level is an ordinary aggregate DuckDB can spill.
+        with log_duckdb_settings_on_error(
+            db, f"generate_content_report_for_compendium: count labels in {compendium_path}"
+        ):
+            label_counts = db.execute(
+                f"""WITH label_counts AS (
+                       SELECT clique_leader, label, COUNT(*) AS label_count
+                       FROM ({node_cliques})
+                       WHERE regexp_matches(label, $nonblank)
+                       GROUP BY ALL
+                   ), clique_label_counts AS (
+                       SELECT SUM(label_count) AS label_count, COUNT(*) AS unique_label_count
+                       FROM label_counts GROUP BY clique_leader
+                   )
+                   SELECT label_count, unique_label_count, COUNT(*) FROM clique_label_counts GROUP BY ALL""",
+                {"nonblank": NONBLANK_PATTERN},
+            ).fetchall()
+        with log_duckdb_settings_on_error(
+            db, f"generate_content_report_for_compendium: count descriptions in {compendium_path}"
+        ):
+            description_counts = db.execute(
+                f"""WITH descriptions AS (
+                       SELECT clique_leader, UNNEST(description) AS description FROM ({node_cliques})
+                   ), description_counts AS (
+                       SELECT clique_leader, description, COUNT(*) AS description_count
+                       FROM descriptions
+                       WHERE regexp_matches(description, $nonblank)
+                       GROUP BY ALL
+                   ), clique_description_counts AS (
+                       SELECT SUM(description_count) AS description_count, COUNT(*) AS unique_description_count
+                       FROM description_counts GROUP BY clique_leader
+                   )
+                   SELECT description_count, unique_description_count, COUNT(*) FROM clique_description_counts
+                   GROUP BY ALL""",
+                {"nonblank": NONBLANK_PATTERN},
+            ).fetchall()
+
+    counters = {
+        "clique_count": count_lines,
+        "cliques_by_id_count": cliques_by_id_count,
+        "cliques_by_label_count": _histogram(count_lines, ((count, n) for count, _, n in label_counts)),
+        "cliques_by_unique_label_count": _histogram(count_lines, ((count, n) for _, count, n in label_counts)),
+        "cliques_by_description_count": _histogram(count_lines, ((count, n) for count, _, n in description_counts)),
+        "cliques_by_unique_description_count": _histogram(
+            count_lines, ((count, n) for _, count, n in description_counts)
+        ),
+    }
 
+    with open(report_path, "w") as report_file:
         json.dump(
             {
                 "name": os.path.splitext(os.path.basename(compendium_path))[0],
@@ -135,6 +166,19 @@ def generate_content_report_for_compendium(compendium_path, report_path):
         )
 
 
+def _histogram(clique_count, counts):
+    """Add up (count, number of cliques) pairs into a histogram of cliques by count.
+
+    The pairs only cover cliques with at least one label or description; the rest are counted under 0.
+    """
+    histogram = defaultdict(int)
+    for count, cliques in counts:
+        histogram[int(count)] += cliques
+    if clique_count > sum(histogram.values()):
+        histogram[0] = clique_count - sum(histogram.values())
+    return dict(histogram)
+
+
 def summarize_content_report_for_compendia(compendia_report_paths, summary_path):
     """
     Summarize all the content reports generated by generate_content_report_for_compendium().
@@ -1,3 +1,6 @@
+from collections import Counter
+
+
 def normalize_sdf_tag(tag_line):
     """
     Normalize an SDF data-item tag line ('> <ChEBI ID>') to the key used to look it up.
@@ -16,23 +19,53 @@ def normalize_sdf_tag(tag_line):
 
 def read_sdf(infile, interesting_keys):
     """Given an sdf file name and a set of normalized tag keys (see normalize_sdf_tag()) that we'd
-    like to extract, return a dictionary going chebiid -> {properties} where the properties are
-    chosen from the interesting keys"""
+    like to extract, yield a (chebiid, {properties}) tuple for each ChEBI ID, where the properties
+    are chosen from the interesting keys.
+
+    The file is streamed one entry at a time, so memory use stays flat however large the SDF is;
+    only the interesting keys of each entry are kept once it has been parsed. Each ChEBI ID is
+    yielded once, as it was when this returned a dictionary: an ID with several entries is yielded
+    with the properties of its last entry, when that entry is read. Every other ID is yielded in
+    file order."""
+    # Count each ID's entries first (a quick pass that parses nothing but the ID), so that an ID
+    # with several entries can be held back until its last one.
+    remaining = Counter(_read_sdf_chebi_ids(infile))
+    for chebi_id, chebi_dict in _read_sdf_entries(infile, interesting_keys):
+        remaining[chebi_id] -= 1
+        if remaining[chebi_id] == 0:
+            yield chebi_id, chebi_dict
+
+
+def _read_sdf_entries(infile, interesting_keys):
+    """Yield a (chebiid, {properties}) tuple for every entry of an SDF file, in file order."""
+    with open(infile) as inf:
+        chunk = []
+        for line in inf:
+            if "$$$$" in line:
+                yield chebi_sdf_entry_to_dict(chunk, interesting_keys=interesting_keys)
+                chunk = []
+            else:
+                chunk.append(line.rstrip("\n"))
+
+
+def _read_sdf_chebi_ids(infile):
+    """Yield the ChEBI ID of every entry of an SDF file, as chebi_sdf_entry_to_dict() would find it."""
     with open(infile) as inf:
-        chebisdf = inf.read()
-    lines = chebisdf.split("\n")
-    chunk = []
-    chebi_props = {}
-    for line in lines:
-        if "$$$$" in line:
-            chebi_id, chebi_dict = chebi_sdf_entry_to_dict(chunk, interesting_keys=interesting_keys)
-            chebi_props[chebi_id] = chebi_dict
-            chunk = []
-        else:
-            if line != "\n":
-                line = line.strip("\n")
-                chunk += [line]
-    return chebi_props
+        chebi_id = ""
+        current_key = "mol_file"
+        for line in inf:
+            if "$$$$" in line:
+                yield chebi_id
+                chebi_id = ""
+                current_key = "mol_file"
+                continue
+            line = line.rstrip("\n")
+            if not line:
+                continue
+            if line[0] == ">":
+                current_key = normalize_sdf_tag(line)
+            elif current_key == "chebiid":
+                chebi_id = line
 
 
 def chebi_sdf_entry_to_dict(sdf_chunk, interesting_keys=frozenset()):
@@ -1,5 +1,6 @@
 # Shared code used by Snakemake files
 import gzip
+import os
 import shutil
 
 import src.util
@@ -25,6 +26,18 @@ def duckdb_memory_limit_mb(mem_mb, fraction=0.75):
     return int(int(mem_mb) * fraction)
 
 
+def compendium_parquet_file(config, compendium_filename, table):
+    """The Parquet file that export_compendia_to_duckdb (duckdb.snakefile) writes one table of a compendium to.
+
+    :param config: The Babel config to use.
+    :param compendium_filename: The compendium filename, e.g. `Gene.txt`.
+    :param table: The table: `Node`, `Clique` or `Edge`.
+    :return: The path of the Parquet file, e.g. `babel_outputs/duckdb/parquet/filename=Gene/Edge.parquet`.
+    """
+    stem = os.path.splitext(compendium_filename)[0]
+    return f"{config['output_directory']}/duckdb/parquet/filename={stem}/{table}.parquet"
+
+
 def write_done(filename):
     """Write a file to indicate that we are done."""
     with open(filename, "w") as f:
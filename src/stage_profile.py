@@ -0,0 +1,133 @@
+"""Per-stage wall time, call counts and peak RSS growth for a hot loop, such as write_compendium()'s.
+
+A :class:`StageProfile` is cheap enough to leave on: entering and leaving a stage costs two
+``perf_counter()`` calls and one ``getrusage()``, a couple of microseconds, against the hundreds
+a clique takes to write.
+
+Stages nest, and each reports its *exclusive* time: while ``apply_labels`` runs inside
+``create_node``, the time is charged to ``apply_labels`` alone. Time spent outside every stage is
+not charged to any of them.
+
+Memory is reported as the growth of the process's *peak* RSS, since that is what a SLURM ``mem``
+request has to cover: a stage that loads a prefix's labels for the first time grows it, and a
+stage that allocates and frees the same memory on every call does not. To keep it cheap, peak RSS
+is only read when a stage ends, so any growth between two stages is charged to the next one to end.
+"""
+
+import time
+from dataclasses import asdict, dataclass
+
+from src.memory import process_peak_rss_bytes
+
+BYTES_PER_MIB = 1024 * 1024
+
+
+@dataclass
+class StageStats:
+    """The totals for one stage."""
+
+    calls: int = 0
+    seconds: float = 0.0
+    peak_rss_growth_bytes: int = 0
+
+    def add(self, other: "StageStats"):
+        self.calls += other.calls
+        self.seconds += other.seconds
+        self.peak_rss_growth_bytes += other.peak_rss_growth_bytes
+
+
+class _Stage:
+    """The context manager returned by StageProfile.stage(). One is created per stage name and reused."""
+
+    __slots__ = ("profile", "name", "stats")
+
+    def __init__(self, profile, name, stats):
+        self.profile = profile
+        self.name = name
+        self.stats = stats
+
+    def __enter__(self):
+        profile = self.profile
+        now = time.perf_counter()
+        if profile.open_stages:
+            profile.open_stages[-1].stats.seconds += now - profile.last_time
+        profile.open_stages.append(self)
+        profile.last_time = now
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        profile = self.profile
+        now = time.perf_counter()
+        peak_rss = process_peak_rss_bytes()
+        stats = self.stats
+        stats.calls += 1
+        stats.seconds += now - profile.last_time
+        stats.peak_rss_growth_bytes += peak_rss - profile.last_peak_rss
+        profile.last_peak_rss = peak_rss
+        profile.open_stages.pop()
+        profile.last_time = now
+
+
+class StageProfile:
+    """Accumulates StageStats for the stages of a loop.
+
+    Wrap each stage in ``with profile.stage("name"):``. Stages are reported in the order they were
+    first entered, unless they were declared in advance with ``stage_names``.
+    """
+
+    def __init__(self, stage_names=()):
+        self.stats: dict[str, StageStats] = {}
+        self._stages: dict[str, _Stage] = {}
+        self.open_stages: list[_Stage] = []
+        self.last_time = time.perf_counter()
+        self.last_peak_rss = process_peak_rss_bytes()
+        for name in stage_names:
+            self.stage(name)
+
+    def stage(self, name: str) -> _Stage:
+        """Return a context manager that charges the time and peak RSS growth inside it to the named stage."""
+        stage = self._stages.get(name)
+        if stage is None:
+            stats = self.stats[name] = StageStats()
+            stage = self._stages[name] = _Stage(self, name, stats)
+        return stage
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+class NullStageProfile:
+    """A StageProfile that records nothing, for code that is only sometimes profiled."""
+
+    _stage = _NullStage()
+
+    def stage(self, name: str) -> _NullStage:
+        return self._stage
+
+
+NULL_STAGE_PROFILE = NullStageProfile()
+
+
+def add_stage_stats(totals: dict[str, StageStats], stats: dict[str, StageStats]):
+    """Add one profile's stage totals (say, a worker's) into another's, keeping the order of both."""
+    for name, stage_stats in stats.items():
+        totals.setdefault(name, StageStats()).add(stage_stats)
+
+
+def stage_stats_to_dict(stats: dict[str, StageStats]) -> dict:
+    """Convert stage totals into plain types for YAML or JSON: seconds to the millisecond, memory in MiB."""
+    result = {}
+    for name, stage_stats in stats.items():
+        values = asdict(stage_stats)
+        result[name] = {
+            "calls": values["calls"],
+            "seconds": round(values["seconds"], 3),
+            "peak_rss_growth_mib": round(values["peak_rss_growth_bytes"] / BYTES_PER_MIB, 1),
+        }
+    return result
@@ -1,3 +1,4 @@
+import functools
 import logging
 import re
 from dataclasses import dataclass, field
@@ -10,6 +11,10 @@ logger = logging.getLogger(__name__)
 
 _instance: Optional["SynonymFilter"] = None
 
+# How many (label, type scope) -> matching entry results SynonymFilter remembers. The same labels come up over and
+# over (get_synonyms(), apply_labels() and choose_preferred_name() all check them), so this avoids re-matching them.
+MATCH_CACHE_SIZE = 2**18
+
 
 def get_synonym_filter() -> "SynonymFilter":
     global _instance, logger
@@ -59,6 +64,49 @@ class SynonymFilter:
         self.filtered_count: int = 0
         self.filtered_by_source: dict[str, int] = {}
         self._load(filter_file)
+        self._compile()
+
+    def _compile(self) -> None:
+        """Compile the entries into a single matcher, so that most labels are rejected without a per-entry loop.
+
+        - Whole-label entries go into a hash from lowercased label to entry indices.
+        - Partial labels and patterns are folded into one alternation regex. A label that doesn't match it can't
+          match any of them; a label that does is checked against each of them in order, so the first matching
+          entry (and therefore its reason and action) is the same as in a plain loop over the entries. Patterns
+          with capturing groups are left out of the alternation (their backreferences would be renumbered) and
+          are always checked.
+
+        Type scoping is applied afterwards, to whichever entries matched.
+        """
+        self._exact_index: dict[str, list[int]] = {}
+        self._searched: list[int] = []
+        self._always_searched: list[int] = []
+        alternatives = []
+        for i, entry in enumerate(self._entries):
+            if entry._pattern is not None:
+                if entry._pattern.groups:
+                    self._always_searched.append(i)
+                else:
+                    self._searched.append(i)
+                    alternatives.append(f"(?:{entry._pattern.pattern})")
+            elif entry._partial:
+                self._searched.append(i)
+                alternatives.append(re.escape(entry._exact))
+            elif entry._exact is not None:
+                self._exact_index.setdefault(entry._exact, []).append(i)
+
+        self._search_regex: re.Pattern | None = None
+        if alternatives:
+            try:
+                self._search_regex = re.compile("|".join(alternatives), re.IGNORECASE)
+            except re.error as e:
+                # e.g. a pattern with inline global flags, which are only allowed at the start of a whole regex.
+                logger.warning(f"SynonymFilter: could not combine partial labels and patterns ({e}); checking each.")
+                self._always_searched = sorted(self._always_searched + self._searched)
+                self._searched = []
+
+        self._scopes: dict[tuple, frozenset[int]] = {}
+        self._find_match = functools.lru_cache(maxsize=MATCH_CACHE_SIZE)(self._find_match_uncached)
 
     def _load(self, path: Path) -> None:
         if not path.exists():
@@ -123,17 +171,49 @@ class SynonymFilter:
         """
         if not label:
             return False
-        label_lower = label.lower()
-        for entry in self._entries:
+        entry = self._find_match(label, self._scope(node_types))
+        if entry is None:
+            return False
+        # Only the match is cached: the warning and the counts happen on every call, as they always have.
+        logger.warning(f"Obsolete label '{label}' (reason: {entry.reason}) found in {source}; action={entry.action}")
+        self.filtered_count += 1
+        self.filtered_by_source[source] = self.filtered_by_source.get(source, 0) + 1
+        return entry.action == "remove"
+
+    def _scope(self, node_types: list | None) -> frozenset[int] | None:
+        """Return the indices of the type-scoped entries that apply to node_types (None if the types are unknown)."""
+        if node_types is None:
+            return None
+        key = tuple(node_types)
+        scope = self._scopes.get(key)
+        if scope is None:
+            scope = frozenset(
+                i
+                for i, entry in enumerate(self._entries)
+                if entry.only_for_types and any(t in entry.only_for_types for t in node_types)
+            )
+            self._scopes[key] = scope
+        return scope
+
+    def _find_match_uncached(self, label: str, scope: frozenset[int] | None) -> _FilterEntry | None:
+        """Return the first entry (in file order) that applies to this type scope and matches label, if any."""
+
+        def applies(i: int) -> bool:
             # Type-scoped check: skip entries whose only_for_types doesn't overlap this node's types.
             # When node_types=None we don't know the type, so we skip scoped entries to avoid false positives.
-            if entry.only_for_types and (node_types is None or not any(t in entry.only_for_types for t in node_types)):
-                continue
-            if entry.matches(label_lower):
-                logger.warning(
-                    f"Obsolete label '{label}' (reason: {entry.reason}) found in {source}; action={entry.action}"
-                )
-                self.filtered_count += 1
-                self.filtered_by_source[source] = self.filtered_by_source.get(source, 0) + 1
-                return entry.action == "remove"
-        return False
+            return not self._entries[i].only_for_types or (scope is not None and i in scope)
+
+        label_lower = label.lower()
+        best = next((i for i in self._exact_index.get(label_lower, ()) if applies(i)), None)
+
+        candidates = self._always_searched
+        if self._searched and self._search_regex.search(label_lower):
+            candidates = sorted(self._searched + self._always_searched)
+        for i in candidates:
+            if best is not None and i > best:
+                break
+            if applies(i) and self._entries[i].matches(label_lower):
+                best = i
+                break
+
+        return None if best is None else self._entries[best]
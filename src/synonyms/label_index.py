@@ -0,0 +1,290 @@
+"""Sorted, memory-mapped indexes of the per-prefix ``labels`` and ``synonyms`` files.
+
+``SynonymFactory.load_synonyms()`` and ``NodeFactory.load_extra_labels()`` used to read a whole
+``babel_downloads/<PREFIX>/labels`` (and ``synonyms``) file into a Python dict before answering a
+single lookup. For UniProtKB, PUBCHEM.COMPOUND and NCBIGene that costs tens of GB per compendium
+job. This module converts each of those files into a ``.idx`` file next to it, which the
+factories open with :func:`open_fresh_index` and binary-search through an ``mmap``: the process
+only pages in the parts of the file it touches, and several jobs on the same node share the
+page cache.
+
+Index layout (offsets are native-endian unsigned 64-bit integers)::
+
+    MAGIC (8 bytes) | key count N (8 bytes)
+    key offsets   (N + 1 entries, into the key blob)
+    value offsets (N + 1 entries, into the value blob)
+    key blob      (UTF-8 CURIEs, sorted by code point, no separators)
+    value blob    (for each CURIE, its values in input order, joined with "\\n")
+
+Input lines never contain a newline, so "\\n" is a safe value separator. Building the index is an
+external merge sort (:class:`src.external_sort.ExternalSorter`), so the builder's memory is
+bounded by ``chunk_size`` rather than by the size of the input. The sort is stable, so the values
+for one CURIE keep the order they had in the input file; ``load_extra_labels()`` relies on that
+to keep "last label wins".
+"""
+
+import itertools
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+from array import array
+from collections.abc import Iterator, Mapping
+from operator import itemgetter
+
+from src.external_sort import DEFAULT_CHUNK_SIZE, ExternalSorter
+from src.predicates import HAS_EXACT_SYNONYM
+from src.util import get_logger
+
+logger = get_logger(__name__)
+
+MAGIC = b"BABELIX1"
+HEADER = struct.Struct("=8sQ")
+OFFSET_TYPECODE = "Q"
+
+INDEX_SUFFIX = ".idx"
+
+# The two kinds of per-prefix file we know how to index, plus plain "key<TAB>value" records (used by
+# src/incremental.py to index the cliques of a previous build).
+LABELS = "labels"
+SYNONYMS = "synonyms"
+RECORDS = "records"
+
+
+def parse_labels_line(line: str) -> tuple[str, str]:
+    """Parse a line of a ``labels`` file the way the factories do: a CURIE and an optional label."""
+    x = line.strip().split("\t", maxsplit=1)
+    return x[0], (x[1] if len(x) == 2 else "")
+
+
+def parse_synonyms_line(line: str) -> tuple[str, str] | None:
+    """Parse a line of a ``synonyms`` file into a CURIE and a "predicate<TAB>synonym" value.
+
+    Lines with fewer than three columns are skipped (None), as in ``SynonymFactory.load_synonyms()``.
+    """
+    x = line.strip().split("\t")
+    if len(x) < 3:
+        return None
+    return x[0], f"{x[1]}\t{x[2]}"
+
+
+def parse_record_line(line: str) -> tuple[str, str]:
+    """Parse a "key<TAB>value" line, where the value may itself contain tabs."""
+    key, value = line.rstrip("\n").split("\t", maxsplit=1)
+    return key, value
+
+
+PARSERS = {
+    LABELS: parse_labels_line,
+    SYNONYMS: parse_synonyms_line,
+    RECORDS: parse_record_line,
+}
+
+
+def index_filename(tsv_filename: str) -> str:
+    """Return the path of the index built from a labels or synonyms file."""
+    return tsv_filename + INDEX_SUFFIX
+
+
+def _sorted_records(tsv_filename: str, kind: str, chunk_size: int, tmp_dir: str) -> Iterator[tuple[str, str]]:
+    """Yield the (CURIE, value) records of a labels or synonyms file, stably sorted by CURIE."""
+    parse = PARSERS[kind]
+    sorter = ExternalSorter(tmp_dir, chunk_size)
+    with open(tsv_filename) as inf:
+        for line in inf:
+            record = parse(line)
+            if record is not None:
+                sorter.add(*record)
+    yield from sorter.sorted()
+
+
+def build_index(tsv_filename: str, output_filename: str, kind: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Build a sorted index from a per-prefix labels or synonyms file.
+
+    :param tsv_filename: The ``labels`` or ``synonyms`` file to index.
+    :param output_filename: Where to write the index (usually :func:`index_filename` of the input).
+    :param kind: :data:`LABELS`, :data:`SYNONYMS` or :data:`RECORDS`, which determines how lines are parsed.
+    :param chunk_size: The number of records to sort in memory before spilling to disk.
+    :return: The number of distinct CURIEs in the index.
+    """
+    if kind not in PARSERS:
+        raise ValueError(f"Unknown index kind {kind!r}, expected one of {sorted(PARSERS)}")
+
+    output_dir = os.path.dirname(os.path.abspath(output_filename))
+    os.makedirs(output_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=output_dir, prefix=".label_index-") as tmp_dir:
+        parts = {name: os.path.join(tmp_dir, name) for name in ("key_offsets", "value_offsets", "keys", "values")}
+        key_offsets = array(OFFSET_TYPECODE, [0])
+        value_offsets = array(OFFSET_TYPECODE, [0])
+        key_end = value_end = 0
+        count = 0
+        with (
+            open(parts["key_offsets"], "wb") as key_offsets_f,
+            open(parts["value_offsets"], "wb") as value_offsets_f,
+            open(parts["keys"], "wb") as keys_f,
+            open(parts["values"], "wb") as values_f,
+        ):
+            records = _sorted_records(tsv_filename, kind, chunk_size, tmp_dir)
+            for key, group in itertools.groupby(records, key=itemgetter(0)):
+                key_bytes = key.encode("utf-8")
+                value_bytes = "\n".join(value for _, value in group).encode("utf-8")
+                keys_f.write(key_bytes)
+                values_f.write(value_bytes)
+                key_end += len(key_bytes)
+                value_end += len(value_bytes)
+                key_offsets.append(key_end)
+                value_offsets.append(value_end)
+                count += 1
+                if len(key_offsets) >= chunk_size:
+                    key_offsets.tofile(key_offsets_f)
+                    value_offsets.tofile(value_offsets_f)
+                    key_offsets = array(OFFSET_TYPECODE)
+                    value_offsets = array(OFFSET_TYPECODE)
+            key_offsets.tofile(key_offsets_f)
+            value_offsets.tofile(value_offsets_f)
+
+        # Assemble next to the output and rename into place, so a half-written index is never picked up.
+        tmp_output = os.path.join(tmp_dir, "index")
+        with open(tmp_output, "wb") as outf:
+            outf.write(HEADER.pack(MAGIC, count))
+            for name in ("key_offsets", "value_offsets", "keys", "values"):
+                with open(parts[name], "rb") as inf:
+                    shutil.copyfileobj(inf, outf)
+        os.replace(tmp_output, output_filename)
+
+    logger.info(f"Indexed {count:,} CURIEs from {tsv_filename} into {output_filename}")
+    return count
+
+
+class SortedStringIndex:
+    """A read-only, memory-mapped view of an index written by :func:`build_index`.
+
+    Lookups binary-search the sorted key blob, so they cost O(log N) page touches and no
+    per-CURIE Python objects are kept in memory.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{filename} is not a label index (bad magic {magic!r})")
+        self._count = count
+
+        offset_size = array(OFFSET_TYPECODE).itemsize
+        table_size = (count + 1) * offset_size
+        key_offsets_start = HEADER.size
+        value_offsets_start = key_offsets_start + table_size
+        self._view = memoryview(self._mmap)
+        self._key_offsets = self._view[key_offsets_start:value_offsets_start].cast(OFFSET_TYPECODE)
+        self._value_offsets = self._view[value_offsets_start : value_offsets_start + table_size].cast(OFFSET_TYPECODE)
+        self._keys_start = value_offsets_start + table_size
+        self._values_start = self._keys_start + self._key_offsets[count]
+
+    def __len__(self):
+        return self._count
+
+    def _key(self, i: int) -> bytes:
+        return self._mmap[self._keys_start + self._key_offsets[i] : self._keys_start + self._key_offsets[i + 1]]
+
+    def _find(self, key: bytes) -> int | None:
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_key = self._key(mid)
+            if mid_key < key:
+                lo = mid + 1
+            elif mid_key > key:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def get(self, key: str) -> list[str] | None:
+        """Return the values recorded for a CURIE, in input order, or None if it isn't indexed."""
+        i = self._find(key.encode("utf-8"))
+        if i is None:
+            return None
+        start = self._values_start + self._value_offsets[i]
+        end = self._values_start + self._value_offsets[i + 1]
+        return self._mmap[start:end].decode("utf-8").split("\n")
+
+    def __contains__(self, key) -> bool:
+        return isinstance(key, str) and self._find(key.encode("utf-8")) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(self._count):
+            yield self._key(i).decode("utf-8")
+
+    def close(self):
+        """Release the memory map. Further lookups will fail."""
+        self._key_offsets.release()
+        self._value_offsets.release()
+        self._view.release()
+        self._mmap.close()
+
+
+def open_fresh_index(tsv_filename: str) -> SortedStringIndex | None:
+    """Open the index for a labels or synonyms file if there is one and it is up to date.
+
+    An index older than the file it was built from is ignored (with a warning), so a re-downloaded
+    prefix falls back to reading the file directly rather than returning stale labels.
+    """
+    idx_filename = index_filename(tsv_filename)
+    if not os.path.exists(idx_filename) or not os.path.exists(tsv_filename):
+        return None
+    if os.path.getmtime(idx_filename) < os.path.getmtime(tsv_filename):
+        logger.warning(f"Ignoring {idx_filename}: it is older than {tsv_filename}")
+        return None
+    return SortedStringIndex(idx_filename)
+
+
+class IndexedLabels(Mapping):
+    """The ``{curie: label}`` dict of ``NodeFactory.load_extra_labels()``, backed by a labels index.
+
+    As with the dict, a CURIE listed more than once gets the last label in the file.
+    """
+
+    def __init__(self, index: SortedStringIndex):
+        self.index = index
+
+    def __getitem__(self, curie: str) -> str:
+        values = self.index.get(curie)
+        if values is None:
+            raise KeyError(curie)
+        return values[-1]
+
+    def __contains__(self, curie) -> bool:
+        return curie in self.index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+
+class IndexedSynonyms:
+    """The ``defaultdict(set)`` of ``SynonymFactory.load_synonyms()``, backed by label and synonym indexes.
+
+    Looking up a CURIE returns the set of (predicate, synonym) tuples the dict would have held --
+    its labels as ``HAS_EXACT_SYNONYM`` plus its synonyms -- or an empty set.
+    """
+
+    def __init__(self, labels: SortedStringIndex | None, synonyms: SortedStringIndex | None):
+        self.labels = labels
+        self.synonyms = synonyms
+
+    def __getitem__(self, curie: str) -> set[tuple[str, str]]:
+        result = set()
+        if self.labels is not None:
+            for label in self.labels.get(curie) or ():
+                result.add((HAS_EXACT_SYNONYM, label))
+        if self.synonyms is not None:
+            for value in self.synonyms.get(curie) or ():
+                predicate, synonym = value.split("\t", maxsplit=1)
+                result.add((predicate, synonym))
+        return result
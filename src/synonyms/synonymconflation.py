@@ -6,27 +6,43 @@ conflation files.
 """
 
 import gzip
+import itertools
 import json
+import os
+import tempfile
 from collections import defaultdict
+from operator import itemgetter
 
 from src import util
 from src.babel_utils import get_numerical_curie_suffix
+from src.external_sort import ExternalSorter
 
 logger = util.get_logger(__name__)
 
+# The number of to-be-conflated synonym records conflate_synonyms() holds in memory before spilling a sorted chunk
+# to disk.
+CONFLATION_SORT_CHUNK_SIZE = 1_000_000
+
 
 # click.command()
 # click.option('--conflation-file', multiple=True, type=click.Path(exists=True))
 # click.option('--output', type=click.Path(exists=False), default='-')
 # click.argument("synonym_files", nargs=-1, type=click.Path(exists=True))
-def conflate_synonyms(synonym_files_gz, compendia_files, conflation_file, output_gz):
+def conflate_synonyms(
+    synonym_files_gz, compendia_files, conflation_file, output_gz, chunk_size=CONFLATION_SORT_CHUNK_SIZE
+):
     """
     Generate a synonym file based on a single input synonym, the conflation described in the input conflation files,
     and any cross-references present in the input compendia files.
 
+    Only the conflation index is kept in memory. Synonyms that aren't conflated are written out as they are read;
+    the rest are tagged with the conflated clique they belong to, external-sorted by that tag on disk (next to
+    output_gz), and then merged one conflated clique at a time.
+
     :param synonym_files_gz: The input synonym files (gzipped).
     :param conflation_file: Any conflation files to apply.
     :param output_gz: The file to write the synonyms to.
+    :param chunk_size: The number of to-be-conflated synonyms to sort in memory before spilling them to disk.
     :return:
     """
 
@@ -74,7 +90,8 @@ def conflate_synonyms(synonym_files_gz, compendia_files, conflation_file, output
     logger.info(f"Loaded all conflation files, found {len(conflation_index):,} identifiers in total.")
 
     # Step 1.1. What if we have synonyms connected with identifiers that are not primary identifiers? To solve that
-    # problem, we further enrich these identifiers with information from the compendia files.
+    # problem, we further enrich these identifiers with information from the compendia files. We only need the
+    # identifiers of each of these cliques, so that's all we keep (as one tuple shared by all its identifiers).
     cliques_with_conflations = defaultdict(list)
     count_clique_ids_added = 0
 
@@ -83,19 +100,18 @@ def conflate_synonyms(synonym_files_gz, compendia_files, conflation_file, output
         with open(compendium_filename) as compendiumf:
             for line in compendiumf:
                 clique = json.loads(line)
-                identifiers = clique.get("identifiers", [])
-                ids = map(lambda i: i["i"], identifiers)
+                clique_ids = tuple(i["i"] for i in clique.get("identifiers", []))
 
                 # Is this clique being conflated? If not, we can just ignore it.
-                for id in ids:
+                for index, id in enumerate(clique_ids):
                     if id in conflation_index:
-                        # Yes, this clique is mentioned in the conflation index! Associate all of its
-                        # IDs with this clique so that we can load it later.
-                        for id_inner in ids:
+                        # Yes, this clique is mentioned in the conflation index! Associate the identifiers after
+                        # this one with this clique so that we can load it later.
+                        for id_inner in clique_ids[index + 1 :]:
                             # We add all the other identifiers in this clique to the conflation index. That way,
                             # if someone refers to PUBCHEM.COMPOUND:962 when the preferred ID is CHEBI:15377, we will
                             # pull in synonyms from CHEBI:15377 as well.
-                            cliques_with_conflations[id_inner].append(clique)
+                            cliques_with_conflations[id_inner].append(clique_ids)
                             if id_inner not in conflation_index:
                                 conflation_index[id_inner] = conflation_index[id]
                                 count_clique_ids_added += 1
@@ -108,9 +124,16 @@ def conflate_synonyms(synonym_files_gz, compendia_files, conflation_file, output
     )
 
     logger.info(f"Writing output to {output_gz}.")
-    with gzip.open(output_gz, "wt", encoding="utf8") as outputf:
-        # Step 2. Conflate the synonyms.
-        synonyms_to_conflate = defaultdict(lambda: defaultdict(list))
+    with (
+        gzip.open(output_gz, "wt", encoding="utf8") as outputf,
+        tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_gz))) as tmp_dir,
+    ):
+        # Step 2. Write out the synonyms that don't need conflating, and tag the rest with the conflated clique they
+        # belong to. Cliques are numbered in the order we first see them, so sorting by that number groups each
+        # clique's synonyms together (in input order, since the sort is stable) and keeps the cliques in that order.
+        conflated_clique_numbers = dict()
+        conflated_clique_ids = list()
+        synonyms_to_conflate = ExternalSorter(tmp_dir, chunk_size=chunk_size, key_type=int)
         for synonym_filename_gz in synonym_files_gz:
             logger.info(f"Reading synonym file {synonym_filename_gz}")
             with gzip.open(synonym_filename_gz, "rt", encoding="utf-8") as synonymsf:
@@ -119,32 +142,36 @@ def conflate_synonyms(synonym_files_gz, compendia_files, conflation_file, output
 
                     # Do we need to conflate this synonym at all?
                     curie = synonym["curie"]
-                    bl_type = "biolink:" + synonym.get("types", ["Entity"])[0]
                     if curie not in conflation_index:
                         # No known conflation. We can just write it out.
                         print(json.dumps(synonym), file=outputf)
-                        logger.debug(f"Ignoring synonym {curie}, no known conflation.")
                     else:
-                        # We need to conflate this. Add this to the synonyms_to_conflate list.
+                        # We need to conflate this. Tag it with its conflated clique and set it aside.
                         preferred_id = conflation_index[curie]
-                        if curie in synonyms_to_conflate[preferred_id]:
-                            logger.warning(
-                                f"Duplicate CURIE in conflation: {preferred_id} appears multiple times in {curie}"
-                            )
-                        synonyms_to_conflate[preferred_id][curie].append(synonym)
-                        synonyms = synonyms_to_conflate[preferred_id].values()
-                        bl_types = set()
-                        for synonym_list in synonyms:
-                            for synonym in synonym_list:
-                                bl_types.add("biolink:" + synonym.get("types", ["Entity"])[0])
-                        logger.debug(f"Conflating synonym {curie} ({bl_type}) to {preferred_id} ({bl_types}).")
-
-        logger.info(f"Identified {len(synonyms_to_conflate)} conflated cliques that need to be synonymized.")
-        logger.debug(f"Conflated cliques: {json.dumps(synonyms_to_conflate, sort_keys=True)}")
-
-        # Step 3. Conflate any synonyms that need conflating.
-        for curie in synonyms_to_conflate:
-            synonyms_by_curie = synonyms_to_conflate[curie]
+                        clique_number = conflated_clique_numbers.get(preferred_id)
+                        if clique_number is None:
+                            clique_number = len(conflated_clique_ids)
+                            conflated_clique_numbers[preferred_id] = clique_number
+                            conflated_clique_ids.append(preferred_id)
+                        synonyms_to_conflate.add(clique_number, synonym_text.rstrip("\n"))
+
+        logger.info(
+            f"Identified {len(conflated_clique_ids)} conflated cliques that need to be synonymized from "
+            f"{len(synonyms_to_conflate):,} synonyms."
+        )
+        del conflated_clique_numbers
+
+        # Step 3. Conflate any synonyms that need conflating, one conflated clique at a time.
+        for clique_number, records in itertools.groupby(synonyms_to_conflate.sorted(), key=itemgetter(0)):
+            curie = conflated_clique_ids[clique_number]
+            synonyms_by_curie = defaultdict(list)
+            for _, synonym_text in records:
+                synonym = json.loads(synonym_text)
+                if synonym["curie"] in synonyms_by_curie:
+                    logger.warning(
+                        f"Duplicate CURIE in conflation: {curie} appears multiple times in {synonym['curie']}"
+                    )
+                synonyms_by_curie[synonym["curie"]].append(synonym)
 
             # We conflate synonyms in this way:
             # 1. We traverse the list in the order of identifiers in the original conflation.
@@ -160,18 +187,13 @@ def conflate_synonyms(synonym_files_gz, compendia_files, conflation_file, output
             for conflation_id_not_normalized in conflation_order:
                 if conflation_id_not_normalized in cliques_with_conflations:
                     conflation_ids = []
-                    for clique in cliques_with_conflations[conflation_id_not_normalized]:
-                        for ident in clique.get("identifiers", []):
-                            conflation_ids.append(ident["i"])
+                    for clique_ids in cliques_with_conflations[conflation_id_not_normalized]:
+                        conflation_ids.extend(clique_ids)
                 else:
                     conflation_ids = [conflation_id_not_normalized]
-                logger.info(f"Expanded {conflation_id_not_normalized} into {conflation_ids}.")
+                logger.debug(f"Expanded {conflation_id_not_normalized} into {conflation_ids}.")
                 for conflation_id in conflation_ids:
-                    logger.info(f"Looking into conflation ID {conflation_id} for {conflation_id_not_normalized}.")
                     for synonym in synonyms_by_curie[conflation_id]:
-                        logger.info(
-                            f"conflation_order = {conflation_order}, synonyms_by_curie[{conflation_id}] = {synonyms_by_curie[conflation_id]}"
-                        )
                         if "curie" not in final_conflation:
                             final_conflation["curie"] = synonym["curie"]
 
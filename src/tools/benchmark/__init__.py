@@ -0,0 +1,6 @@
+"""Offline benchmarks of the clique-building hot paths.
+
+A thin CLI (:mod:`src.tools.benchmark.cli`, installed as ``babel-benchmark``) over
+:mod:`src.benchmarks`, which generates the synthetic inputs and holds the cases. See
+``docs/tools/Benchmarks.md``.
+"""
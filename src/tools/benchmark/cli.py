@@ -0,0 +1,102 @@
+"""``babel-benchmark`` — time the clique-building hot paths over synthetic inputs, and compare with a baseline.
+
+Argument parsing and output formatting only; the inputs are generated by
+:mod:`src.benchmarks.synthetic` and the cases live in :mod:`src.benchmarks.cases`.
+
+Invocation::
+
+    uv run babel-benchmark --scales small medium --output results.json
+    uv run babel-benchmark --scales small --compare baseline.json
+
+Every case runs in a fresh process, so its peak RSS is its own. ``--compare`` prints how much
+slower and bigger each case is than its baseline, and exits with status 1 if any of them is more
+than ``--tolerance`` worse. ``--results`` compares a stored results file instead of running the
+cases again.
+
+See ``docs/tools/Benchmarks.md``.
+"""
+
+import argparse
+import sys
+import tempfile
+
+from src.benchmarks.cases import (
+    CASES,
+    DEFAULT_TOLERANCE,
+    compare_results,
+    read_results,
+    run_benchmarks,
+    write_results,
+)
+from src.benchmarks.synthetic import SCALES
+
+
+def format_results(results):
+    """Format benchmark results as a plain-text table."""
+    lines = [f"{'case':<24}{'scale':<8}{'items':>10}{'seconds':>10}{'items/s':>12}{'peak RSS MiB':>14}"]
+    for r in results:
+        lines.append(
+            f"{r.case:<24}{r.scale:<8}{r.items:>10,}{r.seconds:>10.3f}{r.items_per_second:>12,.0f}{r.peak_rss_mib:>14,.0f}"
+        )
+    return "\n".join(lines)
+
+
+def format_comparisons(comparisons):
+    """Format comparisons with a baseline as a plain-text table, flagging regressions."""
+    lines = [f"{'case':<24}{'scale':<8}{'time':>8}{'RSS':>8}"]
+    for c in comparisons:
+        flag = "  REGRESSED" if c.regressed else ""
+        lines.append(f"{c.result.case:<24}{c.result.scale:<8}{c.time_ratio:>7.2f}x{c.rss_ratio:>7.2f}x{flag}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the clique-building hot paths over synthetic inputs.")
+    parser.add_argument(
+        "--cases", nargs="+", choices=sorted(CASES), default=list(CASES), help="Cases to run (default: all)."
+    )
+    parser.add_argument(
+        "--scales", nargs="+", choices=list(SCALES), default=["small"], help="Scales to run them at (default: small)."
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic inputs (default: 0).")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per case; the fastest is reported (default: 1).")
+    parser.add_argument(
+        "--workdir",
+        help="Directory to keep the synthetic inputs in, so later runs can reuse them (default: a temporary directory).",
+    )
+    parser.add_argument("--output", help="Path to write the results JSON to.")
+    parser.add_argument("--results", help="Compare this stored results JSON instead of running the cases.")
+    parser.add_argument("--compare", help="Baseline results JSON to compare with; exits 1 on a regression.")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help=f"How much slower or bigger than the baseline counts as a regression (default: {DEFAULT_TOLERANCE}).",
+    )
+    args = parser.parse_args(argv)
+
+    if args.results:
+        results = read_results(args.results)
+    elif args.workdir:
+        results = run_benchmarks(args.cases, args.scales, args.workdir, seed=args.seed, repeat=args.repeat)
+    else:
+        with tempfile.TemporaryDirectory(prefix="babel-benchmark-") as workdir:
+            results = run_benchmarks(args.cases, args.scales, workdir, seed=args.seed, repeat=args.repeat)
+
+    print(format_results(results))
+    if args.output:
+        write_results(results, args.output, seed=args.seed)
+
+    if args.compare:
+        comparisons = compare_results(results, read_results(args.compare), args.tolerance)
+        print()
+        print(format_comparisons(comparisons))
+        regressions = [c for c in comparisons if c.regressed]
+        if regressions:
+            print(f"{len(regressions)} of {len(comparisons)} cases regressed by more than {args.tolerance:.0%}.")
+            sys.exit(1)
+        print(f"No regressions in {len(comparisons)} cases.")
+
+
+if __name__ == "__main__":
+    main()
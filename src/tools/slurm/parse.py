@@ -13,12 +13,16 @@ run-analysis directory such as ``data/babel-1.17/``:
   :func:`extract_error_content` quotes the whole log, so an archived run needs these files
   intact for the failure report, not just for the requested side.
 
+``babel-slurm-resources`` also reads the per-stage profiles write_compendium() leaves in
+``reports/write_compendium/<compendium>.json``, if the run has them.
+
 Every reader tolerates partial runs and missing/``NA``/``-`` cells.
 """
 
 from __future__ import annotations
 
 import csv
+import json
 import re
 from dataclasses import dataclass
 from datetime import datetime
@@ -107,6 +111,63 @@ def read_benchmarks(benchmarks_dir: str | Path) -> dict[str, Benchmark]:
     return result
 
 
+# --- write_compendium() stage profiles ---------------------------------------
+
+
+@dataclass
+class ProfiledStage:
+    """One stage of writing a compendium, from ``reports/write_compendium/<compendium>.json``.
+
+    ``seconds`` is summed across write_compendium()'s worker processes, and ``peak_rss_growth_mib``
+    is how much the stage grew each worker's peak RSS, summed likewise (see src/stage_profile.py).
+    """
+
+    name: str
+    calls: int
+    seconds: float
+    peak_rss_growth_mib: float
+
+
+@dataclass
+class CompendiumProfile:
+    """Where write_compendium() spent its time and memory on one compendium."""
+
+    compendium: str
+    cliques: int
+    workers: int
+    seconds: float
+    stages: list[ProfiledStage]
+
+    @property
+    def slowest_stage(self) -> ProfiledStage | None:
+        return max(self.stages, key=lambda s: s.seconds, default=None)
+
+    @property
+    def largest_stage(self) -> ProfiledStage | None:
+        """The stage that grew peak RSS the most."""
+        return max(self.stages, key=lambda s: s.peak_rss_growth_mib, default=None)
+
+
+def read_compendium_profiles(profiles_dir: str | Path) -> dict[str, CompendiumProfile]:
+    """Read every ``*.json`` profile write_compendium() left in ``profiles_dir``, keyed by compendium.
+
+    Profiles are keyed by compendium, not by rule: one rule writes several compendia, and
+    write_compendium() has no way to know which rule called it. A missing directory (a run from
+    before profiles were written, or with ``write_compendium_profile_json`` off) reads as none.
+    """
+    result: dict[str, CompendiumProfile] = {}
+    for path in sorted(Path(profiles_dir).glob("*.json")):
+        document = json.loads(path.read_text())
+        result[document["compendium"]] = CompendiumProfile(
+            compendium=document["compendium"],
+            cliques=document["cliques"],
+            workers=document["workers"],
+            seconds=document["seconds"],
+            stages=[ProfiledStage(name, **values) for name, values in document["stages"].items()],
+        )
+    return result
+
+
 # --- SLURM efficiency report -------------------------------------------------
 
 
@@ -27,7 +27,15 @@ from typing import TypeVar
 
 from src.util import get_repo_root
 
-from .parse import Benchmark, read_benchmarks, read_efficiency_report, read_rule_logs, read_snakefile_resources
+from .parse import (
+    Benchmark,
+    CompendiumProfile,
+    read_benchmarks,
+    read_compendium_profiles,
+    read_efficiency_report,
+    read_rule_logs,
+    read_snakefile_resources,
+)
 
 # Every memory figure in this module is **decimal MB**, the unit SLURM and Snakemake use: `mem="8G"`
 # reaches the scheduler as 8000 MB, and the efficiency report's RequestedMem_MB is decimal too. That
@@ -366,6 +374,7 @@ def build_markdown(
     new_default_mem_mb: int,
     new_default_cpus: int,
     default_runtime_min: int = DEFAULT_RUNTIME_MIN,
+    profiles: dict[str, CompendiumProfile] | None = None,
 ) -> str:
     if not recs:
         return "No benchmark data found."
@@ -485,9 +494,38 @@ def build_markdown(
             f"{r.cores_used:.1f} | {r.requested_cpus or '-'} | {r.wall_sec:.0f}s | "
             f"{_fmt_gb(r.rec_mem_mb)} | {r.rec_cpus} | {r.classification}"
         )
+    if profiles:
+        lines.append("")
+        lines.extend(build_profile_section(profiles))
     return "\n".join(lines)
 
 
+def build_profile_section(profiles: dict[str, CompendiumProfile]) -> list[str]:
+    """Which stage of write_compendium() each compendium spent its time and memory in, slowest compendium first.
+
+    This is what to optimise once a compendia rule's row above says it is too slow or too big. Profiles
+    are per compendium, so read one alongside the row of the rule that writes it.
+    """
+    # Profiles are in mebibytes, like the benchmark TSVs, and converted the same way (see MIB_TO_MB).
+    lines = ["## write_compendium() stages", ""]
+    lines.append(
+        "Stage times are summed across worker processes; memory is how much a stage grew the peak RSS. "
+        "See `write_compendium_profile_json` in config.yaml."
+    )
+    lines.append("")
+    lines.append("compendium | cliques | workers | write time | slowest stage | largest stage")
+    lines.append("---------- | ------- | ------- | ---------- | ------------- | -------------")
+    for p in sorted(profiles.values(), key=lambda p: p.seconds, reverse=True):
+        total = sum(s.seconds for s in p.stages) or 1
+        slowest, largest = p.slowest_stage, p.largest_stage
+        slowest_str = f"{slowest.name} ({slowest.seconds / total:.0%})" if slowest else "-"
+        largest_str = f"{largest.name} (+{_fmt_gb(largest.peak_rss_growth_mib * MIB_TO_MB)})" if largest else "-"
+        lines.append(
+            f"{p.compendium} | {p.cliques:,} | {p.workers} | {_fmt_min(p.seconds / 60)} | {slowest_str} | {largest_str}"
+        )
+    return lines
+
+
 def write_csv(recs: list[Recommendation], path: str | Path) -> None:
     with open(path, "w", newline="") as handle:
         writer = csv.writer(handle)
@@ -632,4 +670,5 @@ def run(args: argparse.Namespace) -> None:
     if args.csv:
         write_csv(recs, args.csv)
         print(f"Wrote {len(recs)} rows to {args.csv}", file=sys.stderr)
-    print(build_markdown(recs, new_default_mem_mb, args.new_default_cpus, args.default_runtime_min))
+    profiles = read_compendium_profiles(run_dir / "reports" / "write_compendium")
+    print(build_markdown(recs, new_default_mem_mb, args.new_default_cpus, args.default_runtime_min, profiles))
@@ -436,9 +436,17 @@ def get_biolink_model_toolkit(biolink_version):
     (e.g. ``get_element(x)["class_uri"]`` → ``"biolink:ChemicalEntity"``), not raw
     element names.
 
+    If ``biolink_model_yaml`` is set in config.yaml, the model is read from that local file instead (and
+    biolink_version is ignored), so that runs without network access -- benchmarks, tests, and the worker
+    processes they start -- can still create a NodeFactory. Babel never asks the toolkit about predicate
+    mappings, so those aren't loaded for a local model.
+
     :param biolink_version: The Biolink Model version to use (e.g. ``"4.3.6"`` or a commit SHA).
     :return: A Toolkit instance from the bmt library using the specified Biolink version.
     """
+    biolink_model_yaml = get_config().get("biolink_model_yaml")
+    if biolink_model_yaml:
+        return Toolkit(biolink_model_yaml, predicate_map={"predicate mappings": []})
     ref = _biolink_ref(biolink_version)
     return Toolkit(f"https://raw.githubusercontent.com/biolink/biolink-model/{ref}/biolink-model.yaml")
 
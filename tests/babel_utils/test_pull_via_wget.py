@@ -1,11 +1,11 @@
-"""Unit tests for pull_via_wget()'s recursive, timestamping download.
+"""Unit tests for pull_via_wget()'s recursive, timestamping download, and its single-file downloads.
 
-This is the mechanism that makes preloading PubMed downloads from a previous run work (see
-docs/RunningBabel.md, "Preloading PubMed downloads"): a recursive `wget --timestamping` fetch
-must leave already-present files alone and download only the ones we don't have yet.
+A recursive `wget --timestamping` fetch must leave already-present files alone and download only
+the ones we don't have yet, so a directory carried over from a previous run can be reused. A single
+file is downloaded by src.downloads.download_file() rather than wget (see tests/test_downloads.py).
 
 The tests run against a throwaway HTTP server on localhost, so they need no external network —
-but they do need the `wget` binary, and are skipped if it isn't installed.
+but the recursive ones do need the `wget` binary, and are skipped if it isn't installed.
 """
 
 import functools
@@ -71,7 +71,7 @@ def test_recursive_wget_downloads_every_file_into_an_empty_directory(http_server
 def test_recursive_wget_keeps_preloaded_files_and_downloads_only_the_new_ones(http_server, tmp_path):
     """A file we already have (same size, not older than the server's copy) should be left
     untouched, while a file we don't have yet should be downloaded. This is what lets a new
-    Babel run reuse the PubMed files carried over from a previous run."""
+    Babel run reuse the files carried over from a previous run."""
     base_url, remote_dir = http_server
     (remote_dir / "files" / "preloaded.txt").write_text("REMOTE content")
     (remote_dir / "files" / "new.txt").write_text("brand new")
@@ -136,34 +136,31 @@ def test_recursive_wget_redownloads_a_stale_preloaded_file_rather_than_resuming_
     assert revised.read_text() == "new remote content"
 
 
-# UNSAFE OPTION COMBINATIONS
-#
-# These guards fire before wget is invoked, so these tests need neither the server nor the binary.
+# SINGLE FILES
 
 
 @pytest.mark.unit
-def test_non_recursive_download_omits_timestamping(tmp_path):
-    """wget disables -N (and warns) whenever -O is also passed, so passing --timestamping alongside
-    -O is a pure no-op that just prints a warning. A non-recursive pull_via_wget() call (which
-    always uses -O) should not pass --timestamping even though it defaults to True."""
-
-    def fake_wget(command_line, **kwargs):
-        # -O's argument is the output file; touch it so the post-download file-type check passes.
-        out_file = command_line[command_line.index("-O") + 1]
-        open(out_file, "w").close()
-        return type("Result", (), {"returncode": 0, "stderr": ""})()
-
-    with patch("subprocess.run", side_effect=fake_wget) as mock_run:
-        pull_via_wget(
-            "http://127.0.0.1:1/",
-            "file.txt",
-            decompress=False,
-            outpath=str(tmp_path / "local" / "file.txt"),
-        )
+def test_non_recursive_download_uses_download_file_rather_than_wget(http_server, tmp_path):
+    """A single file is downloaded by src.downloads.download_file(), not wget, and (like wget
+    --continue) a file we already have that is the same size as the server's copy is kept."""
+    base_url, remote_dir = http_server
+    (remote_dir / "file.txt").write_text("remote content")
+    outpath = tmp_path / "local" / "file.txt"
 
-    wget_call = mock_run.call_args_list[0].args[0]
-    assert "--timestamping" not in wget_call
-    assert "-O" in wget_call
+    with patch("subprocess.run") as mock_run:
+        pull_via_wget(base_url, "file.txt", decompress=False, outpath=str(outpath))
+        assert outpath.read_text() == "remote content"
+
+        outpath.write_text("LOCAL content!")
+        pull_via_wget(base_url, "file.txt", decompress=False, outpath=str(outpath))
+        assert outpath.read_text() == "LOCAL content!"
+
+    mock_run.assert_not_called()
+
+
+# UNSAFE OPTION COMBINATIONS
+#
+# These guards fire before wget is invoked, so these tests need neither the server nor the binary.
 
 
 @pytest.mark.unit
@@ -0,0 +1,103 @@
+"""Unit tests for the helpers behind write_compendium()'s sharded, multi-process mode.
+
+write_compendium() splits synonym_list into contiguous shards, writes each shard in a worker
+process and concatenates the shard outputs in order. The output is only identical to a
+single-process run if the shards cover every clique exactly once, in order, and the per-shard
+counts add up to what one pass would have counted. The last test checks exactly that, by writing
+the same small compendium with one worker and with three.
+"""
+
+import filecmp
+import os
+
+import pytest
+import yaml
+
+from src.babel_utils import CompendiumCounts, concatenate_files, split_into_shards, write_compendium
+from src.benchmarks.cases import benchmark_environment
+from src.benchmarks.synthetic import SCALES, generate
+from src.stage_profile import StageStats
+
+pytestmark = pytest.mark.unit
+
+
+@pytest.mark.parametrize("count,shard_count", [(10, 3), (10, 10), (3, 8), (1, 4), (100, 7)])
+def test_shards_preserve_order_and_cover_everything(count, shard_count):
+    """Concatenating the shards gives back the input in order, with no empty shards."""
+    items = [frozenset({f"A:{i}"}) for i in range(count)]
+    shards = split_into_shards(items, shard_count)
+
+    assert [item for shard in shards for item in shard] == items
+    assert all(shards)
+    assert len(shards) == min(count, shard_count)
+    # Near-equal: no shard is more than one item larger than another.
+    assert max(map(len, shards)) - min(map(len, shards)) <= 1
+
+
+def test_shards_of_a_set_follow_its_iteration_order():
+    """Compendium builders pass sets of frozensets; shards follow the set's own iteration order."""
+    items = {frozenset({f"A:{i}", f"B:{i}"}) for i in range(50)}
+    shards = split_into_shards(items, 4)
+    assert [item for shard in shards for item in shard] == list(items)
+
+
+def test_split_into_shards_of_nothing():
+    assert split_into_shards([], 4) == []
+
+
+def test_concatenate_files_in_order(tmp_path):
+    inputs = []
+    for i in range(3):
+        path = tmp_path / f"shard-{i}.jsonl"
+        path.write_text(f'{{"shard": {i}}}\n')
+        inputs.append(str(path))
+    output = tmp_path / "merged.jsonl"
+
+    concatenate_files(inputs, str(output))
+
+    assert output.read_text() == '{"shard": 0}\n{"shard": 1}\n{"shard": 2}\n'
+
+
+def test_compendium_counts_add():
+    """Shard counts add up field by field, including the per-source property counts and stage profiles."""
+    total = CompendiumCounts()
+    first = CompendiumCounts(cliques=2, eq_ids=5, synonyms=7, filtered=1, stages={"create_node": StageStats(2, 1.0, 0)})
+    first.property_sources["CHEBI"] += 3
+    second = CompendiumCounts(
+        cliques=1, eq_ids=2, synonyms=0, filtered=0, stages={"create_node": StageStats(1, 0.5, 8)}
+    )
+    second.property_sources["CHEBI"] += 1
+    second.property_sources["UNII"] += 2
+
+    total.add(first)
+    total.add(second)
+
+    assert (total.cliques, total.eq_ids, total.synonyms, total.filtered) == (3, 7, 7, 1)
+    assert dict(total.property_sources) == {"CHEBI": 4, "UNII": 2}
+    assert total.stages == {"create_node": StageStats(3, 1.5, 8)}
+
+
+# Starting three spawned workers, each importing Babel and loading its factories, can take a while on a busy machine.
+@pytest.mark.timeout(120)
+def test_sharded_write_matches_single_process_write(tmp_path):
+    """Writing a compendium over a (spawned) process pool gives byte-identical files and the same counts."""
+    dataset = generate(str(tmp_path / "dataset"), SCALES["tiny"], seed=7)
+    with benchmark_environment(dataset) as config:
+        cliques = dataset.read_cliques()
+        for ofname, workers in (("Serial.txt", 1), ("Sharded.txt", 3)):
+            write_compendium([], cliques, ofname, None, icrdf_filename=dataset.icrdf_filename, workers=workers)
+        output_directory = config["output_directory"]
+
+    for subdir in ("compendia", "synonyms"):
+        serial = os.path.join(output_directory, subdir, "Serial.txt")
+        sharded = os.path.join(output_directory, subdir, "Sharded.txt")
+        assert os.path.getsize(serial) > 0
+        assert filecmp.cmp(serial, sharded, shallow=False), f"{subdir} differ"
+
+    metadata = {}
+    for ofname in ("Serial.txt", "Sharded.txt"):
+        with open(os.path.join(output_directory, "metadata", ofname + ".yaml")) as inf:
+            metadata[ofname] = yaml.safe_load(inf)
+    assert metadata["Serial.txt"]["counts"] == metadata["Sharded.txt"]["counts"]
+    assert metadata["Serial.txt"]["counts"]["cliques"] == SCALES["tiny"]
+    assert metadata["Sharded.txt"]["profile"]["workers"] == 3
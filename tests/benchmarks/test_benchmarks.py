@@ -0,0 +1,83 @@
+"""Unit tests for src/benchmarks: the synthetic inputs, and running and comparing benchmark cases."""
+
+import filecmp
+import os
+
+import pytest
+
+from src.babel_utils import glom
+from src.benchmarks.cases import (
+    BenchmarkResult,
+    compare_results,
+    read_results,
+    run_benchmarks,
+    write_results,
+)
+from src.benchmarks.synthetic import (
+    CLIQUES_FILENAME,
+    CONCORDS_FILENAME,
+    SCALES,
+    generate,
+    load_or_generate,
+)
+
+pytestmark = pytest.mark.unit
+
+
+@pytest.fixture(scope="module")
+def tiny(tmp_path_factory):
+    return generate(str(tmp_path_factory.mktemp("tiny")), SCALES["tiny"], seed=7)
+
+
+def test_generation_is_deterministic(tiny, tmp_path):
+    again = generate(str(tmp_path), SCALES["tiny"], seed=7)
+    for filename in (CLIQUES_FILENAME, CONCORDS_FILENAME):
+        assert filecmp.cmp(os.path.join(tiny.root, filename), os.path.join(again.root, filename), shallow=False)
+
+
+def test_glomming_the_concords_rebuilds_the_cliques(tiny):
+    cliques = tiny.read_cliques()
+    assert len(cliques) == SCALES["tiny"]
+
+    dicts = {}
+    glom(dicts, tiny.read_concords())
+    glommed = {frozenset(clique) for clique in dicts.values()}
+    # Singleton cliques have no concords, so only the others can be rebuilt from them.
+    assert glommed == {frozenset(c.identifiers) for c in cliques if len(c.identifiers) > 1}
+
+
+def test_a_matching_dataset_is_reused(tiny):
+    manifest_mtime = os.path.getmtime(os.path.join(tiny.root, "manifest.json"))
+    assert load_or_generate(tiny.root, SCALES["tiny"], seed=7) == tiny
+    assert os.path.getmtime(os.path.join(tiny.root, "manifest.json")) == manifest_mtime
+
+
+def test_cases_run_in_process(tiny, tmp_path):
+    # run_benchmarks() keeps its datasets in {workdir}/{scale}-{seed}, so point it at the fixture's.
+    os.symlink(tiny.root, tmp_path / "tiny-7")
+    results = run_benchmarks(["glom", "get_synonyms"], ["tiny"], str(tmp_path), seed=7, isolate=False)
+
+    assert [(r.case, r.scale) for r in results] == [("glom", "tiny"), ("get_synonyms", "tiny")]
+    assert results[0].items == len(tiny.read_concords())
+    assert results[1].items == SCALES["tiny"]
+    assert all(r.seconds > 0 and r.peak_rss_mib > 0 for r in results)
+
+    with pytest.raises(ValueError):
+        run_benchmarks(["glom"], ["enormous"], str(tmp_path))
+
+
+def test_results_round_trip_and_compare(tmp_path):
+    baseline = [BenchmarkResult("glom", "small", 100, 2.0, 100.0), BenchmarkResult("glom", "medium", 1000, 20.0, 500)]
+    filename = str(tmp_path / "baseline.json")
+    write_results(baseline, filename)
+    assert read_results(filename) == baseline
+
+    results = [
+        BenchmarkResult("glom", "small", 100, 2.3, 100.0),
+        BenchmarkResult("glom", "medium", 1000, 20.0, 650.0),
+        BenchmarkResult("create_node", "small", 100, 1.0, 100.0),
+    ]
+    comparisons = compare_results(results, baseline, tolerance=0.2)
+    # create_node has no baseline, so it is not compared.
+    assert [(c.result.scale, c.regressed) for c in comparisons] == [("small", False), ("medium", True)]
+    assert comparisons[1].rss_ratio == pytest.approx(1.3)
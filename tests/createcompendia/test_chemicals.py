@@ -8,11 +8,13 @@ reading of the ChEBI SDF, whose tags ChEBI renames between releases.
 
 import gzip
 import json
+import random
 from pathlib import Path
 
 import pytest
 
 from src import categories
+from src.babel_utils import glom, remove_overused_xrefs
 from src.categories import (
     CHEMICAL_ENTITY,
     CHEMICAL_MIXTURE,
@@ -25,6 +27,8 @@ from src.categories import (
 )
 from src.createcompendia.chemicals import (
     CHEBI_DBX_SOURCE_NAMES,
+    UNICHEM_PREFIXES_TO_REMOVE_OVERUSED_XREFS,
+    combine_unichem,
     create_typed_sets,
     make_chebi_relations,
     read_chebi_lookup_ids,
@@ -106,6 +110,85 @@ def test_write_unichem_concords_raises_when_source_produces_no_entries(tmp_path)
         write_unichem_concords(str(struct), str(ref), str(tmp_path))
 
 
+@pytest.mark.unit
+@pytest.mark.parametrize("sort_by_uci", [True, False])
+def test_write_unichem_concords_joins_on_uci_in_reference_order(tmp_path, sort_by_uci):
+    """Each concord lists its rows in reference file order, whether or not the files are sorted by UCI."""
+    struct_rows = [("3", "CCCC"), ("1", "AAAA"), ("2", "BBBB"), ("3", "CCCC-LAST")]
+    ref_rows = [("2", CHEBI_SRC_ID, "20"), ("3", CHEBI_SRC_ID, "30"), ("1", CHEBI_SRC_ID, "10")]
+    ref_rows += [("1", src_id, "100") for src_id in unichem_data_sources if src_id != CHEBI_SRC_ID]
+    if sort_by_uci:
+        struct_rows.sort(key=lambda row: int(row[0]))
+    struct = tmp_path / "structure.tsv.gz"
+    with gzip.open(struct, "wt") as out:
+        out.write(UNICHEM_STRUCT_TSV_HEADER)
+        for uci, inchikey in struct_rows:
+            out.write(f"{uci}\tInChI=1S/X\t{inchikey}\n")
+    ref = tmp_path / "reference.tsv"
+    _write_ref(ref, ref_rows)
+
+    write_unichem_concords(str(struct), str(ref), str(tmp_path), chunk_size=2)
+
+    assert (tmp_path / f"UNICHEM_{CHEBI}").read_text() == (
+        "CHEBI:20\toio:equivalent\tINCHIKEY:BBBB\n"
+        "CHEBI:30\toio:equivalent\tINCHIKEY:CCCC-LAST\n"
+        "CHEBI:10\toio:equivalent\tINCHIKEY:AAAA\n"
+    )
+
+
+@pytest.mark.unit
+def test_write_unichem_concords_raises_on_a_uci_without_a_structure(tmp_path):
+    struct = tmp_path / "structure.tsv.gz"
+    ref = tmp_path / "reference.tsv"
+    _write_struct(struct)
+    _write_ref(ref, [("2", CHEBI_SRC_ID, "12345"), *_bare_rows_for_other_sources()])
+
+    with pytest.raises(KeyError, match="UCI 2"):
+        write_unichem_concords(str(struct), str(ref), str(tmp_path))
+
+
+def _concord_lines(concord):
+    with open(concord) as inf:
+        return [line.rstrip("\n") for line in inf]
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("seed", range(3))
+def test_combine_unichem_matches_glomming_every_concord_in_turn(tmp_path, seed):
+    """Glomming each concord separately and merging the components must give the cliques one shared glom does."""
+    rng = random.Random(seed)
+    concordances = []
+    for prefix in ["CHEBI", "UNII", "DRUGBANK", "DrugCentral"]:
+        concord = tmp_path / f"UNICHEM_{prefix}"
+        # Few InChIKeys, so compounds claim several of them and InChIKeys are shared within and across sources.
+        concord.write_text(
+            "".join(f"{prefix}:{rng.randrange(20)}\toio:equivalent\tINCHIKEY:K{rng.randrange(15)}\n" for _ in range(40))
+        )
+        concordances.append(str(concord))
+
+    dicts = {}
+    for concord in concordances:
+        pairs = [line.split("\t")[::2] for line in _concord_lines(concord)]
+        if pairs[0][0].split(":")[0] in UNICHEM_PREFIXES_TO_REMOVE_OVERUSED_XREFS:
+            pairs = remove_overused_xrefs(pairs)
+        glom(dicts, [set(pair) for pair in pairs], unique_prefixes=["INCHIKEY"])
+    expected = {frozenset(clique) for clique in dicts.values()}
+
+    combine_unichem(concordances, str(tmp_path / "UNICHEM"))
+    with open(tmp_path / "UNICHEM") as inf:
+        assert {frozenset(json.loads(line)) for line in inf} == expected
+
+
+@pytest.mark.unit
+def test_combine_unichem_rejects_concords_sharing_a_prefix(tmp_path):
+    first, second = tmp_path / "UNICHEM_CHEBI", tmp_path / "UNICHEM_CHEBI_AGAIN"
+    first.write_text("CHEBI:1\toio:equivalent\tINCHIKEY:A\n")
+    second.write_text("CHEBI:1\toio:equivalent\tINCHIKEY:B\n")
+
+    with pytest.raises(RuntimeError, match="share a prefix"):
+        combine_unichem([str(first), str(second)], str(tmp_path / "UNICHEM"))
+
+
 # ----
 # FOOD-AND-EXTRACT TYPE VOTE (issues #828, #935)
 # ----
@@ -370,6 +453,21 @@ def test_make_chebi_relations_emits_kegg_and_pubchem_xrefs(tmp_path):
     assert not any(f"{PUBCHEMCOMPOUND}:85612588" in line for line in concord_lines)
 
 
+@pytest.mark.unit
+def test_make_chebi_relations_writes_a_repeated_sdf_entry_once(tmp_path):
+    """An SDF entry that appears twice should produce its xrefs and properties once, as it did when
+    the whole SDF was read into a dictionary keyed by ChEBI ID."""
+    sdf = tmp_path / "repeated.sdf"
+    sdf.write_text(ABACAVIR_SDF.read_text() * 2)
+
+    concord_lines, props = _run_make_chebi_relations(tmp_path, sdf=sdf)
+    single_concord_lines, single_props = _run_make_chebi_relations(tmp_path)
+
+    assert concord_lines == single_concord_lines
+    # The properties name the SDF file they came from, which differs.
+    assert [p["value"] for p in props] == [p["value"] for p in single_props]
+
+
 @pytest.mark.unit
 def test_make_chebi_relations_splits_multivalue_tags(tmp_path):
     """A semicolon-delimited tag value should never survive into a CURIE.
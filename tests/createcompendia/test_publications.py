@@ -1,11 +1,22 @@
-"""Unit tests for the PubMed download verification in src/createcompendia/publications.py.
+"""Unit tests for the PubMed download, verification and parsing in src/createcompendia/publications.py.
+
+download_pubmed() downloads the PubMed files in a bounded pool, keeping the ones we already have that
+match the checksums PubMed publishes for them.
 
 verify_pubmed_downloads() is the backstop that makes it safe to carry PubMed files forward from a
 previous run (see docs/RunningBabel.md, "Preloading PubMed downloads"): it MD5s every downloaded
 `.gz` against the `.md5` file PubMed publishes alongside it, and re-downloads the ones that fail.
+
+parse_pubmed_into_tsvs() parses each PubMed file into its own shard, possibly in parallel, and
+concatenates the shards in file order.
 """
 
+import functools
+import gzip
 import hashlib
+import json
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
 
 import pytest
 
@@ -45,6 +56,60 @@ def no_downloads(monkeypatch):
     return attempts
 
 
+# DOWNLOADING
+
+
+@pytest.fixture
+def pubmed_server(tmp_path, monkeypatch):
+    """Serve tmp_path/'remote' over HTTP on localhost as a stand-in for PubMed, listing the `.xml.gz`
+    files in each of its directories in place of PubMed's FTP listing; yields (base_url, remote_dir)."""
+    remote_dir = tmp_path / "remote"
+    for subdir in ("baseline", "updatefiles"):
+        (remote_dir / subdir).mkdir(parents=True)
+    monkeypatch.setattr(
+        publications,
+        "list_pubmed_files",
+        lambda subdir, listing_base: sorted(path.name for path in (remote_dir / subdir).glob("*.xml.gz")),
+    )
+
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=str(remote_dir))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/", remote_dir
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join(timeout=5)
+
+
+@pytest.mark.unit
+def test_download_pubmed_keeps_files_matching_their_md5s_and_downloads_the_rest(pubmed_server, tmp_path):
+    base_url, remote_dir = pubmed_server
+    write_pubmed_file(remote_dir / "baseline", "pubmed26n0001.xml.gz", b"first file")
+    write_pubmed_file(remote_dir / "baseline", "pubmed26n0002.xml.gz", b"second file, revised")
+    write_pubmed_file(remote_dir / "updatefiles", "pubmed26n0003.xml.gz", b"an update")
+
+    # Preloaded from a previous run: one file is still current, the other has since been revised.
+    local_dir = tmp_path / "local" / "PubMed"
+    (local_dir / "baseline").mkdir(parents=True)
+    current = local_dir / "baseline" / "pubmed26n0001.xml.gz"
+    current.write_bytes(b"first file")
+    current_mtime = current.stat().st_mtime_ns
+    (local_dir / "baseline" / "pubmed26n0002.xml.gz").write_bytes(b"second file")
+
+    done_file = local_dir / "downloaded"
+    publications.download_pubmed(str(done_file), pubmed_base=base_url, workers=2)
+
+    assert current.stat().st_mtime_ns == current_mtime
+    assert (local_dir / "baseline" / "pubmed26n0002.xml.gz").read_bytes() == b"second file, revised"
+    assert (local_dir / "updatefiles" / "pubmed26n0003.xml.gz").read_bytes() == b"an update"
+    for path in local_dir.glob("*/*.xml.gz"):
+        assert publications.verify_pubmed_download_against_md5(str(path), f"{path}.md5")
+    assert done_file.exists()
+
+
 # VERIFYING A SINGLE FILE AGAINST ITS MD5
 
 
@@ -146,3 +211,90 @@ def test_verifying_a_corrupt_download_redownloads_it_and_its_md5(baseline_dir, t
     # The file that was fine was never touched.
     assert good.read_bytes() == b"pubmed article data"
     assert done_file.exists()
+
+
+# PARSING PUBMED FILES
+
+
+def pubmed_article(pmid, title, statuses=(), doi=None, pmc=None):
+    """Return the XML of a minimal PubmedArticle."""
+    ids = f'<ArticleId IdType="pubmed">{pmid}</ArticleId>'
+    if doi:
+        ids += f'<ArticleId IdType="doi">{doi}</ArticleId>'
+    if pmc:
+        ids += f'<ArticleId IdType="pmc">{pmc}</ArticleId>'
+    history = "".join(f'<PubMedPubDate PubStatus="{status}"><Year>2020</Year></PubMedPubDate>' for status in statuses)
+    return (
+        f"<PubmedArticle><MedlineCitation><Article><ArticleTitle>{title}</ArticleTitle></Article></MedlineCitation>"
+        f"<PubmedData><History>{history}</History><ArticleIdList>{ids}</ArticleIdList></PubmedData></PubmedArticle>"
+    )
+
+
+def write_pubmed_xml(path, *articles):
+    with gzip.open(path, "wt") as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n<PubmedArticleSet>\n')
+        f.write("\n".join(articles))
+        f.write("\n</PubmedArticleSet>\n")
+
+
+@pytest.fixture
+def pubmed_files(tmp_path):
+    baseline = tmp_path / "baseline"
+    updatefiles = tmp_path / "updatefiles"
+    baseline.mkdir()
+    updatefiles.mkdir()
+    write_pubmed_xml(
+        baseline / "pubmed26n0001.xml.gz",
+        pubmed_article(1, "First", ["pubmed", "medline"], doi="10.1/one"),
+        pubmed_article(2, "Second\nline", ["pubmed"], pmc="PMC2"),
+    )
+    write_pubmed_xml(baseline / "pubmed26n0002.xml.gz", pubmed_article(3, "Caf\u00e9", []))
+    (baseline / "pubmed26n0002.xml.gz.md5").write_text("not parsed\n")
+    write_pubmed_xml(updatefiles / "pubmed26n0003.xml.gz", pubmed_article(1, "First, revised", ["retracted"]))
+    return baseline, updatefiles
+
+
+def parse_pubmed(pubmed_files, out_dir, workers):
+    out_dir.mkdir()
+    outputs = {
+        "titles_file": out_dir / "titles.tsv",
+        "status_file": out_dir / "statuses.jsonl.gz",
+        "pmid_id_file": out_dir / "PMID",
+        "pmid_doi_concord_file": out_dir / "PMID_DOI",
+        "metadata_yaml": out_dir / "metadata.yaml",
+    }
+    publications.parse_pubmed_into_tsvs(
+        *map(str, pubmed_files), **{name: str(path) for name, path in outputs.items()}, workers=workers
+    )
+    return outputs
+
+
+@pytest.mark.unit
+def test_parse_pubmed_into_tsvs(pubmed_files, tmp_path):
+    """Every file is parsed in order, and statuses are merged across files."""
+    outputs = parse_pubmed(pubmed_files, tmp_path / "out", workers=1)
+
+    assert outputs["titles_file"].read_text() == (
+        "PMID:1\tFirst\nPMID:2\tSecond\\nline\nPMID:3\tCaf\u00e9\nPMID:1\tFirst, revised\n"
+    )
+    assert outputs["pmid_id_file"].read_text() == "".join(
+        f"PMID:{pmid}\tbiolink:JournalArticle\n" for pmid in (1, 2, 3, 1)
+    )
+    assert outputs["pmid_doi_concord_file"].read_text() == "PMID:1\teq\tdoi:10.1/one\nPMID:2\teq\tPMC:PMC2\n"
+    with gzip.open(outputs["status_file"], "rt") as f:
+        assert [json.loads(line) for line in f] == [
+            {"id": "PMID:1", "statuses": ["medline", "pubmed", "retracted"]},
+            {"id": "PMID:2", "statuses": ["pubmed"]},
+            {"id": "PMID:3", "statuses": []},
+        ]
+
+
+@pytest.mark.unit
+def test_parse_pubmed_into_tsvs_output_does_not_depend_on_workers(pubmed_files, tmp_path):
+    single = parse_pubmed(pubmed_files, tmp_path / "single", workers=1)
+    parallel = parse_pubmed(pubmed_files, tmp_path / "parallel", workers=3)
+
+    for name in ("titles_file", "pmid_id_file", "pmid_doi_concord_file"):
+        assert parallel[name].read_bytes() == single[name].read_bytes()
+    with gzip.open(single["status_file"], "rb") as s, gzip.open(parallel["status_file"], "rb") as p:
+        assert p.read() == s.read()
@@ -1,7 +1,7 @@
-"""Network tests for the HMDB download.
+"""Tests for the HMDB data handler.
 
-These verify that HMDB's download URL is reachable with the User-Agent Babel sends.
-Run with: uv run pytest --network tests/datahandlers/test_hmdb.py
+The network tests verify that HMDB's download URL is reachable with the User-Agent Babel sends.
+Run them with: uv run pytest --network tests/datahandlers/test_hmdb.py
 """
 
 import urllib.error
@@ -10,12 +10,12 @@ import urllib.request
 import pytest
 
 from src.babel_utils import get_user_agent
-
-pytestmark = [pytest.mark.network]
+from src.datahandlers.hmdb import make_labels_and_synonyms_and_smiles
 
 HMDB_ZIP_URL = "https://hmdb.ca/system/downloads/current/hmdb_metabolites.zip"
 
 
+@pytest.mark.network
 def test_hmdb_url_accessible_with_user_agent():
     """HMDB download URL should be reachable with our User-Agent (not 403)."""
     req = urllib.request.Request(HMDB_ZIP_URL, headers={"User-Agent": get_user_agent()})
@@ -31,6 +31,7 @@ def test_hmdb_url_accessible_with_user_agent():
         )
 
 
+@pytest.mark.network
 def test_hmdb_url_rejects_no_user_agent():
     """HMDB returns 403 when no User-Agent is set (raw urllib default).
 
@@ -50,3 +51,33 @@ def test_hmdb_url_rejects_no_user_agent():
             pass  # expected — server rejects bare requests
         else:
             pytest.fail(f"Unexpected HTTP {e.code} from HMDB (expected 403 for bare UA)")
+
+
+@pytest.mark.unit
+def test_make_labels_and_synonyms_and_smiles_streams_metabolites(tmp_path):
+    xml = tmp_path / "hmdb_metabolites.xml"
+    xml.write_text(
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<hmdb xmlns="http://www.hmdb.ca">\n'
+        "<metabolite><accession>HMDB0000001</accession><name>1-Methylhistidine</name>"
+        "<synonyms><synonym>Pi-methylhistidine</synonym><synonym>1-MHis</synonym></synonyms>"
+        "<smiles>CN1C=NC(C[C@H](N)C(O)=O)=C1</smiles></metabolite>\n"
+        # A single synonym comes back from xmltodict as a string rather than a list.
+        "<metabolite><accession>HMDB0000002</accession><name>1,3-Diaminopropane</name>"
+        "<synonyms><synonym>Propane-1,3-diamine</synonym></synonyms></metabolite>\n"
+        "<metabolite><accession>HMDB0000005</accession><name>2-Ketobutyric acid</name><synonyms/></metabolite>\n"
+        "</hmdb>\n"
+    )
+    labels, synonyms, smiles = tmp_path / "labels", tmp_path / "synonyms", tmp_path / "smiles"
+
+    make_labels_and_synonyms_and_smiles(str(xml), str(labels), str(synonyms), str(smiles))
+
+    assert labels.read_text() == (
+        "HMDB:HMDB0000001\t1-Methylhistidine\nHMDB:HMDB0000002\t1,3-Diaminopropane\nHMDB:HMDB0000005\t2-Ketobutyric acid\n"
+    )
+    assert synonyms.read_text() == (
+        "HMDB:HMDB0000001\toio:exact\tPi-methylhistidine\n"
+        "HMDB:HMDB0000001\toio:exact\t1-MHis\n"
+        "HMDB:HMDB0000002\toio:exact\tPropane-1,3-diamine\n"
+    )
+    assert smiles.read_text() == "HMDB:HMDB0000001\tCN1C=NC(C[C@H](N)C(O)=O)=C1\n"
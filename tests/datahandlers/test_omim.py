@@ -30,7 +30,7 @@ def test_pull_via_urllib_sends_user_agent(tmp_path):
 
     captured = []
 
-    def fake_open(req):
+    def fake_open(req, timeout=None):
         captured.append(req)
         mock_resp = MagicMock()
         mock_resp.read.return_value = b""
@@ -0,0 +1,91 @@
+"""Unit tests for src/datahandlers/rdf_store.py: persistent pyoxigraph stores opened read-only."""
+
+import os
+
+import pyoxigraph
+import pytest
+
+from src.datahandlers.ec import ECgraph
+from src.datahandlers.ec import rdf_sources as ec_rdf_sources
+from src.datahandlers.rdf_store import (
+    RdfSource,
+    build_rdf_store,
+    has_fresh_store,
+    open_rdf_store,
+    store_dirname,
+)
+
+pytestmark = pytest.mark.unit
+
+LABEL_QUERY = "SELECT ?s ?label WHERE { ?s <http://www.w3.org/2000/01/rdf-schema#label> ?label } ORDER BY ?s"
+
+NT = (
+    b'<http://example.org/a> <http://www.w3.org/2000/01/rdf-schema#label> "A" .\n'
+    b'<http://example.org/b> <http://www.w3.org/2000/01/rdf-schema#label> "B" .\n'
+)
+
+
+def _labels(store):
+    return [(str(row["s"]), row["label"].value) for row in store.query(LABEL_QUERY)]
+
+
+def test_store_is_built_once_and_opened_read_only(tmp_path):
+    nt_file = tmp_path / "source.nt"
+    nt_file.write_bytes(NT)
+    sources = [RdfSource(str(nt_file), pyoxigraph.RdfFormat.N_TRIPLES)]
+    store_dir = store_dirname(str(nt_file))
+
+    assert not has_fresh_store(store_dir, sources)
+    build_rdf_store(store_dir, sources)
+    assert has_fresh_store(store_dir, sources)
+    assert not os.path.exists(store_dir + ".tmp")
+
+    # The source is no longer read: the store answers from disk, read-only.
+    nt_file.write_bytes(b"")
+    os.utime(nt_file, ns=(0, 0))
+    store = open_rdf_store(store_dir, sources)
+    assert _labels(store) == [("<http://example.org/a>", "A"), ("<http://example.org/b>", "B")]
+    with pytest.raises(RuntimeError):
+        store.add(
+            pyoxigraph.Quad(
+                pyoxigraph.NamedNode("http://example.org/c"),
+                pyoxigraph.NamedNode("http://example.org/p"),
+                pyoxigraph.Literal("C"),
+            )
+        )
+
+    # A second reader can open the same store at the same time.
+    assert _labels(open_rdf_store(store_dir, sources)) == _labels(store)
+
+
+def test_stale_or_missing_store_falls_back_to_memory(tmp_path):
+    nt_file = tmp_path / "source.nt"
+    nt_file.write_bytes(NT)
+    sources = [RdfSource(str(nt_file), pyoxigraph.RdfFormat.N_TRIPLES)]
+    store_dir = store_dirname(str(nt_file))
+
+    assert len(_labels(open_rdf_store(store_dir, sources))) == 2
+
+    build_rdf_store(store_dir, sources)
+    # A re-downloaded source is newer than its store, which is then ignored.
+    nt_file.write_bytes(NT[: NT.index(b"\n") + 1])
+    os.utime(nt_file, (os.path.getmtime(nt_file) + 60,) * 2)
+    assert not has_fresh_store(store_dir, sources)
+    assert _labels(open_rdf_store(store_dir, sources)) == [("<http://example.org/a>", "A")]
+
+
+def test_ecgraph_opens_its_store(tmp_path):
+    rdf_file = tmp_path / "enzyme.rdf"
+    rdf_file.write_bytes(b"""<?xml version="1.0"?>
+<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+         xmlns:rdfs="http://www.w3.org/2000/01/rdf-schema#"
+         xmlns:owl="http://www.w3.org/2002/07/owl#">
+  <owl:Ontology rdf:about=""/>
+  <rdf:Description rdf:about="http://purl.uniprot.org/enzyme/1.1.1.1">
+    <rdfs:label>alcohol dehydrogenase</rdfs:label>
+  </rdf:Description>
+</rdf:RDF>""")
+    build_rdf_store(store_dirname(str(rdf_file)), ec_rdf_sources(str(rdf_file)))
+
+    graph = ECgraph(str(rdf_file))
+    assert _labels(graph.m) == [("<http://purl.uniprot.org/enzyme/1.1.1.1>", "alcohol dehydrogenase")]
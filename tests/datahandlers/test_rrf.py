@@ -0,0 +1,114 @@
+"""Tests for reading UMLS and RxNorm RRF files through their Parquet copies (src/datahandlers/rrf.py).
+
+Each test reads a small MRCONSO, MRSTY or RXNREL written here, both from the RRF file itself and from
+the Parquet copy convert_rrf_to_parquet() makes of it, and checks that the two agree.
+"""
+
+import os
+
+import pytest
+
+from src.datahandlers import rrf, umls
+
+MRCONSO_LINES = [
+    "C0000005|ENG|P|L0000005|PF|S0007492|Y|A26634265||M0019694|D012711|MSH|PEP|D012711|(131)I-Macroaggregated Albumin|0|N|256|",
+    "C0000005|FRE|P|L0000005|PF|S0007492|Y|A26634266||M0019694|D012711|MSHFRE|PEP|D012711|Albumine macroagrégée|3|N||",
+    "C0000039|ENG|P|L0000039|PF|S0007564|N|A0016515||M0023172|D015060|MSH|MH|D015060|1,2-Dipalmitoylphosphatidylcholine|0|N|256|",
+    'C0000039|ENG|S|L0000035|PF|S0007560|Y|A1317708||M0023172|D015060|MSH|TQ|D015060|"Dipalmitoyl" Lecithin|0|O||',
+    "C0000052|ENG|P|L0000052|PF|S0007583|Y|A0016537|||D000001|DRUGBANK|IN|DB00001|Lepirudin|0|E||",
+    "C0000052|ENG|P|L0000052|PF|S0007584|Y|A0016538||||HGNC|PT|HGNC:76|ABCA1 \\ transporter|0|Y||",
+]
+MRSTY_LINES = [
+    "C0000005|T116|A1.4.1.2.1.7|Amino Acid, Peptide, or Protein|AT17648347|256|",
+    "C0000005|T121|A1.4.1.1.1|Pharmacologic Substance|AT17575038|256|",
+    "C0000039|T109|A1.4.1.2.1|Organic Chemical|AT45562015|256|",
+]
+RXNREL_LINES = [
+    "1000000||CUI|RO|1000001||CUI|has_ingredient|R1||RXNORM||||N||",
+    "1000001||CUI|RO|1000000||CUI|ingredient_of|R2||RXNORM||||N||",
+    "||AUI|RO|||SDUI|tradename_of|R3||RXNORM||||N||",
+]
+
+
+def write_rrf(tmp_path, name, lines):
+    rrf_filename = os.path.join(tmp_path, f"{name}.RRF")
+    with open(rrf_filename, "w") as outf:
+        outf.write("".join(line + "\n" for line in lines))
+    return rrf_filename
+
+
+def read_both_ways(rrf_filename, columns, **kwargs):
+    """Read an RRF file before and after converting it to Parquet."""
+    from_rrf = list(rrf.read_rrf(rrf_filename, columns, **kwargs))
+    if not rrf.has_fresh_parquet(rrf_filename):
+        rrf.convert_rrf_to_parquet(rrf_filename)
+    from_parquet = list(rrf.read_rrf(rrf_filename, columns, **kwargs))
+    os.remove(rrf.parquet_filename_for(rrf_filename))
+    return from_rrf, from_parquet
+
+
+@pytest.mark.unit
+def test_parquet_matches_rrf(tmp_path):
+    """Every kept column comes back the same, in file order, with empty fields as empty strings."""
+    mrconso = write_rrf(tmp_path, "MRCONSO", MRCONSO_LINES)
+    from_rrf, from_parquet = read_both_ways(mrconso, list(rrf.PARQUET_COLUMNS["CONSO"]))
+    assert from_parquet == from_rrf
+    assert [row[0] for row in from_rrf] == [line.split("|")[0] for line in MRCONSO_LINES]
+    assert from_rrf[3][6] == '"Dipalmitoyl" Lecithin'
+    assert from_rrf[5][6] == "ABCA1 \\ transporter"
+    assert from_rrf[4][2] == "A0016537" and from_rrf[5][5] == "HGNC:76"
+
+    mrsty = write_rrf(tmp_path, "MRSTY", MRSTY_LINES)
+    from_rrf, from_parquet = read_both_ways(mrsty, ["CUI", "STN"])
+    expected = [("C0000005", "A1.4.1.2.1.7"), ("C0000005", "A1.4.1.1.1"), ("C0000039", "A1.4.1.2.1")]
+    assert from_rrf == from_parquet == expected
+
+
+@pytest.mark.unit
+def test_standard_matches_check_mrconso_line(tmp_path):
+    """standard=True keeps the same rows as umls.check_mrconso_line(): English, and not O or E."""
+    mrconso = write_rrf(tmp_path, "MRCONSO", MRCONSO_LINES)
+    expected = [(line.split("|")[7],) for line in MRCONSO_LINES if umls.check_mrconso_line(line)]
+    from_rrf, from_parquet = read_both_ways(mrconso, ["AUI"], standard=True)
+    assert from_rrf == from_parquet == expected == [("A26634265",), ("A0016515",), ("A0016538",)]
+
+
+@pytest.mark.unit
+def test_where(tmp_path):
+    mrconso = write_rrf(tmp_path, "MRCONSO", MRCONSO_LINES)
+    from_rrf, from_parquet = read_both_ways(
+        mrconso, ["CUI", "TTY"], where={"SAB": {"MSH", "DRUGBANK"}, "SUPPRESS": ["N", "O"]}
+    )
+    assert from_rrf == from_parquet == [("C0000005", "PEP"), ("C0000039", "MH"), ("C0000039", "TQ")]
+
+    rxnrel = write_rrf(tmp_path, "RXNREL", RXNREL_LINES)
+    from_rrf, from_parquet = read_both_ways(rxnrel, ["CUI1", "STYPE2"], where={"RELA": ["tradename_of"]})
+    assert from_rrf == from_parquet == [("", "SDUI")]
+
+
+@pytest.mark.unit
+def test_stale_parquet_is_ignored(tmp_path, caplog):
+    """A Parquet copy older than its RRF file is not read, so an updated RRF file is never read stale."""
+    mrsty = write_rrf(tmp_path, "MRSTY", MRSTY_LINES)
+    rrf.convert_rrf_to_parquet(mrsty)
+    assert rrf.has_fresh_parquet(mrsty)
+
+    write_rrf(tmp_path, "MRSTY", MRSTY_LINES[:1])
+    parquet_mtime = os.path.getmtime(rrf.parquet_filename_for(mrsty))
+    os.utime(mrsty, (parquet_mtime + 10, parquet_mtime + 10))
+    assert not rrf.has_fresh_parquet(mrsty)
+    assert list(rrf.read_rrf(mrsty, ["TUI"])) == [("T116",)]
+    assert "reading the RRF file instead" in caplog.text
+
+
+@pytest.mark.unit
+def test_bad_requests(tmp_path):
+    mrsty = write_rrf(tmp_path, "MRSTY", MRSTY_LINES)
+    with pytest.raises(ValueError, match="Don't know the layout"):
+        rrf.read_rrf(os.path.join(tmp_path, "MRSAT.RRF"), ["CUI"])
+    with pytest.raises(ValueError, match="no columns"):
+        rrf.read_rrf(mrsty, ["CUI", "ATUI"])
+    with pytest.raises(ValueError, match="no columns"):
+        rrf.read_rrf(mrsty, ["CUI"], where={"SAB": ["MSH"]})
+    with pytest.raises(ValueError, match="standard rows"):
+        rrf.read_rrf(mrsty, ["CUI"], standard=True)
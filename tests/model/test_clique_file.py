@@ -0,0 +1,41 @@
+"""Unit tests for the binary clique interchange file in src/model/clique_file.py."""
+
+import pytest
+
+from src.model.clique_file import read_cliques, write_cliques
+
+pytestmark = pytest.mark.unit
+
+
+def test_round_trip_preserves_cliques_and_order(tmp_path):
+    cliques = [
+        frozenset({"CHEBI:1", "PUBCHEM.COMPOUND:2", "INCHIKEY:AAAA-BBBB-C"}),
+        frozenset({"MESH:D000001"}),
+        frozenset({"UNII:X", "DRUGBANK:DB1", "UMLS:Cé"}),
+    ]
+    filename = str(tmp_path / "untyped_compendium")
+
+    assert write_cliques(filename, cliques) == 3
+    assert list(read_cliques(filename)) == cliques
+
+
+def test_round_trip_of_a_set_of_cliques(tmp_path):
+    """build_untyped_compendia() writes a set of frozensets, and build_compendia() reads them back into one."""
+    cliques = {frozenset({f"A:{i}", f"B:{i}"}) for i in range(1000)} | {frozenset({"C:1"})}
+    filename = str(tmp_path / "untyped_compendium")
+    write_cliques(filename, cliques)
+    assert set(read_cliques(filename)) == cliques
+
+
+def test_no_cliques(tmp_path):
+    filename = str(tmp_path / "empty")
+    assert write_cliques(filename, []) == 0
+    assert list(read_cliques(filename)) == []
+
+
+def test_old_format_is_rejected(tmp_path):
+    """A Python-repr file from an older build fails loudly rather than being misread."""
+    filename = tmp_path / "untyped_compendium"
+    filename.write_text("{'CHEBI:1', 'MESH:D1'}\n")
+    with pytest.raises(ValueError, match="not a clique file"):
+        list(read_cliques(str(filename)))
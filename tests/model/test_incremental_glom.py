@@ -0,0 +1,66 @@
+"""Unit tests for glom_files(): an incremental glom must give the same cliques as a full one."""
+
+import random
+
+import pytest
+
+from src.incremental import DigestCache
+from src.model.incremental_glom import COMPONENTS_FILENAME, glom_files
+
+pytestmark = pytest.mark.unit
+
+UNIQUE_PREFIXES = ["U", "V"]
+
+
+def _write_concord(path, rng, count):
+    lines = []
+    for _ in range(count):
+        # Small id ranges, so that components grow and the unique prefixes reject some pairs.
+        a = f"{rng.choice(['U', 'V', 'X'])}:{rng.randrange(40)}"
+        b = f"{rng.choice(['U', 'V', 'X'])}:{rng.randrange(40)}"
+        lines.append(f"{a}\toio:equivalent\t{b}\n")
+    path.write_text("".join(lines))
+
+
+def _write_inputs(tmp_path, seed):
+    rng = random.Random(seed)
+    ids = tmp_path / "ids"
+    ids.write_text("".join(f"U:{i}\tbiolink:Gene\n" for i in range(0, 40, 3)))
+    concords = []
+    for name in ("concord_a", "concord_b", "concord_c"):
+        _write_concord(tmp_path / name, rng, 30)
+        concords.append(str(tmp_path / name))
+    return [str(ids)], concords
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_incremental_glom_matches_full_glom(tmp_path, seed):
+    identifier_files, concordance_files = _write_inputs(tmp_path, seed)
+    state_dir = str(tmp_path / "state")
+    cache = DigestCache(str(tmp_path / "digests.json"))
+
+    full = glom_files(identifier_files, concordance_files, UNIQUE_PREFIXES)
+    assert glom_files(identifier_files, concordance_files, UNIQUE_PREFIXES, state_dir, cache) == full
+    assert (tmp_path / "state" / COMPONENTS_FILENAME).exists()
+    # Nothing changed: the cliques come straight from the saved state.
+    assert glom_files(identifier_files, concordance_files, UNIQUE_PREFIXES, state_dir, cache) == full
+
+    # Change one concord, and the incremental glom still matches a full one.
+    _write_concord(tmp_path / "concord_b", random.Random(seed + 100), 30)
+    full = glom_files(identifier_files, concordance_files, UNIQUE_PREFIXES)
+    assert glom_files(identifier_files, concordance_files, UNIQUE_PREFIXES, state_dir, cache) == full
+
+    # As does dropping one.
+    full = glom_files(identifier_files, concordance_files[:2], UNIQUE_PREFIXES)
+    assert glom_files(identifier_files, concordance_files[:2], UNIQUE_PREFIXES, state_dir, cache) == full
+
+
+def test_changed_unique_prefixes_reglom_everything(tmp_path):
+    identifier_files, concordance_files = _write_inputs(tmp_path, 0)
+    state_dir = str(tmp_path / "state")
+    cache = DigestCache(str(tmp_path / "digests.json"))
+
+    glom_files(identifier_files, concordance_files, UNIQUE_PREFIXES, state_dir, cache)
+    assert glom_files(identifier_files, concordance_files, ["U"], state_dir, cache) == glom_files(
+        identifier_files, concordance_files, ["U"]
+    )
@@ -0,0 +1,53 @@
+"""Unit tests for the compiled information content index read by InformationContentFactory."""
+
+import curies
+import pytest
+
+from src.node import (
+    IC_INDEX_MAPPING_KEY,
+    InformationContentFactory,
+    compile_information_content,
+    read_information_content,
+)
+from src.synonyms.label_index import index_filename
+
+pytestmark = pytest.mark.unit
+
+CONVERTERS = [curies.Converter.from_prefix_map({"UBERON": "http://purl.obolibrary.org/obo/UBERON_"})]
+
+ICRDF = (
+    "http://purl.obolibrary.org/obo/UBERON_0000001\t12.5\n"
+    "http://purl.obolibrary.org/obo/UBERON_0000002\t100\n"
+    "http://example.org/unmapped/1\t3.0\n"
+    # A CURIE listed twice keeps its last value, as the dict did.
+    "http://purl.obolibrary.org/obo/UBERON_0000001\t7.25\n"
+)
+
+
+def test_read_information_content(tmp_path):
+    ic_file = tmp_path / "icRDF.tsv"
+    ic_file.write_text(ICRDF)
+
+    assert list(read_information_content(str(ic_file), CONVERTERS)) == [
+        ("http://purl.obolibrary.org/obo/UBERON_0000001", "UBERON:0000001", "12.5"),
+        ("http://purl.obolibrary.org/obo/UBERON_0000002", "UBERON:0000002", "100"),
+        ("http://example.org/unmapped/1", None, "3.0"),
+        ("http://purl.obolibrary.org/obo/UBERON_0000001", "UBERON:0000001", "7.25"),
+    ]
+
+
+def test_factory_reads_the_compiled_index(tmp_path):
+    ic_file = tmp_path / "icRDF.tsv"
+    ic_file.write_text(ICRDF)
+
+    assert compile_information_content(str(ic_file), converters=CONVERTERS) == 2
+    assert (tmp_path / "icRDF.tsv.idx").exists()
+    assert index_filename(str(ic_file)) == str(tmp_path / "icRDF.tsv.idx")
+
+    factory = InformationContentFactory(str(ic_file))
+    assert dict(factory.ic) == {"UBERON:0000001": 7.25, "UBERON:0000002": 100.0}
+    assert IC_INDEX_MAPPING_KEY not in factory.ic
+
+    node = {"identifiers": [{"identifier": "UBERON:0000002"}, {"identifier": "UBERON:0000001"}, {"identifier": "X:1"}]}
+    assert factory.get_ic(node) == 7.25
+    assert factory.get_ic({"identifiers": [{"identifier": "X:1"}]}) is None
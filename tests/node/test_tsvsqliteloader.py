@@ -0,0 +1,85 @@
+"""Unit tests for TSVSQLiteLoader and TaxonFactory in src/node.py."""
+
+import os
+
+import pytest
+
+from src.node import TaxonFactory, TSVSQLiteLoader
+
+TAXA = "UniProtKB:P12345\tNCBITaxon:9606\nUniProtKB:P12345\tNCBITaxon:10090\nUniProtKB:Q99999\tNCBITaxon:7955\n"
+
+
+@pytest.fixture
+def download_dir(tmp_path):
+    (tmp_path / "UniProtKB").mkdir()
+    (tmp_path / "UniProtKB" / "taxa").write_text(TAXA)
+    return tmp_path
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("persist", [False, True])
+def test_get_curies(download_dir, persist):
+    loader = TSVSQLiteLoader(str(download_dir), "taxa", "curie-curie", persist=persist)
+    result = loader.get_curies(["UniProtKB:P12345", "UniProtKB:q99999", "UniProtKB:NOPE", "NCBIGene:1"])
+    assert result == {
+        "UniProtKB:P12345": {"NCBITaxon:9606", "NCBITaxon:10090"},
+        "UniProtKB:q99999": {"NCBITaxon:7955"},
+        "UniProtKB:NOPE": set(),
+        "NCBIGene:1": set(),
+    }
+    assert loader.get_sqlite_counts() == {"UniProtKB": 3}
+    loader.close()
+    assert os.path.exists(download_dir / "UniProtKB" / "taxa.sqlite") == persist
+
+
+@pytest.mark.unit
+def test_get_curies_batches_large_queries(download_dir, monkeypatch):
+    monkeypatch.setattr(TSVSQLiteLoader, "QUERY_BATCH_SIZE", 2)
+    loader = TSVSQLiteLoader(str(download_dir), "taxa", "curie-curie")
+    curies = [f"UniProtKB:X{i}" for i in range(5)] + ["UniProtKB:P12345", "UniProtKB:p12345", "UniProtKB:Q99999"]
+    result = loader.get_curies(curies)
+    assert set(result) == set(curies)
+    assert result["UniProtKB:P12345"] == result["UniProtKB:p12345"] == {"NCBITaxon:9606", "NCBITaxon:10090"}
+    assert result["UniProtKB:Q99999"] == {"NCBITaxon:7955"}
+    loader.close()
+
+
+@pytest.mark.unit
+def test_persisted_database_is_reused_and_rebuilt(download_dir):
+    taxa_file = download_dir / "UniProtKB" / "taxa"
+    db_file = download_dir / "UniProtKB" / "taxa.sqlite"
+
+    loader = TSVSQLiteLoader(str(download_dir), "taxa", "curie-curie", persist=True)
+    loader.load_prefix("UniProtKB")
+    loader.close()
+    built = os.stat(db_file).st_mtime_ns
+
+    # Unchanged TSV: the database is opened as-is.
+    loader = TSVSQLiteLoader(str(download_dir), "taxa", "curie-curie", persist=True)
+    assert loader.get_curies(["UniProtKB:Q99999"]) == {"UniProtKB:Q99999": {"NCBITaxon:7955"}}
+    loader.close()
+    assert os.stat(db_file).st_mtime_ns == built
+
+    # A changed TSV (different size) invalidates it.
+    taxa_file.write_text(TAXA + "UniProtKB:A00001\tNCBITaxon:562\n")
+    loader = TSVSQLiteLoader(str(download_dir), "taxa", "curie-curie", persist=True)
+    assert loader.get_curies(["UniProtKB:A00001"]) == {"UniProtKB:A00001": {"NCBITaxon:562"}}
+    loader.close()
+
+
+@pytest.mark.unit
+def test_taxon_factory_prefetch(download_dir):
+    factory = TaxonFactory(str(download_dir), persist=False)
+    factory.prefetch(["UniProtKB:P12345", "UniProtKB:NOPE"])
+    assert set(factory.prefetched) == {"UniProtKB:P12345", "UniProtKB:NOPE"}
+
+    # Prefetched CURIEs are answered from the cache, and anything else falls through to SQLite.
+    result = factory.get_taxa(["UniProtKB:p12345", "UniProtKB:NOPE", "UniProtKB:Q99999", "uniprotkb:P12345"])
+    assert result == {
+        "UniProtKB:p12345": {"NCBITaxon:9606", "NCBITaxon:10090"},
+        "UniProtKB:NOPE": set(),
+        "UniProtKB:Q99999": {"NCBITaxon:7955"},
+        # The prefix picks the taxa file, so it isn't case-insensitive.
+        "uniprotkb:P12345": set(),
+    }
+    factory.close()
@@ -0,0 +1,76 @@
+"""Tests for the per-compendium content report, worked out from the Parquet files exported from a small compendium."""
+
+import json
+
+import pytest
+
+from src.exporters.duckdb_exporters import export_compendia_to_parquet
+from src.reports.compendia_per_file_reports import generate_content_report_for_compendium
+
+_COMPENDIUM = [
+    {
+        "type": "biolink:SmallMolecule",
+        "ic": None,
+        "identifiers": [
+            {"i": "CHEBI:15422", "l": "ATP", "d": ["A nucleotide.", " "], "t": []},
+            {"i": "PUBCHEM.COMPOUND:5957", "l": "ATP", "d": ["A nucleotide."], "t": []},
+            {"i": "MESH:D000255", "l": "\xa0", "d": [], "t": []},
+        ],
+        "preferred_name": "ATP",
+        "taxa": [],
+    },
+    {
+        "type": "biolink:SmallMolecule",
+        "ic": 42.0,
+        "identifiers": [{"i": "CHEBI:27732", "l": "caffeine", "d": [], "t": []}],
+        "preferred_name": "caffeine",
+        "taxa": [],
+    },
+    {
+        "type": "biolink:Drug",
+        "ic": None,
+        "identifiers": [{"i": "RXCUI:1", "l": "", "d": [], "t": []}],
+        "preferred_name": "",
+        "taxa": [],
+    },
+]
+
+
+@pytest.fixture
+def exported_compendium(tmp_path):
+    compendium = tmp_path / "Chemical.txt"
+    compendium.write_text("".join(json.dumps(clique) + "\n" for clique in _COMPENDIUM))
+    parquet_files = {table: str(tmp_path / f"{table}.parquet") for table in ("Node", "Clique", "Edge")}
+    export_compendia_to_parquet(
+        str(compendium), parquet_files["Clique"], parquet_files["Edge"], str(tmp_path / "compendium.duckdb")
+    )
+    return str(compendium), parquet_files
+
+
+@pytest.mark.unit
+def test_generate_content_report_for_compendium(exported_compendium, tmp_path):
+    compendium, parquet_files = exported_compendium
+    report_path = str(tmp_path / "Chemical.json")
+    generate_content_report_for_compendium(
+        compendium, report_path, parquet_files["Node"], parquet_files["Clique"], parquet_files["Edge"]
+    )
+
+    with open(report_path) as report_file:
+        report = json.load(report_file)
+    assert report == {
+        "name": "Chemical",
+        "compendium_path": compendium,
+        "report_path": report_path,
+        "count_lines": 3,
+        "count_by_biolink_type": {"biolink:SmallMolecule": 2, "biolink:Drug": 1},
+        "count_by_prefix": {"CHEBI": 2, "PUBCHEM.COMPOUND": 1, "MESH": 1, "RXCUI": 1},
+        "counters": {
+            "clique_count": 3,
+            "cliques_by_id_count": {"1": 2, "3": 1},
+            # Blank labels and descriptions (including whitespace-only ones) aren't counted.
+            "cliques_by_label_count": {"0": 1, "1": 1, "2": 1},
+            "cliques_by_unique_label_count": {"0": 1, "1": 2},
+            "cliques_by_description_count": {"0": 2, "2": 1},
+            "cliques_by_unique_description_count": {"0": 2, "1": 1},
+        },
+    }
@@ -239,6 +239,68 @@ def test_empty_yaml_loads_zero_entries(tmp_path):
     assert fltr.should_suppress("mongolism", source="UMLS") is False
 
 
+# ---------------------------------------------------------------------------
+# Compiled matcher
+# ---------------------------------------------------------------------------
+
+COMPILED_ENTRIES = [
+    {"label": "mongolism", "reason": "whole", "action": "warn"},
+    {"pattern": r"manic.depress", "reason": "pattern"},
+    {"label": "retardation", "reason": "partial", "partial": True},
+    {"label": "mongolism", "reason": "shadowed whole"},
+    {"label": "retard", "reason": "scoped partial", "partial": True, "only_for_types": ["biolink:Disease"]},
+    {"pattern": r"^(a+)b\1$", "reason": "backreference"},
+    {"label": "a.b", "reason": "escaped partial", "partial": True},
+]
+
+
+def reference_match(fltr, label, node_types):
+    """The first matching entry from a plain loop over the entries, which the compiled matcher must agree with."""
+    for entry in fltr._entries:
+        if entry.only_for_types and (node_types is None or not any(t in entry.only_for_types for t in node_types)):
+            continue
+        if entry.matches(label.lower()):
+            return entry
+    return None
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "label",
+    [
+        "Mongolism",
+        "manic-depressive",
+        "mental retardation",
+        "retarded growth",
+        "aabaa",
+        "aabaaa",
+        "axb",
+        "a.b",
+        "nothing to see here",
+    ],
+)
+@pytest.mark.parametrize("node_types", [None, ["biolink:Disease"], ["biolink:Gene"]])
+def test_compiled_matcher_agrees_with_entry_loop(tmp_path, label, node_types):
+    fltr = make_filter(tmp_path, COMPILED_ENTRIES)
+    expected = reference_match(fltr, label, node_types)
+    assert fltr._find_match(label, fltr._scope(node_types)) is expected
+    expected_suppress = expected is not None and expected.action == "remove"
+    assert fltr.should_suppress(label, source="src", node_types=node_types) is expected_suppress
+
+
+@pytest.mark.unit
+def test_cached_matches_still_count_and_warn(tmp_path, caplog):
+    """The match cache must not change the counts or the warnings."""
+    fltr = make_filter(tmp_path, [{"label": "mongolism", "reason": "offensive"}])
+    with caplog.at_level(logging.WARNING):
+        for _ in range(3):
+            assert fltr.should_suppress("mongolism", source="UMLS") is True
+    assert fltr.filtered_count == 3
+    assert fltr.filtered_by_source == {"UMLS": 3}
+    assert sum("Obsolete label 'mongolism'" in r.message for r in caplog.records) == 3
+    assert fltr._find_match.cache_info().hits == 2
+
+
 # ---------------------------------------------------------------------------
 # Singleton behaviour
 # ---------------------------------------------------------------------------
@@ -0,0 +1,169 @@
+"""Unit tests for src/synonyms/label_index.py."""
+
+import os
+import random
+from collections import defaultdict
+
+import pytest
+
+from src.node import NodeFactory, SynonymFactory
+from src.predicates import HAS_EXACT_SYNONYM
+from src.synonyms.label_index import (
+    LABELS,
+    SYNONYMS,
+    IndexedLabels,
+    SortedStringIndex,
+    build_index,
+    index_filename,
+    open_fresh_index,
+)
+
+LABELS_TEXT = (
+    "NCBIGene:2\tA2M\n"
+    "NCBIGene:1\tA1BG\n"
+    "NCBIGene:3\n"
+    "NCBIGene:10\tNAT2\twith a tab\n"
+    "NCBIGene:1\talpha-1-B glycoprotein\n"
+    "NCBIGene:é\tnon-ASCII ümläut\n"
+)
+SYNONYMS_TEXT = (
+    "NCBIGene:1\toio:hasExactSynonym\tA1B\n"
+    "NCBIGene:1\toio:hasRelatedSynonym\tGAB\n"
+    "NCBIGene:2\ttoo-short\n"
+    "NCBIGene:2\toio:hasExactSynonym\tCPAMD5\n"
+)
+
+
+def write_prefix(tmp_path, prefix="NCBIGene", labels=LABELS_TEXT, synonyms=SYNONYMS_TEXT, indexed=True):
+    prefix_dir = tmp_path / prefix
+    prefix_dir.mkdir(parents=True)
+    labels_file = prefix_dir / "labels"
+    synonyms_file = prefix_dir / "synonyms"
+    labels_file.write_text(labels)
+    synonyms_file.write_text(synonyms)
+    if indexed:
+        build_index(str(labels_file), index_filename(str(labels_file)), LABELS)
+        build_index(str(synonyms_file), index_filename(str(synonyms_file)), SYNONYMS)
+    return labels_file, synonyms_file
+
+
+def make_synonym_factory(tmp_path):
+    sf = object.__new__(SynonymFactory)
+    sf.synonym_dir = tmp_path
+    sf.synonyms = {}
+    sf.common_synonyms = defaultdict(set)
+    return sf
+
+
+def make_node_factory(tmp_path):
+    nf = object.__new__(NodeFactory)
+    nf.label_dir = tmp_path
+    nf.extra_labels = {}
+    return nf
+
+
+@pytest.mark.unit
+def test_lookup_matches_input(tmp_path):
+    labels_file, _ = write_prefix(tmp_path, indexed=False)
+    count = build_index(str(labels_file), str(tmp_path / "labels.idx"), LABELS)
+    index = SortedStringIndex(str(tmp_path / "labels.idx"))
+
+    assert count == len(index) == 5
+    assert index.get("NCBIGene:1") == ["A1BG", "alpha-1-B glycoprotein"]
+    assert index.get("NCBIGene:3") == [""]
+    assert index.get("NCBIGene:10") == ["NAT2\twith a tab"]
+    assert index.get("NCBIGene:é") == ["non-ASCII ümläut"]
+    assert index.get("NCBIGene:4") is None
+    assert "NCBIGene:2" in index
+    assert "NCBIGene:0" not in index
+    assert list(index) == sorted(index)
+    index.close()
+
+
+@pytest.mark.unit
+def test_empty_input(tmp_path):
+    (tmp_path / "labels").write_text("")
+    assert build_index(str(tmp_path / "labels"), str(tmp_path / "labels.idx"), LABELS) == 0
+    index = SortedStringIndex(str(tmp_path / "labels.idx"))
+    assert len(index) == 0
+    assert index.get("NCBIGene:1") is None
+    index.close()
+
+
+@pytest.mark.unit
+def test_external_sort_is_stable(tmp_path):
+    """Spilling to many small chunks must give the same index, with per-CURIE values in input order."""
+    rng = random.Random(42)
+    lines = [f"X:{rng.randrange(50)}\tlabel {i}\n" for i in range(1000)]
+    (tmp_path / "labels").write_text("".join(lines))
+
+    build_index(str(tmp_path / "labels"), str(tmp_path / "labels.idx"), LABELS, chunk_size=7)
+    index = SortedStringIndex(str(tmp_path / "labels.idx"))
+
+    expected = defaultdict(list)
+    for line in lines:
+        curie, label = line.rstrip("\n").split("\t")
+        expected[curie].append(label)
+    assert len(index) == len(expected)
+    for curie, labels in expected.items():
+        assert index.get(curie) == labels
+    index.close()
+
+
+@pytest.mark.unit
+def test_bad_magic_is_rejected(tmp_path):
+    (tmp_path / "labels.idx").write_bytes(b"not an index at all")
+    with pytest.raises(ValueError):
+        SortedStringIndex(str(tmp_path / "labels.idx"))
+
+
+@pytest.mark.unit
+def test_stale_index_is_ignored(tmp_path):
+    labels_file, _ = write_prefix(tmp_path)
+    assert open_fresh_index(str(labels_file)) is not None
+
+    idx = index_filename(str(labels_file))
+    os.utime(idx, (0, 0))
+    assert open_fresh_index(str(labels_file)) is None
+
+
+@pytest.mark.unit
+def test_synonym_factory_index_matches_dict(tmp_path):
+    """load_synonyms() must return the same synonyms whether or not the prefix is indexed."""
+    write_prefix(tmp_path / "plain", indexed=False)
+    write_prefix(tmp_path / "indexed", indexed=True)
+    plain = make_synonym_factory(tmp_path / "plain")
+    indexed = make_synonym_factory(tmp_path / "indexed")
+    plain.load_synonyms("NCBIGene")
+    indexed.load_synonyms("NCBIGene")
+
+    assert isinstance(plain.synonyms["NCBIGene"], defaultdict)
+    assert not isinstance(indexed.synonyms["NCBIGene"], defaultdict)
+    for curie in ["NCBIGene:1", "NCBIGene:2", "NCBIGene:3", "NCBIGene:10", "NCBIGene:é", "NCBIGene:404"]:
+        assert indexed.synonyms["NCBIGene"][curie] == plain.synonyms["NCBIGene"][curie]
+    assert (HAS_EXACT_SYNONYM, "A1BG") in indexed.synonyms["NCBIGene"]["NCBIGene:1"]
+
+
+@pytest.mark.unit
+def test_synonym_factory_needs_every_file_indexed(tmp_path):
+    labels_file, synonyms_file = write_prefix(tmp_path, indexed=False)
+    build_index(str(labels_file), index_filename(str(labels_file)), LABELS)
+    sf = make_synonym_factory(tmp_path)
+    sf.load_synonyms("NCBIGene")
+    assert isinstance(sf.synonyms["NCBIGene"], defaultdict)
+
+
+@pytest.mark.unit
+def test_load_extra_labels_uses_index(tmp_path):
+    write_prefix(tmp_path)
+    nf = make_node_factory(tmp_path)
+    nf.load_extra_labels("NCBIGene")
+
+    labels = nf.extra_labels["NCBIGene"]
+    assert isinstance(labels, IndexedLabels)
+    # Last label wins, as with the dict.
+    assert labels["NCBIGene:1"] == "alpha-1-B glycoprotein"
+    assert labels["NCBIGene:3"] == ""
+    assert "NCBIGene:404" not in labels
+    with pytest.raises(KeyError):
+        labels["NCBIGene:404"]
@@ -0,0 +1,66 @@
+"""Unit tests for src/synonyms/synonymconflation.py."""
+
+import gzip
+import json
+
+import pytest
+
+from src.synonyms.synonymconflation import conflate_synonyms
+
+
+def synonym(curie, names, types, taxa=(), count=1):
+    return {
+        "curie": curie,
+        "preferred_name": names[0],
+        "names": names,
+        "types": types,
+        "taxa": list(taxa),
+        "clique_identifier_count": count,
+        "shortest_name_length": min(len(n) for n in names),
+    }
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("chunk_size", [1, 1000])
+def test_conflate_synonyms(tmp_path, chunk_size):
+    compendium = tmp_path / "compendium.txt"
+    compendium.write_text(
+        "\n".join(
+            json.dumps({"identifiers": [{"i": i} for i in ids]})
+            for ids in [["CHEBI:1", "PUBCHEM.COMPOUND:1"], ["RXCUI:2"], ["CHEBI:3"], ["CHEBI:9"]]
+        )
+        + "\n"
+    )
+    conflation = tmp_path / "conflation.txt"
+    conflation.write_text(json.dumps(["RXCUI:2", "CHEBI:1"]) + "\n" + json.dumps(["CHEBI:3"]) + "\n")
+    synonyms_gz = tmp_path / "synonyms.txt.gz"
+    with gzip.open(synonyms_gz, "wt") as f:
+        for record in [
+            synonym("CHEBI:1", ["water", "H2O"], ["SmallMolecule", "ChemicalEntity"], ["NCBITaxon:9606"], 2),
+            synonym("CHEBI:9", ["unrelated"], ["SmallMolecule"]),
+            synonym("RXCUI:2", ["aqua", "water"], ["Drug"], ["NCBITaxon:10090"]),
+            synonym("CHEBI:3", ["ice"], ["SmallMolecule"]),
+        ]:
+            f.write(json.dumps(record) + "\n")
+
+    output_gz = tmp_path / "output.txt.gz"
+    conflate_synonyms([str(synonyms_gz)], [str(compendium)], [str(conflation)], str(output_gz), chunk_size=chunk_size)
+
+    with gzip.open(output_gz, "rt") as f:
+        output = [json.loads(line) for line in f]
+
+    # Unconflated synonyms come first, as they were, followed by one record per conflation in the order the
+    # conflations were first seen in the synonym files.
+    assert output[0] == synonym("CHEBI:9", ["unrelated"], ["SmallMolecule"])
+    assert [record["curie"] for record in output[1:]] == ["RXCUI:2", "CHEBI:3"]
+    drug = output[1]
+    assert drug["preferred_name"] == "aqua"
+    assert drug["names"] == ["aqua", "water", "H2O"]
+    assert drug["types"] == ["Drug", "SmallMolecule", "ChemicalEntity"]
+    assert drug["taxa"] == ["NCBITaxon:9606", "NCBITaxon:10090"]
+    assert drug["taxon_specific"] is True
+    assert drug["clique_identifier_count"] == 3
+    assert drug["shortest_name_length"] == 3
+    assert drug["curie_suffix"] == 2
+    assert output[2]["names"] == ["ice"]
+    assert output[2]["taxon_specific"] is False
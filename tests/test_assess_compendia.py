@@ -0,0 +1,87 @@
+"""Tests for the compendium assessments in src/assess_compendia.py, over Parquet files exported from small compendia."""
+
+import json
+
+import pytest
+
+from src.assess_compendia import assess, assess_completeness
+from src.exporters.duckdb_exporters import export_compendia_to_parquet
+
+
+def _clique(*curies, biolink_type="biolink:SmallMolecule"):
+    return {
+        "type": biolink_type,
+        "ic": None,
+        "identifiers": [{"i": curie, "l": "", "d": [], "t": []} for curie in curies],
+        "preferred_name": "",
+        "taxa": [],
+    }
+
+
+def export_compendium(tmp_path, name, cliques):
+    """Write a compendium and export it, returning the paths of its Clique and Edge Parquet files."""
+    compendium = tmp_path / f"{name}.txt"
+    compendium.write_text("".join(json.dumps(clique) + "\n" for clique in cliques))
+    parquet_dir = tmp_path / "parquet" / f"filename={name}"
+    parquet_dir.mkdir(parents=True)
+    clique_parquet, edge_parquet = str(parquet_dir / "Clique.parquet"), str(parquet_dir / "Edge.parquet")
+    export_compendia_to_parquet(str(compendium), clique_parquet, edge_parquet, str(tmp_path / f"{name}.duckdb"))
+    return clique_parquet, edge_parquet
+
+
+@pytest.mark.unit
+def test_assess_completeness(tmp_path):
+    """Identifiers from every ids file that aren't in any of the compendia are reported once each, sorted."""
+    _, small_molecule_edges = export_compendium(tmp_path, "SmallMolecule", [_clique("CHEBI:1", "MESH:D1")])
+    _, drug_edges = export_compendium(tmp_path, "Drug", [_clique("RXCUI:1", biolink_type="biolink:Drug")])
+
+    ids_dir = tmp_path / "ids"
+    ids_dir.mkdir()
+    (ids_dir / "CHEBI").write_text("CHEBI:1\tbiolink:SmallMolecule\nCHEBI:3\tbiolink:SmallMolecule\n")
+    (ids_dir / "MESH").write_text("MESH:D1\nMESH:D2\textra\tcolumns\n\n")
+    (ids_dir / "RXNORM").write_text("RXCUI:1\tbiolink:Drug\nCHEBI:3\tbiolink:Drug\n")
+    (ids_dir / "EMPTY").write_text("")
+
+    report = tmp_path / "completeness.txt"
+    assess_completeness(str(ids_dir), [small_molecule_edges, drug_edges], str(report))
+    assert report.read_text() == "Missing identifiers: 2\nCHEBI:3\nMESH:D2\n"
+
+    assess_completeness(str(ids_dir), [small_molecule_edges], str(report), memory_limit_mb=100)
+    assert report.read_text() == "Missing identifiers: 3\nCHEBI:3\nMESH:D2\nRXCUI:1\n"
+
+
+@pytest.mark.unit
+def test_assess(tmp_path):
+    clique_parquet, edge_parquet = export_compendium(
+        tmp_path,
+        "SmallMolecule",
+        [
+            _clique("CHEBI:1", "MESH:D1", "MESH:D2"),
+            _clique("CHEBI:2", "mesh:D3", "MESH:D4"),
+            _clique("CHEBI:3"),
+            _clique("CHEBI:4"),
+            _clique("CHEBI:5"),
+            _clique("NOPREFIX"),
+        ],
+    )
+    report = tmp_path / "SmallMolecule.txt"
+    assess(clique_parquet, edge_parquet, str(report))
+
+    lines = report.read_text().split("\n")
+    assert lines[:8] == [
+        "6 clusters",
+        "Max cluster size: 3",
+        "",
+        "Cluster Size Distribution",
+        "1\t4",
+        "3\t2",
+        "",
+        "Cluster Type Distribution",
+    ]
+    # The order of the pairs in each frozenset depends on hashing, so compare them as sets.
+    cluster_types = {line.rsplit("\t", 1)[1]: eval(line.rsplit("\t", 1)[0]) for line in lines[8:] if line}
+    assert cluster_types == {
+        "1": frozenset({(None, 1)}),
+        "3": frozenset({("CHEBI", 1)}),
+        "2": frozenset({("CHEBI", 1), ("MESH", 2)}),
+    }
@@ -0,0 +1,154 @@
+"""Unit tests for AsyncThrottledRequester, against a stub JSON API on localhost.
+
+The stub answers every request with the query (or form) parameters it was sent, after failing the first
+`server.failures` requests with HTTP 503, and records when each request arrived and how many were in flight at once.
+"""
+
+import asyncio
+import json
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.async_requester import AsyncThrottledRequester, ResponseCache, TokenBucket
+
+
+class StubAPIHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def respond(self, params):
+        server = self.server
+        with server.lock:
+            server.arrivals.append(time.monotonic())
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            fail = server.failures > 0
+            server.failures -= fail
+        time.sleep(server.delay)
+        with server.lock:
+            server.in_flight -= 1
+
+        if fail:
+            self.send_response(503)
+            self.end_headers()
+            return
+        body = json.dumps(params).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.respond(urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query))
+
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        self.respond(urllib.parse.parse_qs(self.rfile.read(length).decode("utf-8")))
+
+
+@pytest.fixture
+def stub_api():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubAPIHandler)
+    server.lock = threading.Lock()
+    server.arrivals = []
+    server.in_flight = 0
+    server.max_in_flight = 0
+    server.failures = 0
+    server.delay = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/", server
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join(timeout=5)
+
+
+@pytest.mark.unit
+def test_token_bucket_spaces_out_events():
+    async def acquire_all(bucket, count):
+        start = time.monotonic()
+        for _ in range(count):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    # The first token is there already; the other four take 1/rate seconds each.
+    assert 0.2 <= asyncio.run(acquire_all(TokenBucket(20), 5)) < 1
+    # A bucket with capacity 5 allows a burst of five at once.
+    assert asyncio.run(acquire_all(TokenBucket(20, capacity=5), 5)) < 0.15
+
+
+@pytest.mark.unit
+def test_requests_are_rate_limited_and_bounded(stub_api):
+    url, server = stub_api
+    server.delay = 0.2
+
+    async def run():
+        requester = AsyncThrottledRequester(rate=50, max_concurrency=3)
+        return await requester.request_all_json((url, {"id": i}, "GET") for i in range(9))
+
+    results = asyncio.run(run())
+    assert results == [{"id": [str(i)]} for i in range(9)]
+    # Requests overlap, but never more than three at once, and they are started 1/50s apart.
+    assert server.max_in_flight == 3
+    assert server.arrivals[-1] - server.arrivals[0] >= 0.8 * 8 / 50
+
+
+@pytest.mark.unit
+def test_failures_are_retried_with_backoff(stub_api):
+    url, server = stub_api
+    server.failures = 2
+
+    async def run(max_attempts):
+        requester = AsyncThrottledRequester(rate=100, max_attempts=max_attempts, backoff_base=0.1)
+        return await requester.request_json(url, [("id", "1"), ("id", "2")], method="POST")
+
+    assert asyncio.run(run(max_attempts=3)) == {"id": ["1", "2"]}
+    # Backing off 0.1s, then 0.2s.
+    assert server.arrivals[2] - server.arrivals[0] >= 0.3
+
+    server.failures = 3
+    with pytest.raises(RuntimeError, match="failed after 3 attempts: HTTP 503"):
+        asyncio.run(run(max_attempts=3))
+
+
+@pytest.mark.unit
+def test_responses_are_cached_on_disk(stub_api, tmp_path):
+    url, server = stub_api
+
+    async def run(params):
+        requester = AsyncThrottledRequester(rate=100, cache_dir=str(tmp_path / "cache"))
+        result = await requester.request_json(url, params)
+        return result, requester.cache_hits
+
+    assert asyncio.run(run({"id": "1", "api_key": "first"})) == ({"id": ["1"], "api_key": ["first"]}, 0)
+    assert len(server.arrivals) == 1
+
+    # A re-run -- even with a different API key, which isn't part of the cache key -- isn't sent again.
+    assert asyncio.run(run({"id": "1", "api_key": "second"})) == ({"id": ["1"], "api_key": ["first"]}, 1)
+    assert asyncio.run(run({"id": "2"}))[1] == 0
+    assert len(server.arrivals) == 2
+
+    key = ResponseCache.key("GET", url, [("id", "1")])
+    assert ResponseCache(str(tmp_path / "cache")).get(key) == {"id": ["1"], "api_key": ["first"]}
+
+
+@pytest.mark.unit
+def test_error_responses_are_not_cached(stub_api, tmp_path):
+    url, server = stub_api
+
+    async def run():
+        requester = AsyncThrottledRequester(rate=100, cache_dir=str(tmp_path / "cache"))
+        # The stub echoes its parameters, so this is a 200 response with an ERROR key, as E-utilities can send.
+        result = await requester.request_json(url, {"ERROR": "Search Backend failed"})
+        return result, requester.cache_hits
+
+    assert asyncio.run(run()) == ({"ERROR": ["Search Backend failed"]}, 0)
+    assert asyncio.run(run()) == ({"ERROR": ["Search Backend failed"]}, 0)
+    assert len(server.arrivals) == 2
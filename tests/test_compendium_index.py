@@ -0,0 +1,83 @@
+"""Unit tests for src/compendium_index.py: the CURIE → clique indexes the conflation builders look CURIEs up in."""
+
+import json
+import os
+
+import pytest
+
+from src.compendium_index import (
+    Clique,
+    CliqueRef,
+    CompendiumIndex,
+    build_compendium_index,
+    compendium_index_filename,
+)
+from src.createcompendia.drugchemical import rxcui_leader
+
+pytestmark = pytest.mark.unit
+
+
+def _write_compendium(path, cliques):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as outf:
+        for clique_type, identifiers in cliques:
+            outf.write(json.dumps({"type": clique_type, "identifiers": [{"i": i} for i in identifiers]}) + "\n")
+    return str(path)
+
+
+def test_index_lives_next_to_the_compendia_directory(tmp_path):
+    compendium = str(tmp_path / "babel_outputs" / "compendia" / "Drug.txt")
+    assert compendium_index_filename(compendium) == str(
+        tmp_path / "babel_outputs" / "compendium_index" / "Drug.txt.idx"
+    )
+
+
+def test_lookups_match_the_dicts_they_replace(tmp_path):
+    compendia = tmp_path / "babel_outputs" / "compendia"
+    drug = _write_compendium(
+        compendia / "Drug.txt",
+        [("biolink:Drug", ["CHEBI:1", "RXCUI:10", "MESH:D1"]), ("biolink:Drug", ["RXCUI:11"])],
+    )
+    chemical = _write_compendium(
+        compendia / "ChemicalEntity.txt",
+        [("biolink:SmallMolecule", ["CHEBI:2", "RXCUI:20"]), ("biolink:ChemicalEntity", ["UNII:3"])],
+    )
+    assert build_compendium_index(drug) == 4
+    assert build_compendium_index(chemical) == 3
+    assert os.path.exists(compendium_index_filename(drug))
+
+    with CompendiumIndex([drug, chemical]) as index:
+        assert index.get("MESH:D1") == CliqueRef("CHEBI:1", "biolink:Drug", "Drug.txt")
+        assert index.get("RXCUI:20") == CliqueRef("CHEBI:2", "biolink:SmallMolecule", "ChemicalEntity.txt")
+        assert index.get("NOPE:1") is None
+        assert index.get_clique("CHEBI:1") == Clique(
+            "CHEBI:1", "biolink:Drug", "Drug.txt", ["CHEBI:1", "RXCUI:10", "MESH:D1"]
+        )
+        # Only leaders have their cliques recorded.
+        assert index.get_clique("RXCUI:10") is None
+        assert "UNII:3" in index and "NOPE:1" not in index
+        assert list(index) == sorted(["CHEBI:1", "RXCUI:10", "MESH:D1", "RXCUI:11", "CHEBI:2", "RXCUI:20", "UNII:3"])
+
+        preferred = index.preferred_curies()
+        assert preferred["RXCUI:10"] == "CHEBI:1"
+        assert len(preferred) == 7
+        with pytest.raises(KeyError):
+            preferred["NOPE:1"]
+
+        assert rxcui_leader(index, "RXCUI:11") == "RXCUI:11"
+        assert rxcui_leader(index, "MESH:D1") is None
+
+
+def test_later_compendia_win_and_missing_indexes_are_built(tmp_path):
+    compendia = tmp_path / "compendia"
+    first = _write_compendium(compendia / "First.txt", [("biolink:Gene", ["A:1", "B:1"])])
+    second = _write_compendium(compendia / "Second.txt", [("biolink:Protein", ["C:1", "B:1"])])
+    # Only the first compendium has an index, and it is then rewritten, so both are built on the fly.
+    build_compendium_index(first)
+    first_index_filename = compendium_index_filename(first)
+    os.utime(first_index_filename, (os.path.getmtime(first) - 60,) * 2)
+
+    with CompendiumIndex([first, second]) as index:
+        assert index.get("B:1") == CliqueRef("C:1", "biolink:Protein", "Second.txt")
+        assert index.get("A:1") == CliqueRef("A:1", "biolink:Gene", "First.txt")
+        assert not os.path.exists(compendium_index_filename(second))
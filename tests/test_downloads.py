@@ -0,0 +1,255 @@
+"""Unit tests for the segmented, resumable download engine in src/downloads.py.
+
+They run against a throwaway HTTP server on localhost that serves tmp_path/'remote' with support for single
+byte-range requests (which Python's SimpleHTTPRequestHandler lacks), and which can be told to ignore Range headers
+or to drop the connection partway through a response.
+"""
+
+import functools
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import src.downloads as downloads
+from src.downloads import DownloadJob, VerificationError, download_file, download_files
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """Serve files with an ETag, honouring `Range: bytes=start-[end]` and `If-Range` unless told otherwise."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, "rb") as f:
+            content = f.read()
+        etag = f'"{hashlib.md5(content).hexdigest()}"'
+        server.requests.append(self.headers.get("Range"))
+
+        start, end = 0, len(content) - 1
+        range_match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range") or "")
+        if_range = self.headers.get("If-Range")
+        partial = server.ranges and range_match and (if_range is None or if_range == etag)
+        if partial:
+            start = int(range_match.group(1))
+            end = int(range_match.group(2)) if range_match.group(2) else end
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(content)}")
+        else:
+            self.send_response(200)
+        if server.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+
+        body = content[start : end + 1]
+        if server.drop_after is not None:
+            # Send part of the body, then drop the connection, once.
+            body, server.drop_after = body[: server.drop_after], None
+            self.close_connection = True
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def http_server(tmp_path):
+    """Serve tmp_path/'remote' over HTTP on localhost; yields (base_url, remote_dir, server)."""
+    remote_dir = tmp_path / "remote"
+    remote_dir.mkdir()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(RangeRequestHandler, directory=str(remote_dir)))
+    server.requests = []
+    server.ranges = True
+    server.drop_after = None
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/", remote_dir, server
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join(timeout=5)
+
+
+@pytest.fixture
+def small_segments(monkeypatch):
+    """Make segments small enough that a test file is split into several, and skip the sleep between attempts."""
+    monkeypatch.setattr(downloads, "MIN_SEGMENT_BYTES", 1000)
+    monkeypatch.setattr(downloads, "CHUNK_BYTES", 256)
+    monkeypatch.setattr(downloads.time, "sleep", lambda seconds: None)
+
+
+def content_of_size(size):
+    return bytes(i * 7 % 251 for i in range(size))
+
+
+@pytest.mark.unit
+def test_download_in_parallel_segments(http_server, tmp_path, small_segments):
+    base_url, remote_dir, server = http_server
+    content = content_of_size(10_000)
+    (remote_dir / "file.bin").write_bytes(content)
+
+    local = tmp_path / "local" / "file.bin"
+    assert download_file(base_url + "file.bin", str(local), md5=hashlib.md5(content).hexdigest(), segments=4)
+
+    assert local.read_bytes() == content
+    # The first request is an ordinary GET, which is cut short once it has the first segment.
+    assert sorted(server.requests, key=str) == [None, "bytes=2500-4999", "bytes=5000-7499", "bytes=7500-9999"]
+    assert os.listdir(local.parent) == ["file.bin"]
+
+
+@pytest.mark.unit
+def test_download_without_range_support_uses_a_single_stream(http_server, tmp_path, small_segments):
+    base_url, remote_dir, server = http_server
+    server.ranges = False
+    content = content_of_size(10_000)
+    (remote_dir / "file.bin").write_bytes(content)
+
+    local = tmp_path / "file.bin"
+    download_file(base_url + "file.bin", str(local), md5=hashlib.md5(content).hexdigest())
+
+    assert local.read_bytes() == content
+    assert server.requests == [None]
+
+
+@pytest.mark.unit
+def test_a_dropped_connection_resumes_where_it_stopped(http_server, tmp_path, small_segments):
+    base_url, remote_dir, server = http_server
+    server.ranges = False
+    server.drop_after = 3000
+    content = content_of_size(10_000)
+    (remote_dir / "file.bin").write_bytes(content)
+
+    # The server drops the connection, and can't resume it: the next attempt starts again.
+    local = tmp_path / "file.bin"
+    download_file(base_url + "file.bin", str(local), attempts=2)
+    assert local.read_bytes() == content
+    assert server.requests == [None, None]
+
+    # With Range support, the second attempt asks only for what the first didn't get.
+    server.ranges = True
+    server.drop_after = 3000
+    server.requests.clear()
+    local.unlink()
+    download_file(base_url + "file.bin", str(local), segments=1, attempts=2)
+    assert local.read_bytes() == content
+    assert server.requests == [None, "bytes=3000-"]
+
+
+@pytest.mark.unit
+def test_a_partial_download_of_a_since_changed_file_is_discarded(http_server, tmp_path, small_segments):
+    base_url, remote_dir, server = http_server
+    server.drop_after = 3000
+    (remote_dir / "file.bin").write_bytes(content_of_size(10_000))
+
+    local = tmp_path / "file.bin"
+    with pytest.raises(downloads.DownloadError):
+        download_file(base_url + "file.bin", str(local), segments=1, attempts=1)
+    state = json.loads((tmp_path / "file.bin.download.json").read_text())
+    assert state["ranges"] == [[0, 10_000, 3000]]
+
+    # The server's copy changes before we try again, so If-Range gets us the whole of the new one.
+    new_content = content_of_size(12_000)[::-1]
+    (remote_dir / "file.bin").write_bytes(new_content)
+    server.requests.clear()
+    download_file(base_url + "file.bin", str(local), segments=1)
+    assert local.read_bytes() == new_content
+    assert server.requests == ["bytes=3000-", None]
+
+
+@pytest.mark.unit
+def test_an_md5_mismatch_is_retried_and_then_raised(http_server, tmp_path, small_segments):
+    base_url, remote_dir, server = http_server
+    (remote_dir / "file.bin").write_bytes(content_of_size(10_000))
+
+    local = tmp_path / "file.bin"
+    with pytest.raises(VerificationError, match="failed MD5 verification"):
+        download_file(base_url + "file.bin", str(local), md5="0" * 32, attempts=2)
+    assert len(server.requests) == 2 * downloads.DEFAULT_SEGMENTS
+    assert sorted(os.listdir(tmp_path)) == ["remote"]
+
+
+@pytest.mark.unit
+def test_gzip_verification(http_server, tmp_path, small_segments):
+    base_url, remote_dir, server = http_server
+    # Two Gzip members, as `cat a.gz b.gz` would produce, is still a valid Gzip file.
+    valid = gzip.compress(content_of_size(20_000)) + gzip.compress(b"second member")
+    (remote_dir / "valid.gz").write_bytes(valid)
+    (remote_dir / "truncated.gz").write_bytes(valid[:-10])
+    (remote_dir / "corrupt.gz").write_bytes(valid[:100] + b"\0" * 200 + valid[300:])
+
+    download_file(base_url + "valid.gz", str(tmp_path / "valid.gz"), verify_gzip=True, segments=1)
+    assert (tmp_path / "valid.gz").read_bytes() == valid
+    with pytest.raises(VerificationError, match="not a valid Gzip file"):
+        download_file(base_url + "truncated.gz", str(tmp_path / "truncated.gz"), verify_gzip=True, attempts=1)
+    with pytest.raises(VerificationError, match="not a valid Gzip file"):
+        download_file(base_url + "corrupt.gz", str(tmp_path / "corrupt.gz"), verify_gzip=True, attempts=1)
+    assert not (tmp_path / "truncated.gz").exists()
+    assert not (tmp_path / "corrupt.gz").exists()
+
+
+@pytest.mark.unit
+def test_keep_existing(http_server, tmp_path, small_segments):
+    base_url, remote_dir, server = http_server
+    (remote_dir / "file.bin").write_bytes(content_of_size(10_000))
+
+    same_size = tmp_path / "same_size.bin"
+    same_size.write_bytes(b"x" * 10_000)
+    assert not download_file(base_url + "file.bin", str(same_size), keep_existing=True)
+    assert same_size.read_bytes() == b"x" * 10_000
+
+    different_size = tmp_path / "different_size.bin"
+    different_size.write_bytes(b"x" * 10)
+    assert download_file(base_url + "file.bin", str(different_size), keep_existing=True)
+    assert different_size.read_bytes() == content_of_size(10_000)
+
+
+@pytest.mark.unit
+def test_keep_existing_only_keeps_a_file_that_passes_verification(http_server, tmp_path, small_segments):
+    base_url, remote_dir, server = http_server
+    valid = gzip.compress(content_of_size(20_000))
+    (remote_dir / "file.gz").write_bytes(valid)
+
+    # The same size as the server's copy, but not a valid Gzip file: it is downloaded again.
+    corrupt = tmp_path / "corrupt.gz"
+    corrupt.write_bytes(valid[:100] + b"\0" * 200 + valid[300:])
+    assert download_file(base_url + "file.gz", str(corrupt), verify_gzip=True, keep_existing=True)
+    assert corrupt.read_bytes() == valid
+
+    # A valid copy with the expected checksum is kept.
+    server.requests.clear()
+    assert not download_file(
+        base_url + "file.gz", str(corrupt), md5=hashlib.md5(valid).hexdigest(), verify_gzip=True, keep_existing=True
+    )
+    assert server.requests == [None]
+
+
+@pytest.mark.unit
+def test_download_files(http_server, tmp_path, small_segments):
+    base_url, remote_dir, server = http_server
+    contents = {f"file{i}.bin": content_of_size(500 * i + 1) for i in range(10)}
+    for name, content in contents.items():
+        (remote_dir / name).write_bytes(content)
+
+    jobs = [
+        DownloadJob(base_url + name, str(tmp_path / "local" / name), md5=hashlib.md5(content).hexdigest())
+        for name, content in contents.items()
+    ]
+    assert download_files(jobs, workers=3) == 10
+    for name, content in contents.items():
+        assert (tmp_path / "local" / name).read_bytes() == content
+
+    jobs.append(DownloadJob(base_url + "missing.bin", str(tmp_path / "local" / "missing.bin")))
+    with pytest.raises(RuntimeError, match="Failed to download .*missing.bin: HTTP Error 404"):
+        download_files(jobs, workers=3)
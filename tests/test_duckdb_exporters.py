@@ -5,11 +5,13 @@ import duckdb
 import pytest
 
 from src.exporters.duckdb_exporters import (
+    CompendiumParquetWriter,
     _metadata_subject_filename,
     export_compendia_to_parquet,
     export_conflation_to_parquet,
     export_intermediates_to_parquet,
     log_duckdb_settings_on_error,
+    merge_compendium_parquet_parts,
 )
 from tests.conftest import CONFLATION_FIXTURE_ROWS
 
@@ -79,6 +81,122 @@ def test_export_compendia_to_parquet_edge_columns(compendium_file, tmp_path):
     assert columns == {"clique_leader", "curie", "conflation", "clique_leader_prefix", "curie_prefix", "biolink_type"}
 
 
+def _write_prewritten_parquet(records, parquet_dir, parts_dir, batch_cliques):
+    """Write records through CompendiumParquetWriter the way write_compendium() does."""
+    os.makedirs(parts_dir)
+    writer = CompendiumParquetWriter(str(parts_dir), "000000-", batch_cliques=batch_cliques)
+    for record in records:
+        writer.add(record)
+    writer.close()
+    merge_compendium_parquet_parts(str(parts_dir), str(parquet_dir))
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("batch_cliques", [1, 100])
+def test_compendium_parquet_writer_matches_export(compendium_file, tmp_path, batch_cliques):
+    """The Parquet files written while writing a compendium must match the ones exported from it."""
+    # Descriptions and taxa with characters that need escaping in lists, plus a missing label.
+    records = _COMPENDIUM_FIXTURE + [
+        {
+            "type": "biolink:Gene",
+            "ic": 12.5,
+            "identifiers": [
+                {"i": "NCBIGene:1", "l": "Gene ONE", "d": ['a "quoted", listed [thing]', "b"], "t": ["NCBITaxon:9606"]},
+                {"i": "HGNC:5", "d": [], "t": []},
+            ],
+            "preferred_name": None,
+            "taxa": ["NCBITaxon:9606"],
+        },
+    ]
+    with open(compendium_file, "w") as fout:
+        for record in records:
+            fout.write(json.dumps(record) + "\n")
+
+    exported_dir = tmp_path / "exported"
+    export_compendia_to_parquet(
+        compendium_file,
+        str(exported_dir / "Clique.parquet"),
+        str(exported_dir / "Edge.parquet"),
+        str(tmp_path / "compendium.duckdb"),
+    )
+    prewritten_dir = tmp_path / "prewritten"
+    _write_prewritten_parquet(records, prewritten_dir, tmp_path / "parts", batch_cliques)
+
+    for table in ("Node", "Clique", "Edge"):
+        exported = duckdb.sql(f"SELECT * FROM read_parquet('{exported_dir / table}.parquet')")
+        prewritten = duckdb.sql(f"SELECT * FROM read_parquet('{prewritten_dir / table}.parquet')")
+        assert prewritten.types == exported.types, table
+        # The JSON export doesn't keep the compendium order, so compare the rows as sorted lists.
+        assert sorted(prewritten.fetchall(), key=repr) == sorted(exported.fetchall(), key=repr), table
+
+
+@pytest.mark.unit
+def test_merge_compendium_parquet_parts_in_shard_order(tmp_path):
+    """Parts are merged in part prefix order (the shard index), whatever order the shards finished in."""
+    records = [
+        {"type": "biolink:Gene", "ic": None, "identifiers": [{"i": f"NCBIGene:{i}", "l": "", "d": [], "t": []}]}
+        for i in range(6)
+    ]
+    parts_dir = tmp_path / "parts"
+    parts_dir.mkdir()
+    for shard in (1, 0):
+        writer = CompendiumParquetWriter(str(parts_dir), f"{shard:06d}-", batch_cliques=2)
+        for record in records[shard * 3 : shard * 3 + 3]:
+            writer.add(record)
+        writer.close()
+    merge_compendium_parquet_parts(str(parts_dir), str(tmp_path))
+
+    leaders = duckdb.sql(f"SELECT clique_leader FROM read_parquet('{tmp_path / 'Clique.parquet'}')").fetchall()
+    assert leaders == [(f"NCBIGene:{i}",) for i in range(6)]
+
+    # With no parts at all, the tables are still written, empty.
+    merge_compendium_parquet_parts(str(tmp_path / "empty"), str(tmp_path / "empty"))
+    assert duckdb.sql(f"SELECT COUNT(*) FROM read_parquet('{tmp_path / 'empty' / 'Edge.parquet'}')").fetchone() == (0,)
+
+
+@pytest.mark.unit
+def test_export_compendia_to_parquet_uses_prewritten_parquet(compendium_file, tmp_path):
+    prewritten_dir = tmp_path / "prewritten"
+    _write_prewritten_parquet(_COMPENDIUM_FIXTURE, prewritten_dir, tmp_path / "parts", 100)
+
+    output_dir = tmp_path / "output"
+    duckdb_file = str(tmp_path / "compendium.duckdb")
+    export_compendia_to_parquet(
+        compendium_file,
+        str(output_dir / "Clique.parquet"),
+        str(output_dir / "Edge.parquet"),
+        duckdb_file,
+        prewritten_parquet_dir=str(prewritten_dir),
+    )
+
+    for table in ("Node", "Clique", "Edge"):
+        with (
+            open(output_dir / f"{table}.parquet", "rb") as output,
+            open(prewritten_dir / f"{table}.parquet", "rb") as f,
+        ):
+            assert output.read() == f.read()
+    # The DuckDB file has views over the copied Parquet files.
+    with duckdb.connect(duckdb_file, read_only=True) as db:
+        assert db.execute("SELECT COUNT(*) FROM Edge").fetchone() == (3,)
+
+
+@pytest.mark.unit
+def test_export_compendia_to_parquet_rejects_mismatched_prewritten_parquet(compendium_file, tmp_path):
+    prewritten_dir = tmp_path / "prewritten"
+    _write_prewritten_parquet(_COMPENDIUM_FIXTURE[:1], prewritten_dir, tmp_path / "parts", 100)
+    # The Parquet files must be at least as new as the compendium to be used at all.
+    os.utime(compendium_file, (0, 0))
+
+    with pytest.raises(RuntimeError, match="don't match"):
+        export_compendia_to_parquet(
+            compendium_file,
+            str(tmp_path / "output" / "Clique.parquet"),
+            str(tmp_path / "output" / "Edge.parquet"),
+            str(tmp_path / "compendium.duckdb"),
+            prewritten_parquet_dir=str(prewritten_dir),
+        )
+
+
 @pytest.mark.unit
 def test_log_duckdb_settings_on_error_reraises_and_logs(caplog):
     """On failure the helper should log the operation name and effective settings, then re-raise."""
@@ -0,0 +1,82 @@
+"""Unit tests for src/eutil.py's MeSH-to-NCBITaxon lookup, against a stub E-utilities elink on localhost."""
+
+import json
+import os
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import src.eutil as eutil
+
+# MeSH UID -> the NCBITaxon ids elink links it to.
+TAXA = {"68004926": [562], "67000001": [9606, 10090], "68000001": []}
+
+
+class StubElinkHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        params = urllib.parse.parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8"))
+        self.server.batches.append(params["id"])
+        linksets = []
+        for uid in params["id"]:
+            linkset = {"dbfrom": "mesh", "ids": [int(uid)]}
+            if TAXA.get(uid):
+                linkset["linksetdbs"] = [{"dbto": "taxonomy", "linkname": "mesh_taxonomy", "links": TAXA[uid]}]
+            linksets.append(linkset)
+        body = json.dumps({"header": {}, "linksets": linksets}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def stub_eutils():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubElinkHandler)
+    server.batches = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/", server
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join(timeout=5)
+
+
+@pytest.mark.unit
+def test_lookup(stub_eutils, tmp_path, monkeypatch):
+    base_url, server = stub_eutils
+    monkeypatch.setattr(eutil, "ELINK_BATCH_SIZE", 2)
+    monkeypatch.delenv("EUTILS_API_KEY", raising=False)
+    meshes = ["MESH:D004926", "MESH:C000001", "MESH:D000001", "MESH:Q000532"]
+
+    expected = {"MESH:D004926": "NCBITaxon:562"}
+    assert eutil.lookup(meshes, cache_dir=str(tmp_path), eutils_base=base_url) == expected
+    # The Q term isn't looked up, and the rest go two to a request.
+    assert sorted(server.batches) == [["68000001"], ["68004926", "67000001"]]
+
+    # Running it again is answered from the cache.
+    assert eutil.lookup(meshes, cache_dir=str(tmp_path), eutils_base=base_url) == expected
+    assert len(server.batches) == 2
+
+
+@pytest.mark.unit
+def test_lookup_caches_per_release_by_default(stub_eutils, tmp_path, monkeypatch):
+    base_url, server = stub_eutils
+    monkeypatch.delenv("EUTILS_API_KEY", raising=False)
+    config = {"download_directory": str(tmp_path), "release_name": "2026jan01"}
+    monkeypatch.setattr(eutil, "get_config", lambda: config)
+
+    assert eutil.lookup(["MESH:D004926"], eutils_base=base_url) == {"MESH:D004926": "NCBITaxon:562"}
+    assert os.listdir(tmp_path / "eutils") == ["2026jan01"]
+
+    # A later release doesn't read the earlier release's cache.
+    config["release_name"] = "2026feb01"
+    eutil.lookup(["MESH:D004926"], eutils_base=base_url)
+    assert len(server.batches) == 2
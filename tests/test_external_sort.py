@@ -0,0 +1,32 @@
+"""Unit tests for src/external_sort.py."""
+
+import os
+import random
+
+import pytest
+
+from src.external_sort import ExternalSorter
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("chunk_size", [3, 1000])
+def test_sort_is_stable(tmp_path, chunk_size):
+    rng = random.Random(7)
+    records = [(rng.randrange(20), f"value {i}") for i in range(200)]
+
+    sorter = ExternalSorter(str(tmp_path), chunk_size=chunk_size, key_type=int)
+    for key, value in records:
+        sorter.add(key, value)
+
+    assert len(sorter) == len(records)
+    assert list(sorter.sorted()) == sorted(records, key=lambda record: record[0])
+    # Chunk files are removed as they are read back.
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.unit
+def test_string_keys_and_values_with_tabs(tmp_path):
+    sorter = ExternalSorter(str(tmp_path), chunk_size=2)
+    for key, value in [("b", "x\ty"), ("a", ""), ("é", "z"), ("a", "second")]:
+        sorter.add(key, value)
+    assert list(sorter.sorted()) == [("a", ""), ("a", "second"), ("b", "x\ty"), ("é", "z")]
@@ -1,5 +1,7 @@
 """glom is a tool that looks at list of sets of values and combines them together if they share members"""
 
+import random
+
 import pytest
 
 from src.babel_utils import glom
@@ -64,3 +66,77 @@ def test_bigger_sets():
         assert False
     except ValueError:
         assert True
+
+
+def _reference_glom(conc_set, newgroups, unique_prefixes=(), close=None):
+    """The original set-rebuilding merge, kept here as an oracle for the union-find engine."""
+    close = close or {}
+    for group in newgroups:
+        existing_sets = [conc_set[x] for x in group if x in conc_set]
+        newset = set().union(*existing_sets) | set(group)
+        if any(len({e for e in newset if e.split(":")[0] == up}) > 1 for up in unique_prefixes):
+            continue
+        if any(
+            cd in newset
+            for cpref, closedict in close.items()
+            for e in newset
+            if e.startswith(cpref)
+            for cd in closedict.get(e, ())
+        ):
+            continue
+        for element in newset:
+            conc_set[element] = newset
+
+
+@pytest.mark.unit
+def test_unique_prefix_rejects_the_merging_pair_only():
+    """A pair that would put two INCHIKEYs in one clique is skipped; later pairs still apply."""
+    d = {}
+    glom(d, [("INCHIKEY:A", "CHEBI:1"), ("INCHIKEY:B", "CHEBI:2"), ("CHEBI:1", "CHEBI:2"), ("CHEBI:2", "MESH:1")])
+    assert d["CHEBI:1"] == {"INCHIKEY:A", "CHEBI:1"}
+    assert d["CHEBI:2"] == d["MESH:1"] == {"INCHIKEY:B", "CHEBI:2", "MESH:1"}
+
+
+@pytest.mark.unit
+def test_close_matches_are_never_merged():
+    """A pair that would put a CURIE and one of its close matches into one clique is skipped."""
+    d = {}
+    close = {"MONDO": {"MONDO:1": {"UMLS:2"}}}
+    glom(d, [("MONDO:1", "UMLS:1"), ("UMLS:2", "MESH:2"), ("UMLS:1", "MESH:2"), ("UMLS:1", "MESH:3")], close=close)
+    assert d["MONDO:1"] == {"MONDO:1", "UMLS:1", "MESH:3"}
+    assert d["MESH:2"] == {"UMLS:2", "MESH:2"}
+
+
+@pytest.mark.unit
+def test_untouched_cliques_keep_their_set_object():
+    """Cliques a later call does not touch are left alone; a changed clique gets a new set object."""
+    d = {}
+    glom(d, [("A:1", "B:1"), ("C:1", "D:1")])
+    untouched, changed = d["A:1"], d["C:1"]
+    glom(d, [("D:1", "E:1")])
+    assert d["A:1"] is untouched
+    assert d["C:1"] is not changed
+    assert changed == {"C:1", "D:1"}
+    assert d["C:1"] is d["D:1"] is d["E:1"]
+
+
+@pytest.mark.unit
+def test_forbidden_prefixes_raise():
+    """Bare KEGG and PUBCHEM CURIEs indicate an upstream bug and stop the build."""
+    with pytest.raises(Exception, match="garbage"):
+        glom({}, [("KEGG:C00001", "CHEBI:1")])
+
+
+@pytest.mark.unit
+def test_matches_reference_merge_on_random_pairs():
+    """The union-find engine produces exactly the cliques the original merge did, across several calls."""
+    rng = random.Random(42)
+    prefixes = ["INCHIKEY", "CHEBI", "MESH", "MONDO", "UMLS"]
+    curies = [f"{rng.choice(prefixes)}:{i}" for i in range(300)]
+    close = {"MONDO": {c: set(rng.sample(curies, 3)) for c in curies if c.startswith("MONDO")}}
+    expected, actual = {}, {}
+    for _ in range(5):
+        batch = [tuple(rng.sample(curies, rng.choice([1, 2]))) for _ in range(150)]
+        _reference_glom(expected, batch, unique_prefixes=["INCHIKEY"], close=close)
+        glom(actual, batch, unique_prefixes=["INCHIKEY"], close=close)
+        assert actual == expected
@@ -0,0 +1,132 @@
+"""Unit tests for the incremental build state in src/incremental.py."""
+
+import os
+
+import pytest
+
+import src.incremental as incremental
+from src.incremental import (
+    NOT_REUSABLE,
+    BuildManifest,
+    CliqueLog,
+    CompendiumReuse,
+    DigestCache,
+    clique_key,
+    compendium_manifest,
+    save_compendium_state,
+)
+
+pytestmark = pytest.mark.unit
+
+
+def test_digest_cache_only_rereads_changed_files(tmp_path):
+    data = tmp_path / "concord"
+    data.write_text("A:1\teq\tB:1\n")
+    cache = DigestCache(str(tmp_path / "digests.json"))
+
+    first = cache.digest(str(data))
+    assert cache.digest(str(tmp_path / "missing")) is None
+    cache.save()
+
+    # A fresh cache reads the saved digest back rather than recomputing it.
+    reloaded = DigestCache(str(tmp_path / "digests.json"))
+    assert reloaded.digest(str(data)) == first
+    assert not reloaded.changed
+
+    data.write_text("A:1\teq\tB:2\n")
+    os.utime(data, ns=(0, 1))
+    assert reloaded.digest(str(data)) != first
+
+
+def test_manifest_reports_changed_params_and_inputs(tmp_path):
+    manifest = BuildManifest({"unique_prefixes": ("A",)}, {"ids": "1", "concord": "2"})
+    manifest.save(str(tmp_path))
+    previous = BuildManifest.load(str(tmp_path))
+
+    # Params are round-tripped through JSON, so the tuple compares equal to the saved list.
+    assert previous == manifest
+    current = BuildManifest({"unique_prefixes": ["A", "B"]}, {"ids": "1", "concord": "3", "new": "4"})
+    assert current.params_changed_from(previous) == ["unique_prefixes"]
+    assert current.inputs_changed_from(previous) == ["concord", "new"]
+
+    BuildManifest.invalidate(str(tmp_path))
+    assert BuildManifest.load(str(tmp_path)) is None
+
+
+def test_clique_key():
+    assert clique_key("biolink:Gene", ["B:1", "A:1"]) == clique_key("biolink:Gene", ("A:1", "B:1"))
+    assert clique_key("biolink:Gene", ["A:1"]) != clique_key("biolink:Protein", ["A:1"])
+    assert clique_key(None, ["A:1"]) == NOT_REUSABLE
+
+
+def test_saved_compendium_state_returns_each_cliques_lines(tmp_path):
+    """Every reusable clique's lines can be read back from the saved state; unreusable ones can't."""
+    cliques = [
+        ("biolink:Gene", ["A:1"], b'{"c": 1}\n', b'{"s": 1}\n', 2, 0),
+        # A clique with no node: nothing was written for it.
+        ("biolink:Gene", ["A:2"], b"", b"", 0, 0),
+        (None, ["A:3"], b'{"c": 3}\n', b'{"s": 3}\n', 1, 1),
+        ("biolink:Gene", ["A:4", "B:4"], '{"c": "é"}\n'.encode(), b"", 0, 2),
+    ]
+    compendium = tmp_path / "Gene.txt"
+    synonyms = tmp_path / "Gene.synonyms.txt"
+    log_filename = str(tmp_path / "cliques.tsv")
+    log = CliqueLog(log_filename)
+    with open(compendium, "wb") as cf, open(synonyms, "wb") as sf:
+        for node_type, identifiers, compendium_line, synonyms_line, synonym_count, filtered in cliques:
+            cf.write(compendium_line)
+            sf.write(synonyms_line)
+            log.add(
+                clique_key(node_type, identifiers), len(compendium_line), len(synonyms_line), synonym_count, filtered
+            )
+    log.close()
+
+    state_dir = str(tmp_path / "state")
+    manifest = BuildManifest({"compendium": "Gene.txt"})
+    save_compendium_state(state_dir, manifest, str(compendium), str(synonyms), log_filename)
+
+    assert CompendiumReuse.usable_state_dir(state_dir, manifest) == state_dir
+    assert CompendiumReuse.usable_state_dir(state_dir, BuildManifest({"compendium": "Other.txt"})) is None
+
+    reuse = CompendiumReuse(state_dir)
+    try:
+        for node_type, identifiers, compendium_line, synonyms_line, synonym_count, filtered in cliques:
+            reused = reuse.get(clique_key(node_type, identifiers))
+            if node_type is None:
+                assert reused is None
+            else:
+                assert tuple(reused) == (compendium_line, synonyms_line, synonym_count, filtered)
+        assert reuse.get(clique_key("biolink:Gene", ["A:5"])) is None
+    finally:
+        reuse.close()
+
+
+def test_compendium_state_is_not_reused_across_output_versions(tmp_path, monkeypatch):
+    """State written by code that formatted compendium or synonym lines differently isn't reused."""
+    config = {
+        "download_directory": str(tmp_path / "downloads"),
+        "common": {"labels": [], "synonyms": [], "descriptions": []},
+        "biolink_version": "4.4.3",
+        "preferred_name_boost_prefixes": {},
+    }
+    monkeypatch.setattr(incremental, "get_config", lambda: config)
+
+    def manifest():
+        return compendium_manifest(
+            "Gene.txt",
+            "biolink:Gene",
+            [["A:1"]],
+            {},
+            [],
+            str(tmp_path / "icRDF.tsv"),
+            [],
+            DigestCache(str(tmp_path / "digests.json")),
+        )
+
+    state_dir = str(tmp_path / "state")
+    os.makedirs(state_dir)
+    manifest().save(state_dir)
+    assert CompendiumReuse.usable_state_dir(state_dir, manifest()) == state_dir
+
+    monkeypatch.setattr(incremental, "COMPENDIUM_OUTPUT_VERSION", incremental.COMPENDIUM_OUTPUT_VERSION + 1)
+    assert CompendiumReuse.usable_state_dir(state_dir, manifest()) is None
@@ -0,0 +1,99 @@
+"""Unit tests for src/exporters/kgx.py."""
+
+import gzip
+import hashlib
+import json
+
+import pytest
+
+from src.exporters import kgx
+from src.exporters.kgx import convert_compendium_to_kgx, split_into_line_ranges
+
+
+def write_compendium(path, clique_sizes):
+    with open(path, "w") as f:
+        for index, size in enumerate(clique_sizes):
+            identifiers = [{"i": f"CHEBI:{index}{j}", **({"l": f"label {j}"} if j == 0 else {})} for j in range(size)]
+            f.write(json.dumps({"type": "biolink:SmallMolecule", "identifiers": identifiers}) + "\n")
+
+
+def read_jsonl_gz(path):
+    with gzip.open(path, "rt") as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.mark.unit
+def test_clique_edges(tmp_path):
+    compendium = str(tmp_path / "SmallMolecule.txt")
+    write_compendium(compendium, [3, 1])
+    convert_compendium_to_kgx(compendium, str(tmp_path / "nodes.jsonl.gz"), str(tmp_path / "edges.jsonl.gz"))
+
+    nodes = read_jsonl_gz(tmp_path / "nodes.jsonl.gz")
+    assert [node["id"] for node in nodes] == ["CHEBI:00", "CHEBI:01", "CHEBI:02", "CHEBI:10"]
+    assert nodes[0]["name"] == "label 0"
+    assert nodes[1]["name"] == ""
+    assert nodes[1]["equivalent_identifiers"] == ["CHEBI:00", "CHEBI:01", "CHEBI:02"]
+
+    edges = read_jsonl_gz(tmp_path / "edges.jsonl.gz")
+    assert [(edge["subject"], edge["object"]) for edge in edges] == [
+        ("CHEBI:00", "CHEBI:01"),
+        ("CHEBI:00", "CHEBI:02"),
+        ("CHEBI:01", "CHEBI:02"),
+    ]
+    # Edge IDs are the MD5 of subject + object + compendium filename, as they always have been.
+    assert edges[2]["id"] == hashlib.md5(f"CHEBI:01CHEBI:02{compendium}".encode()).hexdigest()
+
+
+@pytest.mark.unit
+def test_star_edges(tmp_path):
+    compendium = str(tmp_path / "SmallMolecule.txt")
+    write_compendium(compendium, [4])
+    convert_compendium_to_kgx(
+        compendium, str(tmp_path / "nodes.jsonl.gz"), str(tmp_path / "edges.jsonl.gz"), edge_topology="star"
+    )
+    edges = read_jsonl_gz(tmp_path / "edges.jsonl.gz")
+    assert [(edge["subject"], edge["object"]) for edge in edges] == [
+        ("CHEBI:00", "CHEBI:01"),
+        ("CHEBI:00", "CHEBI:02"),
+        ("CHEBI:00", "CHEBI:03"),
+    ]
+
+
+@pytest.mark.unit
+def test_unknown_edge_topology(tmp_path):
+    compendium = str(tmp_path / "SmallMolecule.txt")
+    write_compendium(compendium, [2])
+    with pytest.raises(ValueError):
+        convert_compendium_to_kgx(compendium, str(tmp_path / "n.gz"), str(tmp_path / "e.gz"), edge_topology="mesh")
+
+
+@pytest.mark.unit
+def test_split_into_line_ranges(tmp_path):
+    path = tmp_path / "lines.txt"
+    lines = [f"{'x' * (i % 7)}{i}\n" for i in range(100)]
+    path.write_text("".join(lines))
+    content = path.read_bytes()
+
+    for chunk_count in [1, 2, 3, 10, 1000]:
+        ranges = split_into_line_ranges(str(path), chunk_count)
+        assert len(ranges) <= chunk_count
+        assert ranges[0][0] == 0
+        assert ranges[-1][1] == len(content)
+        for (_, end), (start, _) in zip(ranges, ranges[1:]):
+            assert end == start
+            assert content[start - 1 : start] == b"\n"
+
+
+@pytest.mark.unit
+def test_parallel_output_matches_serial(tmp_path, monkeypatch):
+    """Chunked conversion over a process pool writes exactly the same records, in the same order."""
+    monkeypatch.setattr(kgx, "BATCH_SIZE", 7)
+    compendium = str(tmp_path / "SmallMolecule.txt")
+    write_compendium(compendium, [(i % 5) + 1 for i in range(60)])
+
+    convert_compendium_to_kgx(compendium, str(tmp_path / "n1.jsonl.gz"), str(tmp_path / "e1.jsonl.gz"))
+    convert_compendium_to_kgx(compendium, str(tmp_path / "n2.jsonl.gz"), str(tmp_path / "e2.jsonl.gz"), workers=2)
+
+    assert read_jsonl_gz(tmp_path / "n1.jsonl.gz") == read_jsonl_gz(tmp_path / "n2.jsonl.gz")
+    assert read_jsonl_gz(tmp_path / "e1.jsonl.gz") == read_jsonl_gz(tmp_path / "e2.jsonl.gz")
+    assert len(read_jsonl_gz(tmp_path / "n1.jsonl.gz")) == sum((i % 5) + 1 for i in range(60))
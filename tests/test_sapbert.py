@@ -0,0 +1,116 @@
+"""Unit tests for src/exporters/sapbert.py."""
+
+import gzip
+import itertools
+import json
+import random
+
+import pytest
+
+from src.exporters import sapbert
+from src.exporters.sapbert import convert_synonyms_to_sapbert, sample_name_pairs
+
+
+def write_synonyms(path, entries):
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + "\n")
+
+
+def read_rows(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return [line.rstrip("\n").split("||") for line in f]
+
+
+@pytest.mark.unit
+def test_pair_at_matches_combinations():
+    for count in range(60):
+        names = [f"name {i}" for i in range(count)]
+        pairs = list(itertools.combinations(names, 2))
+        assert [sapbert._pair_at(names, index) for index in range(len(pairs))] == pairs
+
+
+@pytest.mark.unit
+def test_sample_name_pairs():
+    names = [f"name {i}" for i in range(11)]
+    assert sample_name_pairs(names[:10], 45, random.Random(0)) == list(itertools.combinations(names[:10], 2))
+
+    sampled = sample_name_pairs(names, 45, random.Random("CHEBI:15377"))
+    assert len(sampled) == len(set(sampled)) == 45
+    assert set(sampled) < set(itertools.combinations(names, 2))
+    assert sample_name_pairs(names, 45, random.Random("CHEBI:15377")) == sampled
+
+    # A clique with thousands of names has millions of pairs, none of which need to be listed.
+    many_names = [f"name {i}" for i in range(5000)]
+    sampled = sample_name_pairs(many_names, 50, random.Random(1))
+    assert len(set(sampled)) == 50
+    assert all(many_names.index(a) < many_names.index(b) for a, b in sampled)
+
+
+@pytest.mark.unit
+def test_convert_synonyms_to_sapbert(tmp_path):
+    synonyms = str(tmp_path / "Test.txt.gz")
+    write_synonyms(
+        synonyms,
+        [
+            {
+                "curie": "CHEBI:1",
+                "preferred_name": "Water",
+                "names": ["Water", "H2O", "water"],
+                "types": ["SmallMolecule"],
+            },
+            {"curie": "CHEBI:2", "preferred_name": "Salt", "names": ["Table||salt"], "types": []},
+            {"curie": "CHEBI:3", "preferred_name": "", "names": ["Unnamed"], "types": []},
+            {"curie": "CHEBI:4", "preferred_name": "Many", "names": [f"many {i}" for i in range(20)], "types": []},
+        ],
+    )
+    sapbert_filename = str(tmp_path / "sapbert" / "Test.txt.gz")
+    convert_synonyms_to_sapbert(synonyms, sapbert_filename)
+    rows = read_rows(sapbert_filename)
+
+    assert rows[:2] == [
+        ["biolink:SmallMolecule", "CHEBI:1", "Water", "water", "h2o"],
+        ["biolink:NamedThing", "CHEBI:2", "Salt", "salt", "table|salt"],
+    ]
+    many = [row for row in rows if row[1] == "CHEBI:4"]
+    assert len(many) == len({tuple(row) for row in many}) == sapbert.MAX_SYNONYM_PAIRS
+    assert len(rows) == 2 + sapbert.MAX_SYNONYM_PAIRS
+
+    # The sampled pairs are the same every time.
+    again = str(tmp_path / "Again.txt.gz")
+    convert_synonyms_to_sapbert(synonyms, again)
+    assert read_rows(again) == rows
+
+
+@pytest.mark.unit
+def test_parallel_output_matches_serial(tmp_path, monkeypatch):
+    """Chunked conversion over a process pool writes exactly the same bytes, whatever the number of workers."""
+    monkeypatch.setattr(sapbert, "CHUNK_ENTRIES", 7)
+    synonyms = str(tmp_path / "Test.txt.gz")
+    write_synonyms(
+        synonyms,
+        [
+            {
+                "curie": f"CHEBI:{i}",
+                "preferred_name": f"Name {i}",
+                "names": [f"n{i} {j}" for j in range(i % 15)],
+                "types": [],
+            }
+            for i in range(60)
+        ],
+    )
+    convert_synonyms_to_sapbert(synonyms, str(tmp_path / "serial.txt.gz"))
+    convert_synonyms_to_sapbert(synonyms, str(tmp_path / "parallel.txt.gz"), workers=2)
+
+    assert (tmp_path / "serial.txt.gz").read_bytes() == (tmp_path / "parallel.txt.gz").read_bytes()
+    # One row for a clique with fewer than two names, otherwise one per pair up to MAX_SYNONYM_PAIRS.
+    expected_rows = sum(max(1, min(n * (n - 1) // 2, sapbert.MAX_SYNONYM_PAIRS)) for n in (i % 15 for i in range(60)))
+    assert len(read_rows(tmp_path / "serial.txt.gz")) == expected_rows
+
+
+@pytest.mark.unit
+def test_empty_synonyms_file(tmp_path):
+    synonyms = str(tmp_path / "Empty.txt.gz")
+    write_synonyms(synonyms, [])
+    convert_synonyms_to_sapbert(synonyms, str(tmp_path / "Empty-sapbert.txt.gz"))
+    assert read_rows(tmp_path / "Empty-sapbert.txt.gz") == []
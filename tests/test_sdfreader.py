@@ -0,0 +1,61 @@
+"""Unit tests for src/sdfreader.py."""
+
+import types
+
+import pytest
+
+from src.sdfreader import read_sdf
+
+pytestmark = pytest.mark.unit
+
+SDF = """
+  Marvin  02030913412D
+
+  1  0  0  0  0  0            999 V2000
+M  END
+> <ChEBI ID>
+CHEBI:1
+
+> <ChEBI Name>
+first
+
+> <Definition>
+A definition that
+spans two lines.
+
+$$$$
+
+  Marvin  02030913412D
+
+M  END
+> <ChEBI ID>
+CHEBI:2
+
+> <KEGG COMPOUND Database Links>
+C00001;C00002
+
+$$$$
+"""
+
+
+def test_read_sdf_streams_entries_with_only_the_interesting_keys(tmp_path):
+    sdf = tmp_path / "chebi.sdf"
+    sdf.write_text(SDF)
+
+    entries = read_sdf(str(sdf), {"chebiid", "definition", "keggcompounddatabaselinks"})
+    assert isinstance(entries, types.GeneratorType)
+    assert list(entries) == [
+        ("CHEBI:1", {"chebiid": ["CHEBI:1"], "definition": ["A definition that", "spans two lines."]}),
+        ("CHEBI:2", {"chebiid": ["CHEBI:2"], "keggcompounddatabaselinks": ["C00001;C00002"]}),
+    ]
+
+
+def test_read_sdf_yields_a_repeated_chebi_id_once_with_its_last_entry(tmp_path):
+    sdf = tmp_path / "chebi.sdf"
+    sdf.write_text(SDF + SDF.replace("first", "second"))
+
+    entries = list(read_sdf(str(sdf), {"chebiid", "chebiname"}))
+    assert entries == [
+        ("CHEBI:1", {"chebiid": ["CHEBI:1"], "chebiname": ["second"]}),
+        ("CHEBI:2", {"chebiid": ["CHEBI:2"]}),
+    ]
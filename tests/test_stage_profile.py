@@ -0,0 +1,53 @@
+"""Unit tests for src/stage_profile.py, which write_compendium() uses to report where it spends its time."""
+
+import pytest
+
+import src.stage_profile
+from src.stage_profile import NULL_STAGE_PROFILE, StageProfile, StageStats, add_stage_stats, stage_stats_to_dict
+
+pytestmark = pytest.mark.unit
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A clock that only moves when told to, and a peak RSS that only grows when told to."""
+    state = {"now": 0.0, "peak_rss": 0}
+    monkeypatch.setattr(src.stage_profile.time, "perf_counter", lambda: state["now"])
+    monkeypatch.setattr(src.stage_profile, "process_peak_rss_bytes", lambda: state["peak_rss"])
+    return state
+
+
+def test_nested_stages_report_exclusive_time(clock):
+    profile = StageProfile(["outer", "inner", "unused"])
+
+    with profile.stage("outer"):
+        clock["now"] += 1
+        with profile.stage("inner"):
+            clock["now"] += 10
+            clock["peak_rss"] += 4 * 1024 * 1024
+        clock["now"] += 2
+    # Time outside every stage is not charged to any of them.
+    clock["now"] += 100
+    with profile.stage("inner"):
+        clock["now"] += 5
+
+    assert profile.stats == {
+        "outer": StageStats(calls=1, seconds=3, peak_rss_growth_bytes=0),
+        "inner": StageStats(calls=2, seconds=15, peak_rss_growth_bytes=4 * 1024 * 1024),
+        "unused": StageStats(),
+    }
+    assert list(stage_stats_to_dict(profile.stats)) == ["outer", "inner", "unused"]
+    assert stage_stats_to_dict(profile.stats)["inner"] == {"calls": 2, "seconds": 15, "peak_rss_growth_mib": 4.0}
+
+
+def test_stage_stats_add_up_across_workers():
+    totals = {"a": StageStats(1, 1.0, 10)}
+    add_stage_stats(totals, {"a": StageStats(2, 0.5, 5), "b": StageStats(1, 2.0, 0)})
+
+    assert totals == {"a": StageStats(3, 1.5, 15), "b": StageStats(1, 2.0, 0)}
+
+
+def test_the_null_profile_records_nothing():
+    with NULL_STAGE_PROFILE.stage("anything"):
+        pass
+    assert not hasattr(NULL_STAGE_PROFILE, "stats")
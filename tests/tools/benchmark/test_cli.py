@@ -0,0 +1,53 @@
+"""Unit tests for the babel-benchmark CLI wrapper.
+
+The cases themselves are tested in tests/benchmarks/; these cover the argparse layer and the exit
+status that lets a CI job fail on a regression.
+"""
+
+import json
+
+import pytest
+
+from src.benchmarks.cases import BenchmarkResult, write_results
+from src.tools.benchmark.cli import main
+
+pytestmark = pytest.mark.unit
+
+
+@pytest.fixture
+def baseline(tmp_path):
+    path = str(tmp_path / "baseline.json")
+    write_results([BenchmarkResult("glom", "small", 1000, 1.0, 100.0)], path)
+    return path
+
+
+def test_compare_exits_zero_within_tolerance(tmp_path, baseline, capsys):
+    results = str(tmp_path / "results.json")
+    write_results([BenchmarkResult("glom", "small", 1000, 1.1, 105.0)], results)
+
+    main(["--results", results, "--compare", baseline])
+
+    assert "No regressions in 1 cases." in capsys.readouterr().out
+
+
+def test_compare_exits_one_on_a_regression(tmp_path, baseline, capsys):
+    results = str(tmp_path / "results.json")
+    write_results([BenchmarkResult("glom", "small", 1000, 1.5, 100.0)], results)
+
+    with pytest.raises(SystemExit) as excinfo:
+        main(["--results", results, "--compare", baseline])
+
+    assert excinfo.value.code == 1
+    assert "REGRESSED" in capsys.readouterr().out
+    # A looser tolerance lets the same results through.
+    main(["--results", results, "--compare", baseline, "--tolerance", "0.6"])
+
+
+def test_runs_cases_and_writes_results(tmp_path, capsys):
+    output = tmp_path / "results.json"
+
+    main(["--cases", "glom", "--scales", "tiny", "--workdir", str(tmp_path / "work"), "--output", str(output)])
+
+    results = json.loads(output.read_text())["results"]
+    assert [(r["case"], r["scale"]) for r in results] == [("glom", "tiny")]
+    assert "glom" in capsys.readouterr().out
@@ -2,7 +2,7 @@
 
 import pytest
 
-from src.tools.slurm import resources
+from src.tools.slurm import parse, resources
 
 pytestmark = pytest.mark.unit
 
@@ -401,3 +401,23 @@ def test_the_default_runtime_sentence_says_which_direction_to_move(tmp_path):
     # The same run against a generous default is the trim the sentence was written for.
     loose = resources.analyze(tmp_path, default_runtime_min=480)
     assert "the default could drop from 8.0h to 3.0h" in resources.build_markdown(loose, 16 * 1000, 1, 480)
+
+
+def test_write_compendium_profiles_say_which_stage_to_optimise(tmp_path):
+    """The profiles write_compendium() leaves in reports/write_compendium/ are read from the same run directory."""
+    _make_run(tmp_path, "chemical_compendia", rss_mb=1000, mean_load=90.0, requested_mem_mb=64000)
+    profiles_dir = tmp_path / "reports" / "write_compendium"
+    profiles_dir.mkdir(parents=True)
+    (profiles_dir / "SmallMolecule.txt.json").write_text(
+        '{"compendium": "SmallMolecule.txt", "cliques": 1000, "workers": 2, "seconds": 5400.0, "stages": {'
+        '"create_node": {"calls": 1000, "seconds": 100.0, "peak_rss_growth_mib": 9536.7},'
+        '"synonyms": {"calls": 1000, "seconds": 300.0, "peak_rss_growth_mib": 10.0}}}'
+    )
+
+    profiles = parse.read_compendium_profiles(profiles_dir)
+    assert profiles["SmallMolecule.txt"].slowest_stage.name == "synonyms"
+    markdown = resources.build_markdown(resources.analyze(tmp_path), 16 * 1000, 1, profiles=profiles)
+    # Stage memory is in mebibytes, like the benchmarks, and reported in decimal GB like everything else.
+    assert "SmallMolecule.txt | 1,000 | 2 | 1.5h | synonyms (75%) | create_node (+10.0G)" in markdown
+    # A run without profiles reads as none, rather than failing.
+    assert parse.read_compendium_profiles(tmp_path / "missing") == {}